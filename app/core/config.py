@@ -0,0 +1,107 @@
+import os
+import json
+from importlib.util import find_spec
+from dotenv import load_dotenv
+
+# โหลดตัวแปรจากไฟล์ .env
+load_dotenv()
+
+# การตั้งค่า HTTP client ของ OpenAI ที่ใช้ร่วมกันทั้ง worker (ดู services.opeai_service.create_openai_client)
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# จำนวนการเชื่อมต่อพร้อมกันสูงสุด และจำนวนการเชื่อมต่อ keep-alive ที่เก็บไว้ใช้ซ้ำ
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+
+# timeout (วินาที) read คือเวลารอระหว่างข้อมูลแต่ละส่วน ไม่ใช่เวลาทั้งหมดของ stream
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", "120"))
+OPENAI_WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", "30"))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", "10"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# HTTP/2 ใช้ได้เมื่อติดตั้งแพ็กเกจ h2 (pip install "httpx[http2]") ค่า auto จะเปิดให้เองถ้ามี
+_openai_http2 = os.getenv("OPENAI_HTTP2", "auto").lower()
+OPENAI_HTTP2 = find_spec("h2") is not None if _openai_http2 == "auto" else _openai_http2 == "true"
+
+# แคชคำตอบของ chat completion (ปิดไว้โดยค่าเริ่มต้น) ดู services.chat_cache
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "false").lower() == "true"
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "10000"))
+
+# ชั้น semantic: ใช้คำตอบเดิมเมื่อ cosine similarity ของ prompt ใหม่กับ prompt ที่เคยตอบ >= threshold
+CHAT_CACHE_SEMANTIC = os.getenv("CHAT_CACHE_SEMANTIC", "false").lower() == "true"
+CHAT_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CHAT_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+CHAT_CACHE_EMBEDDING_MODEL = os.getenv("CHAT_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+CHAT_CACHE_PATH = os.getenv("CHAT_CACHE_PATH") or None
+
+# รวมคำขอ chat/embeddings ที่เหมือนกันและทำงานพร้อมกันให้ใช้การเรียก upstream ครั้งเดียว
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() != "false"
+
+# รวมข้อความจากคำขอ embeddings ที่เข้ามาพร้อมกันเป็นคำขอเดียว ดู services.embedding_batcher
+# ส่งเมื่อครบ EMBEDDING_BATCH_MAX_SIZE ข้อความ หรือเมื่อข้อความแรกรอครบ EMBEDDING_BATCH_MAX_WAIT_MS
+EMBEDDING_BATCH_ENABLED = os.getenv("EMBEDDING_BATCH_ENABLED", "true").lower() != "false"
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "256"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+
+# การรวมข้อความส่วนย่อยของ chat stream ก่อนส่งให้ client ดู services.stream_chunker
+# STREAM_CHUNK_POLICY คือชื่อกฎคั่นด้วยจุลภาค (size, punctuation, whitespace, thai) หรือ none เพื่อส่งทุกส่วนทันที
+STREAM_CHUNK_POLICY = os.getenv("STREAM_CHUNK_POLICY", "size,punctuation,whitespace,thai")
+STREAM_CHUNK_MAX_CHARS = int(os.getenv("STREAM_CHUNK_MAX_CHARS", "10"))
+STREAM_CHUNK_MAX_HOLD_MS = float(os.getenv("STREAM_CHUNK_MAX_HOLD_MS", "50"))
+
+# ส่ง comment keep-alive ใน SSE เมื่อไม่มี event นานครบจำนวนวินาทีนี้ ดู services.sse_writer
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+# งบ token ของ prompt: ตัดประวัติบทสนทนาที่เก่าที่สุดออกเมื่อเกินงบ ดู services.token_budget
+# งบคือ context window ของโมเดลลบ max_tokens และไม่เกิน CHAT_PROMPT_TOKEN_BUDGET ถ้ากำหนด
+CHAT_TOKEN_BUDGET_ENABLED = os.getenv("CHAT_TOKEN_BUDGET_ENABLED", "true").lower() != "false"
+CHAT_TOKEN_COUNTER = os.getenv("CHAT_TOKEN_COUNTER", "heuristic")
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET")) if os.getenv("CHAT_PROMPT_TOKEN_BUDGET") else None
+CHAT_KEEP_RECENT_MESSAGES = int(os.getenv("CHAT_KEEP_RECENT_MESSAGES", "1"))
+
+# trim คือตัด message เก่าทิ้ง summarize คือแทน message ที่ถูกตัดด้วยบทสรุปจากโมเดล
+CHAT_CONTEXT_STRATEGY = os.getenv("CHAT_CONTEXT_STRATEGY", "trim").lower()
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL") or None
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+
+# บทสนทนาฝั่งเซิร์ฟเวอร์ (/api/v1/openai/conversations) ดู services.conversation_store
+# เก็บใน SQLite ที่ CONVERSATION_STORE_PATH (ค่าเริ่มต้น data/conversations.db) และเก็บบทสนทนาที่ใช้ล่าสุดไว้ในหน่วยความจำ
+CONVERSATION_STORE_PATH = os.getenv("CONVERSATION_STORE_PATH") or None
+CONVERSATION_MEMORY_ENTRIES = int(os.getenv("CONVERSATION_MEMORY_ENTRIES", "1000"))
+
+# key ใน metadata ของเอกสาร (คั่นด้วยจุลภาค) ที่สร้าง expression index ไว้ตอนเริ่มแอป ดู SQLiteService.create_metadata_index
+# การกรองด้วย key อื่นยังทำได้แต่ต้องสแกนตาราง documents
+METADATA_INDEX_FIELDS = [field.strip() for field in os.getenv("METADATA_INDEX_FIELDS", "").split(",") if field.strip()]
+
+# ตัววัดประสิทธิภาพในรูปแบบ Prometheus ที่ GET /metrics ดู services.metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+# ชื่อโมเดลเพิ่มเติม (คั่นด้วยจุลภาค) ที่ใช้เป็นค่า label "model" ได้ นอกเหนือจากโมเดลที่รู้จักใน services.metrics.model_label
+METRICS_MODEL_LABELS = [model.strip() for model in os.getenv("METRICS_MODEL_LABELS", "").split(",") if model.strip()]
+
+# ควบคุมการเรียก OpenAI API ภายในงบต่อนาที คิวตามลำดับความสำคัญ และลองใหม่เมื่อผิดพลาดชั่วคราว ดู services.upstream_scheduler
+# เมื่อเปิดไว้ client ของ OpenAI จะไม่ลองใหม่เอง scheduler ลองใหม่ OPENAI_MAX_RETRIES ครั้งแทน
+UPSTREAM_SCHEDULER_ENABLED = os.getenv("UPSTREAM_SCHEDULER_ENABLED", "true").lower() != "false"
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("OPENAI_REQUESTS_PER_MINUTE")) if os.getenv("OPENAI_REQUESTS_PER_MINUTE") else None
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("OPENAI_TOKENS_PER_MINUTE")) if os.getenv("OPENAI_TOKENS_PER_MINUTE") else None
+UPSTREAM_MAX_QUEUE_SIZE = int(os.getenv("UPSTREAM_MAX_QUEUE_SIZE", "1000"))
+UPSTREAM_MAX_WAIT_SECONDS = float(os.getenv("UPSTREAM_MAX_WAIT_SECONDS", "30"))
+UPSTREAM_RETRY_BASE_SECONDS = float(os.getenv("UPSTREAM_RETRY_BASE_SECONDS", "0.5"))
+UPSTREAM_RETRY_MAX_SECONDS = float(os.getenv("UPSTREAM_RETRY_MAX_SECONDS", "20"))
+
+# ปลายทางของ OpenAI API หลายตัว (API key หรือ endpoint ที่รองรับ API เดียวกัน) ดู services.upstream_pool
+# รูปแบบ JSON: [{"name": "primary", "api_key": "sk-...", "base_url": "https://..."}, ...]
+# ค่าที่ไม่ระบุใช้ OPENAI_API_KEY / OPENAI_BASE_URL ถ้าไม่ได้ตั้งไว้จะมีปลายทางเดียว
+# งบ OPENAI_REQUESTS_PER_MINUTE / OPENAI_TOKENS_PER_MINUTE เป็นงบรวมของทุกปลายทาง
+OPENAI_UPSTREAMS = json.loads(os.getenv("OPENAI_UPSTREAMS") or "[]")
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv("UPSTREAM_FAILURE_THRESHOLD", "3"))
+UPSTREAM_COOLDOWN_SECONDS = float(os.getenv("UPSTREAM_COOLDOWN_SECONDS", "30"))
+
+# ส่งคำขอ chat/embeddings ที่ไม่ใช่ stream ซ้ำไปยังปลายทางอื่นเมื่อช้ากว่าเปอร์เซ็นไทล์ที่กำหนด (ต้องมีอย่างน้อยสองปลายทาง)
+OPENAI_HEDGE_ENABLED = os.getenv("OPENAI_HEDGE_ENABLED", "false").lower() == "true"
+OPENAI_HEDGE_PERCENTILE = float(os.getenv("OPENAI_HEDGE_PERCENTILE", "95"))
+OPENAI_HEDGE_MIN_DELAY_MS = float(os.getenv("OPENAI_HEDGE_MIN_DELAY_MS", "50"))
+OPENAI_HEDGE_MIN_SAMPLES = int(os.getenv("OPENAI_HEDGE_MIN_SAMPLES", "20"))
+OPENAI_HEDGE_BUDGET_RATIO = float(os.getenv("OPENAI_HEDGE_BUDGET_RATIO", "0.1"))
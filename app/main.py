@@ -1,20 +1,44 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
-from services.opeai_service import OpenAIService
+from fastapi.responses import Response
+from services.opeai_service import OpenAIService, create_upstream_pool, embedding_cache
+from services.tourism_service import TourismService
+from services.conversation_store import create_conversation_store
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, metrics
+from services.upstream_scheduler import UpstreamOverloaded, upstream_overloaded_handler
 from schema.openai.chat_models import ChatRequest, ChatResponse
 from routes.tourism.tourism_router import router as tourism_router
 from routes.openai.chat_route import router as openai_router
+from routes.openai.conversation_route import router as conversation_router
 from routes.mt5.connection_route import router as mt5_connection_router
 from routes.mt5.account_route import router as mt5_account_router
 from routes.mt5.market_route import router as mt5_market_router
 from routes.mt5.trade_route import router as mt5_trade_router
 from routes.mt5.technical_route import router as mt5_technical_router
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    สร้างปลายทางของ OpenAI (client หนึ่งตัวต่อปลายทาง) หนึ่งชุดต่อ worker เมื่อเริ่มแอป และปิด connection pool เมื่อปิดแอป
+    รวมถึงที่เก็บบทสนทนา และรอให้แคช embeddings เขียนรายการที่ค้างอยู่ลง SQLite ก่อนปิด
+    """
+    upstream_pool = create_upstream_pool()
+    app.state.openai_service = OpenAIService(upstream_pool=upstream_pool)
+    app.state.tourism_service = TourismService(upstream_pool=upstream_pool)
+    app.state.conversation_store = create_conversation_store()
+    yield
+    await upstream_pool.close()
+    app.state.conversation_store.close()
+    if embedding_cache is not None:
+        embedding_cache.close()
+
 # สร้างแอปพลิเคชัน FastAPI
 app = FastAPI(
     title="AI API Services",
     description="API สำหรับบริการ AI ต่างๆ รวมถึงแชทกับ OpenAI และวางแผนการท่องเที่ยว",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # กำหนดค่า CORS
@@ -27,8 +51,15 @@ app.add_middleware(
     expose_headers=["Content-Type", "Content-Length"],
 )
 
+# บันทึกเวลาของทุก route (เพิ่มหลัง CORS จึงอยู่นอกสุดและนับเวลาของ middleware อื่นด้วย)
+if metrics is not None:
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+# คิวของคำขอไปยัง OpenAI เต็มหรือรอนานเกินกำหนด ตอบ 503 พร้อม Retry-After แทนการรอไม่จำกัด
+app.add_exception_handler(UpstreamOverloaded, upstream_overloaded_handler)
 
 app.include_router(openai_router)
+app.include_router(conversation_router)  # บทสนทนาที่เก็บประวัติฝั่งเซิร์ฟเวอร์
 app.include_router(tourism_router)  # เพิ่ม router สำหรับระบบท่องเที่ยว
 app.include_router(mt5_connection_router)  # เพิ่ม router สำหรับการเชื่อมต่อ MT5
 app.include_router(mt5_account_router)  # เพิ่ม router สำหรับบัญชี MT5
@@ -43,6 +74,7 @@ async def root():
         "message": "ยินดีต้อนรับสู่ API บริการ AI",
         "services": [
             {"name": "OpenAI Chat", "endpoint": "/api/v1/openai/chat"},
+            {"name": "OpenAI Conversations", "endpoint": "/api/v1/openai/conversations"},
             {"name": "Tourism Planning", "endpoint": "/api/v1/tourism/travel-plan"},
             {"name": "MT5 Connection", "endpoint": "/api/mt5/connection"},
             {"name": "MT5 Account", "endpoint": "/api/mt5/account"},
@@ -52,6 +84,17 @@ async def root():
         ]
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """
+    ตัววัดประสิทธิภาพในรูปแบบ Prometheus: เวลาของแต่ละ route, เวลาเรียก OpenAI แยกตามโมเดล,
+    TTFT และช่วงห่างระหว่าง token ของ stream, เวลาของงานฐานข้อมูล และจำนวน token ที่ใช้
+    รวมถึงสถิติของแคช การรวมคำขอ scheduler และปลายทางของ upstream (ดู ServiceMetrics.register_stats)
+    """
+    if metrics is None:
+        return Response(status_code=404)
+    return Response(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
 # หากต้องการรันแอปพลิเคชันโดยตรงจากไฟล์นี้
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,16 @@
+import asyncio
+import time
 from fastapi import APIRouter, Depends, HTTPException
-from schema.embeddings_storage_models import DocumentRequest, DocumentResponse, SearchRequest, SearchResponse, SearchResult
+from schema.embeddings_storage_models import (
+    DocumentRequest, DocumentResponse, SearchRequest, SearchResponse, SearchResult,
+    AnnIndexRequest, AnnIndexResponse, AnnIndexInfo,
+    BulkDocumentRequest, BulkDocumentResponse, BulkDocumentResult
+)
 from schema.openai.embeddings_models import EmbeddingsRequest
 from services.sqlite_service import SQLiteService
-from services.opeai_service import OpenAIService
+from services.opeai_service import OpenAIService, get_openai_service
+from services.upstream_scheduler import PRIORITY_BULK, UpstreamOverloaded, request_priority
+from core import config
 from typing import List
 
 router = APIRouter(
@@ -11,10 +19,11 @@ router = APIRouter(
 )
 
 # สร้างอินสแตนซ์ของ SQLiteService
-sqlite_service = SQLiteService()
+# งานฐานข้อมูลทั้งหมดรันผ่าน sqlite_service.run() ใน executor แยก เพื่อไม่ให้บล็อก event loop
+sqlite_service = SQLiteService(metadata_index_fields=config.METADATA_INDEX_FIELDS)
 
 @router.post("/documents", response_model=DocumentResponse)
-async def add_document(request: DocumentRequest, openai_service: OpenAIService = Depends(OpenAIService)):
+async def add_document(request: DocumentRequest, openai_service: OpenAIService = Depends(get_openai_service)):
     """
     เพิ่มเอกสารและสร้าง embedding ลงในฐานข้อมูล
     
@@ -29,13 +38,15 @@ async def add_document(request: DocumentRequest, openai_service: OpenAIService =
         # สร้าง embedding จากเนื้อหาเอกสาร
         embeddings_request = EmbeddingsRequest(
             input=request.content,
-            model=request.model
+            model=request.model,
+            dimensions=request.dimensions
         )
         
         embeddings_response = await openai_service.create_embeddings(embeddings_request)
         
         # เพิ่มเอกสารและ embedding ลงในฐานข้อมูล
-        document_id = sqlite_service.add_document(
+        document_id = await sqlite_service.run(
+            sqlite_service.add_document,
             content=request.content,
             embedding=embeddings_response.data[0].embedding,
             model=request.model,
@@ -48,11 +59,104 @@ async def add_document(request: DocumentRequest, openai_service: OpenAIService =
             metadata=request.metadata,
             model=request.model
         )
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _ingest_batch(
+    request: BulkDocumentRequest,
+    start: int,
+    results: List[BulkDocumentResult],
+    semaphore: asyncio.Semaphore,
+    openai_service: OpenAIService
+) -> None:
+    """
+    สร้าง embeddings ของเอกสารหนึ่ง batch ด้วยการเรียก API ครั้งเดียว แล้วบันทึกใน transaction เดียว
+    ผลลัพธ์ของแต่ละเอกสารจะถูกเขียนลงใน results ตามลำดับเดิม
+    """
+    items = request.documents[start:start + request.batch_size]
+    
+    # เอกสารว่างจะถูก API ปฏิเสธทั้ง batch จึงแยกออกก่อน
+    indexes = []
+    for offset, item in enumerate(items):
+        if item.content.strip():
+            indexes.append(start + offset)
+        else:
+            results[start + offset] = BulkDocumentResult(index=start + offset, error="Document content is empty")
+    if not indexes:
+        return
+    
+    try:
+        async with semaphore:
+            embeddings_response = await openai_service.create_embeddings(EmbeddingsRequest(
+                input=[request.documents[i].content for i in indexes],
+                model=request.model,
+                dimensions=request.dimensions
+            ))
+        
+        # API ส่ง embedding กลับพร้อม index ตามลำดับของ input
+        embeddings = sorted(embeddings_response.data, key=lambda item: item.index)
+        document_ids = await sqlite_service.run(
+            sqlite_service.add_documents,
+            [
+                {
+                    "content": request.documents[i].content,
+                    "embedding": embedding.embedding,
+                    "metadata": request.documents[i].metadata
+                }
+                for i, embedding in zip(indexes, embeddings)
+            ],
+            model=request.model
+        )
+        for i, document_id in zip(indexes, document_ids):
+            results[i] = BulkDocumentResult(index=i, document_id=document_id)
+    except Exception as e:
+        for i in indexes:
+            results[i] = BulkDocumentResult(index=i, error=str(e))
+
+@router.post("/documents/bulk", response_model=BulkDocumentResponse)
+async def add_documents_bulk(request: BulkDocumentRequest, openai_service: OpenAIService = Depends(get_openai_service)):
+    """
+    เพิ่มเอกสารจำนวนมากในครั้งเดียว
+    
+    แบ่งเอกสารเป็น batch ตาม batch_size เพื่อสร้าง embeddings ด้วยการเรียก API ครั้งเดียวต่อ batch
+    เรียกพร้อมกันได้ไม่เกิน max_concurrency และบันทึกแต่ละ batch ใน transaction เดียว
+    
+    Args:
+        request: รายการเอกสารและการตั้งค่า batch
+        openai_service: บริการ OpenAI
+        
+    Returns:
+        BulkDocumentResponse: ID หรือข้อความผิดพลาดของแต่ละเอกสาร และอัตราการเพิ่มเอกสาร
+    """
+    started = time.perf_counter()
+    results: List[BulkDocumentResult] = [None] * len(request.documents)
+    semaphore = asyncio.Semaphore(request.max_concurrency)
+    
+    # คำขอ embeddings ของงานนี้รอคิว upstream หลังคำขอของผู้ใช้ที่รออยู่ (task ลูกของ gather ได้ค่าเดียวกัน)
+    priority = request_priority.set(PRIORITY_BULK)
+    try:
+        await asyncio.gather(*[
+            _ingest_batch(request, start, results, semaphore, openai_service)
+            for start in range(0, len(request.documents), request.batch_size)
+        ])
+    finally:
+        request_priority.reset(priority)
+    
+    elapsed = time.perf_counter() - started
+    inserted = sum(1 for result in results if result.document_id is not None)
+    
+    return BulkDocumentResponse(
+        results=results,
+        inserted=inserted,
+        failed=len(results) - inserted,
+        elapsed_seconds=elapsed,
+        documents_per_second=inserted / elapsed if elapsed > 0 else 0.0
+    )
+
 @router.post("/search", response_model=SearchResponse)
-async def search_documents(request: SearchRequest, openai_service: OpenAIService = Depends(OpenAIService)):
+async def search_documents(request: SearchRequest, openai_service: OpenAIService = Depends(get_openai_service)):
     """
     ค้นหาเอกสารที่มีเนื้อหาคล้ายกับคำค้นหา
     
@@ -67,16 +171,23 @@ async def search_documents(request: SearchRequest, openai_service: OpenAIService
         # สร้าง embedding จากคำค้นหา
         embeddings_request = EmbeddingsRequest(
             input=request.query,
-            model=request.model
+            model=request.model,
+            dimensions=request.dimensions
         )
         
         embeddings_response = await openai_service.create_embeddings(embeddings_request)
         
         # ค้นหาเอกสารที่มี embedding ใกล้เคียง
-        search_results = sqlite_service.search_similar(
+        search_results = await sqlite_service.run(
+            sqlite_service.search_similar,
             query_embedding=embeddings_response.data[0].embedding,
             model=request.model,
-            top_k=request.top_k
+            top_k=request.top_k,
+            mode=request.mode,
+            nprobe=request.nprobe,
+            filters=[f.model_dump() for f in request.filters] if request.filters else None,
+            query_text=request.query,
+            candidates=request.candidates
         )
         
         # แปลงผลลัพธ์เป็นรูปแบบที่ต้องการ
@@ -85,7 +196,8 @@ async def search_documents(request: SearchRequest, openai_service: OpenAIService
                 document_id=result["document_id"],
                 content=result["content"],
                 metadata=result["metadata"],
-                similarity=result["similarity"]
+                similarity=result["similarity"],
+                score=result.get("score")
             )
             for result in search_results
         ]
@@ -95,9 +207,33 @@ async def search_documents(request: SearchRequest, openai_service: OpenAIService
             query=request.query,
             model=request.model
         )
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/ann-index", response_model=AnnIndexResponse)
+async def build_ann_index(request: AnnIndexRequest):
+    """
+    สร้างดัชนี ANN (IVF) ใหม่สำหรับการค้นหาแบบ mode="ann" และบันทึกไว้ข้างไฟล์ฐานข้อมูล
+    
+    Args:
+        request: ข้อมูลการสร้างดัชนี
+        
+    Returns:
+        AnnIndexResponse: ข้อมูลดัชนีที่สร้างแล้ว
+    """
+    indexes = await sqlite_service.run(
+        sqlite_service.build_ann_index,
+        model=request.model,
+        dimensions=request.dimensions,
+        nlist=request.nlist
+    )
+    if not indexes:
+        raise HTTPException(status_code=404, detail=f"No embeddings found for model {request.model}")
+    
+    return AnnIndexResponse(indexes=[AnnIndexInfo(**index) for index in indexes])
+
 @router.get("/documents/{document_id}", response_model=DocumentResponse)
 async def get_document(document_id: int):
     """
@@ -109,7 +245,7 @@ async def get_document(document_id: int):
     Returns:
         DocumentResponse: ข้อมูลเอกสาร
     """
-    document = sqlite_service.get_document(document_id)
+    document = await sqlite_service.run(sqlite_service.get_document, document_id)
     if not document:
         raise HTTPException(status_code=404, detail=f"Document with ID {document_id} not found")
     
@@ -131,7 +267,7 @@ async def delete_document(document_id: int):
     Returns:
         dict: ข้อความยืนยันการลบ
     """
-    success = sqlite_service.delete_document(document_id)
+    success = await sqlite_service.run(sqlite_service.delete_document, document_id)
     if not success:
         raise HTTPException(status_code=404, detail=f"Document with ID {document_id} not found")
     
@@ -1,7 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
 from schema.openai.chat_models import ChatRequest, ChatResponse, ChatMessage
-from services.opeai_service import OpenAIService
+from services.opeai_service import (
+    OpenAIService, get_openai_service, chat_cache, ensure_upstream_capacity
+)
+from services.upstream_scheduler import UpstreamOverloaded
+from services.sse_writer import SSEWriter, encode_chat_chunk
+from core import config
 import json
 
 router = APIRouter(
@@ -9,21 +13,26 @@ router = APIRouter(
     tags=["OpenAI"]
 )
 
+# ใช้ร่วมกันทั้ง /chat/stream แบบ POST และ GET
+chat_sse = SSEWriter(encode_chat_chunk, keepalive_seconds=config.SSE_KEEPALIVE_SECONDS)
+
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat_completion(request: ChatRequest, openai_service: OpenAIService = Depends(OpenAIService)):
+async def chat_completion(request: ChatRequest, openai_service: OpenAIService = Depends(get_openai_service)):
     try:
         # ถ้าต้องการ stream ให้ใช้ endpoint /chat/stream แทน
         if request.stream:
             raise HTTPException(status_code=400, detail="For streaming responses, use the /chat/stream endpoint")
         
         return await openai_service.chat_completion(request)
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/chat/stream")
-async def chat_completion_stream(request: ChatRequest, openai_service: OpenAIService = Depends(OpenAIService)):
+async def chat_completion_stream(request: ChatRequest, openai_service: OpenAIService = Depends(get_openai_service)):
     """
     Stream chat completion responses using POST
     """
@@ -31,24 +40,10 @@ async def chat_completion_stream(request: ChatRequest, openai_service: OpenAISer
         # กำหนดให้ใช้ stream เสมอสำหรับ endpoint นี้
         request.stream = True
         
-        async def generate():
-            async for chunk in openai_service.chat_completion_stream(request):
-                # ส่งข้อมูลในรูปแบบ Server-Sent Events (SSE)
-                if chunk.delta:  # ตรวจสอบว่ามี delta หรือไม่
-                    yield f"data: {json.dumps(chunk.model_dump())}\n\n"
-            
-            # ส่งสัญญาณว่าสิ้นสุดการ stream
-            yield "data: [DONE]\n\n"
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"  # สำหรับ Nginx
-            }
-        )
+        ensure_upstream_capacity()
+        return chat_sse.response(openai_service.chat_completion_stream(request))
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -57,7 +52,7 @@ async def chat_completion_stream(request: ChatRequest, openai_service: OpenAISer
 async def chat_completion_stream_get(
     messages: str = Query(..., description="JSON string of messages array"),
     model: str = Query("gpt-3.5-turbo", description="Model to use"),
-    openai_service: OpenAIService = Depends(OpenAIService)
+    openai_service: OpenAIService = Depends(get_openai_service)
 ):
     """
     Stream chat completion responses using GET (for EventSource)
@@ -74,23 +69,21 @@ async def chat_completion_stream_get(
             stream=True
         )
         
-        async def generate():
-            async for chunk in openai_service.chat_completion_stream(request):
-                # ส่งข้อมูลในรูปแบบ Server-Sent Events (SSE)
-                if chunk.delta:  # ตรวจสอบว่ามี delta หรือไม่
-                    yield f"data: {json.dumps(chunk.model_dump())}\n\n"
-            
-            # ส่งสัญญาณว่าสิ้นสุดการ stream
-            yield "data: [DONE]\n\n"
-        
-        return StreamingResponse(
-            generate(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"  # สำหรับ Nginx
-            }
-        )
+        ensure_upstream_capacity()
+        return chat_sse.response(openai_service.chat_completion_stream(request))
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/chat/cache")
+async def clear_chat_cache():
+    """
+    ลบคำตอบทั้งหมดในแคช chat
+    """
+    if chat_cache is None:
+        raise HTTPException(status_code=404, detail="Chat cache is not enabled")
+    
+    semantic_entries = await chat_cache.clear()
+    return {"message": "Chat cache cleared", "semantic_entries": semantic_entries}
@@ -0,0 +1,147 @@
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from schema.openai.chat_models import ChatRequest, ChatResponse, ChatMessage, ChatStreamResponse
+from schema.openai.conversation_models import ConversationCreateRequest, ConversationMessageRequest, ConversationResponse
+from services.conversation_store import Conversation, ConversationStore, get_conversation_store
+from services.opeai_service import OpenAIService, get_openai_service, ensure_upstream_capacity
+from services.upstream_scheduler import UpstreamOverloaded
+from routes.openai.chat_route import chat_sse
+
+router = APIRouter(
+    prefix="/api/v1/openai/conversations",
+    tags=["OpenAI Conversations"]
+)
+
+def to_response(conversation: Conversation) -> ConversationResponse:
+    return ConversationResponse(
+        id=conversation.id,
+        model=conversation.model,
+        messages=conversation.messages,
+        created_at=conversation.created_at,
+        updated_at=conversation.updated_at
+    )
+
+
+async def build_turn(conversation_store: ConversationStore, conversation_id: str, turn: ConversationMessageRequest) -> ChatRequest:
+    """
+    สร้าง ChatRequest จากประวัติที่เก็บไว้และข้อความใหม่ของผู้ใช้
+    """
+    conversation = await conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    # messages ในประวัติเป็น ChatMessage อยู่แล้ว Pydantic จึงไม่ตรวจสอบซ้ำ
+    return ChatRequest(
+        messages=[*conversation.messages, ChatMessage(role="user", content=turn.content)],
+        model=turn.model or conversation.model,
+        temperature=turn.temperature,
+        max_tokens=turn.max_tokens,
+        cache=turn.cache
+    )
+
+
+async def record_reply(
+    conversation_store: ConversationStore,
+    conversation_id: str,
+    request: ChatRequest,
+    events: AsyncIterator[ChatStreamResponse]
+) -> AsyncIterator[ChatStreamResponse]:
+    """
+    ส่งต่อ events และเพิ่มข้อความของผู้ใช้กับคำตอบลงในบทสนทนาเมื่อ stream จบสมบูรณ์
+
+    ถ้า stream ผิดพลาดหรือ client ตัดการเชื่อมต่อกลางทาง จะไม่บันทึกรอบนั้น client ส่งข้อความเดิมซ้ำได้
+    """
+    parts = []
+    finish_reason = None
+    async for chunk in events:
+        parts.append(chunk.delta)
+        finish_reason = chunk.finish_reason or finish_reason
+        yield chunk
+
+    if finish_reason:
+        await conversation_store.append(
+            conversation_id,
+            [request.messages[-1], ChatMessage(role="assistant", content="".join(parts))]
+        )
+
+
+@router.post("", response_model=ConversationResponse)
+async def create_conversation(
+    request: ConversationCreateRequest,
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
+    """
+    สร้างบทสนทนาใหม่ และคืน id สำหรับส่งข้อความในรอบถัดไป
+    """
+    conversation = await conversation_store.create(request.model, request.system_message)
+    return to_response(conversation)
+
+
+@router.get("/{conversation_id}", response_model=ConversationResponse)
+async def get_conversation(conversation_id: str, conversation_store: ConversationStore = Depends(get_conversation_store)):
+    conversation = await conversation_store.get(conversation_id)
+    if conversation is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return to_response(conversation)
+
+
+@router.delete("/{conversation_id}")
+async def delete_conversation(conversation_id: str, conversation_store: ConversationStore = Depends(get_conversation_store)):
+    if not await conversation_store.delete(conversation_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"message": "Conversation deleted", "id": conversation_id}
+
+
+@router.post("/{conversation_id}/messages", response_model=ChatResponse)
+async def send_message(
+    conversation_id: str,
+    turn: ConversationMessageRequest,
+    openai_service: OpenAIService = Depends(get_openai_service),
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
+    """
+    ส่งข้อความใหม่ในบทสนทนา และเพิ่มข้อความกับคำตอบลงในประวัติ
+    """
+    request = await build_turn(conversation_store, conversation_id, turn)
+    try:
+        response = await openai_service.chat_completion(request)
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    await conversation_store.append(conversation_id, [request.messages[-1], response.message])
+    return response
+
+
+@router.post("/{conversation_id}/messages/stream")
+async def send_message_stream(
+    conversation_id: str,
+    turn: ConversationMessageRequest,
+    openai_service: OpenAIService = Depends(get_openai_service),
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
+    """
+    ส่งข้อความใหม่ในบทสนทนาแบบ stream คำตอบถูกเพิ่มลงในประวัติก่อนส่ง data: [DONE]
+    """
+    request = await build_turn(conversation_store, conversation_id, turn)
+    request.stream = True
+    ensure_upstream_capacity()
+    return chat_sse.response(record_reply(conversation_store, conversation_id, request, openai_service.chat_completion_stream(request)))
+
+
+@router.get("/{conversation_id}/messages/stream")
+async def send_message_stream_get(
+    conversation_id: str,
+    content: str = Query(..., description="ข้อความใหม่ของผู้ใช้"),
+    model: Optional[str] = Query(None, description="โมเดลสำหรับรอบนี้ ถ้าไม่ระบุจะใช้โมเดลของบทสนทนา"),
+    openai_service: OpenAIService = Depends(get_openai_service),
+    conversation_store: ConversationStore = Depends(get_conversation_store)
+):
+    """
+    ส่งข้อความใหม่ในบทสนทนาแบบ stream ด้วย GET (สำหรับ EventSource) URL มีเฉพาะข้อความใหม่ไม่ใช่ประวัติทั้งหมด
+    """
+    request = await build_turn(conversation_store, conversation_id, ConversationMessageRequest(content=content, model=model))
+    request.stream = True
+    ensure_upstream_capacity()
+    return chat_sse.response(record_reply(conversation_store, conversation_id, request, openai_service.chat_completion_stream(request)))
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from schema.openai.embeddings_models import EmbeddingsRequest, EmbeddingsResponse
-from services.opeai_service import OpenAIService
+from services.opeai_service import OpenAIService, get_openai_service
+from services.upstream_scheduler import UpstreamOverloaded
 
 router = APIRouter(
     prefix="/api/v1/openai",
@@ -9,7 +10,7 @@ router = APIRouter(
 
 
 @router.post("/embeddings", response_model=EmbeddingsResponse)
-async def create_embeddings(request: EmbeddingsRequest, openai_service: OpenAIService = Depends(OpenAIService)):
+async def create_embeddings(request: EmbeddingsRequest, openai_service: OpenAIService = Depends(get_openai_service)):
     """
     สร้าง embeddings จากข้อความที่ได้รับ
     
@@ -22,5 +23,7 @@ async def create_embeddings(request: EmbeddingsRequest, openai_service: OpenAISe
     """
     try:
         return await openai_service.create_embeddings(request)
+    except UpstreamOverloaded:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
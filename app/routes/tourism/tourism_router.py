@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends
 from schema.tourism.travel_models import TravelRequest, TravelResponse
-from services.tourism_service import TourismService
+from services.tourism_service import TourismService, get_tourism_service
+from services.opeai_service import ensure_upstream_capacity
+from services.sse_writer import SSEWriter
+from core import config
 
 router = APIRouter(
     prefix="/api/v1/tourism",
     tags=["tourism"],
 )
 
+travel_plan_sse = SSEWriter(keepalive_seconds=config.SSE_KEEPALIVE_SECONDS)
+
 @router.post("/travel-plan", response_model=TravelResponse)
-async def generate_travel_plan(request: TravelRequest, service: TourismService = Depends()):
+async def generate_travel_plan(request: TravelRequest, service: TourismService = Depends(get_tourism_service)):
     """
     สร้างแผนการท่องเที่ยวตามความต้องการของผู้ใช้
     
@@ -18,6 +23,8 @@ async def generate_travel_plan(request: TravelRequest, service: TourismService =
     - **duration**: ระยะเวลาการเดินทาง (วัน)
     - **interests**: ความสนใจเฉพาะด้าน เช่น อาหาร, ธรรมชาติ, วัฒนธรรม
     
+    คำขอที่มีจุดหมาย ช่วงงบประมาณ จำนวนวัน และความสนใจเหมือนกันจะได้แผนจากแคช
+    
     ตัวอย่างคำขอ:
     ```json
     {
@@ -30,3 +37,20 @@ async def generate_travel_plan(request: TravelRequest, service: TourismService =
     ```
     """
     return await service.generate_travel_plan(request)
+
+@router.post("/travel-plan/stream")
+async def stream_travel_plan(request: TravelRequest, service: TourismService = Depends(get_tourism_service)):
+    """
+    สร้างแผนการท่องเที่ยวแบบ Server-Sent Events รับคำขอแบบเดียวกับ /travel-plan
+    
+    แต่ละเหตุการณ์เป็น `data: {json}` ตามโครงสร้าง TravelPlanStreamEvent:
+    
+    - **overview**: ภาพรวมของแผน ส่งทันทีที่โมเดลเขียนเสร็จ
+    - **day**: แผนของแต่ละวัน (DailyItinerary ที่ตรวจสอบแล้ว) ส่งทันทีที่วันนั้นครบ
+    - **plan**: แผนทั้งหมดที่ตรวจสอบแล้ว เป็นเหตุการณ์สุดท้าย
+    - **error**: ข้อผิดพลาดในการ parse หรือตรวจสอบข้อมูล
+    
+    และปิดท้ายด้วย `data: [DONE]`
+    """
+    ensure_upstream_capacity()
+    return travel_plan_sse.response(service.stream_travel_plan(request))
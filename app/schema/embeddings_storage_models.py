@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Dict, Any, Optional, Literal, Union
 
 class DocumentRequest(BaseModel):
     """
@@ -8,6 +8,42 @@ class DocumentRequest(BaseModel):
     content: str = Field(..., description="เนื้อหาของเอกสาร")
     metadata: Optional[Dict[str, Any]] = Field(None, description="ข้อมูลเพิ่มเติมของเอกสาร")
     model: str = Field("text-embedding-3-small", description="โมเดลที่ใช้สร้าง embeddings")
+    dimensions: Optional[int] = Field(None, description="จำนวนมิติของ embeddings ที่ต้องการ (ใช้ได้กับบางโมเดลเท่านั้น)")
+
+class BulkDocumentItem(BaseModel):
+    """
+    คลาสสำหรับข้อมูลเอกสารแต่ละรายการในการเพิ่มแบบกลุ่ม
+    """
+    content: str = Field(..., description="เนื้อหาของเอกสาร")
+    metadata: Optional[Dict[str, Any]] = Field(None, description="ข้อมูลเพิ่มเติมของเอกสาร")
+
+class BulkDocumentRequest(BaseModel):
+    """
+    คลาสสำหรับรับข้อมูลเอกสารจำนวนมากที่ต้องการเพิ่มในครั้งเดียว
+    """
+    documents: List[BulkDocumentItem] = Field(..., min_length=1, max_length=50000, description="รายการเอกสาร")
+    model: str = Field("text-embedding-3-small", description="โมเดลที่ใช้สร้าง embeddings")
+    dimensions: Optional[int] = Field(None, description="จำนวนมิติของ embeddings ที่ต้องการ (ใช้ได้กับบางโมเดลเท่านั้น)")
+    batch_size: int = Field(256, ge=1, le=2048, description="จำนวนเอกสารต่อการเรียก embeddings API หนึ่งครั้ง")
+    max_concurrency: int = Field(4, ge=1, le=32, description="จำนวนการเรียก embeddings API พร้อมกันสูงสุด")
+
+class BulkDocumentResult(BaseModel):
+    """
+    คลาสสำหรับผลลัพธ์ของเอกสารแต่ละรายการในการเพิ่มแบบกลุ่ม
+    """
+    index: int = Field(..., description="ลำดับของเอกสารใน request")
+    document_id: Optional[int] = Field(None, description="ID ของเอกสาร ถ้าเพิ่มสำเร็จ")
+    error: Optional[str] = Field(None, description="ข้อความผิดพลาด ถ้าเพิ่มไม่สำเร็จ")
+
+class BulkDocumentResponse(BaseModel):
+    """
+    คลาสสำหรับส่งผลลัพธ์การเพิ่มเอกสารแบบกลุ่ม
+    """
+    results: List[BulkDocumentResult] = Field(..., description="ผลลัพธ์ของแต่ละเอกสาร เรียงตามลำดับใน request")
+    inserted: int = Field(..., description="จำนวนเอกสารที่เพิ่มสำเร็จ")
+    failed: int = Field(..., description="จำนวนเอกสารที่เพิ่มไม่สำเร็จ")
+    elapsed_seconds: float = Field(..., description="เวลาที่ใช้ทั้งหมด (วินาที)")
+    documents_per_second: float = Field(..., description="อัตราการเพิ่มเอกสาร (เอกสารต่อวินาที)")
 
 class DocumentResponse(BaseModel):
     """
@@ -18,13 +54,42 @@ class DocumentResponse(BaseModel):
     metadata: Optional[Dict[str, Any]] = Field(None, description="ข้อมูลเพิ่มเติมของเอกสาร")
     model: str = Field(..., description="โมเดลที่ใช้สร้าง embeddings")
 
+class MetadataFilter(BaseModel):
+    """
+    คลาสสำหรับเงื่อนไขกรองเอกสารตาม metadata
+    """
+    field: str = Field(..., pattern=r"^[A-Za-z_][A-Za-z0-9_]*$", description="ชื่อ key ใน metadata")
+    op: Literal["eq", "in", "gt", "gte", "lt", "lte"] = Field("eq", description="ตัวดำเนินการเปรียบเทียบ")
+    value: Union[str, int, float, bool, List[Union[str, int, float, bool]]] = Field(..., description="ค่าที่ใช้เปรียบเทียบ (op=in ต้องเป็นรายการ)")
+    
+    @model_validator(mode="after")
+    def check_value(self):
+        if self.op == "in" and not isinstance(self.value, list):
+            raise ValueError("op 'in' requires a list value")
+        if self.op in ("gt", "gte", "lt", "lte") and (isinstance(self.value, (list, bool)) or not isinstance(self.value, (int, float))):
+            raise ValueError(f"op '{self.op}' requires a numeric value")
+        if self.op == "eq" and isinstance(self.value, list):
+            raise ValueError("op 'eq' requires a single value")
+        return self
+
 class SearchRequest(BaseModel):
     """
     คลาสสำหรับรับข้อมูลคำค้นหา
     """
     query: str = Field(..., description="คำค้นหา")
     model: str = Field("text-embedding-3-small", description="โมเดลที่ใช้สร้าง embeddings")
+    dimensions: Optional[int] = Field(
+        None, description="จำนวนมิติของ embeddings ต้องตรงกับที่ใช้ตอนเพิ่มเอกสาร (ไม่ระบุคือค่าเริ่มต้นของโมเดล)"
+    )
     top_k: int = Field(5, description="จำนวนผลลัพธ์ที่ต้องการ")
+    mode: Literal["exact", "ann", "hybrid", "lexical"] = Field(
+        "exact",
+        description="exact คำนวณทุกเอกสาร, ann ค้นหาแบบประมาณด้วยดัชนี IVF, hybrid รวมผลค้นหาคำ (FTS5) กับผลจากเวกเตอร์ "
+                    "ด้วย reciprocal rank fusion หรือ lexical คำนวณความคล้ายคลึงเฉพาะเอกสารที่มีคำตรงกับคำค้นหา"
+    )
+    nprobe: Optional[int] = Field(None, ge=1, description="จำนวนกลุ่มที่ค้นหาในโหมด ann ยิ่งมากยิ่งแม่นแต่ช้าลง")
+    filters: Optional[List[MetadataFilter]] = Field(None, description="เงื่อนไขกรองตาม metadata (ทุกเงื่อนไขต้องเป็นจริง) คำนวณความคล้ายคลึงเฉพาะเอกสารที่ผ่านเงื่อนไข")
+    candidates: int = Field(100, ge=1, le=1000, description="จำนวนผู้สมัครจากแต่ละฝั่งในโหมด hybrid และจากการค้นหาคำในโหมด lexical")
 
 class SearchResult(BaseModel):
     """
@@ -34,6 +99,7 @@ class SearchResult(BaseModel):
     content: str = Field(..., description="เนื้อหาของเอกสาร")
     metadata: Optional[Dict[str, Any]] = Field(None, description="ข้อมูลเพิ่มเติมของเอกสาร")
     similarity: float = Field(..., description="ค่าความคล้ายคลึง (0-1)")
+    score: Optional[float] = Field(None, description="คะแนน reciprocal rank fusion ในโหมด hybrid (ผลลัพธ์เรียงตามคะแนนนี้)")
 
 class SearchResponse(BaseModel):
     """
@@ -42,3 +108,26 @@ class SearchResponse(BaseModel):
     results: List[SearchResult] = Field(..., description="รายการผลลัพธ์การค้นหา")
     query: str = Field(..., description="คำค้นหา")
     model: str = Field(..., description="โมเดลที่ใช้สร้าง embeddings")
+
+class AnnIndexRequest(BaseModel):
+    """
+    คลาสสำหรับรับข้อมูลการสร้างดัชนี ANN
+    """
+    model: str = Field("text-embedding-3-small", description="โมเดลที่ใช้สร้าง embeddings")
+    dimensions: Optional[int] = Field(None, description="จำนวนมิติ ถ้าไม่ระบุจะสร้างให้ทุกจำนวนมิติของโมเดล")
+    nlist: Optional[int] = Field(None, ge=1, description="จำนวนกลุ่มของ IVF ถ้าไม่ระบุจะคำนวณจากจำนวนเอกสาร")
+
+class AnnIndexInfo(BaseModel):
+    """
+    คลาสสำหรับเก็บข้อมูลดัชนี ANN แต่ละรายการ
+    """
+    model: str = Field(..., description="โมเดลที่ใช้สร้าง embeddings")
+    dimensions: int = Field(..., description="จำนวนมิติของ embeddings")
+    nlist: int = Field(..., description="จำนวนกลุ่มของ IVF")
+    documents: int = Field(..., description="จำนวนเอกสารในดัชนี")
+
+class AnnIndexResponse(BaseModel):
+    """
+    คลาสสำหรับส่งข้อมูลดัชนี ANN ที่สร้างแล้ว
+    """
+    indexes: List[AnnIndexInfo] = Field(..., description="รายการดัชนีที่สร้าง")
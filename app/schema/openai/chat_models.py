@@ -12,10 +12,12 @@ class ChatRequest(BaseModel):
     max_tokens: Optional[int] = Field(default=500, ge=1, description="จำนวน token สูงสุดในการตอบกลับ ควรตั้งค่าอย่างน้อย 100 เพื่อให้ได้คำตอบที่สมบูรณ์")
     stream: Optional[bool] = Field(default=False)
     default_system_message: Optional[bool] = Field(default=True, description="เพิ่ม system message เริ่มต้นหรือไม่")
+    cache: Optional[bool] = Field(default=True, description="ใช้แคชคำตอบหรือไม่ (มีผลเมื่อเปิด CHAT_CACHE_ENABLED) ตั้งเป็น false เพื่อข้ามแคช")
 
 class ChatResponse(BaseModel):
     message: ChatMessage
     usage: Optional[Dict[str, int]] = None
+    cache_hit: Optional[Literal["exact", "semantic"]] = Field(default=None, description="ชั้นของแคชที่ตอบคำขอนี้ หรือ None ถ้าเรียก API")
 
 class ChatStreamResponse(BaseModel):
     delta: str
@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from schema.openai.chat_models import ChatMessage
+
+class ConversationCreateRequest(BaseModel):
+    model: str = Field(default="gpt-3.5-turbo", description="โมเดลเริ่มต้นของบทสนทนา")
+    system_message: Optional[str] = Field(default=None, description="system message ของบทสนทนา ถ้าไม่ระบุจะใช้ system message เริ่มต้น")
+
+class ConversationMessageRequest(BaseModel):
+    content: str = Field(..., description="ข้อความใหม่ของผู้ใช้ (ไม่ต้องส่งประวัติบทสนทนา)")
+    model: Optional[str] = Field(default=None, description="โมเดลสำหรับรอบนี้ ถ้าไม่ระบุจะใช้โมเดลของบทสนทนา")
+    temperature: Optional[float] = Field(default=0.7, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=500, ge=1)
+    cache: Optional[bool] = Field(default=True, description="ใช้แคชคำตอบหรือไม่")
+
+class ConversationResponse(BaseModel):
+    id: str
+    model: str
+    messages: List[ChatMessage]
+    created_at: float
+    updated_at: float
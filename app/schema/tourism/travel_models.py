@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class TravelRequest(BaseModel):
     query: str = Field(..., description="คำถามหรือความต้องการเกี่ยวกับการท่องเที่ยว")
@@ -43,3 +43,15 @@ class TravelPlan(BaseModel):
 
 class TravelResponse(BaseModel):
     travel_plan: TravelPlan
+
+class TravelPlanStreamEvent(BaseModel):
+    """
+    เหตุการณ์ของ /travel-plan/stream แต่ละ type ใช้ field ต่างกัน:
+    overview ใช้ overview, day ใช้ day, plan ใช้ travel_plan (แผนทั้งหมดที่ตรวจสอบแล้ว) และ error ใช้ error
+    """
+    type: Literal["overview", "day", "plan", "error"]
+    overview: Optional[str] = None
+    day: Optional[DailyItinerary] = None
+    travel_plan: Optional[TravelPlan] = None
+    error: Optional[str] = None
+    cached: bool = False
@@ -0,0 +1,302 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+from services.embedding_segment import EmbeddingSegment
+
+
+class IVFIndex:
+    """
+    ดัชนีค้นหาเวกเตอร์แบบประมาณ (IVF: inverted file) สำหรับโมเดลและจำนวนมิติหนึ่งๆ
+
+    แบ่งเวกเตอร์ออกเป็น nlist กลุ่มด้วย spherical k-means แล้วตอนค้นหาจะคำนวณเฉพาะเวกเตอร์
+    ใน nprobe กลุ่มที่ centroid ใกล้คำค้นหาที่สุด ค่า nprobe ยิ่งมาก recall ยิ่งสูงแต่ช้าลง
+    แต่ละกลุ่มเก็บเพียง ID ของเอกสารและหมายเลขแถวใน EmbeddingSegment ส่วนเวกเตอร์อ่านจาก memmap
+    """
+
+    def __init__(self, segment: EmbeddingSegment, centroids: np.ndarray, default_nprobe: Optional[int] = None):
+        """
+        สร้าง IVFIndex จาก centroid ที่ train แล้ว
+
+        Args:
+            segment: ไฟล์ segment ที่เก็บเวกเตอร์
+            centroids: matrix ขนาด (nlist, dimensions) ที่ normalize แล้ว
+            default_nprobe: จำนวนกลุ่มที่ค้นหาเมื่อไม่ระบุ nprobe
+        """
+        self.segment = segment
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nlist, self.dimensions = self.centroids.shape
+        self.default_nprobe = default_nprobe or max(1, self.nlist // 16)
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self._list_rows = [np.empty(0, dtype=np.int64) for _ in range(self.nlist)]
+        self._list_sizes = np.zeros(self.nlist, dtype=np.int64)
+        self._assignments: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self.pending_changes = 0
+
+    def __len__(self) -> int:
+        return len(self._assignments)
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._assignments
+
+    def document_ids(self) -> List[int]:
+        """
+        รายการ ID ของเอกสารทั้งหมดในดัชนี
+        """
+        with self._lock:
+            return list(self._assignments)
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """
+        หา centroid ที่ใกล้ที่สุดของแต่ละเวกเตอร์
+        """
+        return np.argmax(vectors @ centroids.T, axis=1)
+
+    @staticmethod
+    def _chunks(rows: np.ndarray, chunk_size: int = 8192):
+        """
+        แบ่งหมายเลขแถวเป็นช่วง เพื่อจำกัดหน่วยความจำเมื่ออ่านเวกเตอร์จาก segment
+        """
+        for start in range(0, rows.shape[0], chunk_size):
+            yield rows[start:start + chunk_size]
+
+    @classmethod
+    def train(
+        cls,
+        segment: EmbeddingSegment,
+        rows: np.ndarray,
+        nlist: Optional[int] = None,
+        iterations: int = 10,
+        sample_size: Optional[int] = None,
+        seed: int = 0
+    ) -> "IVFIndex":
+        """
+        หา centroid ด้วย spherical k-means จากตัวอย่างของแถวใน segment
+
+        Args:
+            segment: ไฟล์ segment ที่เก็บเวกเตอร์
+            rows: หมายเลขแถวของเวกเตอร์ที่ใช้ train
+            nlist: จำนวนกลุ่ม ถ้าไม่ระบุจะใช้ประมาณ 4 * sqrt(จำนวนเวกเตอร์)
+            iterations: จำนวนรอบของ k-means
+            sample_size: จำนวนเวกเตอร์ที่สุ่มมาใช้ train ถ้าไม่ระบุจะใช้ 64 เท่าของ nlist
+            seed: seed ของตัวสุ่ม
+
+        Returns:
+            IVFIndex: ดัชนีที่มี centroid แล้วแต่ยังไม่มีเวกเตอร์
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.shape[0] == 0:
+            raise ValueError("Cannot train an IVF index without vectors")
+
+        if nlist is None:
+            nlist = int(4 * np.sqrt(rows.shape[0]))
+        nlist = max(1, min(nlist, rows.shape[0]))
+        sample_size = min(rows.shape[0], sample_size or nlist * 64)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(rows, sample_size, replace=False))
+        sample = np.asarray(segment.matrix()[sample_rows])
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = np.concatenate([
+                cls._nearest(sample[start:start + 8192], centroids)
+                for start in range(0, sample_size, 8192)
+            ])
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=nlist)
+
+            # กลุ่มที่ว่างจะสุ่ม centroid ใหม่จากตัวอย่าง
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = EmbeddingSegment.normalize(sums)
+
+        return cls(segment, centroids)
+
+    def add_batch(self, document_ids: Sequence[int], rows: Sequence[int]) -> None:
+        """
+        เพิ่มเอกสารหลายรายการเข้ากลุ่มที่ centroid ใกล้ที่สุด
+
+        Args:
+            document_ids: รายการ ID ของเอกสาร
+            rows: หมายเลขแถวใน segment ของแต่ละเอกสาร
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.shape[0] == 0:
+            return
+
+        matrix = self.segment.matrix()
+        assignments = np.concatenate([
+            self._nearest(matrix[chunk], self.centroids) for chunk in self._chunks(rows)
+        ])
+
+        with self._lock:
+            for document_id in document_ids:
+                self._remove_locked(int(document_id))
+
+            # จัดกลุ่มด้วยการเรียงลำดับครั้งเดียว แทนการเปรียบเทียบทีละกลุ่ม
+            order = np.argsort(assignments, kind="stable")
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+            for list_no in np.nonzero(bounds[1:] > bounds[:-1])[0]:
+                members = order[bounds[list_no]:bounds[list_no + 1]]
+                self._append_locked(int(list_no), document_ids[members], rows[members])
+            self.pending_changes += rows.shape[0]
+
+    def add(self, document_id: int, row: int) -> None:
+        """
+        เพิ่มหรือแทนที่เอกสารในดัชนี
+
+        Args:
+            document_id: ID ของเอกสาร
+            row: หมายเลขแถวใน segment
+        """
+        self.add_batch([document_id], [row])
+
+    def _append_locked(self, list_no: int, document_ids: np.ndarray, rows: np.ndarray) -> None:
+        size = int(self._list_sizes[list_no])
+        needed = size + len(document_ids)
+        if needed > self._list_ids[list_no].shape[0]:
+            capacity = max(needed, self._list_ids[list_no].shape[0] * 2, 16)
+            for lists in (self._list_ids, self._list_rows):
+                grown = np.empty(capacity, dtype=np.int64)
+                grown[:size] = lists[list_no][:size]
+                lists[list_no] = grown
+
+        self._list_ids[list_no][size:needed] = document_ids
+        self._list_rows[list_no][size:needed] = rows
+        for offset, document_id in enumerate(document_ids):
+            self._assignments[int(document_id)] = (list_no, size + offset)
+        self._list_sizes[list_no] = needed
+
+    def remove(self, document_id: int) -> bool:
+        """
+        ลบเอกสารออกจากกลุ่ม
+
+        Args:
+            document_id: ID ของเอกสาร
+
+        Returns:
+            bool: True ถ้าลบสำเร็จ, False ถ้าไม่พบเอกสารในดัชนี
+        """
+        with self._lock:
+            removed = self._remove_locked(document_id)
+            if removed:
+                self.pending_changes += 1
+            return removed
+
+    def _remove_locked(self, document_id: int) -> bool:
+        location = self._assignments.pop(document_id, None)
+        if location is None:
+            return False
+
+        list_no, position = location
+        last = int(self._list_sizes[list_no]) - 1
+        if position != last:
+            moved_id = int(self._list_ids[list_no][last])
+            self._list_ids[list_no][position] = moved_id
+            self._list_rows[list_no][position] = self._list_rows[list_no][last]
+            self._assignments[moved_id] = (list_no, position)
+        self._list_sizes[list_no] = last
+        return True
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        ค้นหาเอกสารที่มี cosine similarity สูงสุดโดยประมาณ
+
+        Args:
+            query_embedding: embedding vector ของคำค้นหา
+            top_k: จำนวนผลลัพธ์ที่ต้องการ
+            nprobe: จำนวนกลุ่มที่ค้นหา
+
+        Returns:
+            List[Tuple[int, float]]: รายการ (document_id, similarity) เรียงจากมากไปน้อย
+        """
+        query = EmbeddingSegment.normalize(query_embedding)
+        nprobe = min(max(1, nprobe or self.default_nprobe), self.nlist)
+
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+
+        with self._lock:
+            ids = [self._list_ids[i][:self._list_sizes[i]] for i in probes]
+            rows = [self._list_rows[i][:self._list_sizes[i]] for i in probes]
+            ids, rows = np.concatenate(ids), np.concatenate(rows)
+        if rows.shape[0] == 0 or top_k <= 0:
+            return []
+
+        # อ่านเฉพาะแถวของกลุ่มที่เลือกจาก memmap เรียงตามตำแหน่งในไฟล์เพื่อให้อ่านต่อเนื่อง
+        order = np.argsort(rows, kind="stable")
+        ids, rows = ids[order], rows[order]
+        scores = self.segment.matrix()[rows] @ query
+
+        k = min(top_k, scores.shape[0])
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def save(self, path: str) -> None:
+        """
+        บันทึก centroid และ ID กับหมายเลขแถวของแต่ละกลุ่มลงไฟล์
+
+        Args:
+            path: พาธของไฟล์ .npz
+        """
+        with self._lock:
+            ids = np.concatenate([self._list_ids[i][:self._list_sizes[i]] for i in range(self.nlist)])
+            rows = np.concatenate([self._list_rows[i][:self._list_sizes[i]] for i in range(self.nlist)])
+            offsets = np.concatenate([[0], np.cumsum(self._list_sizes)])
+            self.pending_changes = 0
+
+        # เขียนไฟล์ชั่วคราวที่ชื่อไม่ซ้ำก่อนแล้วค่อยแทนที่ เพื่อไม่ให้ไฟล์เสียถ้าถูกขัดจังหวะ
+        # หรือถ้าหลาย thread หรือหลาย worker บันทึกพร้อมกัน (ไฟล์ที่แทนที่ทีหลังเป็นฉบับสมบูรณ์เสมอ)
+        directory, name = os.path.split(path)
+        with tempfile.NamedTemporaryFile(dir=directory or ".", prefix=f"{name}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            try:
+                np.savez(f, centroids=self.centroids, ids=ids, rows=rows, offsets=offsets,
+                         default_nprobe=np.int64(self.default_nprobe))
+            except BaseException:
+                f.close()
+                os.unlink(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, segment: EmbeddingSegment, path: str) -> "IVFIndex":
+        """
+        โหลดดัชนีที่บันทึกไว้
+
+        Args:
+            segment: ไฟล์ segment ที่เก็บเวกเตอร์
+            path: พาธของไฟล์ .npz
+
+        Returns:
+            IVFIndex: ดัชนีที่โหลดแล้ว
+        """
+        with np.load(path) as data:
+            index = cls(segment, data["centroids"], default_nprobe=int(data["default_nprobe"]))
+            ids, rows, offsets = data["ids"], data["rows"], data["offsets"]
+            with index._lock:
+                for list_no in range(index.nlist):
+                    start, end = offsets[list_no], offsets[list_no + 1]
+                    if end > start:
+                        index._append_locked(list_no, ids[start:end], rows[start:end])
+        return index
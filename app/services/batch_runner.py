@@ -0,0 +1,305 @@
+"""
+รันไฟล์คำขอ JSONL จำนวนมาก (chat และ embeddings) ผ่าน OpenAIService แบบต่อจากจุดที่ค้างได้
+
+แต่ละบรรทัดของไฟล์ input ใช้รูปแบบเดียวกับ Batch API ของ OpenAI:
+    {"custom_id": "req-1", "method": "POST", "url": "/v1/chat/completions", "body": {"model": "...", "messages": [...]}}
+    {"custom_id": "req-2", "method": "POST", "url": "/v1/embeddings", "body": {"model": "...", "input": "..."}}
+body ถูกตรวจสอบด้วย ChatRequest / EmbeddingsRequest ของแอป
+
+ผลลัพธ์ถูกเขียนต่อท้ายไฟล์ output ทีละบรรทัดตามลำดับที่เสร็จ (ไม่ใช่ลำดับของ input ใช้ custom_id จับคู่):
+    {"id": "batch_req_0", "custom_id": "req-1", "response": {"status_code": 200, "body": {...}}, "error": null}
+
+วิธีใช้ (จากโฟลเดอร์ app):
+    python -m services.batch_runner requests.jsonl results.jsonl --concurrency 32
+ถ้างานถูกหยุดกลางคัน รันคำสั่งเดิมอีกครั้งเพื่อทำต่อจาก checkpoint (ค่าเริ่มต้นคือ <output>.checkpoint)
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Optional, Set
+import openai
+from pydantic import ValidationError
+from schema.openai.chat_models import ChatRequest
+from schema.openai.embeddings_models import EmbeddingsRequest
+from services.opeai_service import OpenAIService, create_upstream_pool
+from services.sse_writer import dumps
+from services.upstream_scheduler import PRIORITY_BULK, UpstreamOverloaded, request_priority
+
+
+class BatchRunner:
+    """
+    อ่านไฟล์ input ทีละบรรทัด ส่งคำขอพร้อมกันไม่เกิน concurrency และเขียนผลลัพธ์ลงไฟล์ output ทันทีที่เสร็จ
+
+    หน่วยความจำคงที่ไม่ขึ้นกับขนาดไฟล์: คำขอที่ยังไม่เสร็จและบรรทัดที่เสร็จก่อนบรรทัดที่ค้างอยู่ถูกจำกัดไว้ไม่เกิน window บรรทัด
+    (ถ้าบรรทัดหนึ่งช้ามาก จะหยุดอ่านบรรทัดใหม่จนกว่าบรรทัดนั้นเสร็จ)
+
+    checkpoint เก็บตำแหน่งในไฟล์ input ของบรรทัดแรกที่ยังไม่เสร็จ บรรทัดหลังจากนั้นที่เสร็จแล้ว และขนาดของไฟล์ output
+    ณ เวลาเดียวกัน เมื่อทำต่อ ไฟล์ output ถูกตัดกลับเป็นขนาดนั้น งานที่ต้องทำซ้ำจึงมีเฉพาะผลลัพธ์ที่เสร็จหลัง
+    checkpoint ครั้งล่าสุด (ไม่เกิน checkpoint_seconds) และไม่มีผลลัพธ์ซ้ำในไฟล์ output
+    การหยุดด้วย Ctrl+C หรือการยกเลิก task จะบันทึก checkpoint ก่อนจบจึงไม่ต้องทำซ้ำเลย
+
+    คำขอเรียกผ่าน OpenAIService ตามปกติ (แคช การรวมเป็นชุด upstream_scheduler และ upstream_pool) ด้วยลำดับความสำคัญ
+    PRIORITY_BULK คำขอที่ถูกปฏิเสธเพราะคิวของ upstream เต็มจะรอตาม Retry-After แล้วลองใหม่แทนการบันทึกเป็นข้อผิดพลาด
+    """
+
+    def __init__(
+        self,
+        service: OpenAIService,
+        input_path: str,
+        output_path: str,
+        checkpoint_path: Optional[str] = None,
+        concurrency: int = 16,
+        window: Optional[int] = None,
+        checkpoint_seconds: float = 1.0
+    ):
+        """
+        สร้าง BatchRunner
+
+        Args:
+            service: บริการ OpenAI ที่ใช้เรียก API
+            input_path: ไฟล์คำขอ JSONL
+            output_path: ไฟล์ผลลัพธ์ JSONL (เขียนต่อท้าย)
+            checkpoint_path: ไฟล์ checkpoint (ค่าเริ่มต้นคือ output_path + ".checkpoint")
+            concurrency: จำนวนคำขอที่ทำพร้อมกันสูงสุด
+            window: ระยะห่างสูงสุดระหว่างบรรทัดที่ค้างอยู่กับบรรทัดที่อ่านล่าสุด (ค่าเริ่มต้นคือ concurrency x 8)
+            checkpoint_seconds: ช่วงเวลาระหว่างการบันทึก checkpoint (วินาที)
+        """
+        self.service = service
+        self.input_path = input_path
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path or output_path + ".checkpoint"
+        self.concurrency = concurrency
+        self.window = window or concurrency * 8
+        self.checkpoint_seconds = checkpoint_seconds
+
+        # บรรทัดแรกที่ยังไม่เสร็จ และตำแหน่ง byte ของบรรทัดที่อ่านแล้วแต่ยังไม่พ้น watermark
+        self._watermark = 0
+        self._starts: Dict[int, int] = {}
+        self._done: Set[int] = set()
+        self._read_offset = 0
+        self._output = None
+        self._last_checkpoint = 0.0
+
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.resumed_from = 0
+        self._previous = 0
+
+    def _input_identity(self) -> Dict[str, int]:
+        stat = os.stat(self.input_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _load_checkpoint(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        if checkpoint["input"] != self._input_identity():
+            raise ValueError(f"{self.input_path} changed since checkpoint {self.checkpoint_path} was written")
+        return checkpoint
+
+    def _save_checkpoint(self, completed: bool = False) -> None:
+        """
+        บันทึก checkpoint พร้อมขนาดของไฟล์ output ที่ flush แล้ว (เขียนไฟล์ใหม่แล้ว replace เพื่อไม่ให้ได้ไฟล์ที่เขียนไม่ครบ)
+        """
+        self._output.flush()
+        checkpoint = {
+            "input": self._input_identity(),
+            "next_line": self._watermark,
+            "offset": self._starts.get(self._watermark, self._read_offset),
+            "done": sorted(self._done),
+            "output_size": self._output.tell(),
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "completed": completed,
+        }
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(temp_path, self.checkpoint_path)
+        self._last_checkpoint = time.monotonic()
+
+    def _complete(self, index: int) -> None:
+        """
+        บันทึกว่าบรรทัด index เสร็จแล้ว และเลื่อน watermark ผ่านบรรทัดที่เสร็จต่อเนื่องกัน
+        """
+        self._done.add(index)
+        while self._watermark in self._done:
+            self._done.discard(self._watermark)
+            self._starts.pop(self._watermark, None)
+            self._watermark += 1
+        if time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+            self._save_checkpoint()
+
+    @staticmethod
+    def _status_code(error: Exception) -> int:
+        if isinstance(error, (ValueError, ValidationError)):
+            return 400
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code
+        return 500
+
+    async def _call(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        url = request.get("url", "")
+        body = request.get("body") or {}
+        if url.endswith("/chat/completions"):
+            chat_request = ChatRequest(**body)
+            if chat_request.stream:
+                raise ValueError("Streaming requests are not supported in batch files")
+            return (await self.service.chat_completion(chat_request)).model_dump()
+        if url.endswith("/embeddings"):
+            return (await self.service.create_embeddings(EmbeddingsRequest(**body))).model_dump()
+        raise ValueError(f"Unsupported url: {url!r}")
+
+    async def _process(self, index: int, line: bytes) -> None:
+        """
+        ทำคำขอของบรรทัด index และเขียนผลลัพธ์หนึ่งบรรทัด
+        """
+        custom_id = None
+        try:
+            request = json.loads(line)
+            custom_id = request.get("custom_id")
+            while True:
+                try:
+                    body = await self._call(request)
+                    break
+                except UpstreamOverloaded as e:
+                    # งาน batch รอได้ จึงรอตามที่ scheduler แนะนำแทนการบันทึกเป็นข้อผิดพลาด
+                    await asyncio.sleep(e.retry_after)
+            record = {"response": {"status_code": 200, "body": body}, "error": None}
+            self.succeeded += 1
+        except Exception as e:
+            record = {"response": None, "error": {"status_code": self._status_code(e), "message": str(e)}}
+            self.failed += 1
+
+        self._output.write(dumps({
+            "id": f"batch_req_{index}",
+            "custom_id": custom_id if custom_id is not None else f"line-{index}",
+            **record
+        }) + b"\n")
+        self._complete(index)
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        รันคำขอทั้งหมดที่ยังไม่เสร็จ
+
+        Returns:
+            Dict[str, Any]: จำนวนคำขอที่สำเร็จและที่ผิดพลาด (รวมงานก่อนหน้าจาก checkpoint) เวลาที่ใช้ และจำนวนคำขอต่อวินาทีของรอบนี้
+        """
+        started = time.perf_counter()
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            self._watermark = self.resumed_from = checkpoint["next_line"]
+            self._read_offset = checkpoint["offset"]
+            self._done = set(checkpoint["done"])
+            self.succeeded = checkpoint["succeeded"]
+            self.failed = checkpoint["failed"]
+        self._previous = self.succeeded + self.failed
+        output_size = checkpoint["output_size"] if checkpoint else 0
+
+        # ตัดผลลัพธ์ที่เขียนหลัง checkpoint ครั้งล่าสุดออก เพราะบรรทัดเหล่านั้นจะถูกทำใหม่
+        mode = "r+b" if os.path.exists(self.output_path) else "w+b"
+        self._output = open(self.output_path, mode)
+        self._output.truncate(output_size)
+        self._output.seek(output_size)
+
+        # task ลูกได้ลำดับความสำคัญเดียวกัน
+        priority = request_priority.set(PRIORITY_BULK)
+        tasks: Set[asyncio.Task] = set()
+        completed = checkpoint is not None and checkpoint["completed"]
+        try:
+            if completed:
+                return self._summary(started)
+
+            with open(self.input_path, "rb") as f:
+                f.seek(self._read_offset)
+                index = self._watermark
+                for line in f:
+                    self._starts[index] = self._read_offset
+                    self._read_offset += len(line)
+                    if index in self._done:
+                        self.skipped += 1
+                    elif not line.strip():
+                        self._complete(index)
+                    else:
+                        while tasks and (len(tasks) >= self.concurrency or index - self._watermark >= self.window):
+                            _, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                        tasks.add(asyncio.create_task(self._process(index, line)))
+                    index += 1
+
+            if tasks:
+                await asyncio.wait(tasks)
+            tasks = set()
+            completed = True
+            return self._summary(started)
+        finally:
+            # คำขอที่ถูกยกเลิกไม่ได้เขียนผลลัพธ์และไม่ถูกนับว่าเสร็จ จึงถูกทำใหม่เมื่อรันต่อ
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self._save_checkpoint(completed)
+            self._output.close()
+            request_priority.reset(priority)
+
+    def _summary(self, started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        processed = self.succeeded + self.failed - self._previous
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "resumed_from_line": self.resumed_from,
+            "elapsed_seconds": elapsed,
+            "requests_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        }
+
+
+async def _run_cli(args: argparse.Namespace) -> Dict[str, Any]:
+    upstream_pool = create_upstream_pool()
+    runner = BatchRunner(
+        OpenAIService(upstream_pool=upstream_pool),
+        args.input,
+        args.output,
+        checkpoint_path=args.checkpoint,
+        concurrency=args.concurrency,
+        checkpoint_seconds=args.checkpoint_seconds
+    )
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.progress_seconds)
+            print(f"{runner.succeeded:,} succeeded, {runner.failed:,} failed", file=sys.stderr)
+
+    reporter = asyncio.create_task(report())
+    try:
+        return await runner.run()
+    finally:
+        reporter.cancel()
+        await upstream_pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="ไฟล์คำขอ JSONL")
+    parser.add_argument("output", help="ไฟล์ผลลัพธ์ JSONL")
+    parser.add_argument("--checkpoint", default=None, help="ไฟล์ checkpoint (ค่าเริ่มต้นคือ <output>.checkpoint)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--checkpoint-seconds", type=float, default=1.0)
+    parser.add_argument("--progress-seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    try:
+        summary = asyncio.run(_run_cli(args))
+    except KeyboardInterrupt:
+        sys.exit("interrupted, run the same command again to resume")
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from schema.openai.chat_models import ChatMessage
+from services.sqlite_service import SQLiteService
+from services.ttl_cache import TTLCache
+
+# ลบ embedding ของคำตอบที่หมดอายุออกจากชั้น semantic ทุกๆ จำนวนการบันทึกนี้
+SEMANTIC_PRUNE_EVERY = 100
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+CHAT_CACHE_METRICS = {
+    "exact_hits": ("counter", "Chat completions answered from the exact-match cache"),
+    "semantic_hits": ("counter", "Chat completions answered from the semantic cache"),
+    "misses": ("counter", "Cacheable chat completions that had to call the upstream API"),
+    "bypassed": ("counter", "Chat completions whose request asked to skip the cache"),
+    "exact_entries": ("gauge", "Answers held in the exact-match cache"),
+}
+
+
+class ChatCompletionCache:
+    """
+    แคชคำตอบของ chat completion สองชั้น
+
+    ชั้น exact ใช้ key จาก (model, temperature, max_tokens, messages ที่ normalize แล้ว) ในหน่วยความจำ
+    ชั้น semantic (ถ้าเปิด) เก็บ embedding ของ prompt ไว้ใน SQLiteService แยกไฟล์ และคืนคำตอบเดิมเมื่อ
+    prompt ใหม่มี cosine similarity กับ prompt ที่เคยตอบไม่น้อยกว่า similarity_threshold
+    โดยเทียบเฉพาะคำตอบที่สร้างด้วย model/temperature/max_tokens เดียวกันและยังไม่หมดอายุ
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 10000,
+        semantic_store: Optional[SQLiteService] = None,
+        similarity_threshold: float = 0.95,
+        embedding_model: str = "text-embedding-3-small"
+    ):
+        """
+        สร้าง ChatCompletionCache
+
+        Args:
+            ttl_seconds: อายุของคำตอบในแคช (วินาที)
+            max_entries: จำนวนคำตอบสูงสุดในชั้น exact
+            semantic_store: ที่เก็บ embedding ของ prompt สำหรับชั้น semantic (None คือปิดชั้น semantic)
+            similarity_threshold: cosine similarity ขั้นต่ำที่ถือว่าเป็น prompt เดียวกัน
+            embedding_model: โมเดลที่ใช้สร้าง embedding ของ prompt
+        """
+        self.ttl_seconds = ttl_seconds
+        self.exact: TTLCache[Dict[str, Any]] = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.semantic_store = semantic_store
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model
+        self._puts_since_prune = 0
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+    @classmethod
+    def make_scope(cls, model: str, temperature: Optional[float], max_tokens: Optional[int]) -> str:
+        """
+        key ของพารามิเตอร์การสร้างคำตอบ คำตอบใช้ร่วมกันได้เฉพาะใน scope เดียวกัน
+        """
+        return hashlib.sha256(json.dumps([model, temperature, max_tokens]).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def prompt_text(cls, messages: List[ChatMessage]) -> str:
+        """
+        ข้อความของบทสนทนาที่ normalize แล้ว ใช้สร้างทั้ง key ของชั้น exact และ embedding ของชั้น semantic
+        """
+        return "\n".join(f"{message.role}: {cls._normalize(message.content)}" for message in messages)
+
+    @classmethod
+    def make_key(cls, model: str, temperature: Optional[float], max_tokens: Optional[int], messages: List[ChatMessage]) -> str:
+        """
+        สร้าง key ของชั้น exact
+        """
+        prompt = cls.prompt_text(messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{cls.make_scope(model, temperature, max_tokens)}:{digest}"
+
+    async def get(
+        self,
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        messages: List[ChatMessage],
+        embed: Callable[[str], Awaitable[List[float]]]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        ค้นหาคำตอบในแคช ชั้น exact ก่อนแล้วจึงชั้น semantic
+
+        Args:
+            model: ชื่อโมเดล
+            temperature: temperature ของคำขอ
+            max_tokens: max_tokens ของคำขอ
+            messages: messages ที่จะส่งไปยัง API (รวม system message แล้ว)
+            embed: ฟังก์ชันสร้าง embedding ของข้อความ ใช้กับชั้น semantic
+
+        Returns:
+            Optional[Dict[str, Any]]: {"content", "usage", "cache_hit"} หรือ None ถ้าไม่พบ
+        """
+        key = self.make_key(model, temperature, max_tokens, messages)
+        entry = self.exact.get(key)
+        if entry is not None:
+            self.exact_hits += 1
+            return {**entry, "cache_hit": "exact"}
+
+        if self.semantic_store is not None:
+            scope = self.make_scope(model, temperature, max_tokens)
+            embedding = await embed(self.prompt_text(messages))
+            results = await self.semantic_store.run(
+                self.semantic_store.search_similar,
+                query_embedding=embedding,
+                model=self.embedding_model,
+                top_k=1,
+                filters=[
+                    {"field": "scope", "op": "eq", "value": scope},
+                    {"field": "expires_at", "op": "gt", "value": time.time()}
+                ]
+            )
+            if results and results[0]["similarity"] >= self.similarity_threshold:
+                metadata = results[0]["metadata"]
+                entry = {"content": metadata["content"], "usage": metadata.get("usage")}
+                # prompt เดียวกันนี้ครั้งถัดไปจะพบในชั้น exact โดยไม่ต้องสร้าง embedding
+                self.exact.set(key, entry, ttl_seconds=max(metadata["expires_at"] - time.time(), 0))
+                self.semantic_hits += 1
+                return {**entry, "cache_hit": "semantic"}
+
+        self.misses += 1
+        return None
+
+    async def put(
+        self,
+        model: str,
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        messages: List[ChatMessage],
+        content: str,
+        usage: Optional[Dict[str, int]],
+        embed: Callable[[str], Awaitable[List[float]]]
+    ) -> None:
+        """
+        บันทึกคำตอบลงแคชทั้งสองชั้น
+
+        Args:
+            model: ชื่อโมเดล
+            temperature: temperature ของคำขอ
+            max_tokens: max_tokens ของคำขอ
+            messages: messages ที่ส่งไปยัง API
+            content: ข้อความคำตอบ
+            usage: ข้อมูลการใช้ token ของคำตอบ
+            embed: ฟังก์ชันสร้าง embedding ของข้อความ ใช้กับชั้น semantic
+        """
+        entry = {"content": content, "usage": usage}
+        self.exact.set(self.make_key(model, temperature, max_tokens, messages), entry)
+
+        if self.semantic_store is None:
+            return
+
+        prompt = self.prompt_text(messages)
+        embedding = await embed(prompt)
+        await self.semantic_store.run(
+            self.semantic_store.add_document,
+            content=prompt,
+            embedding=embedding,
+            model=self.embedding_model,
+            metadata={
+                **entry,
+                "scope": self.make_scope(model, temperature, max_tokens),
+                "expires_at": time.time() + self.ttl_seconds
+            }
+        )
+
+        self._puts_since_prune += 1
+        if self._puts_since_prune >= SEMANTIC_PRUNE_EVERY:
+            self._puts_since_prune = 0
+            await self.semantic_store.run(
+                self.semantic_store.delete_documents,
+                [{"field": "expires_at", "op": "lte", "value": time.time()}]
+            )
+
+    def record_bypass(self) -> None:
+        """
+        บันทึกคำขอที่ขอข้ามแคช
+        """
+        self.bypassed += 1
+
+    async def clear(self) -> int:
+        """
+        ลบคำตอบทั้งหมดในแคช
+
+        Returns:
+            int: จำนวนคำตอบที่ลบจากชั้น semantic
+        """
+        self.exact.clear()
+        if self.semantic_store is None:
+            return 0
+        return await self.semantic_store.run(
+            self.semantic_store.delete_documents,
+            [{"field": "expires_at", "op": "gte", "value": 0}]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติของแคช
+
+        Returns:
+            Dict[str, Any]: จำนวน hit แยกตามชั้น, miss, คำขอที่ข้ามแคช และอัตรา hit
+        """
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "exact_entries": len(self.exact),
+            "semantic_enabled": self.semantic_store is not None,
+            "similarity_threshold": self.similarity_threshold,
+            "ttl_seconds": self.ttl_seconds,
+        }
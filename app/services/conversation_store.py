@@ -0,0 +1,281 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from core import config
+from schema.openai.chat_models import ChatMessage
+from services.metrics import metrics
+from services.sqlite_pool import SQLitePool
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+CONVERSATION_STORE_METRICS = {
+    "memory_conversations": ("gauge", "Conversations held in memory"),
+    "max_memory_conversations": ("gauge", "Configured limit of conversations held in memory"),
+    "created": ("counter", "Conversations created"),
+    "memory_hits": ("counter", "Conversation lookups answered from memory"),
+    "disk_loads": ("counter", "Conversation lookups loaded from SQLite"),
+    "misses": ("counter", "Conversation lookups that found no conversation"),
+    "appended_messages": ("counter", "Messages appended to conversations"),
+}
+
+
+class Conversation:
+    """
+    บทสนทนาหนึ่งรายการ: โมเดลเริ่มต้นและ messages ทั้งหมดตามลำดับ
+    """
+
+    def __init__(self, conversation_id: str, model: str, messages: List[ChatMessage], created_at: float, updated_at: float):
+        self.id = conversation_id
+        self.model = model
+        self.messages = messages
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+
+class ConversationStore:
+    """
+    เก็บประวัติบทสนทนาไว้ฝั่งเซิร์ฟเวอร์ เพื่อให้ client ส่งเฉพาะ message ใหม่ในแต่ละรอบ
+
+    มีสองชั้น: LRU ในหน่วยความจำที่จำกัดจำนวนบทสนทนา และตาราง SQLite ที่คงอยู่ข้ามการรีสตาร์ท
+    message ถูกเก็บทีละแถวตามลำดับ (seq) การเพิ่ม message จึงเขียนเฉพาะแถวใหม่ไม่ว่าบทสนทนาจะยาวเท่าใด
+    งานฐานข้อมูลรันใน thread แยกเพื่อไม่ให้บล็อก event loop
+
+    ชั้นหน่วยความจำเป็นของแต่ละ process ถ้ารันหลาย worker ให้ส่งคำขอของบทสนทนาเดียวกันไปยัง worker เดิม
+    (seq ของแถวใหม่คำนวณในฐานข้อมูลจึงไม่ชนกัน แต่ worker อื่นอาจยังเห็นประวัติเดิมในหน่วยความจำ)
+    """
+
+    def __init__(self, db_path: str = None, max_memory_conversations: int = 1000):
+        """
+        สร้าง ConversationStore
+
+        Args:
+            db_path: พาธไปยังไฟล์ SQLite ถ้าไม่ระบุจะใช้ data/conversations.db
+            max_memory_conversations: จำนวนบทสนทนาสูงสุดใน LRU
+        """
+        if db_path is None:
+            data_dir = Path("data")
+            data_dir.mkdir(exist_ok=True)
+            db_path = data_dir / "conversations.db"
+
+        self.db_path = str(db_path)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_memory_conversations = max_memory_conversations
+        self._memory: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = SQLitePool(self.db_path, size=4)
+        self._create_tables()
+
+        self.created = 0
+        self.memory_hits = 0
+        self.disk_loads = 0
+        self.misses = 0
+        self.appended_messages = 0
+
+    def _create_tables(self) -> None:
+        with self._pool.connection() as conn:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            ''')
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            )
+            ''')
+
+    def _remember(self, conversation: Conversation) -> Conversation:
+        """
+        เก็บบทสนทนาใน LRU และคืนรายการที่อยู่ใน LRU (ถ้ามีอยู่แล้วจะคืนรายการเดิม)
+        """
+        with self._lock:
+            existing = self._memory.get(conversation.id)
+            if existing is not None:
+                self._memory.move_to_end(conversation.id)
+                return existing
+            self._memory[conversation.id] = conversation
+            while len(self._memory) > self.max_memory_conversations:
+                self._memory.popitem(last=False)
+        return conversation
+
+    def _insert_conversation(self, conversation: Conversation) -> None:
+        with self._pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO conversations (id, model, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (conversation.id, conversation.model, conversation.created_at, conversation.updated_at)
+            )
+            self._insert_messages(conn, conversation.id, conversation.messages, conversation.created_at)
+
+    @staticmethod
+    def _insert_messages(conn, conversation_id: str, messages: List[ChatMessage], now: float) -> None:
+        # seq ถัดไปคำนวณจาก primary key ในฐานข้อมูล ไม่ขึ้นกับสำเนาในหน่วยความจำของ worker ใด
+        conn.executemany(
+            '''
+            INSERT INTO conversation_messages (conversation_id, seq, role, content, created_at)
+            VALUES (?, (SELECT COALESCE(MAX(seq), -1) + 1 FROM conversation_messages WHERE conversation_id = ?), ?, ?, ?)
+            ''',
+            [(conversation_id, conversation_id, message.role, message.content, now) for message in messages]
+        )
+
+    def _load(self, conversation_id: str) -> Optional[Conversation]:
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT model, created_at, updated_at FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            messages = [
+                ChatMessage(role=role, content=content)
+                for role, content in conn.execute(
+                    "SELECT role, content FROM conversation_messages WHERE conversation_id = ? ORDER BY seq",
+                    (conversation_id,)
+                )
+            ]
+        return Conversation(conversation_id, row[0], messages, row[1], row[2])
+
+    def _append(self, conversation_id: str, messages: List[ChatMessage], now: float) -> bool:
+        with self._pool.connection() as conn:
+            updated = conn.execute(
+                "UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conversation_id)
+            ).rowcount
+            if updated:
+                self._insert_messages(conn, conversation_id, messages, now)
+        return bool(updated)
+
+    def _delete(self, conversation_id: str) -> bool:
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+            return conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount > 0
+
+    async def create(self, model: str, system_message: Optional[str] = None) -> Conversation:
+        """
+        สร้างบทสนทนาใหม่
+
+        Args:
+            model: โมเดลเริ่มต้นของบทสนทนา
+            system_message: system message ของบทสนทนา (None คือใช้ system message เริ่มต้นของ OpenAIService)
+
+        Returns:
+            Conversation: บทสนทนาที่สร้างแล้ว
+        """
+        now = time.time()
+        messages = [ChatMessage(role="system", content=system_message)] if system_message else []
+        conversation = Conversation(uuid.uuid4().hex, model, messages, now, now)
+        await asyncio.to_thread(self._insert_conversation, conversation)
+        self.created += 1
+        return self._remember(conversation)
+
+    async def get(self, conversation_id: str) -> Optional[Conversation]:
+        """
+        ค้นหาบทสนทนาจาก LRU ก่อน แล้วจึงโหลดจาก SQLite
+
+        Returns:
+            Optional[Conversation]: บทสนทนา หรือ None ถ้าไม่พบ
+        """
+        with self._lock:
+            conversation = self._memory.get(conversation_id)
+            if conversation is not None:
+                self._memory.move_to_end(conversation_id)
+                self.memory_hits += 1
+                return conversation
+
+        conversation = await asyncio.to_thread(self._load, conversation_id)
+        if conversation is None:
+            self.misses += 1
+            return None
+        self.disk_loads += 1
+        return self._remember(conversation)
+
+    async def append(self, conversation_id: str, messages: List[ChatMessage]) -> bool:
+        """
+        เพิ่ม messages ต่อท้ายบทสนทนา
+
+        Returns:
+            bool: True ถ้าเพิ่มสำเร็จ หรือ False ถ้าไม่พบบทสนทนา
+        """
+        now = time.time()
+        if not await asyncio.to_thread(self._append, conversation_id, messages, now):
+            return False
+
+        with self._lock:
+            conversation = self._memory.get(conversation_id)
+            if conversation is not None:
+                conversation.messages.extend(messages)
+                conversation.updated_at = now
+        self.appended_messages += len(messages)
+        return True
+
+    async def delete(self, conversation_id: str) -> bool:
+        """
+        ลบบทสนทนาและ messages ทั้งหมด
+
+        Returns:
+            bool: True ถ้าลบสำเร็จ หรือ False ถ้าไม่พบบทสนทนา
+        """
+        with self._lock:
+            self._memory.pop(conversation_id, None)
+        return await asyncio.to_thread(self._delete, conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติของที่เก็บบทสนทนา
+
+        Returns:
+            Dict[str, Any]: จำนวนบทสนทนาในหน่วยความจำ จำนวนที่พบในหน่วยความจำ โหลดจาก SQLite หรือไม่พบ
+            และจำนวน message ที่เพิ่ม
+        """
+        lookups = self.memory_hits + self.disk_loads + self.misses
+        return {
+            "memory_conversations": len(self._memory),
+            "max_memory_conversations": self.max_memory_conversations,
+            "created": self.created,
+            "memory_hits": self.memory_hits,
+            "disk_loads": self.disk_loads,
+            "misses": self.misses,
+            "memory_hit_rate": self.memory_hits / lookups if lookups else 0.0,
+            "appended_messages": self.appended_messages,
+        }
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+def create_conversation_store() -> ConversationStore:
+    """
+    สร้าง ConversationStore ตาม CONVERSATION_STORE_PATH และ CONVERSATION_MEMORY_ENTRIES
+
+    ควรสร้างครั้งเดียวต่อ worker ใน lifespan ของแอป (สร้างไฟล์ SQLite และ pool) และปิดด้วย close() เมื่อปิดแอป
+    สถิติของที่เก็บที่สร้างล่าสุดถูกส่งออกที่ GET /metrics
+    """
+    store = ConversationStore(
+        db_path=config.CONVERSATION_STORE_PATH,
+        max_memory_conversations=config.CONVERSATION_MEMORY_ENTRIES
+    )
+    if metrics is not None:
+        metrics.register_stats("conversation_store", store.stats, CONVERSATION_STORE_METRICS)
+    return store
+
+
+def get_conversation_store(request: Request) -> ConversationStore:
+    """
+    dependency ของ FastAPI ที่คืน ConversationStore ของ worker ซึ่งสร้างไว้ใน lifespan ของแอป
+
+    ถ้า router ถูกใช้กับแอปที่ไม่มี lifespan (เช่นสคริปต์ทดสอบ) จะสร้างและเก็บไว้ใน app.state ครั้งแรกที่เรียก
+    """
+    store = getattr(request.app.state, "conversation_store", None)
+    if store is None:
+        store = create_conversation_store()
+        request.app.state.conversation_store = store
+    return store
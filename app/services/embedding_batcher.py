@@ -0,0 +1,195 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from openai import BadRequestError
+from schema.openai.embeddings_models import EmbeddingsUsage
+
+# ผลลัพธ์ของผู้เรียกหนึ่งราย: (เวกเตอร์ตามลำดับของ texts, ชื่อโมเดล, การใช้ token ส่วนของผู้เรียก)
+BatchResult = Tuple[List[List[float]], str, EmbeddingsUsage]
+# (model, dimensions, priority)
+BatchKey = Tuple[str, Optional[int], int]
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+EMBEDDING_BATCHER_METRICS = {
+    "requests": ("counter", "Embeddings requests submitted by callers"),
+    "inputs": ("counter", "Input texts submitted by callers"),
+    "upstream_batches": ("counter", "Batched embeddings calls sent upstream"),
+    "split_retries": ("counter", "Batches split and retried after the upstream rejected them"),
+}
+
+
+class _Pending:
+    """
+    ข้อความของผู้เรียกหนึ่งรายที่รอส่งในชุดถัดไป
+    """
+
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str], future: "asyncio.Future[BatchResult]"):
+        self.texts = texts
+        self.future = future
+
+
+class EmbeddingBatcher:
+    """
+    รวมข้อความจากผู้เรียกหลายรายที่เข้ามาพร้อมกันเป็นคำขอ embeddings เดียว
+
+    ข้อความจะถูกเก็บไว้ในคิวแยกตาม (model, dimensions, priority) และส่งเมื่อครบ max_batch_size ข้อความ
+    หรือเมื่อข้อความแรกในคิวรอครบ max_wait_ms แล้วแต่อย่างใดถึงก่อน จากนั้นแยกเวกเตอร์กลับให้
+    ผู้เรียกแต่ละรายตาม index ของผลลัพธ์ การใช้ token ของชุดถูกแบ่งให้ผู้เรียกตามสัดส่วนความยาวข้อความ
+
+    คำขอที่มีลำดับความสำคัญต่างกันไม่ถูกรวมชุดกัน ชุดของงานจำนวนมากจึงไม่ทำให้คำขอของผู้ใช้ต้องรอตามไปด้วย
+    (ชุดถูกส่งใน task ที่สืบทอด context ของผู้เรียกรายแรก ดู services.upstream_scheduler.request_priority)
+
+    ถ้า API ปฏิเสธทั้งชุด (400) จะส่งข้อความของผู้เรียกแต่ละรายแยกกันอีกครั้ง เพื่อไม่ให้ข้อความ
+    ที่ผิดพลาดของผู้เรียกรายหนึ่งทำให้ผู้เรียกรายอื่นในชุดเดียวกันล้มเหลวไปด้วย
+    """
+
+    def __init__(
+        self,
+        create: Callable[..., Awaitable[Any]],
+        max_batch_size: int = 256,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        สร้าง EmbeddingBatcher
+
+        Args:
+            create: ฟังก์ชันเรียก API embeddings (เช่น client.embeddings.create)
+            max_batch_size: จำนวนข้อความสูงสุดต่อคำขอ
+            max_wait_ms: เวลารอสูงสุดของข้อความแรกในคิวก่อนส่ง (มิลลิวินาที)
+        """
+        self._create = create
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queues: Dict[BatchKey, List[_Pending]] = {}
+        self._sizes: Dict[BatchKey, int] = {}
+        self._timers: Dict[BatchKey, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.requests = 0
+        self.inputs = 0
+        self.split_retries = 0
+
+    async def embed(self, model: str, dimensions: Optional[int], texts: List[str], priority: int = 0) -> BatchResult:
+        """
+        สร้าง embeddings ของ texts โดยส่งรวมกับข้อความของผู้เรียกรายอื่นที่เข้ามาพร้อมกัน
+
+        Args:
+            model: ชื่อโมเดล
+            dimensions: จำนวนมิติของ embeddings (None คือค่าเริ่มต้นของโมเดล)
+            texts: ข้อความที่ต้องการแปลง
+            priority: ลำดับความสำคัญของคำขอ
+
+        Returns:
+            BatchResult: เวกเตอร์ตามลำดับของ texts, ชื่อโมเดล และการใช้ token ส่วนของผู้เรียก
+        """
+        self.requests += 1
+        self.inputs += len(texts)
+        key = (model, dimensions, priority)
+        loop = asyncio.get_running_loop()
+        pending = _Pending(texts, loop.create_future())
+
+        # ชุดที่จะล้นถ้ารวมข้อความนี้ถูกส่งออกไปก่อน คำขอที่มีข้อความมากกว่าหนึ่งชุดถูกส่งเป็นชุดของตัวเอง
+        if self._sizes.get(key, 0) + len(texts) > self.max_batch_size:
+            self._flush(key)
+
+        self._queues.setdefault(key, []).append(pending)
+        self._sizes[key] = self._sizes.get(key, 0) + len(texts)
+
+        if self._sizes[key] >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait_ms / 1000, self._flush, key)
+
+        return await pending.future
+
+    def _flush(self, key: BatchKey) -> None:
+        """
+        ส่งข้อความทั้งหมดในคิวของ key เป็นหนึ่งชุด
+        """
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._queues.pop(key, [])
+        self._sizes.pop(key, None)
+        if not batch:
+            return
+
+        task = asyncio.ensure_future(self._send(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: BatchKey, batch: List[_Pending]) -> None:
+        """
+        เรียก API หนึ่งครั้งสำหรับทั้งชุดและแยกผลลัพธ์กลับให้ผู้เรียกแต่ละราย
+        """
+        # ผู้เรียกที่ยกเลิกไปแล้วระหว่างรอไม่ต้องส่ง
+        batch = [pending for pending in batch if not pending.future.done()]
+        if not batch:
+            return
+
+        model, dimensions, _ = key
+        params = {
+            "model": model,
+            "input": [text for pending in batch for text in pending.texts],
+            "encoding_format": "float"
+        }
+        if dimensions:
+            params["dimensions"] = dimensions
+
+        self.batches += 1
+        try:
+            response = await self._create(**params)
+        except BadRequestError as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            self.split_retries += 1
+            await asyncio.gather(*(self._send(key, [pending]) for pending in batch))
+            return
+        except asyncio.CancelledError:
+            for pending in batch:
+                pending.future.cancel()
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+
+        vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+        total_chars = sum(len(text) for text in params["input"]) or 1
+        offset = 0
+        for pending in batch:
+            count = len(pending.texts)
+            share = sum(len(text) for text in pending.texts) / total_chars
+            usage = EmbeddingsUsage(
+                prompt_tokens=round(response.usage.prompt_tokens * share),
+                total_tokens=round(response.usage.total_tokens * share)
+            )
+            if not pending.future.done():
+                pending.future.set_result((vectors[offset:offset + count], response.model, usage))
+            offset += count
+
+    @staticmethod
+    def _fail(batch: List[_Pending], error: Exception) -> None:
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติของการรวมชุด
+
+        Returns:
+            Dict[str, Any]: จำนวนคำขอของผู้เรียก จำนวนคำขอที่ส่งไปยัง API และขนาดชุดเฉลี่ย
+        """
+        return {
+            "requests": self.requests,
+            "inputs": self.inputs,
+            "upstream_batches": self.batches,
+            "split_retries": self.split_retries,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+            "avg_inputs_per_batch": self.inputs / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+        }
@@ -0,0 +1,328 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from services.sqlite_pool import SQLitePool
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+EMBEDDING_CACHE_METRICS = {
+    "memory_hits": ("counter", "Embedding lookups answered from the in-memory LRU"),
+    "disk_hits": ("counter", "Embedding lookups answered from the SQLite tier"),
+    "misses": ("counter", "Embedding lookups that had to call the upstream API"),
+    "memory_entries": ("gauge", "Embeddings held in the in-memory LRU"),
+    "saved_tokens": ("counter", "Input tokens not sent upstream because of cache hits"),
+    "saved_calls": ("counter", "Upstream embeddings calls avoided because of cache hits"),
+    "estimated_saved_seconds": ("gauge", "Saved calls times the average upstream embeddings call time"),
+    "dropped_writes": ("counter", "SQLite tier writes dropped because too many were pending"),
+    "disk_errors": ("counter", "Failed reads and writes of the SQLite tier"),
+}
+
+
+class EmbeddingCache:
+    """
+    แคช embeddings ที่ใช้ key จาก (model, dimensions, hash ของข้อความที่ normalize แล้ว)
+
+    มีสองชั้น: LRU ในหน่วยความจำที่จำกัดจำนวนรายการ และตาราง SQLite ที่คงอยู่ข้ามการรีสตาร์ท
+    เวกเตอร์เก็บเป็น little-endian float32 ทั้งสองชั้น
+
+    การค้นหาใน LRU ทำทันทีใน event loop ส่วนงาน SQLite รันใน executor ของแคชเอง (การอ่านถูกรอผล
+    การเขียนและการลบรายการเก่าไม่ถูกรอ) ไฟล์ฐานข้อมูลถูกสร้างเมื่อใช้ชั้น SQLite ครั้งแรก ไม่ใช่ตอนสร้างออบเจกต์
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        max_memory_entries: int = 10000,
+        max_disk_entries: Optional[int] = 1000000,
+        max_workers: int = 2,
+        max_pending_writes: int = 64
+    ):
+        """
+        สร้าง EmbeddingCache
+
+        Args:
+            db_path: พาธไปยังไฟล์ SQLite ของแคช ถ้าไม่ระบุจะใช้ data/embedding_cache.db
+            max_memory_entries: จำนวนรายการสูงสุดใน LRU
+            max_disk_entries: จำนวนรายการสูงสุดใน SQLite (None คือไม่จำกัด)
+            max_workers: จำนวน thread ของ executor ที่ทำงาน SQLite
+            max_pending_writes: จำนวนชุดการเขียนที่รออยู่สูงสุด ถ้าเกินจะเก็บชุดใหม่ไว้เฉพาะใน LRU
+        """
+        self.db_path = str(db_path or Path("data") / "embedding_cache.db")
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_workers = max_workers
+        self.max_pending_writes = max_pending_writes
+        self._memory: "OrderedDict[str, Tuple[bytes, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts_since_prune = 0
+        self._pending_writes = 0
+
+        # pool และ executor ถูกสร้างเมื่อใช้ครั้งแรก และสร้างใหม่ได้หลัง close()
+        self._pool: Optional[SQLitePool] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._open_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.saved_calls = 0
+        self.dropped_writes = 0
+        self.disk_errors = 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """
+        normalize ข้อความก่อนสร้าง key: Unicode NFC, ตัดช่องว่างหัวท้าย และรวมช่องว่างที่ติดกัน
+        """
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+    @classmethod
+    def make_key(cls, model: str, dimensions: Optional[int], text: str) -> str:
+        """
+        สร้าง key ของแคชจากโมเดล จำนวนมิติ และ hash ของข้อความ
+        """
+        digest = hashlib.sha256(cls.normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or ''}:{digest}"
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """
+        executor ของงาน SQLite (สร้างเมื่อใช้ครั้งแรก)
+        """
+        with self._open_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="embedding-cache")
+            return self._executor
+
+    def _get_pool(self) -> SQLitePool:
+        """
+        pool ของการเชื่อมต่อแบบ WAL สร้างโฟลเดอร์ ไฟล์ และตารางเมื่อใช้ครั้งแรก (เรียกจาก thread ของ executor)
+        """
+        with self._open_lock:
+            if self._pool is None:
+                Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+                pool = SQLitePool(self.db_path, size=self.max_workers)
+                with pool.connection() as conn:
+                    conn.execute('''
+                    CREATE TABLE IF NOT EXISTS embedding_cache (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        embedding BLOB NOT NULL,
+                        tokens INTEGER NOT NULL DEFAULT 0,
+                        created_at REAL NOT NULL
+                    )
+                    ''')
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache (created_at)")
+                self._pool = pool
+            return self._pool
+
+    def _read(self, keys: List[str]) -> List[Tuple[str, bytes, int]]:
+        """
+        อ่านรายการจาก SQLite (รันใน executor)
+        """
+        with self._get_pool().connection() as conn:
+            placeholders = ",".join("?" * len(keys))
+            return conn.execute(
+                f"SELECT key, embedding, tokens FROM embedding_cache WHERE key IN ({placeholders})",
+                keys
+            ).fetchall()
+
+    def _write(self, rows: List[Tuple[str, str, bytes, int, float]]) -> None:
+        """
+        บันทึกรายการลง SQLite และลบรายการเก่าที่เกิน max_disk_entries ทุกๆ 1000 รายการ (รันใน executor)
+        """
+        with self._get_pool().connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO embedding_cache VALUES (?, ?, ?, ?, ?)", rows)
+
+        with self._lock:
+            self._inserts_since_prune += len(rows)
+            prune = bool(self.max_disk_entries) and self._inserts_since_prune >= 1000
+            if prune:
+                self._inserts_since_prune = 0
+        if prune:
+            with self._get_pool().connection() as conn:
+                conn.execute(
+                    """
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+                    )
+                    """,
+                    (self.max_disk_entries,)
+                )
+
+    def _write_done(self, future: Future) -> None:
+        with self._lock:
+            self._pending_writes -= 1
+            if future.exception() is not None:
+                self.disk_errors += 1
+
+    async def get_many(self, model: str, dimensions: Optional[int], texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        ค้นหา embeddings ของหลายข้อความ จาก LRU ก่อน แล้วจึงอ่านเฉพาะที่ไม่พบจาก SQLite ใน executor
+
+        Args:
+            model: ชื่อโมเดล
+            dimensions: จำนวนมิติที่ขอ (None คือค่าเริ่มต้นของโมเดล)
+            texts: รายการข้อความ
+
+        Returns:
+            List[Optional[List[float]]]: embedding ของแต่ละข้อความ หรือ None ถ้าไม่พบในแคช
+        """
+        keys = [self.make_key(model, dimensions, text) for text in texts]
+        found: Dict[str, bytes] = {}
+        missing = []
+
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = entry[0]
+                    self.memory_hits += 1
+                    self.saved_tokens += entry[1]
+                elif key not in found:
+                    missing.append(key)
+
+        if missing:
+            missing = list(dict.fromkeys(missing))
+            try:
+                rows = await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._read, missing)
+            except Exception:
+                # ชั้น SQLite ใช้ไม่ได้ถือเป็น miss คำขอยังไปถึง API ได้ตามปกติ
+                rows = []
+                with self._lock:
+                    self.disk_errors += 1
+
+            with self._lock:
+                for key, value, tokens in rows:
+                    found[key] = value
+                    self._remember(key, value, tokens)
+                    self.disk_hits += 1
+                    self.saved_tokens += tokens
+                self.misses += len(missing) - len(rows)
+
+        return [
+            np.frombuffer(found[key], dtype="<f4").tolist() if key in found else None
+            for key in keys
+        ]
+
+    def put_many(
+        self,
+        model: str,
+        dimensions: Optional[int],
+        texts: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        total_tokens: int = 0
+    ) -> None:
+        """
+        บันทึก embeddings ของหลายข้อความลง LRU ทันที และส่งการเขียนลง SQLite ไปทำใน executor โดยไม่รอ
+
+        Args:
+            model: ชื่อโมเดล
+            dimensions: จำนวนมิติที่ขอ
+            texts: รายการข้อความ
+            embeddings: embedding ของแต่ละข้อความ
+            total_tokens: จำนวน token ที่ใช้ทั้งหมด ใช้เฉลี่ยตามความยาวข้อความเพื่อนับ token ที่ประหยัดได้
+        """
+        if not texts:
+            return
+
+        total_chars = sum(len(text) for text in texts) or 1
+        now = time.time()
+        rows = [
+            (
+                self.make_key(model, dimensions, text),
+                model,
+                np.asarray(embedding, dtype="<f4").tobytes(),
+                round(total_tokens * len(text) / total_chars),
+                now
+            )
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            for key, _, value, tokens, _ in rows:
+                self._remember(key, value, tokens)
+            # ถ้า SQLite เขียนไม่ทัน ไม่ปล่อยให้คิวโตไม่จำกัด รายการยังอยู่ใน LRU
+            if self._pending_writes >= self.max_pending_writes:
+                self.dropped_writes += 1
+                return
+            self._pending_writes += 1
+
+        try:
+            future = self._get_executor().submit(self._write, rows)
+        except RuntimeError:
+            # executor ถูกปิดระหว่างปิดแอป
+            with self._lock:
+                self._pending_writes -= 1
+                self.dropped_writes += 1
+            return
+        future.add_done_callback(self._write_done)
+
+    def close(self) -> None:
+        """
+        รอการเขียนที่ค้างอยู่ให้เสร็จ แล้วปิด executor และการเชื่อมต่อทั้งหมด (ใช้ต่อได้ ระบบจะเปิดใหม่เมื่อใช้ครั้งถัดไป)
+        """
+        with self._open_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._open_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def _remember(self, key: str, value: bytes, tokens: int) -> None:
+        """
+        เพิ่มรายการเข้า LRU และลบรายการที่ใช้ล่าสุดนานที่สุดเมื่อเกินขนาด (ต้องถือ lock อยู่)
+        """
+        self._memory[key] = (value, tokens)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def record_upstream_call(self, seconds: float) -> None:
+        """
+        บันทึกเวลาของการเรียก API จริง เพื่อใช้ประมาณเวลาที่ประหยัดได้
+        """
+        self.upstream_calls += 1
+        self.upstream_seconds += seconds
+
+    def record_saved_call(self) -> None:
+        """
+        บันทึกคำขอที่ตอบได้จากแคชทั้งหมดโดยไม่ต้องเรียก API
+        """
+        self.saved_calls += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        สถิติของแคช
+
+        Returns:
+            Dict[str, float]: จำนวน hit/miss, token ที่ประหยัดได้ และเวลาที่ประหยัดได้โดยประมาณ
+        """
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        average_call = self.upstream_seconds / self.upstream_calls if self.upstream_calls else 0.0
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "saved_tokens": self.saved_tokens,
+            "saved_calls": self.saved_calls,
+            "average_upstream_seconds": average_call,
+            "estimated_saved_seconds": self.saved_calls * average_call,
+            "dropped_writes": self.dropped_writes,
+            "disk_errors": self.disk_errors,
+        }
@@ -0,0 +1,127 @@
+import os
+import threading
+import numpy as np
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows ไม่มี fcntl จึงล็อกได้เฉพาะภายใน process
+    fcntl = None
+
+
+class EmbeddingSegment:
+    """
+    ไฟล์ segment แบบ append-only ที่เก็บเวกเตอร์ที่ normalize แล้วเป็น little-endian float32 เรียงต่อกัน
+    สำหรับโมเดลและจำนวนมิติหนึ่งๆ
+
+    แถวที่ n อยู่ที่ offset n * dimensions * 4 ไบต์ และไม่เคยถูกย้ายหรือเขียนทับภายในไฟล์เดียวกัน การค้นหาอ่านผ่าน
+    np.memmap จาก page cache โดยตรง ทำให้หลาย worker ใช้หน้าหน่วยความจำชุดเดียวกันได้ การ compact จะเขียน
+    เฉพาะแถวที่ยังใช้อยู่ลงไฟล์ใหม่ของ generation ถัดไปแทนการแก้ไฟล์เดิม
+    """
+
+    def __init__(self, path: str, dimensions: int, generation: int = 0):
+        """
+        สร้าง EmbeddingSegment
+
+        Args:
+            path: พาธของไฟล์ segment
+            dimensions: จำนวนมิติของเวกเตอร์
+            generation: ลำดับของไฟล์ที่เพิ่มขึ้นทุกครั้งที่ compact
+        """
+        self.path = str(path)
+        self.dimensions = dimensions
+        self.generation = generation
+        self.row_bytes = dimensions * 4
+        self._lock = threading.Lock()
+        self._map: Optional[np.memmap] = None
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self.path) // self.row_bytes
+        except FileNotFoundError:
+            # ไฟล์ยังไม่ถูกสร้าง (สร้างตอนเพิ่มเวกเตอร์ครั้งแรก) หรือเป็นไฟล์ของ generation เก่าที่ถูกลบหลัง compact
+            # แล้ว การค้นหาที่ค้างอยู่ยังอ่านจาก memmap เดิมได้
+            current = self._map
+            return current.shape[0] if current is not None else 0
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        normalize เวกเตอร์แต่ละแถวให้มีความยาวเป็น 1 (เวกเตอร์ศูนย์จะคงเป็นศูนย์)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def append(self, vectors: np.ndarray) -> int:
+        """
+        เพิ่มเวกเตอร์ต่อท้ายไฟล์ (สร้างไฟล์ถ้ายังไม่มี)
+
+        Args:
+            vectors: matrix ขนาด (จำนวนเวกเตอร์, dimensions)
+
+        Returns:
+            int: หมายเลขแถวของเวกเตอร์แรกที่เพิ่ม
+        """
+        vectors = self.normalize(vectors).reshape(-1, self.dimensions)
+        data = vectors.astype("<f4", copy=False).tobytes()
+
+        with self._lock, open(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                # ตัดแถวที่เขียนไม่ครบ (เช่น process ถูก kill ระหว่างเขียน) ทิ้งก่อน
+                size = os.fstat(f.fileno()).st_size
+                if size % self.row_bytes:
+                    size -= size % self.row_bytes
+                    f.truncate(size)
+                f.seek(size)
+                f.write(data)
+                f.flush()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+        return size // self.row_bytes
+
+    def matrix(self) -> np.ndarray:
+        """
+        map ไฟล์เป็น matrix แบบอ่านอย่างเดียว และ map ใหม่เมื่อไฟล์ยาวขึ้น
+
+        Returns:
+            np.ndarray: matrix ขนาด (จำนวนแถว, dimensions) ที่อ้างอิงไฟล์โดยไม่คัดลอก
+        """
+        rows = len(self)
+        current = self._map
+        if current is not None and current.shape[0] == rows:
+            return current
+        if rows == 0:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+
+        with self._lock:
+            if self._map is None or self._map.shape[0] != rows:
+                self._map = np.memmap(self.path, dtype="<f4", mode="r", shape=(rows, self.dimensions))
+            return self._map
+
+    def compact(self, rows: np.ndarray, path: str, chunk_size: int = 65536) -> "EmbeddingSegment":
+        """
+        คัดลอกแถวที่ระบุตามลำดับลงไฟล์ segment ใหม่ของ generation ถัดไป แถวที่ i ของไฟล์ใหม่คือ rows[i]
+        ของไฟล์นี้ ไฟล์นี้ไม่ถูกแก้ไข ผู้เรียกต้องบันทึกหมายเลขแถวใหม่และลบไฟล์เดิมเอง
+
+        Args:
+            rows: หมายเลขแถวที่ยังใช้อยู่ ควรเรียงจากน้อยไปมากเพื่อให้อ่านไฟล์ต่อเนื่อง
+            path: พาธของไฟล์ใหม่ (ถ้ามีอยู่แล้วจะถูกเขียนทับ)
+            chunk_size: จำนวนแถวที่คัดลอกต่อครั้ง เพื่อจำกัดหน่วยความจำ
+
+        Returns:
+            EmbeddingSegment: segment ของไฟล์ใหม่
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        matrix = self.matrix()
+        with open(path, "wb") as f:
+            for start in range(0, rows.shape[0], chunk_size):
+                f.write(np.asarray(matrix[rows[start:start + chunk_size]], dtype="<f4").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return EmbeddingSegment(path, self.dimensions, self.generation + 1)
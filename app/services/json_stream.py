@@ -0,0 +1,151 @@
+import json
+from typing import List, Optional, Tuple
+
+
+class JsonStreamParser:
+    """
+    parser แบบ incremental สำหรับ JSON object ที่ได้รับมาทีละส่วน (เช่นจาก LLM แบบ stream)
+
+    แจ้งเหตุการณ์ทันทีที่ค่าในระดับบนสุดของ object ครบ และทันทีที่แต่ละสมาชิกของ array
+    ในระดับบนสุดครบ โดยไม่ต้องรอให้เอกสารทั้งหมดจบ แต่ละตัวอักษรถูกสแกนเพียงครั้งเดียว
+
+    เหตุการณ์ที่ feed() คืนกลับ:
+        ("field", key, value)        ค่าของ key ในระดับบนสุดครบแล้ว
+        ("item", key, index, value)  สมาชิกลำดับที่ index ของ array ใน key ระดับบนสุดครบแล้ว
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._expect_value = False
+        self._field_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._item_index = 0
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple]:
+        """
+        เพิ่มข้อความส่วนถัดไปและคืนเหตุการณ์ที่เกิดขึ้นจากข้อความนั้น
+
+        Args:
+            text: ข้อความส่วนถัดไปของเอกสาร JSON
+
+        Returns:
+            List[Tuple]: รายการเหตุการณ์ตามลำดับที่เกิดขึ้น
+
+        Raises:
+            ValueError: ถ้าค่าที่ครบแล้วไม่ใช่ JSON ที่ถูกต้อง
+        """
+        self._buffer += text
+        events: List[Tuple] = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer) and not self.done:
+            pos = self._pos
+            char = buffer[pos]
+            self._pos += 1
+
+            if not self._started:
+                # ข้ามข้อความก่อน { แรก
+                if char == "{":
+                    self._started = True
+                    self._stack.append(char)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._end_string(pos, events)
+                continue
+
+            if char in " \t\r\n":
+                continue
+
+            depth = len(self._stack)
+            if char == ",":
+                self._end_scalar(depth, pos, events)
+                continue
+            if char == ":":
+                if depth == 1:
+                    self._key = self._last_string
+                    self._expect_value = True
+                continue
+            if char in "}]":
+                self._end_scalar(depth, pos, events)
+                self._stack.pop()
+                self._end_container(pos, events)
+                continue
+
+            self._start_value(depth, pos)
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                self._stack.append(char)
+
+        return events
+
+    def _start_value(self, depth: int, pos: int) -> None:
+        """
+        บันทึกตำแหน่งเริ่มต้นของค่าในระดับที่สนใจ
+        """
+        if depth == 1 and self._expect_value:
+            self._field_start = pos
+            self._expect_value = False
+            self._item_index = 0
+        elif depth == 2 and self._stack[1] == "[" and self._item_start is None:
+            self._item_start = pos
+
+    def _end_string(self, pos: int, events: List[Tuple]) -> None:
+        """
+        จัดการเมื่อ string จบ: เป็นได้ทั้ง key ระดับบนสุด ค่าระดับบนสุด หรือสมาชิกของ array
+        """
+        depth = len(self._stack)
+        if depth == 1:
+            if self._field_start == self._string_start:
+                self._emit_field(pos + 1, events)
+            else:
+                self._last_string = json.loads(self._buffer[self._string_start:pos + 1])
+        elif depth == 2 and self._item_start == self._string_start:
+            self._emit_item(pos + 1, events)
+
+    def _end_scalar(self, depth: int, pos: int, events: List[Tuple]) -> None:
+        """
+        ค่าแบบตัวเลข/true/false/null จบเมื่อพบ , หรือวงเล็บปิดในระดับเดียวกัน
+        """
+        if depth == 1 and self._field_start is not None:
+            self._emit_field(pos, events)
+        elif depth == 2 and self._item_start is not None:
+            self._emit_item(pos, events)
+
+    def _end_container(self, pos: int, events: List[Tuple]) -> None:
+        """
+        จัดการเมื่อ object หรือ array ปิด
+        """
+        depth = len(self._stack)
+        if depth == 0:
+            self.done = True
+        elif depth == 1 and self._field_start is not None:
+            self._emit_field(pos + 1, events)
+        elif depth == 2 and self._item_start is not None:
+            self._emit_item(pos + 1, events)
+
+    def _emit_field(self, end: int, events: List[Tuple]) -> None:
+        events.append(("field", self._key, json.loads(self._buffer[self._field_start:end])))
+        self._field_start = None
+
+    def _emit_item(self, end: int, events: List[Tuple]) -> None:
+        events.append(("item", self._key, self._item_index, json.loads(self._buffer[self._item_start:end])))
+        self._item_start = None
+        self._item_index += 1
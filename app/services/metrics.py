@@ -0,0 +1,315 @@
+import bisect
+import functools
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from core import config
+from services.token_budget import MODEL_CONTEXT_WINDOWS
+
+# Content-Type ของ Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ขอบบนของ bucket (วินาที) สำหรับเวลาของคำขอ/upstream ช่วงห่างระหว่าง token และงานฐานข้อมูล
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_GAP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+TOKENS_PER_SECOND_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)
+
+Labels = Tuple[str, ...]
+# key ของ stats() ของ component -> (ชนิด "counter" หรือ "gauge", คำอธิบาย)
+StatsFields = Dict[str, Tuple[str, str]]
+
+# ชื่อโมเดลที่ใช้เป็นค่า label "model" ได้ ชื่อโมเดลมาจากคำขอของ client จึงต้องจำกัดไว้
+# ไม่ให้จำนวน series เพิ่มได้ไม่จำกัด
+KNOWN_MODELS = frozenset([
+    *MODEL_CONTEXT_WINDOWS,
+    "text-embedding-3-small", "text-embedding-3-large", "text-embedding-ada-002",
+    config.CHAT_CACHE_EMBEDDING_MODEL,
+    *([config.CHAT_SUMMARY_MODEL] if config.CHAT_SUMMARY_MODEL else []),
+    *config.METRICS_MODEL_LABELS
+])
+OTHER_MODEL = "other"
+
+
+@functools.lru_cache(maxsize=1024)
+def model_label(model: str) -> str:
+    """
+    ค่า label "model" ของชื่อโมเดล: ชื่อใน KNOWN_MODELS ที่ยาวที่สุดที่เป็น prefix ของชื่อนั้น
+    (เช่น gpt-4o-2024-08-06 เป็น gpt-4o) หรือ "other" ถ้าไม่ตรงกับชื่อใดเลย
+    """
+    matches = [known for known in KNOWN_MODELS if model.startswith(known)]
+    return max(matches, key=len) if matches else OTHER_MODEL
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """
+    ตัวนับที่เพิ่มขึ้นอย่างเดียว แยกตามค่าของ label
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in values]
+
+
+class Histogram:
+    """
+    histogram ที่มี bucket คงที่ แยกตามค่าของ label
+
+    observe() เก็บจำนวนของ bucket เดียวที่ค่าตกอยู่ (ไม่สะสม) จึงมีต้นทุนเท่ากับ bisect หนึ่งครั้ง
+    ค่าสะสมของแต่ละ bucket คำนวณตอน render
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [จำนวนต่อ bucket (รวม +Inf ที่ท้าย), ผลรวม]
+        self._values: Dict[Labels, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+
+        names = self.labelnames + ("le",)
+        lines = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            formatted = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{formatted} {_format_value(total)}")
+            lines.append(f"{self.name}_count{formatted} {cumulative}")
+        return lines
+
+
+class StatsCollector:
+    """
+    ตัววัดที่อ่านจาก stats() ของ component ที่นับสถิติไว้เอง (แคช, scheduler, pool ฯลฯ) ตอน render
+    component จึงไม่ต้องบันทึกลงตัววัดทุกครั้งที่เกิดเหตุการณ์
+
+    แต่ละ key ใน fields กลายเป็นตัววัด {prefix}_{key} (ตัวนับลงท้ายด้วย _total) ค่า None ถูกข้าม
+    และค่า bool เป็น 1 หรือ 0 ถ้ามี labelnames ฟังก์ชัน collect ต้องคืนรายการ (ค่าของ label, stats)
+    """
+
+    def __init__(self, prefix: str, collect: Callable[[], Any], fields: StatsFields, labelnames: Sequence[str] = ()):
+        self.prefix = prefix
+        self.collect = collect
+        self.fields = fields
+        self.labelnames = tuple(labelnames)
+
+    def render(self) -> List[str]:
+        rows = self.collect()
+        if not self.labelnames:
+            rows = [((), rows)]
+
+        lines = []
+        for key, (metric_type, documentation) in self.fields.items():
+            name = f"{self.prefix}_{key}"
+            if metric_type == "counter" and not name.endswith("_total"):
+                name += "_total"
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, stats in rows:
+                value = stats.get(key)
+                if value is not None:
+                    lines.append(f"{name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class ServiceMetrics:
+    """
+    ตัววัดประสิทธิภาพของแอปในรูปแบบ Prometheus (แสดงที่ GET /metrics)
+
+    แยกเวลาที่ใช้ในแอปเองออกจากเวลาของ upstream: เวลาของแต่ละ route, เวลาเรียก OpenAI แยกตามโมเดล,
+    เวลาถึง token แรก (TTFT) และช่วงห่างระหว่าง token ของ stream, เวลาของงานฐานข้อมูล และจำนวน token ที่ใช้
+    การบันทึกแต่ละครั้งเป็นเพียง bisect และการบวกภายใต้ lock จึงแทบไม่เพิ่มเวลาให้คำขอ
+    สถิติที่ component นับไว้เอง (แคช, scheduler, pool ฯลฯ) ส่งออกผ่าน register_stats และอ่านตอน render
+    """
+
+    def __init__(self):
+        self.http_request_duration = Histogram(
+            "http_request_duration_seconds",
+            "Time from request start until the response body is complete",
+            ("method", "route", "status")
+        )
+        self.http_first_byte = Histogram(
+            "http_response_first_byte_seconds",
+            "Time from request start until the first response body bytes are sent",
+            ("method", "route")
+        )
+        self.upstream_duration = Histogram(
+            "upstream_request_duration_seconds",
+            "Duration of OpenAI API calls (whole stream for chat_stream)",
+            ("operation", "model", "outcome")
+        )
+        self.stream_ttft = Histogram(
+            "upstream_stream_time_to_first_token_seconds",
+            "Time from sending a streaming chat request upstream until the first content chunk",
+            ("model",)
+        )
+        self.stream_token_gap = Histogram(
+            "upstream_stream_inter_token_seconds",
+            "Gap between consecutive content chunks of an upstream chat stream",
+            ("model",),
+            TOKEN_GAP_BUCKETS
+        )
+        self.stream_tokens_per_second = Histogram(
+            "upstream_stream_tokens_per_second",
+            "Completion tokens per second after the first token, per completed chat stream",
+            ("model",),
+            TOKENS_PER_SECOND_BUCKETS
+        )
+        self.tokens = Counter(
+            "upstream_tokens_total",
+            "Tokens used by OpenAI API calls (completion tokens of cancelled streams are estimated)",
+            ("operation", "model", "type")
+        )
+        self.db_duration = Histogram(
+            "db_operation_duration_seconds",
+            "Execution time of SQLite service operations in the executor",
+            ("db", "operation"),
+            DB_BUCKETS
+        )
+        self.search_scoring_duration = Histogram(
+            "search_scoring_duration_seconds",
+            "Similarity scoring time of SQLiteService.search_similar, excluding document fetch",
+            ("mode",),
+            DB_BUCKETS
+        )
+        self._metrics = [
+            self.http_request_duration, self.http_first_byte, self.upstream_duration, self.stream_ttft,
+            self.stream_token_gap, self.stream_tokens_per_second, self.tokens, self.db_duration,
+            self.search_scoring_duration
+        ]
+        self._collectors: Dict[str, StatsCollector] = {}
+
+    def record_upstream(self, operation: str, model: str, outcome: str, seconds: float, usage=None) -> None:
+        """
+        บันทึกการเรียก upstream หนึ่งครั้ง และจำนวน token จาก usage ของ OpenAI (ถ้ามี)
+        """
+        model = model_label(model)
+        self.upstream_duration.observe((operation, model, outcome), seconds)
+        if usage is not None:
+            self.record_tokens(operation, model, usage.prompt_tokens, getattr(usage, "completion_tokens", 0))
+
+    def record_tokens(self, operation: str, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        model = model_label(model)
+        if prompt_tokens:
+            self.tokens.inc((operation, model, "prompt"), prompt_tokens)
+        if completion_tokens:
+            self.tokens.inc((operation, model, "completion"), completion_tokens)
+
+    def register_stats(self, prefix: str, collect: Callable[[], Any], fields: StatsFields, labelnames: Sequence[str] = ()) -> None:
+        """
+        ส่งออกค่าจาก stats() ของ component เป็นตัววัด {prefix}_{key} ที่อ่านตอน render
+        การลงทะเบียนซ้ำด้วย prefix เดิมจะแทนที่ของเดิม (เช่น component ที่สร้างใหม่ใน lifespan ของแอป)
+
+        Args:
+            prefix: คำนำหน้าชื่อตัววัด
+            collect: ฟังก์ชันที่คืน stats (dict) หรือรายการ (ค่าของ label, stats) ถ้ามี labelnames
+            fields: key ของ stats ที่ส่งออก -> (ชนิด "counter" หรือ "gauge", คำอธิบาย)
+            labelnames: ชื่อ label ของแต่ละแถวที่ collect คืน
+        """
+        self._collectors[prefix] = StatsCollector(prefix, collect, fields, labelnames)
+
+    def render(self) -> str:
+        """
+        ตัววัดทั้งหมดในรูปแบบ Prometheus text exposition format
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for collector in list(self._collectors.values()):
+            lines.extend(collector.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware ที่บันทึกเวลาของแต่ละคำขอ HTTP แยกตาม method, route template และ status
+
+    ใช้ path ของ route ที่จับคู่ได้ (เช่น /api/v1/openai/conversations/{conversation_id}) แทน URL จริง
+    เพื่อไม่ให้จำนวน label เพิ่มตาม id ส่วนคำขอที่ไม่ตรงกับ route ใดจะใช้ route="unmatched"
+    """
+
+    def __init__(self, app: ASGIApp, metrics: ServiceMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        first_byte = None
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif first_byte is None and message.get("body"):
+                first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            if first_byte is not None:
+                self.metrics.http_first_byte.observe((method, route), first_byte - started)
+            self.metrics.http_request_duration.observe((method, route, str(status)), time.perf_counter() - started)
+
+
+# ปิดได้ด้วย METRICS_ENABLED=false
+metrics = ServiceMetrics() if config.METRICS_ENABLED else None
@@ -1,22 +1,217 @@
 import os
-from openai import AsyncOpenAI
+import re
+import time
+import asyncio
+from fastapi import Request
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout, DEFAULT_CONNECTION_LIMITS
 from dotenv import load_dotenv
+from core import config
 from schema.openai.chat_models import ChatRequest, ChatResponse, ChatMessage, ChatStreamResponse
 from schema.openai.embeddings_models import EmbeddingsRequest, EmbeddingsResponse, EmbeddingData, EmbeddingsUsage
-from typing import List, AsyncGenerator
+from services.embedding_cache import EMBEDDING_CACHE_METRICS, EmbeddingCache
+from services.chat_cache import CHAT_CACHE_METRICS, ChatCompletionCache
+from services.sqlite_service import SQLiteService
+from services.single_flight import SINGLE_FLIGHT_METRICS, SingleFlight
+from services.embedding_batcher import EMBEDDING_BATCHER_METRICS, EmbeddingBatcher
+from services.stream_chunker import make_chunker, rechunk
+from services.stream_usage import STREAM_USAGE_METRICS, StreamUsage
+from services.token_budget import TOKEN_BUDGET_METRICS, TokenBudget
+from services.metrics import metrics, model_label
+from services.upstream_scheduler import UPSTREAM_SCHEDULER_METRICS, UpstreamScheduler, estimate_tokens, request_priority
+from services.upstream_pool import (
+    UPSTREAM_HEDGE_DELAY_METRICS, UPSTREAM_LATENCY_METRICS, UPSTREAM_POOL_METRICS, UPSTREAM_TARGET_METRICS,
+    UpstreamPool, UpstreamTarget
+)
+from typing import List, AsyncGenerator, AsyncIterator, Awaitable, Callable, Optional, Dict, Any, Hashable, TypeVar
 
 # โหลดตัวแปรจากไฟล์ .env
 load_dotenv()
 
+# แคช embeddings ที่ใช้ร่วมกันทั้ง process (ปิดได้ด้วย EMBEDDING_CACHE_ENABLED=false)
+# ไฟล์ SQLite ถูกสร้างเมื่อใช้ครั้งแรก การ import โมดูลนี้จึงไม่เขียนไฟล์ใดๆ และต้อง close() ใน lifespan ของแอป
+embedding_cache = EmbeddingCache(
+    db_path=os.getenv("EMBEDDING_CACHE_PATH"),
+    max_memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000")),
+    max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_ENTRIES", "1000000"))
+) if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false" else None
+if metrics is not None and embedding_cache is not None:
+    metrics.register_stats("embedding_cache", embedding_cache.stats, EMBEDDING_CACHE_METRICS)
+
+# แคชคำตอบของ chat completion (เปิดด้วย CHAT_CACHE_ENABLED=true) ชั้น semantic ใช้ที่เก็บ embeddings แยกไฟล์
+chat_cache = ChatCompletionCache(
+    ttl_seconds=config.CHAT_CACHE_TTL,
+    max_entries=config.CHAT_CACHE_MAX_ENTRIES,
+    semantic_store=SQLiteService(
+        db_path=config.CHAT_CACHE_PATH or "data/chat_cache.db",
+        migrate_in_background=False,
+        max_workers=2,
+        lexical_index=False,
+        # ทุกการค้นหากรองด้วย scope และ expires_at และการล้างรายการหมดอายุกรองด้วย expires_at
+        metadata_index_fields=("scope", "expires_at")
+    ) if config.CHAT_CACHE_SEMANTIC else None,
+    similarity_threshold=config.CHAT_CACHE_SIMILARITY_THRESHOLD,
+    embedding_model=config.CHAT_CACHE_EMBEDDING_MODEL
+) if config.CHAT_CACHE_ENABLED else None
+if metrics is not None and chat_cache is not None:
+    metrics.register_stats("chat_cache", chat_cache.stats, CHAT_CACHE_METRICS)
+
+# รวมคำขอที่เหมือนกันซึ่งกำลังรอ upstream อยู่ให้เรียก API ครั้งเดียว (ปิดได้ด้วย COALESCE_REQUESTS=false)
+inflight = SingleFlight() if config.COALESCE_REQUESTS else None
+if metrics is not None and inflight is not None:
+    metrics.register_stats("inflight", inflight.stats, SINGLE_FLIGHT_METRICS)
+
+# ตัดประวัติบทสนทนาให้ prompt ไม่เกินงบ token ของโมเดล (ปิดได้ด้วย CHAT_TOKEN_BUDGET_ENABLED=false)
+# ผู้สรุปของกลยุทธ์ summarize ผูกกับ client ของแต่ละ OpenAIService ดู OpenAIService._summarize_messages
+token_budget = TokenBudget(
+    counter=config.CHAT_TOKEN_COUNTER,
+    prompt_budget=config.CHAT_PROMPT_TOKEN_BUDGET,
+    keep_recent=config.CHAT_KEEP_RECENT_MESSAGES,
+    summary_max_tokens=config.CHAT_SUMMARY_MAX_TOKENS
+) if config.CHAT_TOKEN_BUDGET_ENABLED else None
+if metrics is not None and token_budget is not None:
+    metrics.register_stats("chat_token_budget", token_budget.stats, TOKEN_BUDGET_METRICS)
+
+# ควบคุมอัตราการเรียก OpenAI API ตามงบ RPM/TPM พร้อมคิวตามลำดับความสำคัญและการลองใหม่
+# (ปิดได้ด้วย UPSTREAM_SCHEDULER_ENABLED=false) ใช้ร่วมกันทุก OpenAIService ของ process เพราะงบผูกกับ API key
+upstream_scheduler = UpstreamScheduler(
+    requests_per_minute=config.OPENAI_REQUESTS_PER_MINUTE,
+    tokens_per_minute=config.OPENAI_TOKENS_PER_MINUTE,
+    max_queue_size=config.UPSTREAM_MAX_QUEUE_SIZE,
+    max_wait_seconds=config.UPSTREAM_MAX_WAIT_SECONDS,
+    max_retries=config.OPENAI_MAX_RETRIES,
+    backoff_base=config.UPSTREAM_RETRY_BASE_SECONDS,
+    backoff_max=config.UPSTREAM_RETRY_MAX_SECONDS
+) if config.UPSTREAM_SCHEDULER_ENABLED else None
+if metrics is not None and upstream_scheduler is not None:
+    metrics.register_stats("upstream_scheduler", upstream_scheduler.stats, UPSTREAM_SCHEDULER_METRICS)
+
+# สถิติของ chat stream ที่เรียก upstream รวมถึง stream ที่ถูกยกเลิกเพราะ client ตัดการเชื่อมต่อ
+stream_usage = StreamUsage()
+if metrics is not None:
+    metrics.register_stats("chat_stream", stream_usage.stats, STREAM_USAGE_METRICS)
+
+T = TypeVar("T")
+
+def ensure_upstream_capacity() -> None:
+    """
+    ปฏิเสธคำขอแบบ stream ด้วย UpstreamOverloaded ก่อนส่ง header ของคำตอบ ถ้าคิวของ upstream_scheduler เต็ม
+    หรือเวลารอโดยประมาณเกิน UPSTREAM_MAX_WAIT_SECONDS (หลังส่ง header แล้วจะตอบ 503 ไม่ได้)
+    """
+    if upstream_scheduler is not None:
+        upstream_scheduler.ensure_capacity()
+
+def create_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    สร้าง AsyncOpenAI ที่มี connection pool ตามการตั้งค่าใน core.config
+    
+    ควรสร้างเพียงครั้งเดียวต่อ worker (ใน lifespan ของแอป) เพื่อใช้การเชื่อมต่อ keep-alive
+    และ TLS session ซ้ำข้ามคำขอ และต้องปิดด้วย await client.close() เมื่อปิดแอป
+    
+    Args:
+        api_key: API key (ถ้าไม่ระบุใช้ OPENAI_API_KEY)
+        base_url: URL ของ API (ถ้าไม่ระบุใช้ OPENAI_BASE_URL)
+    
+    Returns:
+        AsyncOpenAI: client ของ OpenAI
+    """
+    api_key = api_key or config.OPENAI_API_KEY
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment variables")
+    
+    # ใช้คลาส Limits เดียวกับที่ openai ใช้ภายใน เพื่อให้ตรงกับไลบรารี HTTP ของเวอร์ชันที่ติดตั้ง
+    limits = type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=config.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=config.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.OPENAI_KEEPALIVE_EXPIRY
+    )
+    
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url or config.OPENAI_BASE_URL,
+        # เมื่อเปิด upstream_scheduler การลองใหม่ทำใน scheduler ซึ่งใช้งบ RPM/TPM ใหม่ทุกครั้ง
+        max_retries=0 if upstream_scheduler is not None else config.OPENAI_MAX_RETRIES,
+        timeout=Timeout(
+            connect=config.OPENAI_CONNECT_TIMEOUT,
+            read=config.OPENAI_READ_TIMEOUT,
+            write=config.OPENAI_WRITE_TIMEOUT,
+            pool=config.OPENAI_POOL_TIMEOUT
+        ),
+        http_client=DefaultAsyncHttpxClient(limits=limits, http2=config.OPENAI_HTTP2)
+    )
+
+def create_upstream_pool() -> UpstreamPool:
+    """
+    สร้าง UpstreamPool จาก OPENAI_UPSTREAMS (ถ้าไม่ได้ตั้งไว้จะมีปลายทางเดียวจาก OPENAI_API_KEY และ OPENAI_BASE_URL)
+    
+    แต่ละปลายทางมี AsyncOpenAI ของตัวเอง จึงควรสร้างครั้งเดียวต่อ worker และปิดด้วย await pool.close() เช่นเดียวกับ client
+    
+    Returns:
+        UpstreamPool: กลุ่มปลายทางของ OpenAI API
+    """
+    upstreams = config.OPENAI_UPSTREAMS or [{"name": "default"}]
+    targets = [
+        UpstreamTarget(
+            upstream.get("name") or f"upstream-{i}",
+            create_openai_client(upstream.get("api_key"), upstream.get("base_url"))
+        )
+        for i, upstream in enumerate(upstreams)
+    ]
+    return UpstreamPool(
+        targets,
+        hedge=config.OPENAI_HEDGE_ENABLED,
+        hedge_percentile=config.OPENAI_HEDGE_PERCENTILE,
+        hedge_min_delay=config.OPENAI_HEDGE_MIN_DELAY_MS / 1000,
+        hedge_min_samples=config.OPENAI_HEDGE_MIN_SAMPLES,
+        hedge_budget_ratio=config.OPENAI_HEDGE_BUDGET_RATIO,
+        failure_threshold=config.UPSTREAM_FAILURE_THRESHOLD,
+        cooldown_seconds=config.UPSTREAM_COOLDOWN_SECONDS
+    )
+
 class OpenAIService:
-    def __init__(self):
-        self.api_key = os.getenv("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("OPENAI_API_KEY not found in environment variables")
-        self.client = AsyncOpenAI(api_key=self.api_key)
+    def __init__(self, client: Optional[AsyncOpenAI] = None, upstream_pool: Optional[UpstreamPool] = None):
+        """
+        สร้าง OpenAIService
+        
+        Args:
+            client: AsyncOpenAI ที่ใช้ร่วมกัน (ใช้เป็นปลายทางเดียว)
+            upstream_pool: กลุ่มปลายทางที่ใช้ร่วมกัน ถ้าไม่ระบุทั้งสองอย่างจะสร้างใหม่ด้วย create_upstream_pool()
+                (ใช้กับสคริปต์ที่ไม่ได้รันผ่านแอป)
+        """
+        if upstream_pool is None:
+            upstream_pool = UpstreamPool([UpstreamTarget("default", client)]) if client else create_upstream_pool()
+        self.upstream_pool = upstream_pool
+        self.client = upstream_pool.client
+        if metrics is not None:
+            metrics.register_stats("upstream_pool", upstream_pool.stats, UPSTREAM_POOL_METRICS)
+            metrics.register_stats("upstream_target", upstream_pool.target_stats, UPSTREAM_TARGET_METRICS, ("target",))
+            metrics.register_stats(
+                "upstream_target_latency", upstream_pool.latency_stats, UPSTREAM_LATENCY_METRICS, ("target", "operation")
+            )
+            metrics.register_stats(
+                "upstream_hedge_delay", upstream_pool.hedge_delay_stats, UPSTREAM_HEDGE_DELAY_METRICS, ("operation",)
+            )
+        self.embedding_cache = embedding_cache
+        self.chat_cache = chat_cache
+        self.inflight = inflight
+        self.stream_usage = stream_usage
+        self.token_budget = token_budget
+        self.upstream_scheduler = upstream_scheduler
+        if token_budget is not None and config.CHAT_CONTEXT_STRATEGY == "summarize" and token_budget.summarizer is None:
+            token_budget.summarizer = self._summarize_messages
+        # รวมข้อความจากคำขอ embeddings ที่เข้ามาพร้อมกันเป็นคำขอเดียว (ปิดได้ด้วย EMBEDDING_BATCH_ENABLED=false)
+        self.embedding_batcher = EmbeddingBatcher(
+            self._create_embeddings,
+            max_batch_size=config.EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=config.EMBEDDING_BATCH_MAX_WAIT_MS
+        ) if config.EMBEDDING_BATCH_ENABLED else None
+        if metrics is not None and self.embedding_batcher is not None:
+            metrics.register_stats("embedding_batcher", self.embedding_batcher.stats, EMBEDDING_BATCHER_METRICS)
+        self._background_tasks = set()
     
-    async def chat_completion(self, request: ChatRequest) -> ChatResponse:
-        # เพิ่ม system message เริ่มต้นหากต้องการ
+    def _prepare_messages(self, request: ChatRequest) -> List[ChatMessage]:
+        """
+        คัดลอก messages ของคำขอ และเพิ่ม system message เริ่มต้นหากต้องการ
+        """
         messages = list(request.messages)
         
         # ตรวจสอบว่ามี system message อยู่แล้วหรือไม่
@@ -29,28 +224,239 @@ class OpenAIService:
                 content="คุณเป็นผู้ช่วยที่เป็นประโยชน์และตอบคำถามเป็นภาษาไทยเสมอ ให้คำตอบที่ครบถ้วนและมีประโยชน์"
             ))
         
-        response = await self.client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": msg.role, "content": msg.content} for msg in messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=False  # ไม่ใช้ stream ในฟังก์ชันนี้
+        return messages
+    
+    async def _fit_token_budget(self, request: ChatRequest, messages: List[ChatMessage]) -> List[ChatMessage]:
+        """
+        ตัดประวัติบทสนทนาที่เก่าที่สุดออกถ้า prompt เกินงบ token ของโมเดล
+        """
+        if self.token_budget is None:
+            return messages
+        return await self.token_budget.fit(request.model, request.max_tokens, messages)
+    
+    @staticmethod
+    def _record_upstream(operation: str, model: str, outcome: str, started: float, usage: Any = None) -> None:
+        """
+        บันทึกเวลาและจำนวน token ของการเรียก upstream ลงตัววัด (ถ้าเปิด METRICS_ENABLED)
+        """
+        if metrics is not None:
+            metrics.record_upstream(operation, model, outcome, time.perf_counter() - started, usage)
+    
+    async def _call_upstream(
+        self,
+        operation: str,
+        factory: Callable[[UpstreamTarget], Awaitable[T]],
+        tokens: int,
+        hedge: bool = False
+    ) -> T:
+        """
+        เรียก factory(target) บนปลายทางที่ upstream_pool เลือก ผ่าน upstream_scheduler ถ้าเปิดใช้
+        (รอคิวตามงบ RPM/TPM และลองใหม่เมื่อผิดพลาดชั่วคราว ซึ่งอาจได้ปลายทางอื่น)
+        
+        hedge=True ใช้ได้เฉพาะคำขอที่ไม่ใช่ stream คำขอซ้ำของ hedge ไม่ถูกนับในงบของ scheduler
+        operation ใช้ชื่อโมเดลจาก model_label (โมเดลที่ไม่รู้จักรวมเป็น "other") เพราะ upstream_pool
+        เก็บตัวอย่างเวลาตอบสนองแยกตาม operation ตลอดอายุ process
+        """
+        async def call() -> T:
+            return await self.upstream_pool.call(operation, factory, hedge)
+        
+        if self.upstream_scheduler is None:
+            return await call()
+        return await self.upstream_scheduler.call(call, tokens)
+    
+    async def _create_embeddings(self, **params: Any) -> Any:
+        """
+        เรียก embeddings API และบันทึกเวลาและจำนวน token (ใช้ทั้งกับ batcher และการเรียกโดยตรง)
+        """
+        inputs = [params["input"]] if isinstance(params["input"], str) else params["input"]
+        
+        async def create(target: UpstreamTarget):
+            # จับเวลาเฉพาะการเรียกแต่ละครั้ง ไม่รวมเวลารอคิวของ scheduler
+            started = time.perf_counter()
+            try:
+                response = await target.client.embeddings.create(**params)
+            except Exception:
+                self._record_upstream("embeddings", params["model"], "failed", started)
+                raise
+            self._record_upstream("embeddings", params["model"], "completed", started, response.usage)
+            return response
+        
+        return await self._call_upstream(
+            f"embeddings:{model_label(params['model'])}", create, estimate_tokens(inputs, completion=False), hedge=True
         )
+    
+    async def _summarize_messages(self, model: str, previous: Optional[str], messages: List[ChatMessage]) -> str:
+        """
+        สรุป messages ที่ถูกตัดออกจากบทสนทนา ต่อจากบทสรุปเดิม (ถ้ามี)
+        """
+        summary_model = config.CHAT_SUMMARY_MODEL or model
+        
+        # ส่งเฉพาะ message ล่าสุดที่พอดีงบของโมเดลที่ใช้สรุป
+        budget = self.token_budget.budget_for(summary_model, config.CHAT_SUMMARY_MAX_TOKENS) // 2
+        transcript = []
+        for message in reversed(messages):
+            budget -= self.token_budget.count_message(summary_model, message)
+            if budget < 0 and transcript:
+                break
+            transcript.append(f"{message.role}: {message.content}")
+        transcript.reverse()
+        
+        content = "\n".join(transcript)
+        if previous:
+            content = f"บทสรุปเดิม: {previous}\n\n{content}"
+        
+        instruction = "สรุปบทสนทนาต่อไปนี้ให้กระชับ เก็บข้อเท็จจริง ความต้องการ และข้อตกลงสำคัญของผู้ใช้ไว้ ตอบเฉพาะบทสรุป"
         
-        # สร้าง ChatMessage จากการตอบกลับของ OpenAI
-        assistant_message = ChatMessage(
-            role="assistant",
-            content=response.choices[0].message.content
+        async def create(target: UpstreamTarget):
+            started = time.perf_counter()
+            try:
+                response = await target.client.chat.completions.create(
+                    model=summary_model,
+                    messages=[
+                        {"role": "system", "content": instruction},
+                        {"role": "user", "content": content}
+                    ],
+                    temperature=0,
+                    max_tokens=config.CHAT_SUMMARY_MAX_TOKENS
+                )
+            except Exception:
+                self._record_upstream("summary", summary_model, "failed", started)
+                raise
+            self._record_upstream("summary", summary_model, "completed", started, response.usage)
+            return response
+        
+        response = await self._call_upstream(
+            f"summary:{model_label(summary_model)}", create, estimate_tokens([instruction, content], config.CHAT_SUMMARY_MAX_TOKENS), hedge=True
         )
+        return response.choices[0].message.content
+    
+    async def _embed_text(self, text: str) -> List[float]:
+        """
+        สร้าง embedding ของข้อความด้วยโมเดลของแคช chat (ใช้กับชั้น semantic)
+        """
+        response = await self.create_embeddings(EmbeddingsRequest(input=text, model=config.CHAT_CACHE_EMBEDDING_MODEL))
+        return response.data[0].embedding
+    
+    async def _lookup_chat_cache(self, request: ChatRequest, messages: List[ChatMessage]) -> Optional[Dict[str, Any]]:
+        """
+        ค้นหาคำตอบในแคช chat ถ้าเปิดใช้และคำขอไม่ได้ขอข้ามแคช
+        """
+        if self.chat_cache is None:
+            return None
+        if not request.cache:
+            self.chat_cache.record_bypass()
+            return None
+        return await self.chat_cache.get(request.model, request.temperature, request.max_tokens, messages, self._embed_text)
+    
+    def _store_chat_cache(self, request: ChatRequest, messages: List[ChatMessage], content: str, usage: Optional[Dict[str, int]]) -> None:
+        """
+        บันทึกคำตอบลงแคช chat ใน background เพื่อไม่ให้การสร้าง embedding ของชั้น semantic เพิ่ม latency
+        """
+        if self.chat_cache is None or not request.cache:
+            return
+        task = asyncio.create_task(self.chat_cache.put(
+            request.model, request.temperature, request.max_tokens, messages, content, usage, self._embed_text
+        ))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    @staticmethod
+    def _record_stream_metrics(
+        model: str,
+        outcome: str,
+        started: float,
+        first_token_at: Optional[float],
+        last_token_at: Optional[float],
+        usage: Any,
+        received_chunks: int
+    ) -> None:
+        """
+        บันทึกเวลาของ stream จาก upstream จำนวน token (ประมาณจากจำนวนส่วนถ้าไม่ได้รับ usage)
+        และอัตรา token ต่อวินาทีหลังจาก token แรกของ stream ที่จบสมบูรณ์
+        """
+        if metrics is None:
+            return
+        model = model_label(model)
+        metrics.upstream_duration.observe(("chat_stream", model, outcome), time.perf_counter() - started)
+        if usage is not None:
+            completion_tokens = usage.completion_tokens
+            metrics.record_tokens("chat_stream", model, usage.prompt_tokens, completion_tokens)
+        else:
+            completion_tokens = received_chunks
+            metrics.record_tokens("chat_stream", model, 0, completion_tokens)
+        if outcome == "completed" and first_token_at is not None and last_token_at > first_token_at:
+            metrics.stream_tokens_per_second.observe((model,), (completion_tokens - 1) / (last_token_at - first_token_at))
+    
+    async def _coalesce(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        เรียก factory() ผ่าน single-flight ถ้าเปิดการรวมคำขอ (COALESCE_REQUESTS)
+        """
+        if self.inflight is None:
+            return await factory()
+        return await self.inflight.do(key, factory)
+    
+    def _coalesce_stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        อ่าน stream จาก factory() ผ่าน single-flight ถ้าเปิดการรวมคำขอ (COALESCE_REQUESTS)
+        """
+        if self.inflight is None:
+            return factory()
+        return self.inflight.stream(key, factory)
+    
+    async def chat_completion(self, request: ChatRequest) -> ChatResponse:
+        messages = await self._fit_token_budget(request, self._prepare_messages(request))
+        
+        # คำขอที่เคยตอบแล้วจะได้คำตอบจากแคชโดยไม่เรียก API
+        cached = await self._lookup_chat_cache(request, messages)
+        if cached is not None:
+            return ChatResponse(
+                message=ChatMessage(role="assistant", content=cached["content"]),
+                usage=cached["usage"],
+                cache_hit=cached["cache_hit"]
+            )
         
-        return ChatResponse(
-            message=assistant_message,
-            usage={
+        async def create(target: UpstreamTarget):
+            started = time.perf_counter()
+            try:
+                response = await target.client.chat.completions.create(
+                    model=request.model,
+                    messages=[{"role": msg.role, "content": msg.content} for msg in messages],
+                    temperature=request.temperature,
+                    max_tokens=request.max_tokens,
+                    stream=False  # ไม่ใช้ stream ในฟังก์ชันนี้
+                )
+            except Exception:
+                self._record_upstream("chat", request.model, "failed", started)
+                raise
+            self._record_upstream("chat", request.model, "completed", started, response.usage)
+            return response
+        
+        async def fetch() -> ChatResponse:
+            response = await self._call_upstream(
+                f"chat:{model_label(request.model)}", create, estimate_tokens((msg.content for msg in messages), request.max_tokens), hedge=True
+            )
+            
+            # สร้าง ChatMessage จากการตอบกลับของ OpenAI
+            assistant_message = ChatMessage(
+                role="assistant",
+                content=response.choices[0].message.content
+            )
+            
+            usage = {
                 "prompt_tokens": response.usage.prompt_tokens,
                 "completion_tokens": response.usage.completion_tokens,
                 "total_tokens": response.usage.total_tokens
             }
-        )
+            
+            # เก็บเฉพาะคำตอบที่จบสมบูรณ์ ไม่ใช่คำตอบที่ถูกตัดเพราะ max_tokens
+            if response.choices[0].finish_reason == "stop":
+                self._store_chat_cache(request, messages, assistant_message.content, usage)
+            
+            return ChatResponse(message=assistant_message, usage=usage)
+        
+        # คำขอที่เหมือนกันซึ่งเข้ามาพร้อมกันจะใช้การเรียก API ครั้งเดียวกัน
+        key = ("chat", ChatCompletionCache.make_key(request.model, request.temperature, request.max_tokens, messages))
+        return await self._coalesce(key, fetch)
     
     async def chat_completion_stream(self, request: ChatRequest) -> AsyncGenerator[ChatStreamResponse, None]:
         """
@@ -62,101 +468,254 @@ class OpenAIService:
         Yields:
             ChatStreamResponse: ข้อมูลตอบกลับแบบ stream
         """
-        # ตรวจสอบและปรับแต่ง messages
-        messages = request.messages.copy()
-        has_system_message = any(msg.role == "system" for msg in messages)
+        # ตรวจสอบและปรับแต่ง messages และตัดประวัติที่เกินงบ token
+        messages = await self._fit_token_budget(request, self._prepare_messages(request))
         
-        # เพิ่ม system message เริ่มต้นหากยังไม่มีและ default_system_message เป็น True
-        if not has_system_message and request.default_system_message:
-            messages.insert(0, ChatMessage(
-                role="system",
-                content="คุณเป็นผู้ช่วยที่เป็นประโยชน์และตอบคำถามเป็นภาษาไทยเสมอ ให้คำตอบที่ครบถ้วนและมีประโยชน์"
-            ))
+        # คำตอบในแคชจะถูกส่งซ้ำเป็นส่วนๆ ทีละคำ ในรูปแบบเดียวกับ stream จริง
+        cached = await self._lookup_chat_cache(request, messages)
+        if cached is not None:
+            pieces = re.findall(r"\S+\s*|\s+", cached["content"])
+            for i, piece in enumerate(pieces):
+                yield ChatStreamResponse(
+                    delta=piece,
+                    finish_reason="stop" if i == len(pieces) - 1 else None,
+                    index=0
+                )
+            return
         
-        # เรียกใช้ API แบบ stream
-        stream = await self.client.chat.completions.create(
-            model=request.model,
-            messages=[{"role": msg.role, "content": msg.content} for msg in messages],
-            temperature=request.temperature,
-            max_tokens=request.max_tokens,
-            stream=True
-        )
+        async def upstream():
+            started = None
+            target = None
+            
+            async def create(candidate: UpstreamTarget):
+                # เรียกใช้ API แบบ stream (ขอ usage ใน chunk สุดท้ายเพื่อบันทึกการใช้ token)
+                # จับเวลาจากการเรียกครั้งที่สำเร็จ ไม่รวมเวลารอคิวและการลองใหม่ของ scheduler
+                nonlocal started, target
+                started = time.perf_counter()
+                try:
+                    stream = await candidate.client.chat.completions.create(
+                        model=request.model,
+                        messages=[{"role": msg.role, "content": msg.content} for msg in messages],
+                        temperature=request.temperature,
+                        max_tokens=request.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+                except Exception:
+                    self._record_upstream("chat_stream", request.model, "failed", started)
+                    raise
+                target = candidate
+                return stream
+            
+            # งบ TPM ถูกกันไว้ตอนเริ่ม stream (การลองใหม่ทำได้เฉพาะก่อนได้รับ chunk แรก)
+            # stream ไม่ถูก hedge เวลาตอบสนองของปลายทางสำหรับ chat_stream คือเวลาจนได้ header ของคำตอบ
+            stream = await self._call_upstream(
+                f"chat_stream:{model_label(request.model)}", create, estimate_tokens((msg.content for msg in messages), request.max_tokens)
+            )
+            # นับ stream ที่กำลังอ่านเป็นงานของปลายทางจนกว่าจะจบ เพื่อให้การเลือกปลายทางเห็นโหลดจริง
+            target.begin()
+            
+            # เก็บข้อความทั้งหมดไว้บันทึกลงแคชเมื่อ stream จบสมบูรณ์
+            collected = []
+            finish_reason = None
+            usage = None
+            outcome = "cancelled"
+            # เวลาที่ได้รับข้อความส่วนแรกและส่วนล่าสุด สำหรับ TTFT และช่วงห่างระหว่าง token
+            first_token_at = last_token_at = None
+            try:
+                async for chunk in stream:
+                    if chunk.usage:
+                        usage = chunk.usage
+                    if chunk.choices:
+                        finish_reason = chunk.choices[0].finish_reason or finish_reason
+                        if chunk.choices[0].delta.content:
+                            collected.append(chunk.choices[0].delta.content)
+                            if metrics is not None:
+                                now = time.perf_counter()
+                                if first_token_at is None:
+                                    first_token_at = now
+                                    metrics.stream_ttft.observe((model_label(request.model),), now - started)
+                                else:
+                                    metrics.stream_token_gap.observe((model_label(request.model),), now - last_token_at)
+                                last_token_at = now
+                    yield chunk
+                outcome = "completed"
+            except Exception:
+                outcome = "failed"
+                raise
+            finally:
+                # เมื่อ client ตัดการเชื่อมต่อ task ที่อ่าน stream จะถูกยกเลิกและมาถึงตรงนี้ทันที
+                # ปิด response เพื่อหยุดการสร้าง token ฝั่ง upstream และคืนการเชื่อมต่อให้ pool
+                await stream.close()
+                target.end()
+                self.stream_usage.record(outcome, usage, len(collected))
+                self._record_stream_metrics(request.model, outcome, started, first_token_at, last_token_at, usage, len(collected))
+            
+            if finish_reason == "stop":
+                self._store_chat_cache(
+                    request,
+                    messages,
+                    "".join(collected),
+                    {
+                        "prompt_tokens": usage.prompt_tokens,
+                        "completion_tokens": usage.completion_tokens,
+                        "total_tokens": usage.total_tokens
+                    } if usage else None
+                )
         
-        # สำหรับจัดการข้อความภาษาไทย
-        buffer = ""
-        buffer_size_limit = 10  # กำหนดขนาดบัฟเฟอร์สูงสุด
+        # stream ที่เหมือนกันซึ่งเข้ามาพร้อมกันจะอ่านจาก upstream เดียวกัน ผู้ที่เข้าร่วมภายหลังได้ส่วนที่ผ่านไปแล้วก่อน
+        key = ("chat_stream", ChatCompletionCache.make_key(request.model, request.temperature, request.max_tokens, messages))
+        stream = self._coalesce_stream(key, upstream)
         
         # ส่งข้อมูลแบบ stream
-        async for chunk in stream:
-            if chunk.choices and chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                buffer += content
-                
-                # เงื่อนไขในการส่งข้อมูล:
-                # 1. ถ้าบัฟเฟอร์มีขนาดเกินกำหนด
-                # 2. ถ้าในข้อความมีเครื่องหมายวรรคตอน
-                # 3. ถ้ามีช่องว่าง (เว้นวรรค)
-                should_send = (
-                    len(buffer) >= buffer_size_limit or 
-                    any(p in buffer for p in [".", ",", "!", "?", "\n"]) or
-                    " " in buffer
-                )
-                
-                if should_send:
-                    yield ChatStreamResponse(
-                        delta=buffer,
-                        finish_reason=chunk.choices[0].finish_reason,
-                        index=chunk.choices[0].index
-                    )
-                    buffer = ""  # ล้างบัฟเฟอร์
+        # ข้อความส่วนย่อยถูกรวมเป็นส่วนที่ใหญ่ขึ้นตามกฎใน STREAM_CHUNK_POLICY (ดู services.stream_chunker)
+        # และไม่ถูกพักไว้นานเกิน STREAM_CHUNK_MAX_HOLD_MS แม้ข้อความภาษาไทยจะไม่มีช่องว่าง
+        finish_reason = None
+        
+        async def pieces():
+            nonlocal finish_reason
+            async for chunk in stream:
+                if chunk.choices:
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    if chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
         
-        # ส่งข้อมูลที่เหลือในบัฟเฟอร์ (ถ้ามี)
-        if buffer:
+        chunker = make_chunker(
+            config.STREAM_CHUNK_POLICY,
+            max_chars=config.STREAM_CHUNK_MAX_CHARS,
+            max_hold_ms=config.STREAM_CHUNK_MAX_HOLD_MS
+        )
+        async for text in rechunk(pieces(), chunker):
             yield ChatStreamResponse(
-                delta=buffer,
+                delta=text,
                 finish_reason=None,
                 index=0
             )
+        
+        # ส่ง finish_reason เป็นส่วนสุดท้ายแบบเดียวกับ OpenAI
+        if finish_reason:
+            yield ChatStreamResponse(
+                delta="",
+                finish_reason=finish_reason,
+                index=0
+            )
     
     async def create_embeddings(self, request: EmbeddingsRequest) -> EmbeddingsResponse:
         """
         สร้าง embeddings จากข้อความที่ได้รับ
         
+        ข้อความที่เคยสร้างแล้วจะถูกดึงจากแคช และส่งเฉพาะข้อความที่ไม่พบในแคชไปยัง API
+        
         Args:
             request: ข้อมูลคำขอ embeddings
             
         Returns:
             EmbeddingsResponse: ข้อมูลตอบกลับที่มี embeddings
         """
-        # สร้างพารามิเตอร์สำหรับการเรียก API
-        params = {
-            "model": request.model,
-            "input": request.input,
-            "encoding_format": request.encoding_format
-        }
+        texts = [request.input] if isinstance(request.input, str) else list(request.input)
         
-        # เพิ่ม dimensions ถ้ามีการระบุ
-        if request.dimensions:
-            params["dimensions"] = request.dimensions
+        # แคชเก็บเฉพาะเวกเตอร์แบบ float (base64 ส่งต่อไปยัง API ตามเดิม)
+        cache = self.embedding_cache if request.encoding_format in (None, "float") else None
+        embeddings = await cache.get_many(request.model, request.dimensions, texts) if cache else [None] * len(texts)
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        
+        # ข้อความที่ซ้ำกันในคำขอเดียวกันส่งไปยัง API เพียงครั้งเดียว
+        if cache:
+            unique = {}
+            for i in misses:
+                unique.setdefault(cache.normalize_text(texts[i]), i)
+            pending, misses = misses, list(unique.values())
+        
+        model = request.model
+        usage = EmbeddingsUsage(prompt_tokens=0, total_tokens=0)
+        
+        if misses:
+            # สร้างพารามิเตอร์สำหรับการเรียก API
+            params = {
+                "model": request.model,
+                "input": [texts[i] for i in misses] if cache else request.input,
+                "encoding_format": request.encoding_format
+            }
             
-        # เรียกใช้ API
-        response = await self.client.embeddings.create(**params)
+            # เพิ่ม dimensions ถ้ามีการระบุ
+            if request.dimensions:
+                params["dimensions"] = request.dimensions
+                
+            # คำขอแบบ float ส่งผ่าน batcher เพื่อรวมกับคำขอของผู้เรียกรายอื่นที่เข้ามาพร้อมกัน
+            batcher = self.embedding_batcher if request.encoding_format in (None, "float") else None
+            
+            async def fetch():
+                # เรียกใช้ API
+                started = time.perf_counter()
+                if batcher:
+                    vectors, model, usage = await batcher.embed(
+                        request.model, request.dimensions, [texts[i] for i in misses], request_priority.get()
+                    )
+                else:
+                    response = await self._create_embeddings(**params)
+                    vectors = [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+                    model = response.model
+                    usage = EmbeddingsUsage(
+                        prompt_tokens=response.usage.prompt_tokens,
+                        total_tokens=response.usage.total_tokens
+                    )
+                
+                if cache:
+                    cache.record_upstream_call(time.perf_counter() - started)
+                    cache.put_many(
+                        request.model,
+                        request.dimensions,
+                        params["input"],
+                        vectors,
+                        total_tokens=usage.total_tokens
+                    )
+                return vectors, model, usage
+            
+            # คำขอที่เหมือนกันซึ่งเข้ามาพร้อมกันจะใช้การเรียก API ครั้งเดียวกัน
+            key = ("embeddings", request.model, request.dimensions, request.encoding_format,
+                   tuple(params["input"]) if isinstance(params["input"], list) else params["input"])
+            vectors, model, usage = await self._coalesce(key, fetch)
+            
+            for i, embedding in zip(misses, vectors):
+                embeddings[i] = embedding
+            
+            if cache:
+                for i in pending:
+                    embeddings[i] = embeddings[unique[cache.normalize_text(texts[i])]]
+        elif cache:
+            cache.record_saved_call()
         
         # สร้างข้อมูลตอบกลับ
         embedding_data = [
             EmbeddingData(
-                embedding=item.embedding,
-                index=item.index,
-                object=item.object
-            ) for item in response.data
+                embedding=embedding,
+                index=index,
+                object="embedding"
+            ) for index, embedding in enumerate(embeddings)
         ]
         
         return EmbeddingsResponse(
             data=embedding_data,
-            model=response.model,
-            object=response.object,
-            usage=EmbeddingsUsage(
-                prompt_tokens=response.usage.prompt_tokens,
-                total_tokens=response.usage.total_tokens
-            )
-        )
\ No newline at end of file
+            model=model,
+            object="list",
+            usage=usage
+        )
+
+
+def get_openai_service(request: Request) -> OpenAIService:
+    """
+    dependency ของ FastAPI ที่คืน OpenAIService ตัวเดียวของ worker ซึ่งสร้างไว้ใน lifespan ของแอป
+    
+    ถ้า router ถูกใช้กับแอปที่ไม่มี lifespan (เช่นสคริปต์ทดสอบ) จะสร้างและเก็บไว้ใน app.state ครั้งแรกที่เรียก
+    
+    Args:
+        request: คำขอปัจจุบัน
+        
+    Returns:
+        OpenAIService: บริการ OpenAI ที่ใช้ร่วมกัน
+    """
+    service = getattr(request.app.state, "openai_service", None)
+    if service is None:
+        service = OpenAIService()
+        request.app.state.openai_service = service
+    return service
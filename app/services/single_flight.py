@@ -0,0 +1,167 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+SINGLE_FLIGHT_METRICS = {
+    "upstream_calls": ("counter", "Non-stream upstream calls actually made"),
+    "collapsed_calls": ("counter", "Non-stream requests that joined an identical call already in flight"),
+    "upstream_streams": ("counter", "Upstream streams actually opened"),
+    "collapsed_streams": ("counter", "Stream requests that joined an identical stream already in flight"),
+    "in_flight": ("gauge", "Calls and streams currently in flight"),
+}
+
+
+class _Call:
+    """
+    การเรียกที่กำลังทำงานอยู่หนึ่งรายการและจำนวนผู้รอผล
+    """
+
+    def __init__(self, task: "asyncio.Future[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class _Stream:
+    """
+    stream ที่กำลังทำงานอยู่หนึ่งรายการ เก็บทุกส่วนที่ได้รับแล้วไว้ให้ผู้ที่เข้าร่วมภายหลัง
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Event()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        # สร้าง Event ใหม่ทุกครั้งเพื่อให้ผู้รอทุกรายตื่นโดยไม่ต้อง clear
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class SingleFlight:
+    """
+    รวมคำขอที่เหมือนกันซึ่งทำงานพร้อมกันให้เรียก upstream เพียงครั้งเดียว
+
+    do() ให้ผู้เรียกทุกรายที่ใช้ key เดียวกันระหว่างที่การเรียกยังไม่จบได้ผลลัพธ์ (หรือข้อผิดพลาด)
+    เดียวกัน stream() ทำแบบเดียวกันกับ async iterator โดยผู้ที่เข้าร่วมภายหลังจะได้ส่วนที่ได้รับไปแล้ว
+    ก่อนแล้วจึงได้ส่วนที่เหลือแบบสด ผลลัพธ์ไม่ถูกเก็บไว้หลังจากการเรียกจบ (ไม่ใช่แคช)
+
+    การเรียก upstream จะถูกยกเลิกเมื่อผู้รอทุกรายยกเลิกหรือเลิกอ่านแล้วเท่านั้น
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _Stream] = {}
+        self.calls = 0
+        self.collapsed_calls = 0
+        self.streams = 0
+        self.collapsed_streams = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[T]]) -> T:
+        """
+        เรียก factory() หรือรอผลของการเรียกที่ใช้ key เดียวกันซึ่งกำลังทำงานอยู่
+
+        Args:
+            key: key ที่ระบุว่าคำขอเหมือนกัน
+            factory: ฟังก์ชันที่สร้าง coroutine ของการเรียก upstream
+
+        Returns:
+            T: ผลลัพธ์ของการเรียก
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._discard(self._calls, key, call))
+            self.calls += 1
+        else:
+            self.collapsed_calls += 1
+
+        call.waiters += 1
+        try:
+            # shield ป้องกันไม่ให้การยกเลิกของผู้รอรายหนึ่งยกเลิกการเรียกของผู้รอรายอื่น
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        อ่านจาก factory() หรือเข้าร่วม stream ที่ใช้ key เดียวกันซึ่งกำลังทำงานอยู่
+
+        Args:
+            key: key ที่ระบุว่าคำขอเหมือนกัน
+            factory: ฟังก์ชันที่สร้าง async iterator ของ upstream
+
+        Yields:
+            T: ทุกส่วนของ stream ตั้งแต่ส่วนแรก
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Stream()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(self._pump(key, flight, factory))
+            self.streams += 1
+        else:
+            self.collapsed_streams += 1
+
+        flight.subscribers += 1
+        try:
+            position = 0
+            while True:
+                while position < len(flight.items):
+                    yield flight.items[position]
+                    position += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+                self._discard(self._streams, key, flight)
+
+    async def _pump(self, key: Hashable, flight: _Stream, factory: Callable[[], AsyncIterator[Any]]) -> None:
+        """
+        อ่าน upstream และเก็บทุกส่วนไว้ใน flight พร้อมปลุกผู้รอ
+        """
+        try:
+            async for item in factory():
+                flight.items.append(item)
+                flight.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._discard(self._streams, key, flight)
+            flight.notify()
+
+    @staticmethod
+    def _discard(registry: Dict[Hashable, Any], key: Hashable, value: Any) -> None:
+        # ลบเฉพาะเมื่อ key ยังชี้ไปยังรายการเดิม (อาจมีรายการใหม่ที่ใช้ key เดียวกันแล้ว)
+        if registry.get(key) is value:
+            del registry[key]
+
+    def stats(self) -> Dict[str, int]:
+        """
+        สถิติการรวมคำขอ
+
+        Returns:
+            Dict[str, int]: จำนวนการเรียก upstream จริง และจำนวนคำขอที่ถูกรวมเข้ากับคำขอที่กำลังทำงานอยู่
+        """
+        return {
+            "upstream_calls": self.calls,
+            "collapsed_calls": self.collapsed_calls,
+            "upstream_streams": self.streams,
+            "collapsed_streams": self.collapsed_streams,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
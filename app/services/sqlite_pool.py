@@ -0,0 +1,106 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class SQLitePool:
+    """
+    pool ของการเชื่อมต่อ SQLite แบบใช้ซ้ำได้ข้าม thread
+
+    ทุกการเชื่อมต่อเปิดโหมด WAL เพื่อให้ผู้อ่านหลายรายทำงานพร้อมกับผู้เขียนได้โดยไม่บล็อกกัน
+    และถูกสร้างเมื่อจำเป็นจนถึงจำนวนสูงสุด หลังจากนั้นผู้ขอจะรอจนกว่าจะมีการเชื่อมต่อว่าง
+    """
+
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 30.0):
+        """
+        สร้าง SQLitePool
+
+        Args:
+            db_path: พาธไปยังไฟล์ฐานข้อมูล SQLite
+            size: จำนวนการเชื่อมต่อสูงสุด
+            timeout: เวลาสูงสุด (วินาที) ที่รอการเชื่อมต่อว่าง และรอ lock ของฐานข้อมูล
+        """
+        self.db_path = str(db_path)
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        เปิดการเชื่อมต่อใหม่และตั้งค่า PRAGMA สำหรับการใช้งานพร้อมกันหลาย thread
+        """
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # ในโหมด WAL ค่า NORMAL ยังคงปลอดภัยต่อไฟล์เสียหาย แต่ไม่ต้อง fsync ทุก commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        """
+        ยืมการเชื่อมต่อจาก pool (LIFO เพื่อใช้การเชื่อมต่อที่ cache ยังอุ่นอยู่ก่อน)
+        """
+        if self._closed:
+            raise RuntimeError("SQLitePool is closed")
+
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No SQLite connection available after {self.timeout} seconds")
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        """
+        คืนการเชื่อมต่อเข้า pool โดยยกเลิก transaction ที่ค้างอยู่ก่อน
+        """
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        ยืมการเชื่อมต่อภายใน with block: commit เมื่อจบปกติ และ rollback เมื่อเกิดข้อผิดพลาด
+        (เหมือน with sqlite3.connect(...) เดิม แต่ไม่ต้องเปิดการเชื่อมต่อใหม่ทุกครั้ง)
+        """
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._release(conn)
+
+    def close(self) -> None:
+        """
+        ปิดการเชื่อมต่อที่ว่างอยู่ทั้งหมด การเชื่อมต่อที่ถูกยืมอยู่จะถูกปิดเมื่อคืนเข้า pool
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -1,21 +1,99 @@
 import os
-import sqlite3
+import re
 import json
+import asyncio
+import functools
+import threading
+import time
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Callable, TypeVar
 from pathlib import Path
+from services.sqlite_pool import SQLitePool
+from services.embedding_segment import EmbeddingSegment
+from services.vector_index import VectorIndex
+from services.ann_index import IVFIndex
+from services.metrics import metrics
+from services.thai_tokenizer import index_text, match_expression, query_terms
+
+# รูปแบบการเก็บ embedding แบบไบนารี (little-endian float32)
+EMBEDDING_DTYPES = {
+    "float32": np.dtype("<f4"),
+}
+DEFAULT_EMBEDDING_DTYPE = "float32"
+
+# บันทึกดัชนี ANN ลงไฟล์ใหม่ใน background เมื่อมีการเปลี่ยนแปลงสะสมครบจำนวนนี้ และห่างจากครั้งก่อนอย่างน้อย
+# ANN_PERSIST_INTERVAL_SECONDS วินาที (การเปลี่ยนแปลงที่เหลือถูกบันทึกตอน close() ส่วนที่ไม่ได้บันทึก
+# เพราะ process จบกะทันหันจะถูกเติมจาก SQLite ตอนโหลดดัชนี ดู _reconcile_ann_index)
+ANN_PERSIST_EVERY = 1000
+ANN_PERSIST_INTERVAL_SECONDS = float(os.getenv("ANN_PERSIST_INTERVAL_SECONDS", "60"))
+
+# compact ไฟล์ segment หลังการลบ เมื่อสัดส่วนแถวที่ไม่มีเจ้าของเกินค่านี้และไฟล์มีอย่างน้อย SEGMENT_COMPACT_MIN_ROWS แถว
+SEGMENT_COMPACT_DEAD_RATIO = float(os.getenv("SEGMENT_COMPACT_DEAD_RATIO", "0.5"))
+SEGMENT_COMPACT_MIN_ROWS = 10000
+
+# ตัวดำเนินการของเงื่อนไขกรอง metadata และชื่อ key ที่อนุญาต (ชื่อ key ถูกใส่ลงใน SQL โดยตรง)
+METADATA_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+METADATA_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# จำนวนผู้สมัครจากแต่ละฝั่ง (FTS5 และเวกเตอร์) ในโหมด hybrid/lexical และค่าคงที่ k ของ reciprocal rank fusion
+DEFAULT_SEARCH_CANDIDATES = 100
+RRF_K = 60
+
+# จำนวนเอกสารที่ FTS5 ให้คะแนน bm25 ได้ต่อหนึ่งคำค้นหา พจน์ที่พบในเอกสารจำนวนมาก (เช่น "sku" หรือ bigram ทั่วไป)
+# ถูกตัดออกจนผลรวมจำนวนเอกสารของพจน์ที่เหลือไม่เกินค่านี้ โดยคงพจน์ที่พบน้อยที่สุดไว้อย่างน้อยหนึ่งพจน์
+LEXICAL_MATCH_BUDGET = int(os.getenv("LEXICAL_MATCH_BUDGET", "10000"))
+
+# จำนวน token สูงสุดในแคชจำนวนเอกสารต่อ token แคชถูกล้างเมื่อเต็มหรือเมื่อจำนวนเอกสารเปลี่ยนไปเกิน 10%
+TERM_CACHE_SIZE = 100_000
+
+# จำนวน thread ที่รันงานฐานข้อมูลและการค้นหาแทน event loop
+DEFAULT_EXECUTOR_WORKERS = int(os.getenv("SQLITE_EXECUTOR_WORKERS", str(min(8, (os.cpu_count() or 1) + 4))))
+
+T = TypeVar("T")
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """
+    รวมหลายอันดับด้วย reciprocal rank fusion: คะแนนของเอกสารคือผลรวม 1 / (k + อันดับ) จากทุกอันดับที่พบ
+    
+    Args:
+        rankings: รายการ document_id ของแต่ละแหล่ง เรียงจากดีที่สุด
+        k: ค่าคงที่ที่ลดน้ำหนักของอันดับต้นๆ
+        
+    Returns:
+        List[Tuple[int, float]]: รายการ (document_id, score) เรียงจากคะแนนมากไปน้อย
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, document_id in enumerate(ranking, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
 
 class SQLiteService:
     """
     บริการสำหรับจัดการฐานข้อมูล SQLite และเก็บข้อมูล embeddings
     """
     
-    def __init__(self, db_path: str = None):
+    def __init__(
+        self,
+        db_path: str = None,
+        migrate_in_background: bool = True,
+        max_workers: int = DEFAULT_EXECUTOR_WORKERS,
+        lexical_index: bool = True,
+        metadata_index_fields: Sequence[str] = ()
+    ):
         """
         สร้าง SQLiteService
         
         Args:
             db_path: พาธไปยังไฟล์ฐานข้อมูล SQLite ถ้าไม่ระบุจะใช้ค่าเริ่มต้น
+            migrate_in_background: แปลง embeddings แบบ JSON เดิมเป็น BLOB และเติมดัชนี FTS5 ของเอกสารเดิม
+                ใน background thread
+            max_workers: จำนวน thread ของ executor ที่ใช้กับ run()
+            lexical_index: ดูแลดัชนี FTS5 ของเนื้อหาเอกสารสำหรับโหมด hybrid และ lexical
+            metadata_index_fields: key ใน metadata ที่สร้าง expression index ไว้ตอนเริ่มต้น
+                การกรองด้วย key อื่นยังทำได้แต่ต้องสแกนตาราง documents
         """
         if db_path is None:
             # สร้างโฟลเดอร์ data ถ้ายังไม่มี
@@ -24,13 +102,87 @@ class SQLiteService:
             db_path = data_dir / "embeddings.db"
             
         self.db_path = str(db_path)
+        self._db_name = Path(self.db_path).name
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        # การเชื่อมต่อแบบใช้ซ้ำ (WAL) เผื่อไว้สำหรับ thread ของ migration และ thread ที่เรียกโดยตรง
+        self._pool = SQLitePool(self.db_path, size=max_workers + 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sqlite-service")
+        self.lexical_index = lexical_index
         self._create_tables()
+        
+        # ไฟล์ segment และดัชนีเวกเตอร์ แยกตาม (model, dimensions) และโหลดเมื่อค้นหาครั้งแรก
+        self._segments: Dict[Tuple[str, int], EmbeddingSegment] = {}
+        self._segments_lock = threading.Lock()
+        self._indexes: Dict[Tuple[str, int], VectorIndex] = {}
+        self._ann_indexes: Dict[Tuple[str, int], IVFIndex] = {}
+        self._indexes_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        # บันทึกดัชนี ANN ใน thread แยก เพื่อไม่ให้การเพิ่มหรือลบเอกสารต้องรอเขียนไฟล์ทั้งไฟล์
+        self._persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-ann-persist")
+        self._ann_persist_lock = threading.Lock()
+        self._ann_persist_pending = set()
+        self._ann_persisted_at: Dict[Tuple[str, int], float] = {}
+        self._metadata_indexes = set()
+        for field in metadata_index_fields:
+            self.create_metadata_index(field)
+        self._term_documents: Dict[str, int] = {}
+        self._term_documents_corpus = 0
+        self._term_documents_lock = threading.Lock()
+        
+        # แปลงข้อมูลเดิมทีละ batch โดยไม่ต้องหยุดให้บริการ
+        if migrate_in_background and self.has_legacy_embeddings():
+            threading.Thread(target=self.migrate_legacy_embeddings, daemon=True).start()
+        if migrate_in_background and self.lexical_index:
+            threading.Thread(target=self.backfill_lexical_index, daemon=True).start()
+    
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        รันเมธอดแบบ synchronous ของ service ใน executor ของ service เอง เพื่อไม่ให้ query ของ SQLite
+        และการคำนวณ similarity บล็อก event loop (เช่น chat stream ที่ทำงานอยู่พร้อมกัน)
+        
+        Args:
+            func: เมธอดที่ต้องการเรียก เช่น self.search_similar
+            *args: อาร์กิวเมนต์ของเมธอด
+            **kwargs: อาร์กิวเมนต์แบบระบุชื่อของเมธอด
+            
+        Returns:
+            ค่าที่เมธอดคืนกลับ
+        """
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if metrics is not None:
+            call = functools.partial(self._timed, getattr(func, "__name__", "call"), call)
+        return await loop.run_in_executor(self._executor, call)
+    
+    def _timed(self, operation: str, call: Callable[[], T]) -> T:
+        """
+        รัน call ใน executor และบันทึกเวลาที่ใช้จริง (ไม่รวมเวลารอ thread ว่าง)
+        """
+        started = time.perf_counter()
+        try:
+            return call()
+        finally:
+            metrics.db_duration.observe((self._db_name, operation), time.perf_counter() - started)
+    
+    def close(self) -> None:
+        """
+        หยุด executor บันทึกดัชนี ANN ที่ยังมีการเปลี่ยนแปลงค้างอยู่ และปิดการเชื่อมต่อทั้งหมดใน pool
+        """
+        self._executor.shutdown(wait=True)
+        self._persist_executor.shutdown(wait=True)
+        with self._indexes_lock:
+            ann_indexes = list(self._ann_indexes.items())
+        for key, ann_index in ann_indexes:
+            if ann_index.pending_changes:
+                self._persist_ann_index(key, ann_index)
+        self._pool.close()
     
     def _create_tables(self) -> None:
         """
         สร้างตารางในฐานข้อมูลถ้ายังไม่มี
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
             # สร้างตาราง documents สำหรับเก็บข้อมูลเอกสาร
@@ -49,15 +201,201 @@ class SQLiteService:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 document_id INTEGER NOT NULL,
                 model TEXT NOT NULL,
-                embedding TEXT NOT NULL,
+                embedding BLOB NOT NULL,
                 dimensions INTEGER NOT NULL,
+                dtype TEXT,
+                segment_row INTEGER,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (document_id) REFERENCES documents (id) ON DELETE CASCADE
             )
             ''')
             
+            # ฐานข้อมูลเดิมเก็บ embedding เป็น JSON และยังไม่มีคอลัมน์ dtype
+            # แถวที่ dtype เป็น NULL คือแถวแบบ JSON ที่ยังไม่ได้แปลง
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(embeddings)")}
+            if "dtype" not in columns:
+                cursor.execute("ALTER TABLE embeddings ADD COLUMN dtype TEXT")
+            
+            # segment_row คือหมายเลขแถวของเวกเตอร์ในไฟล์ segment ของ (model, dimensions)
+            if "segment_row" not in columns:
+                cursor.execute("ALTER TABLE embeddings ADD COLUMN segment_row INTEGER")
+            
+            # generation ปัจจุบันของไฟล์ segment ของ (model, dimensions) ซึ่งเพิ่มขึ้นทุกครั้งที่ compact
+            # ไม่มีแถวหมายถึง generation 0
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                generation INTEGER NOT NULL,
+                PRIMARY KEY (model, dimensions)
+            )
+            ''')
+            
+            # partial index สำหรับหาแถวที่ยังไม่ได้แปลงโดยไม่ต้องสแกนทั้งตาราง
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_legacy ON embeddings (id) WHERE dtype IS NULL"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_model ON embeddings (model, dimensions)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_document ON embeddings (document_id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_embeddings_unsegmented ON embeddings (model, dimensions) WHERE segment_row IS NULL"
+            )
+            
+            # ดัชนีคำของเนื้อหาเอกสาร rowid คือ documents.id ข้อความถูกแบ่ง token ด้วย thai_tokenizer ก่อนบันทึก
+            # (ภาษาไทยไม่มีช่องว่างระหว่างคำ) tokenizer "ascii" จึงแค่แยกตามช่องว่าง
+            if self.lexical_index:
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(tokens, tokenize = 'ascii')"
+                )
+                # ตารางอ่านอย่างเดียวที่ให้จำนวนเอกสารของแต่ละ token สำหรับตัดพจน์ที่พบบ่อยออกจากคำค้นหา
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts_vocab USING fts5vocab(documents_fts, 'row')"
+                )
+            
             conn.commit()
     
+    @staticmethod
+    def _encode_embedding(embedding: List[float]) -> bytes:
+        """
+        แปลง embedding เป็น BLOB แบบ little-endian float32
+        
+        Args:
+            embedding: embedding vector
+            
+        Returns:
+            bytes: ข้อมูลไบนารีของ embedding
+        """
+        return np.asarray(embedding, dtype=EMBEDDING_DTYPES[DEFAULT_EMBEDDING_DTYPE]).tobytes()
+    
+    @staticmethod
+    def _decode_embedding(value: Any, dtype: Optional[str]) -> np.ndarray:
+        """
+        แปลงค่าจากคอลัมน์ embedding กลับเป็น numpy array
+        
+        BLOB จะถูกอ่านด้วย np.frombuffer โดยไม่คัดลอกข้อมูล (array ที่ได้เป็นแบบอ่านอย่างเดียว)
+        ส่วนแถวแบบ JSON เดิมจะถูก parse ตามปกติ
+        
+        Args:
+            value: ค่าจากคอลัมน์ embedding
+            dtype: ชนิดข้อมูลที่บันทึกไว้ หรือ None ถ้าเป็นแถวแบบ JSON เดิม
+            
+        Returns:
+            np.ndarray: embedding vector
+        """
+        if dtype is None:
+            return np.array(json.loads(value))
+        return np.frombuffer(value, dtype=EMBEDDING_DTYPES[dtype])
+    
+    def has_legacy_embeddings(self) -> bool:
+        """
+        ตรวจสอบว่ายังมี embedding ที่เก็บแบบ JSON เหลืออยู่หรือไม่
+        
+        Returns:
+            bool: True ถ้ายังมีแถวที่ต้องแปลง
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM embeddings WHERE dtype IS NULL LIMIT 1")
+            return cursor.fetchone() is not None
+    
+    def migrate_legacy_embeddings(self, batch_size: int = 500) -> int:
+        """
+        แปลง embedding ที่เก็บแบบ JSON เป็น BLOB ทีละ batch
+        
+        แต่ละ batch ใช้ transaction สั้นๆ ของตัวเอง จึงเรียกได้ขณะที่ระบบยังให้บริการอยู่
+        และเรียกซ้ำได้อย่างปลอดภัยหากถูกขัดจังหวะ
+        
+        Args:
+            batch_size: จำนวนแถวที่แปลงต่อหนึ่ง transaction
+            
+        Returns:
+            int: จำนวนแถวที่แปลงแล้ว
+        """
+        converted = 0
+        last_id = 0
+        
+        while True:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT id, embedding FROM embeddings
+                    WHERE dtype IS NULL AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (last_id, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    return converted
+                
+                # เงื่อนไข dtype IS NULL ป้องกันการเขียนทับแถวที่ถูกแปลงไปแล้วโดย process อื่น
+                cursor.executemany(
+                    "UPDATE embeddings SET embedding = ?, dtype = ? WHERE id = ? AND dtype IS NULL",
+                    [
+                        (self._encode_embedding(json.loads(embedding_json)), DEFAULT_EMBEDDING_DTYPE, row_id)
+                        for row_id, embedding_json in rows
+                    ]
+                )
+                conn.commit()
+                
+                converted += cursor.rowcount
+                last_id = rows[-1][0]
+    
+    def backfill_lexical_index(self, batch_size: int = 500) -> int:
+        """
+        เพิ่มเอกสารที่ยังไม่อยู่ในดัชนี FTS5 (เช่นเอกสารที่เพิ่มก่อนมีดัชนี) ทีละ batch
+        
+        การหาเอกสารเป็นการอ่านอย่างเดียว และแต่ละ batch ตรวจซ้ำภายใน transaction สั้นๆ ของตัวเอง
+        จึงเรียกได้ขณะที่ระบบยังให้บริการอยู่ และเรียกซ้ำได้อย่างปลอดภัยหากถูกขัดจังหวะ
+        
+        Args:
+            batch_size: จำนวนเอกสารที่เพิ่มต่อหนึ่ง transaction
+            
+        Returns:
+            int: จำนวนเอกสารที่เพิ่มลงดัชนี
+        """
+        indexed = 0
+        last_id = 0
+        
+        while True:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT d.id FROM documents d
+                    WHERE d.id > ? AND NOT EXISTS (SELECT 1 FROM documents_fts f WHERE f.rowid = d.id)
+                    ORDER BY d.id
+                    LIMIT ?
+                    """,
+                    (last_id, batch_size)
+                )
+                document_ids = [row[0] for row in cursor.fetchall()]
+                if not document_ids:
+                    return indexed
+                
+                # ตรวจซ้ำหลังจองสิทธิ์เขียน เพราะเอกสารอาจถูกลบหรือถูกเพิ่มลงดัชนีไปแล้วระหว่างนั้น
+                placeholders = ",".join("?" * len(document_ids))
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    f"""
+                    SELECT d.id, d.content FROM documents d
+                    WHERE d.id IN ({placeholders}) AND NOT EXISTS (SELECT 1 FROM documents_fts f WHERE f.rowid = d.id)
+                    """,
+                    document_ids
+                )
+                pending = [(document_id, index_text(content)) for document_id, content in cursor.fetchall()]
+                cursor.executemany("INSERT INTO documents_fts (rowid, tokens) VALUES (?, ?)", pending)
+                conn.commit()
+                
+                indexed += len(pending)
+                last_id = document_ids[-1]
+    
     def add_document(self, content: str, embedding: List[float], model: str, metadata: Dict[str, Any] = None) -> int:
         """
         เพิ่มเอกสารและ embedding ลงในฐานข้อมูล
@@ -71,9 +409,16 @@ class SQLiteService:
         Returns:
             int: ID ของเอกสารที่เพิ่ม
         """
-        with sqlite3.connect(self.db_path) as conn:
+        key = (model, len(embedding))
+        
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
+            # เขียนเวกเตอร์ลง segment ก่อน ถ้า insert ไม่สำเร็จแถวนั้นจะไม่มีเจ้าของและถูกข้ามตอนค้นหา
+            cursor.execute("BEGIN IMMEDIATE")
+            segment = self._get_segment(*key, self._segment_generation(cursor, *key))
+            segment_row = segment.append(np.asarray(embedding, dtype=np.float32))
+            
             # เพิ่มเอกสาร
             cursor.execute(
                 "INSERT INTO documents (content, metadata) VALUES (?, ?)",
@@ -81,75 +426,834 @@ class SQLiteService:
             )
             document_id = cursor.lastrowid
             
+            if self.lexical_index:
+                cursor.execute(
+                    "INSERT INTO documents_fts (rowid, tokens) VALUES (?, ?)",
+                    (document_id, index_text(content))
+                )
+            
             # เพิ่ม embedding
             cursor.execute(
-                "INSERT INTO embeddings (document_id, model, embedding, dimensions) VALUES (?, ?, ?, ?)",
-                (document_id, model, json.dumps(embedding), len(embedding))
+                """
+                INSERT INTO embeddings (document_id, model, embedding, dimensions, dtype, segment_row)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (document_id, model, self._encode_embedding(embedding), len(embedding), DEFAULT_EMBEDDING_DTYPE, segment_row)
             )
             
             conn.commit()
-            return document_id
+        
+        # รอให้ดัชนีที่กำลังโหลดอยู่เสร็จก่อน เพื่อไม่ให้เอกสารใหม่ตกหล่น
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            ann_index = self._ann_indexes.get(key)
+        # ดัชนีของ generation เก่า (compact โดย worker อื่น) จะถูกโหลดใหม่ตอนค้นหาครั้งถัดไป
+        if index is not None and index.segment.generation == segment.generation:
+            index.add(document_id, segment_row)
+        if ann_index is not None and ann_index.segment.generation == segment.generation:
+            ann_index.add(document_id, segment_row)
+            self._maybe_persist_ann_index(key, ann_index)
+        
+        return document_id
     
-    def search_similar(self, query_embedding: List[float], model: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def add_documents(self, documents: List[Dict[str, Any]], model: str) -> List[int]:
         """
-        ค้นหาเอกสารที่มี embedding ใกล้เคียงกับ query_embedding
+        เพิ่มเอกสารและ embedding หลายรายการใน transaction เดียวด้วย executemany
         
         Args:
-            query_embedding: embedding vector ของคำค้นหา
+            documents: รายการ {"content", "embedding", "metadata"} ที่ embedding มีจำนวนมิติเท่ากัน
             model: ชื่อโมเดลที่ใช้สร้าง embedding
-            top_k: จำนวนผลลัพธ์ที่ต้องการ
             
         Returns:
-            List[Dict[str, Any]]: รายการเอกสารที่มี embedding ใกล้เคียงที่สุด
+            List[int]: ID ของเอกสารที่เพิ่ม เรียงตามลำดับของ documents
         """
-        with sqlite3.connect(self.db_path) as conn:
+        if not documents:
+            return []
+        
+        vectors = np.asarray([document["embedding"] for document in documents], dtype=np.float32)
+        key = (model, vectors.shape[1])
+        
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
+            # BEGIN IMMEDIATE จองสิทธิ์เขียนไว้ตลอด transaction ทำให้ ID ที่ AUTOINCREMENT ให้มาเรียงต่อกัน
+            # และไม่มีการ compact ระหว่างที่เขียนเวกเตอร์ลง segment
+            cursor.execute("BEGIN IMMEDIATE")
+            segment = self._get_segment(*key, self._segment_generation(cursor, *key))
+            first_row = segment.append(vectors)
+            segment_rows = list(range(first_row, first_row + len(documents)))
+            cursor.executemany(
+                "INSERT INTO documents (content, metadata) VALUES (?, ?)",
+                [
+                    (document["content"], json.dumps(document["metadata"]) if document.get("metadata") else None)
+                    for document in documents
+                ]
+            )
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            document_ids = list(range(last_id - len(documents) + 1, last_id + 1))
             
-            # ดึงข้อมูล embeddings ทั้งหมดสำหรับโมเดลที่ระบุ
-            cursor.execute(
+            if self.lexical_index:
+                cursor.executemany(
+                    "INSERT INTO documents_fts (rowid, tokens) VALUES (?, ?)",
+                    [(document_id, index_text(document["content"])) for document_id, document in zip(document_ids, documents)]
+                )
+            
+            cursor.executemany(
                 """
-                SELECT e.document_id, e.embedding, d.content, d.metadata
-                FROM embeddings e
-                JOIN documents d ON e.document_id = d.id
-                WHERE e.model = ?
+                INSERT INTO embeddings (document_id, model, embedding, dimensions, dtype, segment_row)
+                VALUES (?, ?, ?, ?, ?, ?)
                 """,
-                (model,)
+                [
+                    (document_id, model, vector.tobytes(), vectors.shape[1], DEFAULT_EMBEDDING_DTYPE, segment_row)
+                    for document_id, vector, segment_row in zip(document_ids, vectors.astype("<f4", copy=False), segment_rows)
+                ]
             )
+            conn.commit()
+        
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            ann_index = self._ann_indexes.get(key)
+        if index is not None and index.segment.generation == segment.generation:
+            index.add_batch(document_ids, segment_rows)
+        if ann_index is not None and ann_index.segment.generation == segment.generation:
+            ann_index.add_batch(document_ids, segment_rows)
+            self._maybe_persist_ann_index(key, ann_index)
+        
+        return document_ids
+    
+    def _storage_path(self, kind: str, model: str, dimensions: int, suffix: str) -> Path:
+        """
+        พาธของไฟล์ข้อมูลประกอบ (segment, ดัชนี ANN) ซึ่งเก็บไว้ข้างไฟล์ฐานข้อมูล
+        """
+        db_path = Path(self.db_path)
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        return db_path.with_name(f"{db_path.stem}.{kind}.{safe_model}.{dimensions}.{suffix}")
+    
+    def _segment_path(self, model: str, dimensions: int, generation: int) -> Path:
+        """
+        พาธของไฟล์ segment (generation 0 ใช้ชื่อเดิมก่อนมีการ compact)
+        """
+        return self._storage_path("seg", model, dimensions, f"{generation}.f32" if generation else "f32")
+    
+    def _ann_path(self, model: str, dimensions: int, generation: int) -> Path:
+        """
+        พาธของไฟล์ดัชนี ANN ซึ่งเก็บหมายเลขแถวของ segment generation เดียวกัน
+        """
+        return self._storage_path("ivf", model, dimensions, f"{generation}.npz" if generation else "npz")
+    
+    @staticmethod
+    def _segment_generation(cursor: Any, model: str, dimensions: int) -> int:
+        """
+        generation ปัจจุบันของไฟล์ segment ตามฐานข้อมูล
+        """
+        cursor.execute("SELECT generation FROM segments WHERE model = ? AND dimensions = ?", (model, dimensions))
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def _get_segment(self, model: str, dimensions: int, generation: int) -> EmbeddingSegment:
+        """
+        ดึงไฟล์ segment ของโมเดลและจำนวนมิติที่ระบุ
+        
+        Args:
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติของ embedding
+            generation: generation ที่อ่านจากฐานข้อมูล (ผู้เขียนอ่านภายใน transaction ที่จองสิทธิ์เขียนไว้)
+            
+        Returns:
+            EmbeddingSegment: ไฟล์ segment
+        """
+        key = (model, dimensions)
+        with self._segments_lock:
+            segment = self._segments.get(key)
+            if segment is None or segment.generation != generation:
+                segment = EmbeddingSegment(str(self._segment_path(model, dimensions, generation)), dimensions, generation)
+                self._segments[key] = segment
+            return segment
+    
+    def _attach_segment_rows(self, model: str, dimensions: int, batch_size: int = 10000) -> None:
+        """
+        เขียน embeddings ที่ยังไม่มีแถวใน segment (ข้อมูลก่อนมี segment) ลงไฟล์ segment ทีละ batch
+        """
+        while True:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                # จองสิทธิ์เขียนก่อนเขียน segment เพื่อไม่ให้ซ้อนกับการ compact
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    """
+                    SELECT id, embedding, dtype FROM embeddings
+                    WHERE model = ? AND dimensions = ? AND segment_row IS NULL
+                    LIMIT ?
+                    """,
+                    (model, dimensions, batch_size)
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                
+                segment = self._get_segment(model, dimensions, self._segment_generation(cursor, model, dimensions))
+                start = segment.append(np.vstack([self._decode_embedding(row[1], row[2]) for row in rows]))
+                
+                cursor.executemany(
+                    "UPDATE embeddings SET segment_row = ? WHERE id = ? AND segment_row IS NULL",
+                    [(start + offset, row[0]) for offset, row in enumerate(rows)]
+                )
+                conn.commit()
+    
+    def _sync_index(self, model: str, dimensions: int) -> Optional[VectorIndex]:
+        """
+        เพิ่ม embeddings ที่ถูกเพิ่มหลังจากดัชนีโหลดล่าสุด (เช่นจาก worker อื่น) เข้าดัชนี
+        โดยอ่านเฉพาะแถวที่ id มากกว่าแถวล่าสุดที่เคยอ่าน ถ้า segment ถูก compact ไปแล้ว
+        (หมายเลขแถวเปลี่ยนทั้งหมด) จะโหลดดัชนีใหม่จาก generation ปัจจุบัน
+        
+        Returns:
+            Optional[VectorIndex]: ดัชนีที่เป็นปัจจุบัน หรือ None ถ้ายังไม่เคยโหลด
+        """
+        key = (model, dimensions)
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            ann_index = self._ann_indexes.get(key)
+        if index is None:
+            return None
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            # อ่าน generation และแถวใหม่จาก snapshot เดียวกัน
+            cursor.execute("BEGIN")
+            if self._segment_generation(cursor, model, dimensions) == index.segment.generation:
+                # JOIN กับ documents เพื่อข้าม embedding ที่เอกสารถูกลบไปแล้ว
+                cursor.execute(
+                    """
+                    SELECT e.id, e.document_id, e.segment_row
+                    FROM embeddings e
+                    JOIN documents d ON e.document_id = d.id
+                    WHERE e.model = ? AND e.dimensions = ? AND e.id > ? AND e.segment_row IS NOT NULL
+                    ORDER BY e.id
+                    """,
+                    (model, dimensions, index.last_embedding_id)
+                )
+                while True:
+                    rows = cursor.fetchmany(50000)
+                    if not rows:
+                        break
+                    document_ids = [row[1] for row in rows]
+                    segment_rows = [row[2] for row in rows]
+                    index.add_batch(document_ids, segment_rows)
+                    if ann_index is not None:
+                        ann_index.add_batch(document_ids, segment_rows)
+                    index.last_embedding_id = rows[-1][0]
+                return index
+        
+        with self._indexes_lock:
+            if self._indexes.get(key) is index:
+                del self._indexes[key]
+                self._ann_indexes.pop(key, None)
+        return self._get_index(model, dimensions)
+    
+    def _get_index(self, model: str, dimensions: int) -> VectorIndex:
+        """
+        ดึงดัชนีเวกเตอร์ของโมเดลและจำนวนมิติที่ระบุ ถ้ายังไม่มีจะสร้างจากฐานข้อมูลครั้งเดียว
+        
+        Args:
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติของ embedding
+            
+        Returns:
+            VectorIndex: ดัชนีเวกเตอร์
+        """
+        key = (model, dimensions)
+        index = self._indexes.get(key)
+        if index is not None:
+            return index
+        
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                return index
+            
+            self._attach_segment_rows(model, dimensions)
+            with self._pool.connection() as conn:
+                generation = self._segment_generation(conn.cursor(), model, dimensions)
+            index = VectorIndex(self._get_segment(model, dimensions, generation))
+            self._indexes[key] = index
+        
+        return self._sync_index(model, dimensions) or index
+    
+    def _model_dimensions(self, model: str) -> List[int]:
+        """
+        รายการจำนวนมิติของ embeddings ที่มีอยู่สำหรับโมเดลที่ระบุ
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT dimensions FROM embeddings WHERE model = ?", (model,))
+            return [row[0] for row in cursor.fetchall()]
+    
+    def _has_embeddings(self, model: str, dimensions: int) -> bool:
+        """
+        มี embeddings ของโมเดลและจำนวนมิติที่ระบุอยู่ในฐานข้อมูลหรือไม่ (ใช้ idx_embeddings_model)
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM embeddings WHERE model = ? AND dimensions = ? LIMIT 1", (model, dimensions))
+            return cursor.fetchone() is not None
+    
+    def _reconcile_ann_index(self, index: VectorIndex, ann_index: IVFIndex) -> None:
+        """
+        ปรับดัชนี ANN ให้ตรงกับดัชนีแบบ exact หลังโหลดหรือสร้างใหม่
+        เอกสารที่เพิ่มหรือลบไประหว่างนั้นจะถูกปรับทีละรายการโดยไม่ต้อง train ใหม่
+        """
+        # อ่าน ID ของดัชนี ANN ก่อน เพราะ add_document เพิ่มเข้าดัชนี exact ก่อนเสมอ
+        ann_ids = np.array(ann_index.document_ids(), dtype=np.int64)
+        document_ids, segment_rows = index.entries()
+        
+        for document_id in np.setdiff1d(ann_ids, document_ids):
+            ann_index.remove(int(document_id))
+        
+        missing = ~np.isin(document_ids, ann_ids)
+        if missing.any():
+            ann_index.add_batch(document_ids[missing], segment_rows[missing])
+    
+    def _maybe_persist_ann_index(self, key: Tuple[str, int], ann_index: IVFIndex) -> None:
+        """
+        นัดบันทึกดัชนี ANN ใน background เมื่อมีการเปลี่ยนแปลงสะสมครบ ANN_PERSIST_EVERY และห่างจากการบันทึก
+        ครั้งก่อนเกิน ANN_PERSIST_INTERVAL_SECONDS แต่ละดัชนีมีงานบันทึกที่รออยู่ได้ครั้งละหนึ่งงาน
+        """
+        if ann_index.pending_changes < ANN_PERSIST_EVERY:
+            return
+        with self._ann_persist_lock:
+            if key in self._ann_persist_pending:
+                return
+            persisted_at = self._ann_persisted_at.get(key)
+            if persisted_at is not None and time.monotonic() - persisted_at < ANN_PERSIST_INTERVAL_SECONDS:
+                return
+            self._ann_persist_pending.add(key)
+        try:
+            self._persist_executor.submit(self._persist_ann_index, key, ann_index)
+        except RuntimeError:
+            # service กำลังปิด close() จะบันทึกเอง
+            with self._ann_persist_lock:
+                self._ann_persist_pending.discard(key)
+    
+    def _persist_ann_index(self, key: Tuple[str, int], ann_index: IVFIndex) -> None:
+        """
+        บันทึกดัชนี ANN ลงไฟล์ของ generation ของมัน ถ้ายังเป็นดัชนีปัจจุบัน (ดัชนีที่ถูกแทนที่ด้วยการ compact
+        หรือ build_ann_index ไม่ถูกบันทึกทับไฟล์)
+        """
+        try:
+            with self._compact_lock:
+                with self._indexes_lock:
+                    current = self._ann_indexes.get(key) is ann_index
+                if current:
+                    ann_index.save(str(self._ann_path(*key, ann_index.segment.generation)))
+        finally:
+            with self._ann_persist_lock:
+                self._ann_persist_pending.discard(key)
+                self._ann_persisted_at[key] = time.monotonic()
+    
+    def build_ann_index(self, model: str, dimensions: Optional[int] = None, nlist: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        สร้างดัชนี ANN (IVF) ใหม่จาก embeddings ทั้งหมดของโมเดล แล้วบันทึกลงไฟล์ข้างฐานข้อมูล
+        
+        Args:
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติ ถ้าไม่ระบุจะสร้างให้ทุกจำนวนมิติที่มีในฐานข้อมูล
+            nlist: จำนวนกลุ่มของ IVF ถ้าไม่ระบุจะคำนวณจากจำนวนเอกสาร
+            
+        Returns:
+            List[Dict[str, Any]]: ข้อมูลของดัชนีที่สร้าง
+        """
+        built = []
+        for dims in ([dimensions] if dimensions else self._model_dimensions(model)):
+            index = self._get_index(model, dims)
+            document_ids, segment_rows = index.entries()
+            if document_ids.size == 0:
+                continue
+            
+            ann_index = IVFIndex.train(index.segment, segment_rows, nlist=nlist)
+            ann_index.add_batch(document_ids, segment_rows)
+            
+            key = (model, dims)
+            with self._indexes_lock:
+                self._ann_indexes[key] = ann_index
+            self._reconcile_ann_index(index, ann_index)
+            ann_index.save(str(self._ann_path(model, dims, index.segment.generation)))
+            
+            built.append({
+                "model": model,
+                "dimensions": dims,
+                "nlist": ann_index.nlist,
+                "documents": len(ann_index)
+            })
+        
+        return built
+    
+    def _get_ann_index(self, model: str, dimensions: int) -> Optional[IVFIndex]:
+        """
+        ดึงดัชนี ANN ของโมเดลและจำนวนมิติที่ระบุ โหลดจากไฟล์ถ้ายังไม่ได้โหลด
+        
+        Returns:
+            Optional[IVFIndex]: ดัชนี ANN หรือ None ถ้ายังไม่เคยสร้าง
+        """
+        key = (model, dimensions)
+        ann_index = self._ann_indexes.get(key)
+        if ann_index is not None:
+            return ann_index
+        
+        index = self._get_index(model, dimensions)
+        path = self._ann_path(model, dimensions, index.segment.generation)
+        if not path.exists():
+            return None
+        
+        with self._indexes_lock:
+            ann_index = self._ann_indexes.get(key)
+            if ann_index is not None:
+                return ann_index
+            ann_index = IVFIndex.load(index.segment, str(path))
+            self._ann_indexes[key] = ann_index
+        
+        self._reconcile_ann_index(index, ann_index)
+        return ann_index
+    
+    def _forget_document(self, key: Tuple[str, int], document_id: int) -> None:
+        """
+        ลบเอกสารออกจากดัชนีทั้งแบบ exact และ ANN ที่โหลดอยู่
+        """
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            ann_index = self._ann_indexes.get(key)
+        if index is not None:
+            index.remove(document_id)
+        if ann_index is not None:
+            ann_index.remove(document_id)
+            self._maybe_persist_ann_index(key, ann_index)
+    
+    def compact_segment(self, model: str, dimensions: int) -> Optional[Dict[str, Any]]:
+        """
+        เขียนเฉพาะเวกเตอร์ที่ยังมีเจ้าของลงไฟล์ segment ใหม่ (generation ถัดไป) แล้วลบไฟล์เดิม
+        เพื่อคืนพื้นที่ของเอกสารที่ถูกลบ หมายเลขแถวใหม่และ generation ถูกบันทึกใน transaction เดียว
+        ที่จองสิทธิ์เขียนไว้ตลอด จึงไม่มีการเพิ่มเอกสารแทรกระหว่างคัดลอก worker อื่นจะโหลดดัชนีใหม่เอง
+        เมื่อเห็นว่า generation เปลี่ยน
+        
+        Args:
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติของ embedding
             
-            results = []
-            query_embedding_np = np.array(query_embedding)
+        Returns:
+            Optional[Dict[str, Any]]: จำนวนแถวก่อนและหลัง compact หรือ None ถ้า worker อื่นเพิ่ง compact ไป
+        """
+        key = (model, dimensions)
+        # โหลดดัชนีให้เสร็จก่อนจองสิทธิ์เขียน เพราะการโหลดครั้งแรกต้องเขียนฐานข้อมูลด้วย
+        self._get_index(model, dimensions)
+        index = self._sync_index(model, dimensions)
+        ann_index = self._get_ann_index(model, dimensions)
+        
+        with self._compact_lock, self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            generation = self._segment_generation(cursor, model, dimensions)
+            if generation != index.segment.generation:
+                return None
             
-            for row in cursor.fetchall():
-                document_id, embedding_json, content, metadata_json = row
-                embedding = np.array(json.loads(embedding_json))
+            cursor.execute(
+                """
+                SELECT id, document_id, segment_row FROM embeddings
+                WHERE model = ? AND dimensions = ? AND segment_row IS NOT NULL
+                ORDER BY segment_row
+                """,
+                (model, dimensions)
+            )
+            rows = cursor.fetchall()
+            embedding_ids = np.array([row[0] for row in rows], dtype=np.int64)
+            document_ids = np.array([row[1] for row in rows], dtype=np.int64)
+            old_rows = np.array([row[2] for row in rows], dtype=np.int64)
+            new_rows = np.arange(len(rows), dtype=np.int64)
+            
+            old_segment = index.segment
+            rows_before = len(old_segment)
+            new_path = self._segment_path(model, dimensions, generation + 1)
+            new_ann_path = self._ann_path(model, dimensions, generation + 1)
+            try:
+                segment = old_segment.compact(old_rows, str(new_path))
+                new_index = VectorIndex(segment)
+                new_index.add_batch(document_ids, new_rows)
+                new_index.last_embedding_id = int(embedding_ids.max()) if rows else 0
                 
-                # คำนวณ cosine similarity
-                similarity = self._cosine_similarity(query_embedding_np, embedding)
+                # ดัชนี ANN ใช้ centroid เดิม เวกเตอร์ไม่เปลี่ยนจึงอยู่กลุ่มเดิม เปลี่ยนเพียงหมายเลขแถว
+                new_ann_index = None
+                if ann_index is not None:
+                    new_ann_index = IVFIndex(segment, ann_index.centroids, ann_index.default_nprobe)
+                    new_ann_index.add_batch(document_ids, new_rows)
+                    new_ann_index.save(str(new_ann_path))
                 
-                results.append({
-                    "document_id": document_id,
-                    "content": content,
-                    "metadata": json.loads(metadata_json) if metadata_json else None,
-                    "similarity": float(similarity)
-                })
+                cursor.executemany(
+                    "UPDATE embeddings SET segment_row = ? WHERE id = ?",
+                    zip(new_rows.tolist(), embedding_ids.tolist())
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO segments (model, dimensions, generation) VALUES (?, ?, ?)
+                    ON CONFLICT (model, dimensions) DO UPDATE SET generation = excluded.generation
+                    """,
+                    (model, dimensions, segment.generation)
+                )
+                conn.commit()
+            except BaseException:
+                for path in (new_path, new_ann_path):
+                    path.unlink(missing_ok=True)
+                raise
+        
+        with self._segments_lock:
+            self._segments[key] = segment
+        with self._indexes_lock:
+            self._indexes[key] = new_index
+            if new_ann_index is not None:
+                self._ann_indexes[key] = new_ann_index
+            else:
+                self._ann_indexes.pop(key, None)
+        
+        # การค้นหาที่ค้างอยู่ยังอ่านไฟล์เดิมผ่าน memmap ได้ (Windows ลบไฟล์ที่เปิดอยู่ไม่ได้ จะค้างไว้แทน)
+        for path in (Path(old_segment.path), self._ann_path(model, dimensions, generation)):
+            try:
+                path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        
+        return {
+            "model": model,
+            "dimensions": dimensions,
+            "generation": segment.generation,
+            "rows_before": rows_before,
+            "rows_after": len(rows)
+        }
+    
+    def _maybe_compact_segment(self, key: Tuple[str, int]) -> None:
+        """
+        compact segment เมื่อสัดส่วนแถวที่ไม่มีเจ้าของเกิน SEGMENT_COMPACT_DEAD_RATIO
+        """
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+        if index is None or self._compact_lock.locked():
+            return
+        rows = len(index.segment)
+        if rows >= SEGMENT_COMPACT_MIN_ROWS and len(index) <= rows * (1 - SEGMENT_COMPACT_DEAD_RATIO):
+            self.compact_segment(*key)
+    
+    @staticmethod
+    def _metadata_expression(field: str, table: str = "d.") -> str:
+        """
+        นิพจน์ SQL สำหรับอ่านค่า key ใน metadata ต้องตรงกับนิพจน์ของ index จึงจะใช้ index ได้
+        """
+        if not METADATA_FIELD_PATTERN.match(field):
+            raise ValueError(f"Invalid metadata field name: {field}")
+        return f"json_extract({table}metadata, '$.{field}')"
+    
+    def create_metadata_index(self, field: str) -> None:
+        """
+        สร้าง expression index บน key ของ metadata เพื่อให้การกรองไม่ต้องสแกนทั้งตาราง
+        
+        เป็นงานดูแลระบบ: การสร้าง index อ่านทั้งตารางและถือสิทธิ์เขียนจนเสร็จ จึงเรียกตอนเริ่มต้น
+        (metadata_index_fields) หรือตอนบำรุงรักษาเท่านั้น การค้นหาและการลบตามเงื่อนไขไม่สร้าง index เอง
+        
+        Args:
+            field: ชื่อ key ใน metadata
+        """
+        if field in self._metadata_indexes:
+            return
+        
+        expression = self._metadata_expression(field, table="")
+        with self._pool.connection() as conn:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_documents_metadata_{field} ON documents ({expression})")
+            conn.commit()
+        self._metadata_indexes.add(field)
+    
+    def _metadata_clauses(self, filters: List[Dict[str, Any]]) -> Optional[Tuple[List[str], List[Any]]]:
+        """
+        แปลงเงื่อนไข metadata เป็นเงื่อนไข SQL บนตาราง documents (alias d) key ที่มี index
+        (create_metadata_index) จะใช้ index ส่วน key อื่น SQLite จะสแกนตาราง
+        
+        Args:
+            filters: รายการเงื่อนไข {"field", "op", "value"}
             
-            # เรียงลำดับตามความคล้ายคลึงจากมากไปน้อย
-            results.sort(key=lambda x: x["similarity"], reverse=True)
+        Returns:
+            Optional[Tuple[List[str], List[Any]]]: เงื่อนไข SQL และพารามิเตอร์ หรือ None ถ้าไม่มีเอกสารใดผ่านได้
+        """
+        clauses, params = [], []
+        for condition in filters:
+            expression = self._metadata_expression(condition["field"])
             
-            return results[:top_k]
+            if condition["op"] == "in":
+                values = list(condition["value"])
+                if not values:
+                    return None
+                clauses.append(f"{expression} IN ({','.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{expression} {METADATA_OPERATORS[condition['op']]} ?")
+                params.append(condition["value"])
+        
+        return clauses, params
     
-    def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
+    def _filter_rows(self, model: str, dimensions: int, filters: List[Dict[str, Any]]) -> np.ndarray:
         """
-        คำนวณ cosine similarity ระหว่างสองเวกเตอร์
+        หาแถวใน segment ของเอกสารที่ผ่านเงื่อนไข metadata ทั้งหมด โดยให้ SQLite ประเมินผ่าน index
         
         Args:
-            a: เวกเตอร์แรก
-            b: เวกเตอร์ที่สอง
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติของ embedding
+            filters: รายการเงื่อนไข {"field", "op", "value"}
             
         Returns:
-            float: ค่า cosine similarity
+            np.ndarray: หมายเลขแถวใน segment
         """
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+        metadata_clauses = self._metadata_clauses(filters)
+        if metadata_clauses is None:
+            return np.empty(0, dtype=np.int64)
+        clauses, params = metadata_clauses[0], [model, dimensions] + metadata_clauses[1]
+        
+        # CROSS JOIN บังคับให้เริ่มจาก documents ผ่าน metadata index แล้วจึงหา embedding ของแต่ละเอกสาร
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT e.segment_row
+                FROM documents d
+                CROSS JOIN embeddings e ON e.document_id = d.id
+                WHERE e.model = ? AND e.dimensions = ? AND e.segment_row IS NOT NULL
+                AND {' AND '.join(clauses)}
+                """,
+                params
+            )
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+    
+    def _selective_terms(self, conn: Any, terms: List[List[str]]) -> List[List[str]]:
+        """
+        เลือกพจน์ของคำค้นหาจากพจน์ที่พบในเอกสารน้อยที่สุดก่อน จนจำนวนเอกสารรวมเกิน LEXICAL_MATCH_BUDGET
+        
+        FTS5 ต้องคำนวณ bm25 ให้ทุกเอกสารที่ตรงกับพจน์ใดพจน์หนึ่ง พจน์ที่พบเกือบทุกเอกสารทำให้ต้องให้คะแนนทั้งตาราง
+        แต่แทบไม่ช่วยจัดอันดับ (idf ต่ำ) จำนวนเอกสารของ phrase ประมาณจาก token ที่พบน้อยที่สุดใน phrase นั้น
+        
+        Args:
+            conn: การเชื่อมต่อฐานข้อมูล
+            terms: พจน์จาก query_terms
+            
+        Returns:
+            List[List[str]]: พจน์ที่ใช้ค้นหา (ไม่มีพจน์ที่ไม่พบในเอกสารใดเลย)
+        """
+        corpus = conn.execute("SELECT count(*) FROM documents_fts_docsize").fetchone()[0]
+        with self._term_documents_lock:
+            if len(self._term_documents) > TERM_CACHE_SIZE or abs(corpus - self._term_documents_corpus) > self._term_documents_corpus * 0.1:
+                self._term_documents.clear()
+                self._term_documents_corpus = corpus
+            frequencies = {token: self._term_documents.get(token) for term in terms for token in term}
+        
+        # fts5vocab นับจาก posting list ของ token จึงแคชผลไว้ (ค่าที่ไม่เป็นปัจจุบันเล็กน้อยมีผลแค่กับการเลือกพจน์)
+        missing = [token for token, count in frequencies.items() if count is None]
+        if missing:
+            found = dict(conn.execute(
+                f"SELECT term, doc FROM documents_fts_vocab WHERE term IN ({','.join('?' * len(missing))})",
+                missing
+            ).fetchall())
+            frequencies.update({token: found.get(token, 0) for token in missing})
+            # ไม่แคช token ที่ยังไม่พบ เพราะเอกสารที่เพิ่มภายหลัง (เช่นรหัสสินค้าใหม่) จะค้นไม่เจอจนกว่าแคชจะถูกล้าง
+            with self._term_documents_lock:
+                self._term_documents.update(found)
+        
+        selected, total = [], 0
+        for count, term in sorted(((min(frequencies[token] for token in term), term) for term in terms), key=lambda item: item[0]):
+            if count == 0:
+                continue
+            if selected and total + count > LEXICAL_MATCH_BUDGET:
+                break
+            selected.append(term)
+            total += count
+        return selected
+    
+    def _lexical_candidates(
+        self,
+        query_text: str,
+        model: str,
+        dimensions: int,
+        limit: int,
+        filters: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        หาเอกสารที่ตรงกับคำค้นหาจากดัชนี FTS5 เรียงตาม bm25 เฉพาะเอกสารที่มี embedding ของ (model, dimensions)
+        
+        Args:
+            query_text: ข้อความคำค้นหา
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            dimensions: จำนวนมิติของ embedding
+            limit: จำนวนผู้สมัครสูงสุด
+            filters: เงื่อนไขกรอง metadata {"field", "op", "value"}
+            
+        Returns:
+            List[Tuple[int, int]]: รายการ (document_id, segment_row) จากตรงที่สุดไปน้อยที่สุด
+        """
+        terms = query_terms(query_text) if self.lexical_index and query_text else []
+        if not terms:
+            return []
+        
+        clauses, params = [], []
+        if filters:
+            metadata_clauses = self._metadata_clauses(filters)
+            if metadata_clauses is None:
+                return []
+            clauses, params = metadata_clauses
+        
+        with self._pool.connection() as conn:
+            match = match_expression(self._selective_terms(conn, terms))
+            if match is None:
+                return []
+            params = [match, model, dimensions] + params
+            
+            # CROSS JOIN บังคับให้เริ่มจากผลของ FTS5 แล้วจึงหา embedding และ metadata ของแต่ละเอกสาร
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT documents_fts.rowid, e.segment_row
+                FROM documents_fts
+                CROSS JOIN embeddings e ON e.document_id = documents_fts.rowid
+                {'CROSS JOIN documents d ON d.id = documents_fts.rowid' if clauses else ''}
+                WHERE documents_fts MATCH ? AND e.model = ? AND e.dimensions = ? AND e.segment_row IS NOT NULL
+                {''.join(' AND ' + clause for clause in clauses)}
+                ORDER BY bm25(documents_fts)
+                LIMIT ?
+                """,
+                params + [limit]
+            )
+            return cursor.fetchall()
+    
+    def search_similar(
+        self,
+        query_embedding: List[float],
+        model: str,
+        top_k: int = 5,
+        mode: str = "exact",
+        nprobe: Optional[int] = None,
+        filters: Optional[List[Dict[str, Any]]] = None,
+        query_text: Optional[str] = None,
+        candidates: int = DEFAULT_SEARCH_CANDIDATES
+    ) -> List[Dict[str, Any]]:
+        """
+        ค้นหาเอกสารที่มี embedding ใกล้เคียงกับ query_embedding
+        
+        Args:
+            query_embedding: embedding vector ของคำค้นหา
+            model: ชื่อโมเดลที่ใช้สร้าง embedding
+            top_k: จำนวนผลลัพธ์ที่ต้องการ
+            mode: "exact" คำนวณทุกเอกสาร, "ann" ใช้ดัชนี IVF (ถ้ายังไม่ได้สร้างจะใช้ exact แทน),
+                "hybrid" รวมอันดับจาก FTS5 และจากเวกเตอร์ด้วย reciprocal rank fusion หรือ
+                "lexical" คำนวณ similarity เฉพาะเอกสารที่ FTS5 พบ (ถ้าไม่พบเลยจะใช้ exact แทน)
+            nprobe: จำนวนกลุ่มที่ค้นหาในโหมด ann (และฝั่งเวกเตอร์ของ hybrid ถ้าสร้างดัชนี IVF ไว้)
+            filters: เงื่อนไขกรอง metadata {"field", "op", "value"} ถ้าระบุจะคำนวณแบบ exact
+                เฉพาะเอกสารที่ผ่านเงื่อนไข
+            query_text: ข้อความคำค้นหาสำหรับ FTS5 ในโหมด hybrid และ lexical
+            candidates: จำนวนผู้สมัครจากแต่ละฝั่งในโหมด hybrid และจาก FTS5 ในโหมด lexical
+            
+        Returns:
+            List[Dict[str, Any]]: รายการเอกสารที่มี embedding ใกล้เคียงที่สุด ในโหมด hybrid มี "score"
+                เป็นคะแนน fusion และเรียงตามคะแนนนั้น
+        """
+        key = (model, len(query_embedding))
+        # โมเดลหรือจำนวนมิติที่ไม่มีเอกสาร ไม่ต้องสร้างไฟล์ segment หรือจองสิทธิ์เขียนบนเส้นทางการค้นหา
+        if key not in self._indexes and not self._has_embeddings(*key):
+            return []
+        self._get_index(*key)
+        index = self._sync_index(*key)
+        
+        rows = self._filter_rows(*key, filters) if filters else None
+        ann_index = self._get_ann_index(*key) if mode in ("ann", "hybrid") and rows is None else None
+        lexical = self._lexical_candidates(query_text, *key, candidates, filters) if mode in ("hybrid", "lexical") else []
+        if mode == "lexical" and lexical:
+            # เอกสารที่ตรงกับคำค้นหาแบบเจาะจง (รหัสสินค้า ชื่อเฉพาะ) มีไม่มาก จึงไม่ต้องคำนวณทุกแถว
+            rows = np.fromiter((segment_row for _, segment_row in lexical), dtype=np.int64)
+        
+        def search() -> Tuple[List[Tuple[int, float]], Optional[Dict[int, float]]]:
+            started = time.perf_counter()
+            scores = None
+            if mode == "hybrid":
+                if ann_index is not None:
+                    vector_hits = ann_index.search(query_embedding, candidates, nprobe)
+                else:
+                    vector_hits = index.search(query_embedding, candidates, rows)
+                fused = reciprocal_rank_fusion([
+                    [document_id for document_id, _ in vector_hits],
+                    [document_id for document_id, _ in lexical]
+                ])[:top_k]
+                scores = dict(fused)
+                
+                # เอกสารที่มาจาก FTS5 อย่างเดียวยังไม่มี similarity ให้คำนวณเฉพาะแถวของเอกสารเหล่านั้น
+                similarities = dict(vector_hits)
+                missing_rows = [
+                    segment_row for document_id, segment_row in lexical
+                    if document_id in scores and document_id not in similarities
+                ]
+                if missing_rows:
+                    similarities.update(index.search(query_embedding, len(missing_rows), missing_rows))
+                hits = [(document_id, similarities[document_id]) for document_id, _ in fused if document_id in similarities]
+                mode_label = "hybrid"
+            elif ann_index is not None:
+                hits = ann_index.search(query_embedding, top_k, nprobe)
+                mode_label = "ann"
+            else:
+                # คำนวณ cosine similarity จาก segment ผ่าน memmap (เฉพาะแถวที่ผ่านเงื่อนไขถ้ามีการกรอง)
+                hits = index.search(query_embedding, top_k, rows)
+                mode_label = "lexical" if mode == "lexical" and lexical else "filtered" if rows is not None else "exact"
+            if metrics is not None:
+                metrics.search_scoring_duration.observe((mode_label,), time.perf_counter() - started)
+            return hits, scores
+        
+        hits, scores = search()
+        results = self._fetch_results(hits, scores)
+        
+        # เอกสารที่ถูกลบโดย worker อื่นจะไม่พบในตาราง documents ให้ลบออกจากดัชนีแล้วค้นหาใหม่
+        if len(results) < len(hits):
+            found = {result["document_id"] for result in results}
+            for document_id, _ in hits:
+                if document_id not in found:
+                    self._forget_document(key, document_id)
+            results = self._fetch_results(*search())
+        
+        return results
+    
+    def _fetch_results(self, hits: List[Tuple[int, float]], scores: Optional[Dict[int, float]] = None) -> List[Dict[str, Any]]:
+        """
+        ดึงเนื้อหาและ metadata ของเอกสารที่ค้นพบ โดยคงลำดับของ hits
+        
+        Args:
+            hits: รายการ (document_id, similarity)
+            scores: คะแนน fusion ของแต่ละเอกสารในโหมด hybrid
+            
+        Returns:
+            List[Dict[str, Any]]: รายการผลลัพธ์การค้นหา
+        """
+        if not hits:
+            return []
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            placeholders = ",".join("?" * len(hits))
+            cursor.execute(
+                f"SELECT id, content, metadata FROM documents WHERE id IN ({placeholders})",
+                [document_id for document_id, _ in hits]
+            )
+            documents = {row[0]: row for row in cursor.fetchall()}
+        
+        results = []
+        for document_id, similarity in hits:
+            row = documents.get(document_id)
+            if row is None:
+                continue
+            _, content, metadata_json = row
+            results.append({
+                "document_id": document_id,
+                "content": content,
+                "metadata": json.loads(metadata_json) if metadata_json else None,
+                "similarity": similarity
+            })
+            if scores is not None:
+                results[-1]["score"] = scores[document_id]
+        
+        return results
     
     def get_document(self, document_id: int) -> Optional[Dict[str, Any]]:
         """
@@ -161,12 +1265,12 @@ class SQLiteService:
         Returns:
             Optional[Dict[str, Any]]: ข้อมูลเอกสาร หรือ None ถ้าไม่พบ
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
             cursor.execute(
                 """
-                SELECT d.id, d.content, d.metadata, e.model, e.embedding
+                SELECT d.id, d.content, d.metadata, e.model, e.embedding, e.dtype
                 FROM documents d
                 LEFT JOIN embeddings e ON d.id = e.document_id
                 WHERE d.id = ?
@@ -178,14 +1282,14 @@ class SQLiteService:
             if not row:
                 return None
             
-            document_id, content, metadata_json, model, embedding_json = row
+            document_id, content, metadata_json, model, embedding_value, dtype = row
             
             return {
                 "document_id": document_id,
                 "content": content,
                 "metadata": json.loads(metadata_json) if metadata_json else None,
                 "model": model,
-                "embedding": json.loads(embedding_json) if embedding_json else None
+                "embedding": self._decode_embedding(embedding_value, dtype).tolist() if embedding_value is not None else None
             }
     
     def delete_document(self, document_id: int) -> bool:
@@ -198,9 +1302,75 @@ class SQLiteService:
         Returns:
             bool: True ถ้าลบสำเร็จ, False ถ้าไม่พบเอกสาร
         """
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
             
+            cursor.execute("SELECT model, dimensions FROM embeddings WHERE document_id = ?", (document_id,))
+            keys = cursor.fetchall()
+            
             cursor.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+            deleted = cursor.rowcount > 0
+            
+            # foreign key ของ SQLite ปิดไว้โดยค่าเริ่มต้น จึงต้องลบ embeddings เองด้วย
+            cursor.execute("DELETE FROM embeddings WHERE document_id = ?", (document_id,))
+            if self.lexical_index:
+                cursor.execute("DELETE FROM documents_fts WHERE rowid = ?", (document_id,))
+            conn.commit()
+        
+        for key in keys:
+            self._forget_document(tuple(key), document_id)
+            self._maybe_compact_segment(tuple(key))
+        
+        return deleted
+    
+    def delete_documents(self, filters: List[Dict[str, Any]]) -> int:
+        """
+        ลบเอกสารทั้งหมดที่ผ่านเงื่อนไข metadata (เช่นเอกสารที่หมดอายุแล้ว)
+        
+        Args:
+            filters: รายการเงื่อนไข {"field", "op", "value"} อย่างน้อยหนึ่งเงื่อนไข
+            
+        Returns:
+            int: จำนวนเอกสารที่ลบ
+        """
+        if not filters:
+            raise ValueError("At least one filter is required")
+        
+        metadata_clauses = self._metadata_clauses(filters)
+        if metadata_clauses is None:
+            return 0
+        clauses, params = metadata_clauses
+        
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT d.id, e.model, e.dimensions
+                FROM documents d
+                LEFT JOIN embeddings e ON e.document_id = d.id
+                WHERE {' AND '.join(clauses)}
+                """,
+                params
+            )
+            rows = cursor.fetchall()
+            document_ids = sorted({row[0] for row in rows})
             
-            return cursor.rowcount > 0
+            for start in range(0, len(document_ids), 500):
+                batch = document_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor.execute(f"DELETE FROM documents WHERE id IN ({placeholders})", batch)
+                cursor.execute(f"DELETE FROM embeddings WHERE document_id IN ({placeholders})", batch)
+                if self.lexical_index:
+                    cursor.execute(f"DELETE FROM documents_fts WHERE rowid IN ({placeholders})", batch)
+            conn.commit()
+        
+        keys = set()
+        for document_id, model, dimensions in rows:
+            if model is not None:
+                self._forget_document((model, dimensions), document_id)
+                keys.add((model, dimensions))
+        for key in keys:
+            self._maybe_compact_segment(key)
+        
+        return len(document_ids)
+
@@ -0,0 +1,181 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
+from pydantic import BaseModel
+from schema.openai.chat_models import ChatStreamResponse
+
+# orjson เร็วกว่า json มาก ถ้าไม่ได้ติดตั้ง (pip install orjson) จะใช้ json แทน
+try:
+    import orjson
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value)
+except ImportError:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(value: Any) -> bytes:
+        return _encoder.encode(value).encode("utf-8")
+
+DATA_PREFIX = b"data: "
+EVENT_END = b"\n\n"
+DONE_EVENT = b"data: [DONE]\n\n"
+# บรรทัดที่ขึ้นต้นด้วย : เป็น comment ของ SSE ซึ่ง client จะข้ามไป ใช้กันไม่ให้ proxy ปิดการเชื่อมต่อที่เงียบนาน
+KEEPALIVE_EVENT = b": keep-alive\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # สำหรับ Nginx
+}
+
+_CHAT_PREFIX = b'data: {"delta":'
+_chat_suffixes: Dict[Tuple[Optional[str], int], bytes] = {}
+
+
+def encode_chat_chunk(chunk: ChatStreamResponse) -> bytes:
+    """
+    เข้ารหัส ChatStreamResponse เป็น event ของ SSE
+
+    ส่วนหัวและส่วนท้ายของ event ถูกเข้ารหัสไว้ล่วงหน้า (ส่วนท้ายแยกตาม finish_reason และ index)
+    จึงเข้ารหัสเฉพาะข้อความ delta ในแต่ละ event ได้ JSON เดียวกับ chunk.model_dump()
+
+    Returns:
+        bytes: event ของ SSE หรือ b"" ถ้า chunk ไม่มีทั้ง delta และ finish_reason
+    """
+    if not chunk.delta and not chunk.finish_reason:
+        return b""
+    key = (chunk.finish_reason, chunk.index)
+    suffix = _chat_suffixes.get(key)
+    if suffix is None:
+        suffix = b',"finish_reason":' + dumps(chunk.finish_reason) + b',"index":' + dumps(chunk.index) + b"}" + EVENT_END
+        _chat_suffixes[key] = suffix
+    return _CHAT_PREFIX + dumps(chunk.delta) + suffix
+
+
+def encode_event(event: Any) -> bytes:
+    """
+    เข้ารหัส event ทั่วไปเป็น event ของ SSE (Pydantic model ไม่รวมค่า None, ค่าอื่นเข้ารหัสเป็น JSON)
+    """
+    if isinstance(event, BaseModel):
+        return DATA_PREFIX + event.model_dump_json(exclude_none=True).encode("utf-8") + EVENT_END
+    return DATA_PREFIX + dumps(event) + EVENT_END
+
+
+class SSEResponse(StreamingResponse):
+    """
+    StreamingResponse ที่ฟัง http.disconnect ตลอดการส่ง ไม่ว่าเซิร์ฟเวอร์จะรองรับ ASGI spec เวอร์ชันใด
+
+    StreamingResponse ของ Starlette ฟังการตัดการเชื่อมต่อเฉพาะ ASGI spec ต่ำกว่า 2.4 ส่วน 2.4 ขึ้นไป
+    จะรู้ก็ต่อเมื่อเขียนข้อมูลไม่สำเร็จ ซึ่งอาจนานมากถ้า upstream ยังไม่ส่งข้อความส่วนถัดไป
+    ที่นี่ให้ Starlette ใช้ทางของ spec ต่ำกว่า 2.4 เสมอ (task group ที่ฟัง http.disconnect คู่กับการส่ง)
+    จึงยกเลิกการอ่าน body_iterator ทันทีที่ client ตัดการเชื่อมต่อ การยกเลิกนั้นส่งต่อไปจนถึง
+    stream ของ upstream (ดู OpenAIService.chat_completion_stream) ส่วนการเขียนที่ล้มเหลวด้วย OSError
+    ยังแปลงเป็น ClientDisconnect เหมือนทางของ spec 2.4
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            scope = {**scope, "asgi": {**scope.get("asgi", {}), "spec_version": "2.3"}}
+        try:
+            await super().__call__(scope, receive, send)
+        except OSError:
+            raise ClientDisconnect()
+        finally:
+            # ถ้าการเขียนล้มเหลว Starlette ไม่ได้ปิด body_iterator ซึ่งจะค้างอยู่จนถูก garbage collect
+            # จึงปิดเองเพื่อให้ stream ของ upstream ถูกปิดทันที (ถ้าอ่านจบหรือถูกยกเลิกไปแล้วจะไม่มีผล)
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+class SSEWriter:
+    """
+    แปลง async iterator ของ event เป็น bytes ของ Server-Sent Events
+
+    source ถูกอ่านใน task แยก event ที่เข้ารหัสแล้วซึ่งสะสมไว้ระหว่างที่ client ยังไม่ได้อ่าน
+    (เช่นหลาย event ในรอบเดียวกันของ event loop) จะถูกรวมเป็น bytes ก้อนเดียว ถ้าไม่มี event
+    นานประมาณ keepalive_seconds จะส่ง comment keep-alive และปิดท้ายด้วย data: [DONE]
+    """
+
+    def __init__(self, encode: Callable[[Any], bytes] = encode_event, keepalive_seconds: float = 15.0):
+        """
+        สร้าง SSEWriter
+
+        Args:
+            encode: ฟังก์ชันเข้ารหัส event หนึ่งรายการเป็น bytes (b"" คือข้าม event นั้น)
+            keepalive_seconds: ระยะเวลาที่ไม่มี event ก่อนส่ง comment keep-alive (วินาที)
+        """
+        self.encode = encode
+        self.keepalive_seconds = keepalive_seconds
+
+    async def stream(self, events: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """
+        อ่าน event จาก events และคืน bytes ที่พร้อมส่งให้ client
+
+        Args:
+            events: event ที่ต้องการส่ง
+
+        Yields:
+            bytes: event ของ SSE หนึ่งรายการหรือมากกว่า
+        """
+        loop = asyncio.get_running_loop()
+        pending: List[bytes] = []
+        ready = asyncio.Event()
+        finished = False
+        error: Optional[Exception] = None
+        last_sent = loop.time()
+
+        async def pump():
+            nonlocal finished, error
+            try:
+                async for event in events:
+                    data = self.encode(event)
+                    if data:
+                        pending.append(data)
+                        ready.set()
+            except Exception as e:
+                error = e
+            finally:
+                finished = True
+                ready.set()
+
+        def keepalive_tick():
+            # timer เดียวต่อ stream ปลุกผู้อ่านเป็นระยะแทนการตั้ง timeout ทุกครั้งที่รอ event
+            nonlocal timer
+            ready.set()
+            timer = loop.call_later(self.keepalive_seconds, keepalive_tick)
+
+        reader = asyncio.ensure_future(pump())
+        timer = loop.call_later(self.keepalive_seconds, keepalive_tick)
+        try:
+            while True:
+                if not pending and not finished:
+                    await ready.wait()
+                ready.clear()
+
+                if pending:
+                    data = pending[0] if len(pending) == 1 else b"".join(pending)
+                    pending.clear()
+                    last_sent = loop.time()
+                    yield data
+                elif finished:
+                    break
+                elif loop.time() - last_sent >= self.keepalive_seconds:
+                    last_sent = loop.time()
+                    yield KEEPALIVE_EVENT
+
+            if error is not None:
+                raise error
+            yield DONE_EVENT
+        finally:
+            timer.cancel()
+            reader.cancel()
+
+    def response(self, events: AsyncIterator[Any]) -> SSEResponse:
+        """
+        สร้าง SSEResponse แบบ text/event-stream จาก events ซึ่งหยุดอ่าน events ทันทีที่ client ตัดการเชื่อมต่อ
+        """
+        return SSEResponse(self.stream(events), media_type="text/event-stream", headers=SSE_HEADERS)
@@ -0,0 +1,249 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# สระหน้า: เริ่มพยางค์ใหม่เสมอ จึงตัดก่อนตัวอักษรเหล่านี้ได้
+THAI_LEADING_VOWELS = frozenset("เแโใไ")
+# ตัวอักษรที่จบพยางค์: สระอะ ไม้ยมก ไปยาลน้อย และทัณฑฆาต
+THAI_SYLLABLE_ENDINGS = frozenset("ะๆฯ์")
+
+
+def _is_thai(char: str) -> bool:
+    return "฀" <= char <= "๿"
+
+
+class ChunkPolicy:
+    """
+    กฎที่ตัดสินว่าข้อความที่พักไว้ควรถูกส่งออกเมื่อใด
+
+    แต่ละกฎดูเฉพาะข้อความส่วนใหม่ ส่วนก่อนหน้า และจำนวนตัวอักษรที่พักไว้ ไม่สแกนบัฟเฟอร์ทั้งหมด
+    งานต่อ token จึงคงที่ไม่ว่าจะพักข้อความไว้มากเท่าใด
+    """
+
+    def boundary_before(self, piece: str, previous: str) -> bool:
+        """
+        True ถ้าควรส่งข้อความที่พักไว้ (ซึ่งลงท้ายด้วย previous) ก่อนเพิ่ม piece
+        """
+        return False
+
+    def boundary_after(self, piece: str, held_chars: int) -> bool:
+        """
+        True ถ้าควรส่งข้อความที่พักไว้ (รวม piece แล้ว ยาว held_chars ตัวอักษร) ทันที
+        """
+        return False
+
+
+class SizePolicy(ChunkPolicy):
+    """
+    ส่งเมื่อข้อความที่พักไว้ยาวถึง max_chars ตัวอักษร
+    """
+
+    def __init__(self, max_chars: int = 10):
+        self.max_chars = max_chars
+
+    def boundary_after(self, piece: str, held_chars: int) -> bool:
+        return held_chars >= self.max_chars
+
+
+class PunctuationPolicy(ChunkPolicy):
+    """
+    ส่งเมื่อข้อความส่วนใหม่มีเครื่องหมายวรรคตอนหรือขึ้นบรรทัดใหม่
+    """
+
+    def __init__(self, marks: Iterable[str] = (".", ",", "!", "?", "\n")):
+        self.marks = frozenset(marks)
+
+    def boundary_after(self, piece: str, held_chars: int) -> bool:
+        return not self.marks.isdisjoint(piece)
+
+
+class WhitespacePolicy(ChunkPolicy):
+    """
+    ส่งเมื่อข้อความส่วนใหม่มีช่องว่าง (จบคำในภาษาที่เว้นวรรคระหว่างคำ)
+    """
+
+    def boundary_after(self, piece: str, held_chars: int) -> bool:
+        return " " in piece
+
+
+class ThaiBoundaryPolicy(ChunkPolicy):
+    """
+    ตัดข้อความภาษาไทยซึ่งไม่มีช่องว่างระหว่างคำ ที่ขอบพยางค์ที่รู้แน่นอนโดยไม่ต้องใช้พจนานุกรม
+
+    ตัดก่อนสระหน้า (เ แ โ ใ ไ) ตัดเมื่อข้อความเปลี่ยนจากอักษรไทยเป็นอักษรอื่น และตัดหลัง
+    ตัวอักษรที่จบพยางค์ (ะ ๆ ฯ ์) จึงไม่แยกสระบน/ล่างหรือวรรณยุกต์ออกจากพยัญชนะของมัน
+    """
+
+    def boundary_before(self, piece: str, previous: str) -> bool:
+        first = piece[0]
+        if first in THAI_LEADING_VOWELS:
+            return True
+        return _is_thai(previous[-1]) and not _is_thai(first)
+
+    def boundary_after(self, piece: str, held_chars: int) -> bool:
+        return piece[-1] in THAI_SYLLABLE_ENDINGS
+
+
+# กฎที่เลือกได้ด้วยชื่อใน STREAM_CHUNK_POLICY เพิ่มกฎใหม่ได้โดยเพิ่มรายการใน dict นี้
+CHUNK_POLICIES: Dict[str, Callable[..., ChunkPolicy]] = {
+    "size": lambda max_chars=10: SizePolicy(max_chars),
+    "punctuation": lambda **_: PunctuationPolicy(),
+    "whitespace": lambda **_: WhitespacePolicy(),
+    "thai": lambda **_: ThaiBoundaryPolicy(),
+}
+
+
+class StreamChunker:
+    """
+    พักข้อความส่วนย่อยจาก stream และรวมเป็นส่วนที่ใหญ่ขึ้นตามกฎที่กำหนด
+
+    ข้อความที่พักไว้จะถูกส่งเมื่อกฎใดกฎหนึ่งตัดสินว่าถึงขอบ หรือเมื่อพักไว้นานครบ max_hold_ms
+    นับจากส่วนแรกที่พักไว้ (ดู rechunk) ถ้าไม่มีกฎเลยทุกส่วนจะถูกส่งทันที
+    """
+
+    def __init__(
+        self,
+        policies: Sequence[ChunkPolicy],
+        max_hold_ms: float = 50.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        สร้าง StreamChunker
+
+        Args:
+            policies: กฎที่ใช้ตัดสินขอบของข้อความ
+            max_hold_ms: เวลาพักข้อความสูงสุดก่อนส่งออก (มิลลิวินาที)
+            clock: ฟังก์ชันคืนเวลาปัจจุบัน (วินาที)
+        """
+        self.policies = list(policies)
+        self.max_hold = max_hold_ms / 1000
+        self.clock = clock
+        self.deadline: Optional[float] = None
+        self._held: List[str] = []
+        self._held_chars = 0
+
+    def feed(self, piece: str) -> List[str]:
+        """
+        เพิ่มข้อความส่วนใหม่
+
+        Args:
+            piece: ข้อความส่วนใหม่จาก stream
+
+        Returns:
+            List[str]: ข้อความที่พร้อมส่งออก (0-2 ส่วน)
+        """
+        if not piece:
+            return []
+        if not self.policies:
+            return [piece]
+
+        ready = []
+        if self._held and any(policy.boundary_before(piece, self._held[-1]) for policy in self.policies):
+            ready.append(self.flush())
+
+        if not self._held:
+            self.deadline = self.clock() + self.max_hold
+        self._held.append(piece)
+        self._held_chars += len(piece)
+
+        if any(policy.boundary_after(piece, self._held_chars) for policy in self.policies):
+            ready.append(self.flush())
+        return ready
+
+    def flush(self) -> str:
+        """
+        คืนข้อความทั้งหมดที่พักไว้และล้างบัฟเฟอร์
+        """
+        text = "".join(self._held)
+        self._held.clear()
+        self._held_chars = 0
+        self.deadline = None
+        return text
+
+
+def make_chunker(policy: str, max_chars: int = 10, max_hold_ms: float = 50.0) -> StreamChunker:
+    """
+    สร้าง StreamChunker จากรายชื่อกฎคั่นด้วยจุลภาค เช่น "size,punctuation,whitespace,thai"
+
+    Args:
+        policy: ชื่อกฎใน CHUNK_POLICIES คั่นด้วยจุลภาค ("none" หรือค่าว่างคือส่งทุกส่วนทันที)
+        max_chars: ความยาวสูงสุดของข้อความที่พักไว้สำหรับกฎ size
+        max_hold_ms: เวลาพักข้อความสูงสุด (มิลลิวินาที)
+
+    Returns:
+        StreamChunker: chunker ใหม่ (ใช้ได้กับ stream เดียว)
+
+    Raises:
+        ValueError: ถ้าไม่รู้จักชื่อกฎ
+    """
+    names = [name.strip() for name in policy.split(",") if name.strip() and name.strip() != "none"]
+    unknown = [name for name in names if name not in CHUNK_POLICIES]
+    if unknown:
+        raise ValueError(f"Unknown stream chunk policy: {', '.join(unknown)}")
+    policies = [CHUNK_POLICIES[name](max_chars=max_chars) for name in names]
+    return StreamChunker(policies, max_hold_ms=max_hold_ms)
+
+
+async def rechunk(source: AsyncIterator[str], chunker: StreamChunker) -> AsyncIterator[str]:
+    """
+    อ่านข้อความจาก source และส่งออกเป็นส่วนตาม chunker
+
+    source ถูกอ่านใน task แยกผ่านคิวขนาดหนึ่งส่วน ขณะที่มีข้อความพักไว้จะรอส่วนถัดไปไม่เกิน deadline
+    ของ chunker ถ้าครบกำหนดก่อนจะส่งข้อความที่พักไว้ออกไปเลยแล้วรอต่อ ข้อความจึงไม่ค้างนานเกิน
+    max_hold_ms แม้ upstream จะช้า
+
+    Args:
+        source: ข้อความส่วนย่อยจาก upstream
+        chunker: chunker ที่ใช้รวมข้อความ
+
+    Yields:
+        str: ข้อความที่รวมแล้ว
+    """
+    if not chunker.policies:
+        # ไม่มีกฎจึงไม่มีการพักข้อความ ส่งต่อทุกส่วนโดยไม่ต้องผ่านคิว
+        async for piece in source:
+            if piece:
+                yield piece
+        return
+
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[Tuple[bool, Any]]" = asyncio.Queue(maxsize=1)
+
+    async def pump():
+        # (True, ข้อความ) สำหรับแต่ละส่วน และ (False, ข้อผิดพลาดหรือ None) เมื่อ source จบ
+        try:
+            async for piece in source:
+                await queue.put((True, piece))
+        except Exception as e:
+            await queue.put((False, e))
+        else:
+            await queue.put((False, None))
+
+    reader = asyncio.ensure_future(pump())
+    try:
+        while True:
+            deadline = chunker.deadline
+            if deadline is None or not queue.empty():
+                item = await queue.get()
+            else:
+                remaining = deadline - chunker.clock()
+                try:
+                    async with asyncio.timeout_at(loop.time() + remaining):
+                        item = await queue.get()
+                except TimeoutError:
+                    yield chunker.flush()
+                    continue
+
+            is_piece, value = item
+            if not is_piece:
+                if value is not None:
+                    raise value
+                break
+            for text in chunker.feed(value):
+                yield text
+
+        text = chunker.flush()
+        if text:
+            yield text
+    finally:
+        reader.cancel()
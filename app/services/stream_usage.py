@@ -0,0 +1,69 @@
+import threading
+from typing import Any, Dict, Optional
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+STREAM_USAGE_METRICS = {
+    "completed": ("counter", "Chat streams that finished normally"),
+    "cancelled": ("counter", "Chat streams cancelled before finishing, e.g. on client disconnect"),
+    "failed": ("counter", "Chat streams that failed with an upstream error"),
+    "prompt_tokens": ("counter", "Prompt tokens reported by the upstream for chat streams"),
+    "completion_tokens": ("counter", "Completion tokens of chat streams, estimated for cancelled streams"),
+    "cancelled_completion_tokens": ("counter", "Estimated completion tokens generated by cancelled chat streams"),
+}
+
+
+class StreamUsage:
+    """
+    สถิติของ chat stream ที่เรียก upstream: จำนวนที่จบสมบูรณ์ ถูกยกเลิก หรือผิดพลาด และการใช้ token
+
+    stream ที่จบสมบูรณ์ใช้ usage จริงจาก upstream (stream_options.include_usage) ส่วน stream ที่ถูกยกเลิก
+    กลางทาง (เช่น client ตัดการเชื่อมต่อ) upstream ไม่ส่ง usage มาให้ จึงประมาณ completion token
+    จากจำนวนส่วนของข้อความที่ได้รับแล้ว (upstream ส่งประมาณหนึ่ง token ต่อส่วน)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cancelled_completion_tokens = 0
+
+    def record(self, outcome: str, usage: Optional[Any], received_chunks: int) -> None:
+        """
+        บันทึกผลของ stream หนึ่งรายการ
+
+        Args:
+            outcome: "completed", "cancelled" หรือ "failed"
+            usage: usage จาก upstream (None ถ้าไม่ได้รับ)
+            received_chunks: จำนวนส่วนของข้อความที่ได้รับแล้ว
+        """
+        completion_tokens = usage.completion_tokens if usage is not None else received_chunks
+        with self._lock:
+            if outcome == "completed":
+                self.completed += 1
+            elif outcome == "cancelled":
+                self.cancelled += 1
+                self.cancelled_completion_tokens += completion_tokens
+            else:
+                self.failed += 1
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def stats(self) -> Dict[str, int]:
+        """
+        สถิติของ stream
+
+        Returns:
+            Dict[str, int]: จำนวน stream แยกตามผล และจำนวน token (รวมส่วนที่ประมาณจาก stream ที่ถูกยกเลิก)
+        """
+        return {
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cancelled_completion_tokens": self.cancelled_completion_tokens,
+        }
@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from typing import List, Optional
+
+# ช่วงอักษรไทย กับคำที่ไม่ใช่ภาษาไทย (อักษรละติน ตัวเลข รหัสสินค้า) ส่วนเครื่องหมายวรรคตอนถือเป็นตัวคั่น
+TOKEN_PATTERN = re.compile(r"[\u0E00-\u0E7F]+|[^\W_\u0E00-\u0E7F]+")
+
+# กลุ่มอักษรไทยหนึ่งตำแหน่ง: สระหน้า (เ แ โ ใ ไ) ถ้ามี + อักษรหนึ่งตัว + สระบน/ล่างและวรรณยุกต์ที่ตามมา
+THAI_CLUSTER_PATTERN = re.compile(r"[\u0E40-\u0E44]?[\u0E00-\u0E7F][\u0E31\u0E34-\u0E3A\u0E47-\u0E4E]*")
+THAI_CHARACTER_PATTERN = re.compile(r"[\u0E00-\u0E7F]")
+
+# จำกัดจำนวนพจน์ของคำค้นหาเพื่อไม่ให้ FTS5 ต้องรวม posting list มากเกินไป
+MAX_QUERY_TERMS = 64
+
+
+def _thai_bigrams(run: str) -> List[str]:
+    """
+    แบ่งข้อความภาษาไทยที่ไม่มีช่องว่างเป็น bigram ของกลุ่มอักษรที่ซ้อนทับกัน เช่น "เชียงใหม่" เป็น
+    "เชีย ยง งให ใหม่" การค้นหาคำใดๆ จึงกลายเป็นการค้นหา bigram ที่อยู่ติดกันโดยไม่ต้องใช้พจนานุกรมตัดคำ
+    """
+    clusters = THAI_CLUSTER_PATTERN.findall(run)
+    if len(clusters) < 2:
+        return clusters
+    return [first + second for first, second in zip(clusters, clusters[1:])]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    แปลงข้อความเป็นรายการ token สำหรับดัชนี FTS5 ข้อความถูก normalize แบบ NFKC และ casefold ก่อน
+    ส่วนที่เป็นภาษาไทยถูกแบ่งเป็น bigram และส่วนอื่นแยกตามตัวคั่น (เช่น "SKU-1234" เป็น "sku", "1234")
+
+    Args:
+        text: ข้อความที่ต้องการแบ่ง
+
+    Returns:
+        List[str]: รายการ token ตามลำดับในข้อความ
+    """
+    tokens = []
+    for run in TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if THAI_CHARACTER_PATTERN.match(run):
+            tokens.extend(_thai_bigrams(run))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def index_text(text: str) -> str:
+    """
+    ข้อความที่เก็บลงตาราง FTS5 คือ token คั่นด้วยช่องว่าง ซึ่ง tokenizer "ascii" ของ SQLite แยกกลับได้ตรงกัน
+    """
+    return " ".join(tokenize(text))
+
+
+def query_terms(text: str, max_terms: int = MAX_QUERY_TERMS) -> List[List[str]]:
+    """
+    แบ่งคำค้นหาเป็นพจน์สำหรับ FTS5
+
+    แต่ละคำที่คั่นด้วยช่องว่างให้ทั้ง phrase ของ token ทั้งหมด (ตรงกับข้อความต่อเนื่อง เช่นรหัสสินค้าหรือชื่อเฉพาะ)
+    และ token แต่ละตัว เมื่อรวมกันด้วย OR แล้ว bm25 จะจัดอันดับเอกสารที่ตรงกันมากกว่าไว้ก่อน
+
+    Args:
+        text: คำค้นหา
+        max_terms: จำนวนพจน์สูงสุด
+
+    Returns:
+        List[List[str]]: รายการพจน์ แต่ละพจน์คือ token ที่ต้องอยู่ติดกันตามลำดับ
+    """
+    terms = []
+    for word in text.split():
+        tokens = tokenize(word)
+        if len(tokens) > 1:
+            terms.append(tuple(tokens))
+        terms.extend((token,) for token in tokens)
+    return [list(term) for term in dict.fromkeys(terms)][:max_terms]
+
+
+def match_expression(terms: List[List[str]]) -> Optional[str]:
+    """
+    สร้างนิพจน์ MATCH ของ FTS5 ที่รวมพจน์ด้วย OR (token มีเฉพาะตัวอักษรและตัวเลข จึงใส่ในเครื่องหมายคำพูดได้ตรงๆ)
+
+    Returns:
+        Optional[str]: นิพจน์ MATCH หรือ None ถ้าไม่มีพจน์
+    """
+    if not terms:
+        return None
+    return " OR ".join('"' + " ".join(term) + '"' for term in terms)
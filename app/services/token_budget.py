@@ -0,0 +1,286 @@
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from schema.openai.chat_models import ChatMessage
+from services.ttl_cache import TTLCache
+
+# จำนวน token ที่ API ใช้เพิ่มต่อ message (role และตัวคั่น) และสำหรับเริ่มคำตอบ
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+
+# ขนาด context window ของโมเดล (prompt + คำตอบ) เทียบกับชื่อโมเดลแบบ prefix ที่ยาวที่สุด
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.1": 1047576,
+    "o1": 200000,
+    "o3": 200000,
+    "o4": 200000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+TOKEN_BUDGET_METRICS = {
+    "prompt_budget": ("gauge", "Configured upper bound on prompt tokens, absent when only the context window applies"),
+    "requests": ("counter", "Chat requests checked against the prompt token budget"),
+    "trimmed_requests": ("counter", "Chat requests whose history was trimmed to fit the budget"),
+    "dropped_messages": ("counter", "History messages dropped to fit the budget"),
+    "summaries": ("counter", "Summaries generated for dropped history"),
+    "summary_failures": ("counter", "Summary calls that failed and fell back to dropping history"),
+    "count_cache_entries": ("gauge", "Entries in the per-message token count cache"),
+    "count_cache_hit_rate": ("gauge", "Hit rate of the per-message token count cache"),
+}
+
+# ผู้สรุปบทสนทนา: (ชื่อโมเดล, บทสรุปเดิมหรือ None, messages ที่ต้องสรุปเพิ่ม) -> บทสรุปใหม่
+Summarizer = Callable[[str, Optional[str], List[ChatMessage]], Awaitable[str]]
+
+
+def context_window(model: str) -> int:
+    """
+    ขนาด context window ของโมเดล ถ้าไม่รู้จักจะคืน DEFAULT_CONTEXT_WINDOW
+    """
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model.startswith(prefix)]
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_WINDOW
+
+
+class TokenCounter(ABC):
+    """
+    ตัวนับ token ของข้อความ ทำงานในเครื่องโดยไม่เรียกเครือข่าย
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def count(self, text: str) -> int:
+        """
+        จำนวน token ของข้อความ
+        """
+
+
+class HeuristicTokenCounter(TokenCounter):
+    """
+    ประมาณจำนวน token จากจำนวนตัวอักษรแบบเผื่อไว้ (นับเกินดีกว่านับขาด)
+
+    ตัวอักษร ASCII ประมาณ 3 ตัวต่อ token และตัวอักษรอื่น (เช่นภาษาไทย) ประมาณ 1 ตัวต่อ token
+    """
+
+    name = "heuristic"
+
+    def count(self, text: str) -> int:
+        ascii_chars = len(text.encode("ascii", "ignore"))
+        return -(-ascii_chars // 3) + len(text) - ascii_chars
+
+
+class TiktokenCounter(TokenCounter):
+    """
+    นับ token ด้วย tiktoken (pip install tiktoken) ตาม encoding ของโมเดล
+
+    tiktoken ดาวน์โหลดไฟล์ encoding ในการใช้ครั้งแรก ถ้าเซิร์ฟเวอร์ไม่มีเครือข่ายให้เตรียมไฟล์ไว้ใน
+    TIKTOKEN_CACHE_DIR ก่อน
+    """
+
+    def __init__(self, model: str):
+        import tiktoken
+
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("o200k_base")
+        self.name = f"tiktoken:{self.encoding.name}"
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+# ตัวนับที่เลือกได้ด้วยชื่อใน CHAT_TOKEN_COUNTER เพิ่มตัวนับใหม่ได้โดยเพิ่มรายการใน dict นี้
+TOKEN_COUNTERS: Dict[str, Callable[[str], TokenCounter]] = {
+    "heuristic": lambda model: HeuristicTokenCounter(),
+    "tiktoken": TiktokenCounter,
+}
+
+
+class TokenBudget:
+    """
+    ตัดประวัติบทสนทนาให้ prompt ไม่เกินงบ token ของโมเดล
+
+    งบ token ของ prompt คือ context window ของโมเดลลบ max_tokens ของคำตอบ (และไม่เกิน prompt_budget
+    ถ้ากำหนด) เมื่อเกินงบจะเก็บ system message ทั้งหมดและ message ล่าสุดไว้ให้มากที่สุดที่พอดีงบ
+    แล้วตัด message ที่เก่ากว่าออก หรือแทนด้วยบทสรุปถ้ามี summarizer
+
+    จำนวน token ของแต่ละ message ถูกแคชไว้ตาม hash ของ role และเนื้อหา บทสรุปถูกแคชตาม hash ของ
+    ส่วนต้นของบทสนทนาที่ถูกตัด และบทสรุปใหม่สร้างต่อจากบทสรุปของส่วนต้นที่สั้นกว่า ในแต่ละรอบของ
+    บทสนทนาจึงนับและสรุปเฉพาะ message ที่เพิ่มเข้ามาใหม่
+    """
+
+    def __init__(
+        self,
+        counter: str = "heuristic",
+        prompt_budget: Optional[int] = None,
+        keep_recent: int = 1,
+        summarizer: Optional[Summarizer] = None,
+        summary_max_tokens: int = 300,
+        cache_entries: int = 100000
+    ):
+        """
+        สร้าง TokenBudget
+
+        Args:
+            counter: ชื่อตัวนับ token ใน TOKEN_COUNTERS
+            prompt_budget: งบ token สูงสุดของ prompt ไม่ว่าโมเดลจะรองรับเท่าใด (None คือใช้ context window)
+            keep_recent: จำนวน message ล่าสุดที่เก็บไว้เสมอแม้จะเกินงบ
+            summarizer: ฟังก์ชันสรุป message ที่ถูกตัด (None คือตัดทิ้ง)
+            summary_max_tokens: งบ token ที่กันไว้ให้บทสรุป
+            cache_entries: จำนวนรายการสูงสุดของแคชจำนวน token
+        """
+        if counter not in TOKEN_COUNTERS:
+            raise ValueError(f"Unknown token counter: {counter}")
+        self.counter = counter
+        self.prompt_budget = prompt_budget
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self._counters: Dict[str, TokenCounter] = {}
+        self._counts: TTLCache[int] = TTLCache(max_entries=cache_entries, ttl_seconds=float("inf"))
+        self._summaries: TTLCache[str] = TTLCache(max_entries=10000, ttl_seconds=86400)
+
+        self.requests = 0
+        self.trimmed_requests = 0
+        self.dropped_messages = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def counter_for(self, model: str) -> TokenCounter:
+        counter = self._counters.get(model)
+        if counter is None:
+            counter = self._counters[model] = TOKEN_COUNTERS[self.counter](model)
+        return counter
+
+    def budget_for(self, model: str, max_tokens: Optional[int]) -> int:
+        """
+        งบ token ของ prompt สำหรับโมเดลและ max_tokens ของคำตอบ
+        """
+        budget = context_window(model) - (max_tokens or 0)
+        if self.prompt_budget is not None:
+            budget = min(budget, self.prompt_budget)
+        return budget
+
+    @staticmethod
+    def _digest(message: ChatMessage) -> bytes:
+        return hashlib.blake2b(f"{message.role}\0{message.content}".encode("utf-8"), digest_size=16).digest()
+
+    def count_message(self, model: str, message: ChatMessage, digest: Optional[bytes] = None) -> int:
+        """
+        จำนวน token ของ message หนึ่งรายการ (รวม overhead ต่อ message) จากแคชถ้าเคยนับแล้ว
+        """
+        counter = self.counter_for(model)
+        key = (counter.name, digest or self._digest(message))
+        count = self._counts.get(key)
+        if count is None:
+            count = counter.count(message.content) + TOKENS_PER_MESSAGE
+            self._counts.set(key, count)
+        return count
+
+    def count_messages(self, model: str, messages: List[ChatMessage]) -> int:
+        """
+        จำนวน token ของ prompt ทั้งหมด
+        """
+        return sum(self.count_message(model, message) for message in messages) + TOKENS_PER_REPLY
+
+    async def fit(self, model: str, max_tokens: Optional[int], messages: List[ChatMessage]) -> List[ChatMessage]:
+        """
+        ตัด messages ให้พอดีงบ token ของโมเดล
+
+        Args:
+            model: ชื่อโมเดล
+            max_tokens: max_tokens ของคำตอบ
+            messages: messages ที่จะส่งไปยัง API (รวม system message แล้ว)
+
+        Returns:
+            List[ChatMessage]: messages เดิมถ้าไม่เกินงบ หรือ messages ที่ตัดแล้ว
+        """
+        self.requests += 1
+        digests = [self._digest(message) for message in messages]
+        counts = [self.count_message(model, message, digest) for message, digest in zip(messages, digests)]
+        budget = self.budget_for(model, max_tokens)
+        if sum(counts) + TOKENS_PER_REPLY <= budget:
+            return messages
+
+        pinned = [i for i, message in enumerate(messages) if message.role == "system"]
+        used = sum(counts[i] for i in pinned) + TOKENS_PER_REPLY
+        if self.summarizer is not None:
+            used += self.summary_max_tokens + TOKENS_PER_MESSAGE
+
+        # เก็บ message ล่าสุดต่อเนื่องย้อนหลังไปจนกว่าจะเกินงบ
+        history = [i for i in range(len(messages)) if messages[i].role != "system"]
+        kept = len(history)
+        for position in range(len(history) - 1, -1, -1):
+            count = counts[history[position]]
+            if len(history) - position > self.keep_recent and used + count > budget:
+                break
+            used += count
+            kept = position
+        dropped, recent = history[:kept], history[kept:]
+        if not dropped:
+            return messages
+
+        self.trimmed_requests += 1
+        self.dropped_messages += len(dropped)
+        result = [messages[i] for i in pinned]
+        if self.summarizer is not None:
+            summary = await self._summarize(model, [messages[i] for i in dropped], [digests[i] for i in dropped])
+            if summary:
+                result.append(ChatMessage(role="system", content=f"สรุปบทสนทนาก่อนหน้า: {summary}"))
+        result.extend(messages[i] for i in recent)
+        return result
+
+    async def _summarize(self, model: str, dropped: List[ChatMessage], digests: List[bytes]) -> Optional[str]:
+        """
+        สรุป messages ที่ถูกตัด โดยใช้บทสรุปของส่วนต้นที่ยาวที่สุดที่เคยสรุปไว้แล้วเป็นจุดเริ่ม
+        """
+        # hash ของส่วนต้นแต่ละความยาว: chain[k] แทน dropped[:k + 1]
+        chain: List[bytes] = []
+        previous = model.encode("utf-8")
+        for digest in digests:
+            previous = hashlib.blake2b(previous + digest, digest_size=16).digest()
+            chain.append(previous)
+
+        summary, start = None, 0
+        for k in range(len(chain) - 1, -1, -1):
+            summary = self._summaries.get(chain[k])
+            if summary is not None:
+                start = k + 1
+                break
+        if start == len(dropped):
+            return summary
+
+        try:
+            summary = await self.summarizer(model, summary, dropped[start:])
+        except Exception:
+            # สรุปไม่สำเร็จก็ยังส่งคำขอได้ โดยตัด message เก่าทิ้งไปแทน
+            self.summary_failures += 1
+            return summary
+        self.summaries += 1
+        self._summaries.set(chain[-1], summary)
+        return summary
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติของการตัดประวัติบทสนทนา
+
+        Returns:
+            Dict[str, Any]: จำนวนคำขอ คำขอที่ถูกตัด message ที่ถูกตัด บทสรุป และอัตรา hit ของแคชจำนวน token
+        """
+        counts = self._counts.stats()
+        return {
+            "counter": self.counter,
+            "prompt_budget": self.prompt_budget,
+            "requests": self.requests,
+            "trimmed_requests": self.trimmed_requests,
+            "dropped_messages": self.dropped_messages,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "count_cache_entries": counts["entries"],
+            "count_cache_hit_rate": counts["hit_rate"],
+        }
@@ -1,14 +1,84 @@
 import os
-from openai import OpenAI
-from schema.tourism.travel_models import TravelRequest, TravelResponse, TravelPlan
+import re
+import unicodedata
+from fastapi import Request
+from openai import AsyncOpenAI
+from schema.tourism.travel_models import TravelRequest, TravelResponse, TravelPlan, DailyItinerary, TravelPlanStreamEvent
+from services.opeai_service import create_openai_client, get_openai_service, upstream_scheduler
+from services.json_stream import JsonStreamParser
+from services.ttl_cache import TTLCache
+from services.upstream_scheduler import UpstreamScheduler, estimate_tokens
+from services.upstream_pool import UpstreamPool, UpstreamTarget
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple, List, AsyncGenerator, Awaitable, Callable
+
+# แคชแผนการท่องเที่ยวที่ผ่านการตรวจสอบแล้ว ใช้ร่วมกันทั้ง process
+travel_plan_cache: TTLCache[TravelPlan] = TTLCache(
+    max_entries=int(os.getenv("TRAVEL_PLAN_CACHE_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("TRAVEL_PLAN_CACHE_TTL", "21600"))
+)
+
+# ความกว้างของช่วงงบประมาณ (บาท) งบประมาณในช่วงเดียวกันใช้แผนเดียวกัน
+TRAVEL_PLAN_BUDGET_BUCKET = float(os.getenv("TRAVEL_PLAN_BUDGET_BUCKET", "2000"))
+
+def _normalize(text: str) -> str:
+    """
+    normalize ข้อความสำหรับเปรียบเทียบ: Unicode NFC, รวมช่องว่าง และไม่สนตัวพิมพ์เล็ก/ใหญ่
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip().casefold()
 
 class TourismService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[TTLCache] = travel_plan_cache,
+        scheduler: Optional[UpstreamScheduler] = upstream_scheduler,
+        upstream_pool: Optional[UpstreamPool] = None
+    ):
+        """
+        สร้าง TourismService
         
-    async def generate_travel_plan(self, request: TravelRequest) -> TravelResponse:
+        Args:
+            client: AsyncOpenAI ที่ใช้ร่วมกัน (ใช้เป็นปลายทางเดียว) ถ้าไม่ระบุทั้ง client และ upstream_pool จะสร้างใหม่
+            cache: แคชของแผนการท่องเที่ยว (None คือไม่ใช้แคช)
+            scheduler: ตัวควบคุมอัตราการเรียก API ที่ใช้งบร่วมกับ OpenAIService (None คือเรียกโดยตรง)
+            upstream_pool: กลุ่มปลายทางที่ใช้ร่วมกับ OpenAIService
+        """
+        self.upstream_pool = upstream_pool or UpstreamPool([UpstreamTarget("default", client or create_openai_client())])
+        self.client = self.upstream_pool.client
+        self.cache = cache
+        self.scheduler = scheduler
+    
+    @staticmethod
+    def cache_key(request: TravelRequest) -> Tuple:
+        """
+        สร้าง key ของแคชจากคำขอที่ normalize แล้ว: จุดหมาย, ช่วงงบประมาณ, จำนวนวัน และความสนใจที่เรียงแล้ว
+        
+        ถ้าไม่ระบุจุดหมายปลายทาง จะใช้ข้อความคำขอแทนเพราะจุดหมายอยู่ในข้อความนั้น
+        
+        Args:
+            request: ข้อมูลคำขอแผนการท่องเที่ยว
+            
+        Returns:
+            Tuple: key ของแคช
+        """
+        destination = _normalize(request.destination) if request.destination else None
+        query = None if destination else _normalize(request.query)
+        budget = int(request.budget // TRAVEL_PLAN_BUDGET_BUCKET) if request.budget else None
+        interests = tuple(sorted({_normalize(interest) for interest in request.interests or [] if interest.strip()}))
+        
+        return (destination, query, budget, request.duration, interests)
+    
+    def _build_messages(self, request: TravelRequest) -> List[Dict[str, str]]:
+        """
+        สร้าง messages สำหรับเรียก API จากคำขอ
+        
+        Args:
+            request: ข้อมูลคำขอแผนการท่องเที่ยว
+            
+        Returns:
+            List[Dict[str, str]]: system message และ user message
+        """
         # สร้าง system message ที่กำหนดรูปแบบการตอบกลับเป็น JSON
         system_message = """
         คุณเป็นผู้เชี่ยวชาญด้านการท่องเที่ยวที่มีความรู้เกี่ยวกับสถานที่ท่องเที่ยวทั่วโลก
@@ -67,20 +137,133 @@ class TourismService:
             user_prompt += f"\nระยะเวลา: {request.duration} วัน"
         if request.interests:
             user_prompt += f"\nความสนใจ: {', '.join(request.interests)}"
-            
-        # เรียกใช้ OpenAI API
-        response = self.client.chat.completions.create(
+        
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    async def _create_completion(self, messages: List[Dict[str, str]], **params: Any) -> Any:
+        """
+        เรียก chat completions API บนปลายทางที่ upstream_pool เลือก ผ่าน scheduler ถ้าเปิดใช้
+        
+        ไม่ใช้ hedge เพราะแผนการท่องเที่ยวใช้เวลาสร้างนานตามความยาวของแผน การส่งซ้ำจะเสีย token มากโดยได้เวลาคืนน้อย
+        """
+        create: Callable[[UpstreamTarget], Awaitable[Any]] = lambda target: target.client.chat.completions.create(
             model="gpt-4o-mini",  # หรือใช้ gpt-4 ถ้ามี
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"}
+            messages=messages,
+            response_format={"type": "json_object"},
+            **params
         )
+        factory: Callable[[], Awaitable[Any]] = lambda: self.upstream_pool.call("travel_plan:gpt-4o-mini", create)
+        if self.scheduler is None:
+            return await factory()
+        return await self.scheduler.call(factory, estimate_tokens(message["content"] for message in messages))
+    
+    async def generate_travel_plan(self, request: TravelRequest) -> TravelResponse:
+        """
+        สร้างแผนการท่องเที่ยวตามคำขอ คำขอที่ normalize แล้วตรงกับแผนในแคชจะได้แผนนั้นทันทีโดยไม่เรียก API
+        
+        Args:
+            request: ข้อมูลคำขอแผนการท่องเที่ยว
+            
+        Returns:
+            TravelResponse: แผนการท่องเที่ยว
+        """
+        key = self.cache_key(request)
+        if self.cache is not None:
+            travel_plan = self.cache.get(key)
+            if travel_plan is not None:
+                return TravelResponse(travel_plan=travel_plan)
+        
+        # เรียกใช้ OpenAI API
+        response = await self._create_completion(self._build_messages(request))
         
         # แปลงข้อความตอบกลับเป็น JSON
         result_json = json.loads(response.choices[0].message.content)
         
         # แปลง JSON เป็น TravelResponse object
         travel_plan = TravelPlan(**result_json)
+        
+        # เก็บเฉพาะแผนที่ผ่านการตรวจสอบ schema แล้ว
+        if self.cache is not None:
+            self.cache.set(key, travel_plan)
+        
         return TravelResponse(travel_plan=travel_plan)
+    
+    async def stream_travel_plan(self, request: TravelRequest) -> AsyncGenerator[TravelPlanStreamEvent, None]:
+        """
+        สร้างแผนการท่องเที่ยวแบบ stream โดย parse JSON จากโมเดลแบบ incremental
+        
+        ส่ง overview และแต่ละวันของ daily_itinerary ที่ผ่านการตรวจสอบแล้วทันทีที่ส่วนนั้นครบ
+        และส่งแผนทั้งหมดเป็นเหตุการณ์สุดท้าย แผนในแคชจะถูกส่งทั้งหมดทันที
+        
+        Args:
+            request: ข้อมูลคำขอแผนการท่องเที่ยว
+            
+        Yields:
+            TravelPlanStreamEvent: เหตุการณ์ overview, day, plan หรือ error
+        """
+        key = self.cache_key(request)
+        travel_plan = self.cache.get(key) if self.cache is not None else None
+        if travel_plan is not None:
+            yield TravelPlanStreamEvent(type="overview", overview=travel_plan.overview, cached=True)
+            for day in travel_plan.daily_itinerary:
+                yield TravelPlanStreamEvent(type="day", day=day, cached=True)
+            yield TravelPlanStreamEvent(type="plan", travel_plan=travel_plan, cached=True)
+            return
+        
+        stream = await self._create_completion(self._build_messages(request), stream=True)
+        
+        parser = JsonStreamParser()
+        fields: Dict[str, Any] = {}
+        try:
+            async for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                
+                for event in parser.feed(chunk.choices[0].delta.content):
+                    if event[0] == "field":
+                        _, name, value = event
+                        fields[name] = value
+                        if name == "overview":
+                            yield TravelPlanStreamEvent(type="overview", overview=value)
+                    elif event[1] == "daily_itinerary":
+                        # วันที่ไม่ผ่านการตรวจสอบจะถูกรายงานและข้ามไป แผนทั้งหมดจะถูกตรวจสอบอีกครั้งตอนจบ
+                        try:
+                            yield TravelPlanStreamEvent(type="day", day=DailyItinerary(**event[3]))
+                        except ValueError as e:
+                            yield TravelPlanStreamEvent(type="error", error=f"Invalid day {event[2] + 1}: {e}")
+        except ValueError as e:
+            yield TravelPlanStreamEvent(type="error", error=f"Invalid JSON from model: {e}")
+            return
+        finally:
+            # ปิดการเชื่อมต่อกับ upstream ทั้งเมื่อ JSON ไม่ถูกต้องและเมื่อ client ตัดการเชื่อมต่อกลางทาง
+            await stream.close()
+        
+        try:
+            travel_plan = TravelPlan(**fields)
+        except ValueError as e:
+            yield TravelPlanStreamEvent(type="error", error=f"Invalid travel plan: {e}")
+            return
+        
+        if self.cache is not None:
+            self.cache.set(key, travel_plan)
+        yield TravelPlanStreamEvent(type="plan", travel_plan=travel_plan)
+
+
+def get_tourism_service(request: Request) -> TourismService:
+    """
+    dependency ของ FastAPI ที่คืน TourismService ตัวเดียวของ worker ซึ่งใช้ปลายทางของ OpenAI ร่วมกับ OpenAIService
+    
+    Args:
+        request: คำขอปัจจุบัน
+        
+    Returns:
+        TourismService: บริการวางแผนการท่องเที่ยว
+    """
+    service = getattr(request.app.state, "tourism_service", None)
+    if service is None:
+        service = TourismService(upstream_pool=get_openai_service(request).upstream_pool)
+        request.app.state.tourism_service = service
+    return service
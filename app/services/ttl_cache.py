@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class TTLCache(Generic[T]):
+    """
+    แคชในหน่วยความจำที่จำกัดทั้งอายุของรายการ (TTL) และจำนวนรายการ
+
+    รายการที่หมดอายุจะถูกลบเมื่อถูกอ่าน และเมื่อเต็มจะลบรายการที่ใช้ล่าสุดนานที่สุด (LRU) ก่อน
+    ใช้ได้จากหลาย thread
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600.0, clock: Callable[[], float] = time.monotonic):
+        """
+        สร้าง TTLCache
+
+        Args:
+            max_entries: จำนวนรายการสูงสุด
+            ttl_seconds: อายุของแต่ละรายการ (วินาที)
+            clock: ฟังก์ชันคืนเวลาปัจจุบัน (วินาที)
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, T]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """
+        อ่านค่าจากแคช
+
+        Args:
+            key: key ของรายการ
+
+        Returns:
+            Optional[T]: ค่าที่เก็บไว้ หรือ None ถ้าไม่พบหรือหมดอายุแล้ว
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: T, ttl_seconds: Optional[float] = None) -> None:
+        """
+        เก็บค่าลงแคช
+
+        Args:
+            key: key ของรายการ
+            value: ค่าที่ต้องการเก็บ
+            ttl_seconds: อายุของรายการนี้ ถ้าไม่ระบุจะใช้ค่าของแคช
+        """
+        expires_at = self._clock() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> bool:
+        """
+        ลบรายการออกจากแคช
+
+        Returns:
+            bool: True ถ้ามีรายการนี้อยู่
+        """
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """
+        ลบทุกรายการ
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        สถิติของแคช
+
+        Returns:
+            Dict[str, float]: จำนวนรายการ hit/miss และอัตรา hit
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
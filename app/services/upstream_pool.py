@@ -0,0 +1,334 @@
+import asyncio
+import itertools
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple, TypeVar
+from openai import AsyncOpenAI
+from services.upstream_scheduler import is_transient_error
+
+T = TypeVar("T")
+
+# น้ำหนักของตัวอย่างใหม่ใน EWMA ของเวลาตอบสนองแต่ละปลายทาง
+EWMA_ALPHA = 0.2
+
+# จำนวน hedge ที่สะสมไว้ใช้ได้ทันทีเมื่อ upstream ช้าพร้อมกันหลายคำขอ
+HEDGE_BURST = 10.0
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+UPSTREAM_POOL_METRICS = {
+    "hedge_enabled": ("gauge", "Whether slow upstream requests are hedged to another target"),
+    "requests": ("counter", "Requests sent through the upstream pool"),
+    "hedged": ("counter", "Requests duplicated to a second target"),
+    "hedge_wins": ("counter", "Hedged requests answered first by the duplicate"),
+    "hedge_budget_exhausted": ("counter", "Hedges skipped because the hedge budget was used up"),
+}
+UPSTREAM_TARGET_METRICS = {
+    "healthy": ("gauge", "Whether the upstream target is accepting requests (0 while cooling down)"),
+    "in_flight": ("gauge", "Requests in flight to the upstream target"),
+    "calls": ("counter", "Calls sent to the upstream target"),
+    "failures": ("counter", "Transient failures from the upstream target"),
+    "cancelled": ("counter", "Calls to the upstream target cancelled before finishing"),
+}
+UPSTREAM_LATENCY_METRICS = {
+    "seconds": ("gauge", "EWMA response time of the upstream target per operation"),
+}
+UPSTREAM_HEDGE_DELAY_METRICS = {
+    "seconds": ("gauge", "Delay before a request of the operation is hedged"),
+}
+
+# (ค่าของ label, stats) ต่อแถว ดู StatsCollector
+StatsRows = List[Tuple[Tuple[str, ...], Dict[str, Any]]]
+
+
+class UpstreamTarget:
+    """
+    ปลายทางหนึ่งของ OpenAI API (API key และ base URL ของตัวเอง) พร้อมสถานะที่ใช้เลือกปลายทาง:
+    จำนวนคำขอที่กำลังทำ เวลาตอบสนองเฉลี่ยแบบ EWMA แยกตาม operation และข้อผิดพลาดติดกัน
+    """
+
+    def __init__(self, name: str, client: AsyncOpenAI):
+        self.name = name
+        self.client = client
+        self.in_flight = 0
+        # operation -> EWMA ของเวลาตอบสนอง (วินาที)
+        self.latency: Dict[str, float] = {}
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+        self.calls = 0
+        self.failures = 0
+        self.cancelled = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.unhealthy_until
+
+    def begin(self) -> None:
+        self.in_flight += 1
+
+    def end(self) -> None:
+        self.in_flight -= 1
+
+    def score(self, operation: str) -> float:
+        """
+        เวลารอโดยประมาณถ้าส่งคำขอใหม่มาที่ปลายทางนี้ (ค่าน้อยถูกเลือกก่อน) ปลายทางที่ยังไม่มีตัวอย่างได้ 0 จึงถูกลองก่อน
+        """
+        return (self.in_flight + 1) * self.latency.get(operation, 0.0)
+
+    def observe(self, operation: str, seconds: float, lower_bound: bool = False) -> None:
+        """
+        บันทึกเวลาตอบสนอง ถ้า lower_bound เป็น True (คำขอถูกยกเลิกก่อนได้คำตอบ) จะปรับเฉพาะเมื่อนานกว่าค่าเฉลี่ยเดิม
+        """
+        previous = self.latency.get(operation)
+        if previous is None:
+            self.latency[operation] = seconds
+        elif not lower_bound or seconds > previous:
+            self.latency[operation] = previous + EWMA_ALPHA * (seconds - previous)
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy(now),
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+        }
+
+
+class UpstreamPool:
+    """
+    กลุ่มปลายทางของ OpenAI API (หลาย API key หรือ endpoint ที่รองรับ API เดียวกัน)
+
+    แต่ละคำขอถูกส่งไปยังปลายทางที่ปกติและมีเวลารอโดยประมาณน้อยที่สุด ((คำขอที่กำลังทำ + 1) x EWMA ของเวลาตอบสนอง)
+    ปลายทางที่ผิดพลาดชั่วคราวติดกัน failure_threshold ครั้งจะถูกพักไว้ cooldown_seconds วินาที
+    ข้อผิดพลาดของคำขอเอง (4xx อื่นๆ) ไม่นับเป็นความผิดของปลายทาง
+
+    ถ้าเปิด hedge คำขอที่เรียกด้วย hedge=True และยังไม่ได้คำตอบเมื่อเกินเปอร์เซ็นไทล์ hedge_percentile ของเวลาตอบสนอง
+    ที่ผ่านมา จะถูกส่งซ้ำไปยังปลายทางอื่น ใช้คำตอบที่มาถึงก่อนและยกเลิกอีกคำขอ จำนวนคำขอซ้ำถูกจำกัดไว้ไม่เกิน
+    hedge_budget_ratio ของจำนวนคำขอทั้งหมด เพื่อไม่ให้ upstream ที่ช้าทั้งระบบได้รับโหลดเพิ่มเป็นสองเท่า
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[UpstreamTarget],
+        hedge: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_min_delay: float = 0.05,
+        hedge_min_samples: int = 20,
+        hedge_budget_ratio: float = 0.1,
+        failure_threshold: int = 3,
+        cooldown_seconds: float = 30.0,
+        window_size: int = 500
+    ):
+        """
+        สร้าง UpstreamPool
+
+        Args:
+            targets: ปลายทางทั้งหมด (อย่างน้อยหนึ่ง)
+            hedge: เปิดการส่งคำขอซ้ำเมื่อคำขอช้ากว่าปกติ
+            hedge_percentile: เปอร์เซ็นไทล์ของเวลาตอบสนองที่ใช้เป็นเวลาก่อนส่งคำขอซ้ำ
+            hedge_min_delay: เวลาขั้นต่ำก่อนส่งคำขอซ้ำ (วินาที)
+            hedge_min_samples: จำนวนตัวอย่างเวลาตอบสนองขั้นต่ำของ operation ก่อนเริ่ม hedge
+            hedge_budget_ratio: สัดส่วนสูงสุดของคำขอซ้ำต่อคำขอทั้งหมด
+            failure_threshold: จำนวนข้อผิดพลาดชั่วคราวติดกันก่อนพักปลายทาง
+            cooldown_seconds: เวลาที่พักปลายทาง (วินาที) หลังจากนั้นจะถูกลองใหม่
+            window_size: จำนวนตัวอย่างเวลาตอบสนองล่าสุดต่อ operation ที่ใช้คำนวณเปอร์เซ็นไทล์
+        """
+        if not targets:
+            raise ValueError("UpstreamPool requires at least one target")
+        self.targets: List[UpstreamTarget] = list(targets)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_budget_ratio = hedge_budget_ratio
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.window_size = window_size
+
+        self._samples: Dict[str, Deque[float]] = {}
+        # operation -> (จำนวนตัวอย่างตอนคำนวณ, เวลาก่อน hedge) คำนวณใหม่ทุก 10 ตัวอย่าง
+        self._delays: Dict[str, tuple] = {}
+        self._sample_counts: Dict[str, int] = {}
+        self._hedge_tokens = HEDGE_BURST
+        # หมุนลำดับปลายทางเพื่อกระจายคำขอเมื่อคะแนนเท่ากัน
+        self._rotation = itertools.count()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedge_budget_exhausted = 0
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """
+        client ของปลายทางแรก สำหรับโค้ดที่ต้องการ client เดียว
+        """
+        return self.targets[0].client
+
+    def pick(self, operation: str, exclude: Optional[UpstreamTarget] = None) -> UpstreamTarget:
+        """
+        เลือกปลายทางที่ปกติและมีเวลารอโดยประมาณน้อยที่สุด ถ้าทุกปลายทางถูกพักไว้จะเลือกจากทั้งหมด
+        """
+        now = time.monotonic()
+        others = [target for target in self.targets if target is not exclude] or self.targets
+        candidates = [target for target in others if target.healthy(now)] or others
+        start = next(self._rotation) % len(candidates)
+        candidates = candidates[start:] + candidates[:start]
+        return min(candidates, key=lambda target: (target.score(operation), target.in_flight))
+
+    def _record_sample(self, operation: str, seconds: float) -> None:
+        samples = self._samples.get(operation)
+        if samples is None:
+            samples = self._samples[operation] = deque(maxlen=self.window_size)
+        samples.append(seconds)
+        self._sample_counts[operation] = self._sample_counts.get(operation, 0) + 1
+
+    def hedge_delay(self, operation: str) -> Optional[float]:
+        """
+        เวลาก่อนส่งคำขอซ้ำของ operation (None ถ้ายังมีตัวอย่างไม่พอ)
+        """
+        samples = self._samples.get(operation)
+        if samples is None or len(samples) < self.hedge_min_samples:
+            return None
+        count = self._sample_counts[operation]
+        cached = self._delays.get(operation)
+        if cached is None or count - cached[0] >= 10:
+            ordered = sorted(samples)
+            index = max(0, math.ceil(self.hedge_percentile / 100 * len(ordered)) - 1)
+            cached = self._delays[operation] = (count, max(self.hedge_min_delay, ordered[index]))
+        return cached[1]
+
+    async def _attempt(self, target: UpstreamTarget, operation: str, factory: Callable[[UpstreamTarget], Awaitable[T]]) -> T:
+        """
+        เรียก factory(target) หนึ่งครั้ง และบันทึกเวลาตอบสนองและสุขภาพของปลายทาง
+        """
+        target.begin()
+        target.calls += 1
+        started = time.perf_counter()
+        try:
+            result = await factory(target)
+        except asyncio.CancelledError:
+            # ถูกยกเลิก (แพ้ hedge หรือ client ตัดการเชื่อมต่อ): เวลาที่ใช้ไปเป็นขอบล่างของเวลาตอบสนองจริง
+            # ใช้กับ EWMA ของปลายทางได้ แต่ไม่เก็บเป็นตัวอย่างของเปอร์เซ็นไทล์ เพราะคำขอที่แพ้ hedge ถูกตัดที่
+            # ไม่นานหลัง hedge_delay จะดึงเปอร์เซ็นไทล์ลง ทำให้ส่งซ้ำบ่อยขึ้นและได้ตัวอย่างสั้นเพิ่มขึ้นอีก
+            elapsed = time.perf_counter() - started
+            target.cancelled += 1
+            target.observe(operation, elapsed, lower_bound=True)
+            raise
+        except Exception as e:
+            if is_transient_error(e):
+                target.failures += 1
+                target.consecutive_failures += 1
+                if target.consecutive_failures >= self.failure_threshold:
+                    target.unhealthy_until = time.monotonic() + self.cooldown_seconds
+            raise
+        finally:
+            target.end()
+
+        elapsed = time.perf_counter() - started
+        target.consecutive_failures = 0
+        target.observe(operation, elapsed)
+        self._record_sample(operation, elapsed)
+        return result
+
+    async def call(self, operation: str, factory: Callable[[UpstreamTarget], Awaitable[T]], hedge: bool = False) -> T:
+        """
+        เรียก factory(target) บนปลายทางที่เลือก และส่งซ้ำไปยังปลายทางอื่นถ้าช้ากว่าปกติ (เมื่อ hedge=True)
+
+        Args:
+            operation: ชื่อของงาน (เช่น "chat:gpt-4o") เวลาตอบสนองถูกเก็บแยกตามชื่อนี้ตลอดอายุ process
+                จึงต้องมาจากชุดค่าที่จำกัด ไม่ใช่ค่าจากคำขอของ client โดยตรง
+            factory: ฟังก์ชันที่เรียก API หนึ่งครั้งด้วย client ของปลายทางที่ได้รับ
+            hedge: คำขอนี้ส่งซ้ำได้หรือไม่ (เฉพาะคำขอที่ไม่ใช่ stream และไม่มีผลข้างเคียง)
+
+        Returns:
+            ค่าที่ factory คืนกลับจากปลายทางที่ตอบก่อน
+        """
+        self.requests += 1
+        self._hedge_tokens = min(HEDGE_BURST, self._hedge_tokens + self.hedge_budget_ratio)
+        primary = self.pick(operation)
+        delay = self.hedge_delay(operation) if hedge and self.hedge and len(self.targets) > 1 else None
+        if delay is None:
+            return await self._attempt(primary, operation, factory)
+
+        tasks = {asyncio.ensure_future(self._attempt(primary, operation, factory)): primary}
+        try:
+            pending = set(tasks)
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                if self._hedge_tokens >= 1:
+                    self._hedge_tokens -= 1
+                    self.hedged += 1
+                    secondary = self.pick(operation, exclude=primary)
+                    task = asyncio.ensure_future(self._attempt(secondary, operation, factory))
+                    tasks[task] = secondary
+                    pending.add(task)
+                else:
+                    self.hedge_budget_exhausted += 1
+
+            while True:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if tasks[task] is not primary:
+                            self.hedge_wins += 1
+                        return task.result()
+                    # ข้อผิดพลาดของคำขอเองจะเกิดซ้ำที่ปลายทางอื่นเช่นกัน จึงไม่รออีกคำขอ
+                    if not pending or not is_transient_error(error):
+                        raise error
+                done = set()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    # อ่านข้อผิดพลาดของคำขอที่แพ้ไว้ ไม่ให้ asyncio เตือนว่าไม่มีผู้รับ
+                    task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติการ hedge ของทั้ง pool
+
+        Returns:
+            Dict[str, Any]: จำนวนคำขอ จำนวนที่ส่งซ้ำ จำนวนที่คำขอซ้ำตอบก่อน และจำนวนที่ไม่ได้ส่งซ้ำเพราะงบหมด
+        """
+        return {
+            "hedge_enabled": self.hedge,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_budget_exhausted": self.hedge_budget_exhausted,
+        }
+
+    def target_stats(self) -> StatsRows:
+        """
+        สถานะของปลายทางแต่ละตัว (สุขภาพ คำขอที่กำลังทำ จำนวนการเรียก ข้อผิดพลาด) แยกตามชื่อปลายทาง
+        """
+        now = time.monotonic()
+        return [((target.name,), target.stats(now)) for target in self.targets]
+
+    def latency_stats(self) -> StatsRows:
+        """
+        EWMA ของเวลาตอบสนอง (วินาที) แยกตามปลายทางและ operation
+        """
+        return [
+            ((target.name, operation), {"seconds": seconds})
+            for target in self.targets
+            for operation, seconds in list(target.latency.items())
+        ]
+
+    def hedge_delay_stats(self) -> StatsRows:
+        """
+        เวลาก่อนส่งคำขอซ้ำ (วินาที) ของแต่ละ operation ที่มีตัวอย่างพอแล้ว
+        """
+        delays = ((operation, self.hedge_delay(operation)) for operation in list(self._samples))
+        return [((operation,), {"seconds": delay}) for operation, delay in delays if delay is not None]
+
+    async def close(self) -> None:
+        """
+        ปิด connection pool ของทุกปลายทาง
+        """
+        await asyncio.gather(*(target.client.close() for target in self.targets))
@@ -0,0 +1,335 @@
+import asyncio
+import heapq
+import itertools
+import math
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+import openai
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from services.token_budget import HeuristicTokenCounter, TOKENS_PER_MESSAGE
+
+# ลำดับความสำคัญของคำขอ (ค่าน้อยได้ก่อน): คำขอของผู้ใช้ที่รออยู่ได้ก่อนงานเบื้องหลังจำนวนมาก
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# ลำดับความสำคัญของคำขอปัจจุบัน route ที่เป็นงานจำนวนมากตั้งค่าเป็น PRIORITY_BULK
+# task ลูกที่สร้างจากคำขอนั้น (เช่น asyncio.gather) ได้ค่าเดียวกัน
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+# จำนวน token ของคำตอบที่กันไว้เมื่อคำขอไม่ได้ระบุ max_tokens
+DEFAULT_COMPLETION_TOKENS = 1000
+
+T = TypeVar("T")
+
+_counter = HeuristicTokenCounter()
+
+# สถิติที่ส่งออกที่ GET /metrics ดู ServiceMetrics.register_stats
+UPSTREAM_SCHEDULER_METRICS = {
+    "requests_per_minute": ("gauge", "Configured upstream request budget per minute"),
+    "tokens_per_minute": ("gauge", "Configured upstream token budget per minute"),
+    "available_requests": ("gauge", "Requests left in the per-minute budget, absent when unlimited"),
+    "available_tokens": ("gauge", "Tokens left in the per-minute budget, absent when unlimited"),
+    "queue_length": ("gauge", "Requests waiting for upstream budget"),
+    "admitted": ("counter", "Requests admitted to call the upstream"),
+    "queued": ("counter", "Requests that had to wait in the queue"),
+    "rejected": ("counter", "Requests rejected because the queue was full or the wait too long"),
+    "retries": ("counter", "Upstream calls retried after a retryable error"),
+    "rate_limited": ("counter", "429 responses received from the upstream"),
+    "queue_seconds": ("counter", "Total seconds requests spent waiting in the queue"),
+    "paused_seconds": ("gauge", "Seconds left before admission resumes after a 429"),
+}
+
+
+def estimate_tokens(texts: Iterable[str], max_tokens: Optional[int] = None, completion: bool = True) -> int:
+    """
+    ประมาณจำนวน token ที่ OpenAI นับในงบ TPM: token ของ prompt บวก max_tokens ของคำตอบ
+
+    Args:
+        texts: ข้อความของ prompt (เนื้อหาของแต่ละ message หรือข้อความที่ต้องการ embeddings)
+        max_tokens: max_tokens ของคำตอบ (None คือใช้ DEFAULT_COMPLETION_TOKENS)
+        completion: คำขอมีคำตอบเป็นข้อความหรือไม่ (embeddings ไม่มี)
+    """
+    prompt = sum(_counter.count(text) + TOKENS_PER_MESSAGE for text in texts)
+    if not completion:
+        return prompt
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    ข้อผิดพลาดของ upstream ที่ลองใหม่ได้: 429, 408, 409, 5xx และการเชื่อมต่อ (รวม timeout)
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in (408, 409)
+
+
+class UpstreamOverloaded(Exception):
+    """
+    คิวของคำขอไปยัง upstream เต็ม หรือต้องรอนานเกินกำหนด route แปลงเป็น HTTP 503 พร้อม Retry-After
+    """
+
+    def __init__(self, retry_after: float, message: str = "Upstream is overloaded, retry later"):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+async def upstream_overloaded_handler(request: Request, exc: UpstreamOverloaded) -> JSONResponse:
+    """
+    exception handler ของแอปที่แปลง UpstreamOverloaded เป็น HTTP 503 พร้อม header Retry-After
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+class TokenBucket:
+    """
+    token bucket ที่เติมต่อเนื่องตามอัตราต่อนาที และจุได้ไม่เกินงบหนึ่งนาที
+
+    คำขอที่ใหญ่กว่างบทั้งนาทีผ่านได้เมื่อ bucket เต็ม และทำให้ระดับติดลบจนกว่าจะเติมคืน
+    """
+
+    def __init__(self, per_minute: Optional[float]):
+        self.capacity = per_minute
+        self.rate = per_minute / 60 if per_minute else None
+        self.level = per_minute or 0.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.rate is not None:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        เวลาที่ต้องรอจนกว่าจะมีงบพอสำหรับ amount (0 ถ้ามีพอแล้วหรือไม่จำกัด)
+        """
+        if self.rate is None:
+            return 0.0
+        return max(0.0, (min(amount, self.capacity) - self.level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.rate is not None:
+            self.level -= amount
+
+
+class UpstreamScheduler:
+    """
+    ควบคุมการเรียก OpenAI API ภายในงบคำขอต่อนาที (RPM) และ token ต่อนาที (TPM) ที่กำหนดไว้ในเครื่อง
+
+    คำขอที่มีงบพอจะผ่านทันที ถ้าไม่พอจะรอในคิวตามลำดับความสำคัญ (PRIORITY_INTERACTIVE ก่อน PRIORITY_BULK
+    แล้วตามลำดับที่มาถึง) ถ้าคิวเต็มหรือเวลารอโดยประมาณเกิน max_wait_seconds จะปฏิเสธทันทีด้วย
+    UpstreamOverloaded แทนการรอไม่จำกัด
+
+    ข้อผิดพลาดชั่วคราว (429, 408, 409, 5xx, การเชื่อมต่อ) ถูกลองใหม่ด้วย exponential backoff แบบสุ่ม (full jitter)
+    และใช้งบใหม่ทุกครั้ง เมื่อได้ 429 ทั้ง scheduler จะหยุดส่งคำขอจนครบ Retry-After ของ upstream
+    คำขอที่ยังได้ 429 หลังลองครบแล้วจะกลายเป็น UpstreamOverloaded
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_queue_size: int = 1000,
+        max_wait_seconds: float = 30.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0
+    ):
+        """
+        สร้าง UpstreamScheduler
+
+        Args:
+            requests_per_minute: งบคำขอต่อนาที (None คือไม่จำกัด)
+            tokens_per_minute: งบ token ต่อนาที (None คือไม่จำกัด)
+            max_queue_size: จำนวนคำขอที่รอในคิวได้สูงสุด
+            max_wait_seconds: เวลารอโดยประมาณสูงสุดที่ยอมรับ เกินกว่านี้จะปฏิเสธทันที
+            max_retries: จำนวนครั้งที่ลองใหม่เมื่อเกิดข้อผิดพลาดชั่วคราว
+            backoff_base: ระยะรอพื้นฐานของการลองใหม่ครั้งแรก (วินาที) เพิ่มเป็นสองเท่าทุกครั้ง
+            backoff_max: ระยะรอสูงสุดของการลองใหม่ (วินาที)
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue_size = max_queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # (priority, ลำดับที่มาถึง, tokens, future)
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._paused_until = 0.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.queue_seconds = 0.0
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return now
+
+    def _wait_time(self, now: float, requests: int, tokens: int) -> float:
+        return max(self._paused_until - now, self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+
+    def _estimate_wait(self, priority: int, tokens: int) -> float:
+        """
+        เวลารอโดยประมาณของคำขอใหม่ นับเฉพาะคำขอในคิวที่จะได้ก่อน (ความสำคัญเท่ากันหรือสูงกว่า)
+        """
+        now = self._refill()
+        ahead = [entry for entry in self._queue if entry[0] <= priority and not entry[3].done()]
+        return self._wait_time(now, len(ahead) + 1, sum(entry[2] for entry in ahead) + tokens)
+
+    def ensure_capacity(self, tokens: int = 0, priority: Optional[int] = None) -> None:
+        """
+        ปฏิเสธทันทีด้วย UpstreamOverloaded ถ้าคำขอใหม่จะถูกปฏิเสธเมื่อเข้าคิว
+
+        ใช้กับ route แบบ stream ที่ต้องตัดสินใจก่อนส่ง header ของคำตอบ
+        """
+        priority = request_priority.get() if priority is None else priority
+        if len(self._queue) >= self.max_queue_size:
+            self.rejected += 1
+            raise UpstreamOverloaded(self._estimate_wait(priority, tokens))
+        wait = self._estimate_wait(priority, tokens)
+        if wait > self.max_wait_seconds:
+            self.rejected += 1
+            raise UpstreamOverloaded(wait)
+
+    async def acquire(self, tokens: int, priority: Optional[int] = None) -> None:
+        """
+        รอจนกว่าจะมีงบสำหรับคำขอหนึ่งครั้งที่ใช้ tokens token
+        """
+        priority = request_priority.get() if priority is None else priority
+        now = self._refill()
+        if not self._queue and self._wait_time(now, 1, tokens) <= 0:
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.admitted += 1
+            return
+
+        self.ensure_capacity(tokens, priority)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), tokens, future))
+        self.queued += 1
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+        started = time.monotonic()
+        # ถ้าผู้เรียกถูกยกเลิกระหว่างรอ future จะถูกยกเลิกด้วยและ dispatcher จะข้ามไป
+        await future
+        self.queue_seconds += time.monotonic() - started
+
+    async def _dispatch(self) -> None:
+        """
+        ปล่อยคำขอในคิวตามลำดับความสำคัญเมื่อมีงบพอ
+        """
+        while self._queue:
+            priority, sequence, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            now = self._refill()
+            wait = self._wait_time(now, 1, tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            heapq.heappop(self._queue)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self.admitted += 1
+            future.set_result(None)
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """
+        ระยะรอที่ upstream แนะนำจาก header retry-after-ms หรือ retry-after (วินาที)
+        """
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            if response.headers.get("retry-after-ms"):
+                return float(response.headers["retry-after-ms"]) / 1000
+            if response.headers.get("retry-after"):
+                return float(response.headers["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+    async def call(self, factory: Callable[[], Awaitable[T]], tokens: int, priority: Optional[int] = None) -> T:
+        """
+        เรียก factory() เมื่อมีงบ และลองใหม่เมื่อเกิดข้อผิดพลาดชั่วคราว
+
+        Args:
+            factory: ฟังก์ชันที่เรียก API หนึ่งครั้ง (ถูกเรียกใหม่ทุกครั้งที่ลองใหม่)
+            tokens: จำนวน token โดยประมาณของคำขอ (ดู estimate_tokens)
+            priority: ลำดับความสำคัญ (None คือใช้ request_priority ของคำขอปัจจุบัน)
+
+        Returns:
+            ค่าที่ factory() คืนกลับ
+        """
+        priority = request_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            await self.acquire(tokens, priority)
+            try:
+                return await factory()
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                rate_limited = isinstance(e, openai.RateLimitError)
+                retry_after = self._retry_after(e)
+                if rate_limited:
+                    self.rate_limited += 1
+                if attempt >= self.max_retries:
+                    if rate_limited:
+                        raise UpstreamOverloaded(retry_after or self.backoff_base) from e
+                    raise
+
+                # full jitter: สุ่มระยะรอเพื่อไม่ให้คำขอที่ล้มเหลวพร้อมกันลองใหม่พร้อมกัน
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if retry_after is not None:
+                    delay += retry_after
+                if rate_limited:
+                    # หยุดทั้ง scheduler ไม่ใช่เฉพาะคำขอนี้ คำขออื่นที่ส่งไปตอนนี้ก็จะได้ 429 เช่นกัน
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                attempt += 1
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        สถิติของ scheduler
+
+        Returns:
+            Dict[str, Any]: งบที่เหลือ จำนวนคำขอที่ผ่าน ที่ต้องรอคิว ที่ถูกปฏิเสธ การลองใหม่ และเวลารอรวมกับเวลารอเฉลี่ย
+        """
+        self._refill()
+        return {
+            "requests_per_minute": self.requests.capacity,
+            "tokens_per_minute": self.tokens.capacity,
+            "available_requests": round(self.requests.level, 1) if self.requests.rate else None,
+            "available_tokens": round(self.tokens.level) if self.tokens.rate else None,
+            "queue_length": sum(1 for entry in self._queue if not entry[3].done()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "queue_seconds": self.queue_seconds,
+            "avg_queue_seconds": self.queue_seconds / self.queued if self.queued else 0.0,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+        }
@@ -0,0 +1,165 @@
+import threading
+import numpy as np
+from typing import List, Optional, Tuple, Sequence
+from services.embedding_segment import EmbeddingSegment
+
+
+class VectorIndex:
+    """
+    ดัชนีเวกเตอร์สำหรับโมเดลและจำนวนมิติหนึ่งๆ ที่อ่านเวกเตอร์จาก EmbeddingSegment
+
+    เวกเตอร์ใน segment ถูก normalize ไว้แล้ว จึงคำนวณ cosine similarity ของทุกเอกสารได้ด้วยการคูณ
+    matrix-vector ครั้งเดียวบน memmap และเลือก top-k ด้วย argpartition ในหน่วยความจำของ process
+    เก็บ ID ของเอกสารต่อแถว (-1 สำหรับแถวที่ถูกลบหรือไม่มีเจ้าของ) และแถวต่อ ID ของเอกสาร (ID ของ SQLite
+    เรียงต่อกันจึงใช้ array ที่ index ด้วย ID ได้) เพื่อให้การลบเอกสารไม่ต้องสแกนทุกแถว
+
+    เวกเตอร์อยู่ใน page cache ผ่าน memmap ไม่นับเป็นหน่วยความจำของ process แต่ array ทั้งสองยังโตตามจำนวนเอกสาร
+    ประมาณ 16 ไบต์ต่อเอกสาร (8 ไบต์ต่อแถวและ 8 ไบต์ต่อ ID ที่เคยใช้) หน่วยความจำของ process จึงไม่คงที่ทั้งหมด
+    แต่เล็กกว่าขนาดเวกเตอร์มาก (เช่น 1536 มิติคือ 6 KB ต่อเอกสาร)
+    """
+
+    def __init__(self, segment: EmbeddingSegment):
+        """
+        สร้าง VectorIndex
+
+        Args:
+            segment: ไฟล์ segment ที่เก็บเวกเตอร์
+        """
+        self.segment = segment
+        self.dimensions = segment.dimensions
+        self._row_ids = np.full(max(len(segment), 1024), -1, dtype=np.int64)
+        self._id_rows = np.full(1024, -1, dtype=np.int64)
+        self._count = 0
+        self._lock = threading.Lock()
+        self.last_embedding_id = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def _grow(array: np.ndarray, size: int) -> np.ndarray:
+        """
+        ขยาย array แบบเพิ่มเป็นเท่าตัว เพื่อให้การเพิ่มทีละแถวมีต้นทุนเฉลี่ยคงที่
+        """
+        if size <= array.shape[0]:
+            return array
+        grown = np.full(max(size, array.shape[0] * 2), -1, dtype=np.int64)
+        grown[:array.shape[0]] = array
+        return grown
+
+    def add(self, document_id: int, row: int) -> None:
+        """
+        ผูกเอกสารเข้ากับแถวใน segment
+
+        Args:
+            document_id: ID ของเอกสาร
+            row: หมายเลขแถวใน segment
+        """
+        self.add_batch([document_id], [row])
+
+    def add_batch(self, document_ids: Sequence[int], rows: Sequence[int]) -> None:
+        """
+        ผูกเอกสารหลายรายการเข้ากับแถวใน segment
+
+        Args:
+            document_ids: รายการ ID ของเอกสาร
+            rows: หมายเลขแถวใน segment ของแต่ละเอกสาร
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return
+
+        # ถ้า ID ซ้ำกันใน batch ใช้แถวสุดท้าย
+        _, last = np.unique(document_ids[::-1], return_index=True)
+        if last.shape[0] < document_ids.shape[0]:
+            keep = document_ids.shape[0] - 1 - last
+            document_ids, rows = document_ids[keep], rows[keep]
+
+        with self._lock:
+            self._row_ids = self._grow(self._row_ids, int(rows.max()) + 1)
+            self._id_rows = self._grow(self._id_rows, int(document_ids.max()) + 1)
+            # เอกสารที่ถูกเพิ่มซ้ำย้ายไปแถวใหม่ แถวเดิมจึงไม่มีเจ้าของอีกต่อไป
+            previous = self._id_rows[document_ids]
+            self._row_ids[previous[previous >= 0]] = -1
+            self._count += int(np.count_nonzero(previous < 0))
+            self._id_rows[document_ids] = rows
+            self._row_ids[rows] = document_ids
+
+    def remove(self, document_id: int) -> bool:
+        """
+        ลบเอกสารออกจากดัชนี แถวใน segment ยังคงอยู่แต่จะไม่ถูกนำมาคำนวณอีก
+
+        Args:
+            document_id: ID ของเอกสาร
+
+        Returns:
+            bool: True ถ้าลบสำเร็จ, False ถ้าไม่พบเอกสารในดัชนี
+        """
+        with self._lock:
+            if not 0 <= document_id < self._id_rows.shape[0] or self._id_rows[document_id] < 0:
+                return False
+            self._row_ids[self._id_rows[document_id]] = -1
+            self._id_rows[document_id] = -1
+            self._count -= 1
+            return True
+
+    def entries(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ID ของเอกสารและหมายเลขแถวใน segment ของทุกเอกสารในดัชนี
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: ID ของเอกสาร และหมายเลขแถว
+        """
+        with self._lock:
+            rows = np.nonzero(self._row_ids >= 0)[0]
+            return self._row_ids[rows], rows
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int = 5,
+        rows: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        ค้นหาเอกสารที่มี cosine similarity สูงสุด
+
+        Args:
+            query_embedding: embedding vector ของคำค้นหา
+            top_k: จำนวนผลลัพธ์ที่ต้องการ
+            rows: จำกัดการคำนวณเฉพาะหมายเลขแถวเหล่านี้ (เช่นผลจากการกรอง metadata) ถ้าไม่ระบุจะคำนวณทุกแถว
+
+        Returns:
+            List[Tuple[int, float]]: รายการ (document_id, similarity) เรียงจากมากไปน้อย
+        """
+        query = EmbeddingSegment.normalize(query_embedding)
+        matrix = self.segment.matrix()
+        if matrix.shape[0] == 0 or top_k <= 0:
+            return []
+
+        if rows is not None:
+            # อ่านเฉพาะแถวที่ผ่านเงื่อนไข เรียงตามตำแหน่งในไฟล์เพื่อให้อ่านต่อเนื่อง
+            rows = np.unique(np.asarray(rows, dtype=np.int64))
+            rows = rows[rows < min(matrix.shape[0], self._row_ids.shape[0])]
+            scores = matrix[rows] @ query
+            with self._lock:
+                row_ids = self._row_ids[rows]
+        else:
+            # อ่านจาก page cache ผ่าน memmap โดยตรง สิ่งที่สร้างในหน่วยความจำมีเพียงคะแนนต่อแถว
+            scores = matrix @ query
+            with self._lock:
+                count = min(scores.shape[0], self._row_ids.shape[0])
+                scores = scores[:count]
+                row_ids = self._row_ids[:count].copy()
+
+        scores[row_ids < 0] = -np.inf
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return []
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        return [(int(row_ids[i]), float(scores[i])) for i in order if row_ids[i] >= 0]
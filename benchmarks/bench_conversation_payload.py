@@ -0,0 +1,84 @@
+"""
+วัดขนาดคำขอและเวลาที่เซิร์ฟเวอร์ใช้ต่อรอบของบทสนทนา ระหว่าง GET /chat/stream เดิม (ส่งประวัติทั้งหมดเป็น
+JSON ใน query string) กับ GET /conversations/{id}/messages/stream (ส่งเฉพาะข้อความใหม่)
+
+ใช้ OpenAIService จำลองที่ตอบทันที เวลาที่วัดจึงเป็นงานของเซิร์ฟเวอร์เอง (แปลง URL, ตรวจสอบ messages,
+อ่านประวัติจากที่เก็บ และส่ง SSE) ผ่าน TestClient ของ Starlette
+
+วิธีใช้:
+    python benchmarks/bench_conversation_payload.py --turns 200 --reply-chars 400
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+# ฐานข้อมูลบทสนทนาถูกสร้างใน data/ ของโฟลเดอร์ชั่วคราว
+os.chdir(tempfile.mkdtemp(prefix="bench_conversation_payload_"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from schema.openai.chat_models import ChatStreamResponse  # noqa: E402
+from services.opeai_service import get_openai_service  # noqa: E402
+from routes.openai import chat_route, conversation_route  # noqa: E402
+
+
+class FakeOpenAIService:
+    def __init__(self, reply):
+        self.reply = reply
+
+    async def chat_completion_stream(self, request):
+        yield ChatStreamResponse(delta=self.reply)
+        yield ChatStreamResponse(delta="", finish_reason="stop")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--reply-chars", type=int, default=400, help="ความยาวของคำตอบแต่ละรอบ (ตัวอักษร)")
+    parser.add_argument("--report-every", type=int, default=50)
+    args = parser.parse_args()
+
+    reply = ("ตอบ " * args.reply_chars)[:args.reply_chars]
+    app = FastAPI()
+    app.include_router(chat_route.router)
+    app.include_router(conversation_route.router)
+    app.dependency_overrides[get_openai_service] = lambda: FakeOpenAIService(reply)
+    client = TestClient(app)
+
+    conversation_id = client.post("/api/v1/openai/conversations", json={}).json()["id"]
+    history = []
+    print(f"{'turn':>5} {'legacy bytes':>13} {'legacy ms':>10} {'session bytes':>14} {'session ms':>11}")
+    for turn in range(1, args.turns + 1):
+        question = f"คำถามที่ {turn}"
+        history.append({"role": "user", "content": question})
+
+        legacy_url = "/api/v1/openai/chat/stream?" + urlencode({"messages": json.dumps(history, ensure_ascii=False)})
+        started = time.perf_counter()
+        try:
+            client.get(legacy_url).raise_for_status()
+            legacy_ms = f"{(time.perf_counter() - started) * 1000:.2f}"
+        except Exception as e:
+            # client และ proxy ส่วนใหญ่จำกัดความยาว URL (httpx ไม่เกิน 64 KB)
+            legacy_ms = type(e).__name__
+
+        session_url = f"/api/v1/openai/conversations/{conversation_id}/messages/stream?" + urlencode({"content": question})
+        started = time.perf_counter()
+        client.get(session_url).raise_for_status()
+        session_ms = (time.perf_counter() - started) * 1000
+
+        history.append({"role": "assistant", "content": reply})
+        if turn % args.report_every == 0 or turn == 1:
+            print(f"{turn:>5} {len(legacy_url.encode()):>13,} {legacy_ms:>10} "
+                  f"{len(session_url.encode()):>14,} {session_ms:>11.2f}")
+
+    print(f"store stats: {app.state.conversation_store.stats()}")
+
+
+if __name__ == "__main__":
+    main()
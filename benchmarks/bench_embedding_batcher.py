@@ -0,0 +1,115 @@
+"""
+เปรียบเทียบ throughput และ latency ของ OpenAIService.create_embeddings เมื่อปิด/เปิด EmbeddingBatcher
+
+ผู้เรียกแต่ละรายส่งข้อความเดียว (แบบเดียวกับ /embeddings และ /embeddings-storage) พร้อมกัน --concurrency ราย
+upstream ถูกจำลองในโปรเซสเดียวกัน: ใช้เวลา --base-latency มิลลิวินาทีต่อคำขอ บวก --per-input มิลลิวินาที
+ต่อข้อความ และรับคำขอพร้อมกันได้ไม่เกิน --upstream-limit คำขอ (แทน rate limit และ connection pool)
+ปิดแคช embeddings และการรวมคำขอที่เหมือนกันเพื่อวัดเฉพาะผลของการรวมชุด
+
+latency ที่เพิ่มขึ้นจากการรวมชุดมีค่าไม่เกิน max_wait_ms ต่อคำขอ แต่ลดจำนวนคำขอที่ต้องรอคิว upstream
+
+วิธีใช้:
+    python benchmarks/bench_embedding_batcher.py --requests 5000 --concurrency 256 --upstream-limit 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+os.environ["COALESCE_REQUESTS"] = "false"
+# ไฟล์แคชทั้งหมดถูกสร้างใน data/ ของโฟลเดอร์ชั่วคราว
+os.chdir(tempfile.mkdtemp(prefix="bench_embedding_batcher_"))
+
+from schema.openai.embeddings_models import EmbeddingsRequest  # noqa: E402
+from services.embedding_batcher import EmbeddingBatcher  # noqa: E402
+from services.opeai_service import OpenAIService  # noqa: E402
+
+
+def make_fake_client(args, counter):
+    """
+    สร้าง client จำลองที่มี latency ตามจำนวนข้อความและจำกัดจำนวนคำขอพร้อมกัน
+    """
+    semaphore = asyncio.Semaphore(args.upstream_limit)
+
+    async def create(**params):
+        texts = params["input"] if isinstance(params["input"], list) else [params["input"]]
+        async with semaphore:
+            counter.append(len(texts))
+            await asyncio.sleep((args.base_latency + args.per_input * len(texts)) / 1000)
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=[0.0] * 8) for i in range(len(texts))],
+            model=params["model"],
+            usage=SimpleNamespace(prompt_tokens=len(texts), total_tokens=len(texts))
+        )
+
+    return SimpleNamespace(embeddings=SimpleNamespace(create=create))
+
+
+async def run(args, max_wait_ms):
+    """
+    ส่งคำขอทั้งหมดและคืน (คำขอต่อวินาที, latency p50, p99 เป็นมิลลิวินาที, จำนวนคำขอ upstream)
+    """
+    counter = []
+    service = OpenAIService(client=make_fake_client(args, counter))
+    service.embedding_batcher = None if max_wait_ms is None else EmbeddingBatcher(
+        service.client.embeddings.create, max_batch_size=args.max_batch_size, max_wait_ms=max_wait_ms
+    )
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await service.create_embeddings(EmbeddingsRequest(input=f"text {i}"))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[call(i) for i in range(args.requests)])
+    elapsed = time.perf_counter() - started
+
+    latencies = np.array(latencies) * 1000
+    return args.requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99), len(counter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--upstream-limit", type=int, default=16, help="จำนวนคำขอ upstream พร้อมกันสูงสุด")
+    parser.add_argument("--base-latency", type=float, default=40.0, help="latency ต่อคำขอ upstream (มิลลิวินาที)")
+    parser.add_argument("--per-input", type=float, default=0.05, help="latency เพิ่มต่อข้อความ (มิลลิวินาที)")
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait", type=float, nargs="+", default=[1.0, 5.0, 20.0],
+                        help="ค่า max_wait_ms ที่ต้องการเปรียบเทียบ")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, upstream limit {args.upstream_limit}, "
+          f"upstream latency {args.base_latency:.0f} ms + {args.per_input} ms/input")
+    print(f"{'batching':>14} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'upstream':>9}")
+    for max_wait_ms in [None, *args.max_wait]:
+        name = "off" if max_wait_ms is None else f"wait {max_wait_ms:g} ms"
+        throughput, p50, p99, upstream = asyncio.run(run(args, max_wait_ms))
+        print(f"{name:>14} {throughput:>9.1f} {p50:>9.2f} {p99:>9.2f} {upstream:>9}")
+
+    # ที่โหลดต่ำ (ผู้เรียกทีละราย) การรวมชุดเพิ่ม latency ได้ไม่เกิน max_wait_ms
+    args.requests, args.concurrency = 200, 1
+    print(f"\n{args.requests} requests, concurrency 1 (added latency at low load)")
+    print(f"{'batching':>14} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'upstream':>9}")
+    for max_wait_ms in [None, *args.max_wait]:
+        name = "off" if max_wait_ms is None else f"wait {max_wait_ms:g} ms"
+        throughput, p50, p99, upstream = asyncio.run(run(args, max_wait_ms))
+        print(f"{name:>14} {throughput:>9.1f} {p50:>9.2f} {p99:>9.2f} {upstream:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+วัดผลกระทบของการค้นหาเอกสารต่อ latency ของ stream อื่นใน event loop เดียวกัน
+
+จำลอง chat stream ที่ส่ง token ทุกๆ --interval มิลลิวินาที แล้วยิงคำขอ /search ของ
+embeddings storage พร้อมกันผ่าน ASGI (ไม่ผ่านเครือข่าย) โดยใช้ embedding ปลอมแทน OpenAI
+รายงานระยะห่างระหว่าง token (p50/p99/max) ของสองแบบ:
+    inline    เรียก SQLiteService ใน event loop โดยตรง (พฤติกรรมเดิม)
+    executor  เรียกผ่าน sqlite_service.run() ใน executor แยก
+
+ถ้า executor ทำงานถูกต้อง ระยะห่างระหว่าง token ควรใกล้เคียงกับ --interval ไม่ว่าจะค้นหาอยู่หรือไม่
+
+วิธีใช้:
+    python benchmarks/bench_event_loop_latency.py --documents 200000 --dimensions 256 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+# ไฟล์ฐานข้อมูลและแคชทั้งหมดถูกสร้างใน data/ ของโฟลเดอร์ชั่วคราว
+os.chdir(tempfile.mkdtemp(prefix="bench_event_loop_latency_"))
+
+import httpx  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from routes import embeddings_storage_route  # noqa: E402
+from routes.embeddings_storage_route import router, sqlite_service  # noqa: E402
+from schema.openai.embeddings_models import EmbeddingsResponse, EmbeddingData, EmbeddingsUsage  # noqa: E402
+from services.opeai_service import get_openai_service  # noqa: E402
+
+
+def make_fake_openai(dimensions):
+    """
+    สร้างคลาสแทน OpenAIService ที่คืน embedding แบบสุ่มโดยไม่เรียก API
+    """
+    rng = np.random.default_rng(1)
+
+    class FakeOpenAIService:
+        async def create_embeddings(self, request):
+            texts = [request.input] if isinstance(request.input, str) else request.input
+            return EmbeddingsResponse(
+                data=[
+                    EmbeddingData(embedding=rng.standard_normal(dimensions).tolist(), index=i)
+                    for i in range(len(texts))
+                ],
+                model=request.model,
+                usage=EmbeddingsUsage(prompt_tokens=0, total_tokens=0)
+            )
+
+    return FakeOpenAIService
+
+
+async def fake_stream(stop, interval, gaps):
+    """
+    จำลอง chat stream: รอ interval วินาทีต่อ token และบันทึกระยะห่างจริงระหว่าง token
+    """
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        gaps.append(now - last)
+        last = now
+
+
+async def run_searches(client, model, requests, concurrency):
+    """
+    ยิงคำขอค้นหาทั้งหมดโดยมีคำขอค้างอยู่พร้อมกันไม่เกิน concurrency
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def search(i):
+        async with semaphore:
+            response = await client.post(
+                "/api/v1/embeddings-storage/search",
+                json={"query": f"query {i}", "model": model, "top_k": 10}
+            )
+            response.raise_for_status()
+
+    await asyncio.gather(*[search(i) for i in range(requests)])
+
+
+async def measure(app, model, args):
+    """
+    วัดระยะห่างระหว่าง token ของ stream จำลองขณะที่มีการค้นหา
+    """
+    gaps = []
+    stop = asyncio.Event()
+    stream = asyncio.create_task(fake_stream(stop, args.interval / 1000, gaps))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await run_searches(client, model, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await stream
+    gaps = np.array(gaps) * 1000
+    return elapsed, np.percentile(gaps, 50), np.percentile(gaps, 99), gaps.max()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=5.0, help="ระยะห่างระหว่าง token ของ stream จำลอง (มิลลิวินาที)")
+    args = parser.parse_args()
+
+    model = "bench-embedding"
+    rng = np.random.default_rng(0)
+    for start in range(0, args.documents, 10_000):
+        count = min(10_000, args.documents - start)
+        vectors = rng.standard_normal((count, args.dimensions), dtype=np.float32)
+        sqlite_service.add_documents(
+            [{"content": f"document {start + i}", "embedding": vector} for i, vector in enumerate(vectors)],
+            model=model
+        )
+    # โหลดดัชนีก่อนจับเวลา
+    sqlite_service.search_similar(rng.standard_normal(args.dimensions).tolist(), model)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_openai_service] = make_fake_openai(args.dimensions)
+
+    run_in_executor = sqlite_service.run
+
+    async def run_inline(func, *a, **kw):
+        return func(*a, **kw)
+
+    print(f"{args.documents} documents, {args.requests} searches, concurrency {args.concurrency}, "
+          f"token interval {args.interval:.1f} ms")
+    print(f"{'mode':>10} {'searches/s':>11} {'p50 gap ms':>11} {'p99 gap ms':>11} {'max gap ms':>11}")
+    for mode, runner in (("inline", run_inline), ("executor", run_in_executor)):
+        embeddings_storage_route.sqlite_service.run = runner
+        elapsed, p50, p99, worst = asyncio.run(measure(app, model, args))
+        print(f"{mode:>10} {args.requests / elapsed:>11.1f} {p50:>11.2f} {p99:>11.2f} {worst:>11.2f}")
+
+    sqlite_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+วัด latency ของคำขอ chat/embeddings แบบไม่ใช่ stream ผ่าน UpstreamPool ที่มีหลายปลายทาง เมื่อปิดและเปิด hedge
+
+เปิด mock_openai.py --targets ตัวเป็นปลายทาง แต่ละตัวช้าเป็นบางครั้งแบบอิสระต่อกัน (--slow-fraction ของคำขอได้เวลาเพิ่ม
+--slow-ms) ซึ่งทำให้ p99 เท่ากับเวลาของโหนดที่ช้า แล้วเรียก OpenAIService โดยตรง (ปิดแคช การรวมคำขอ batcher และ scheduler
+เพื่อให้ทุกคำขอไปถึง upstream) รายงาน p50/p95/p99/max และจำนวนคำขอที่ส่งไปยัง upstream เพิ่มจากการ hedge
+
+วิธีใช้:
+    python benchmarks/bench_hedging.py --operation chat --targets 3 --latency-ms 50 --slow-fraction 0.05 --slow-ms 1000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.chdir(tempfile.mkdtemp(prefix="bench_hedging_"))
+# ทุกคำขอต้องไปถึง upstream และ pool ถูกสร้างในสคริปต์นี้เอง
+os.environ.update({
+    "OPENAI_API_KEY": "mock",
+    "EMBEDDING_CACHE_ENABLED": "false",
+    "CHAT_CACHE_ENABLED": "false",
+    "COALESCE_REQUESTS": "false",
+    "EMBEDDING_BATCH_ENABLED": "false",
+    "UPSTREAM_SCHEDULER_ENABLED": "false",
+    "CHAT_TOKEN_BUDGET_ENABLED": "false",
+})
+
+from loadtest import free_port, wait_for_port  # noqa: E402
+from schema.openai.chat_models import ChatMessage, ChatRequest  # noqa: E402
+from schema.openai.embeddings_models import EmbeddingsRequest  # noqa: E402
+from services.opeai_service import OpenAIService, create_openai_client  # noqa: E402
+from services.upstream_pool import UpstreamPool, UpstreamTarget  # noqa: E402
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+
+def start_targets(args):
+    processes, urls = [], []
+    for _ in range(args.targets):
+        port = free_port()
+        process = subprocess.Popen([
+            sys.executable, str(BENCHMARKS_DIR / "mock_openai.py"), "--port", str(port),
+            "--latency-ms", str(args.latency_ms), "--tokens-per-second", "0", "--completion-tokens", "20",
+            "--slow-fraction", str(args.slow_fraction), "--slow-ms", str(args.slow_ms)
+        ])
+        processes.append(process)
+        wait_for_port(port, process)
+        urls.append(f"http://127.0.0.1:{port}/v1")
+    return processes, urls
+
+
+async def run(args, urls, hedge):
+    pool = UpstreamPool(
+        [UpstreamTarget(f"mock-{i}", create_openai_client("mock", url)) for i, url in enumerate(urls)],
+        hedge=hedge,
+        hedge_percentile=args.percentile,
+        hedge_budget_ratio=args.budget_ratio
+    )
+    service = OpenAIService(upstream_pool=pool)
+
+    async def one(i):
+        started = time.perf_counter()
+        if args.operation == "chat":
+            await service.chat_completion(ChatRequest(
+                messages=[ChatMessage(role="user", content=f"คำถามที่ {i}")], max_tokens=20, cache=False
+            ))
+        else:
+            await service.create_embeddings(EmbeddingsRequest(input=[f"ข้อความที่ {i}"], model="text-embedding-3-small"))
+        return time.perf_counter() - started
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(i):
+        async with semaphore:
+            return await one(i)
+
+    # warm-up ให้ pool มีตัวอย่างเวลาตอบสนองพอคำนวณเปอร์เซ็นไทล์
+    await asyncio.gather(*[limited(i) for i in range(args.warmup)])
+    calls_before = sum(target.calls for target in pool.targets)
+    hedged_before, wins_before = pool.hedged, pool.hedge_wins
+
+    latencies = np.array(await asyncio.gather(*[limited(args.warmup + i) for i in range(args.requests)])) * 1000
+    upstream_calls = sum(target.calls for target in pool.targets) - calls_before
+    await pool.close()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{'on' if hedge else 'off':>5} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} {latencies.max():>8.1f} "
+          f"{pool.hedged - hedged_before:>7} {pool.hedge_wins - wins_before:>5} {(upstream_calls / args.requests - 1) * 100:>7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--operation", choices=["chat", "embeddings"], default="chat")
+    parser.add_argument("--targets", type=int, default=3, help="จำนวนปลายทางจำลอง")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="เวลาตอบสนองปกติของปลายทาง")
+    parser.add_argument("--slow-fraction", type=float, default=0.05, help="สัดส่วนของคำขอที่ช้าในแต่ละปลายทาง")
+    parser.add_argument("--slow-ms", type=float, default=1000.0, help="เวลาที่เพิ่มให้คำขอที่ช้า")
+    parser.add_argument("--percentile", type=float, default=95.0, help="เปอร์เซ็นไทล์ที่ใช้เป็นเวลาก่อน hedge")
+    parser.add_argument("--budget-ratio", type=float, default=0.1, help="สัดส่วนสูงสุดของคำขอซ้ำ")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    processes, urls = start_targets(args)
+    try:
+        print(f"{'hedge':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'hedged':>7} {'wins':>5} {'extra':>8}")
+        for hedge in (False, True):
+            asyncio.run(run(args, urls, hedge))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+วัดเวลาค้นหาและอัตราการพบเอกสารเป้าหมายของ SQLiteService.search_similar ในโหมด exact, hybrid และ lexical
+
+คลังเอกสารจำลองเป็นข้อความภาษาไทยแบบสุ่มที่แต่ละเอกสารมีรหัสสินค้าไม่ซ้ำกัน (เช่น SKU-000123) และ embedding
+แบบ clustered คำค้นหาคือรหัสสินค้าพร้อมคำภาษาไทย โดย embedding ของคำค้นหาเป็นเวกเตอร์ของเอกสารเป้าหมาย
+ที่ใส่ noise มาก จำลองกรณีที่ embedding แยกรหัสสินค้าออกจากกันไม่ได้ รายงาน ms/query และ hit@k
+(สัดส่วนคำค้นหาที่เอกสารเป้าหมายอยู่ใน top_k)
+
+วิธีใช้:
+    python benchmarks/bench_hybrid_search.py --documents 100000 --dimensions 256 --queries 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.chdir(tempfile.mkdtemp(prefix="bench_hybrid_search_"))
+
+from services.sqlite_service import SQLiteService  # noqa: E402
+
+MODEL = "bench-model"
+WORDS = [
+    "โรงแรม", "ริมทะเล", "เชียงใหม่", "ภูเก็ต", "กระบี่", "ทัวร์", "ดำน้ำ", "ตั๋ว", "เครื่องบิน", "ร้านอาหาร",
+    "ราคาถูก", "ครอบครัว", "สปา", "ห้องพัก", "วิวภูเขา", "ตลาดน้ำ", "วัด", "พิพิธภัณฑ์", "เดินป่า", "ล่องเรือ"
+]
+
+
+def build_corpus(service, rng, args):
+    """
+    เพิ่มเอกสารจำลองเป็นชุดๆ และคืนเวกเตอร์ของทุกเอกสารตามลำดับ document_id
+    """
+    centers = rng.standard_normal((max(16, args.documents // 500), args.dimensions), dtype=np.float32)
+    vectors = centers[rng.integers(0, centers.shape[0], args.documents)]
+    vectors += rng.standard_normal(vectors.shape, dtype=np.float32) * 0.6
+
+    document_ids = []
+    for start in range(0, args.documents, 1000):
+        batch = []
+        for i in range(start, min(start + 1000, args.documents)):
+            words = "".join(rng.choice(WORDS, 6))
+            batch.append({"content": f"{words} รหัส SKU-{i:06d}", "embedding": vectors[i]})
+        document_ids.extend(service.add_documents(batch, MODEL))
+    return np.asarray(document_ids), vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=100, help="จำนวนผู้สมัครจากแต่ละฝั่ง")
+    parser.add_argument("--noise", type=float, default=3.0, help="ขนาด noise ของ embedding คำค้นหา")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    service = SQLiteService(db_path="data/bench.db", migrate_in_background=False)
+    start = time.perf_counter()
+    document_ids, vectors = build_corpus(service, rng, args)
+    print(f"indexed {args.documents} documents in {time.perf_counter() - start:.1f}s")
+
+    targets = rng.integers(0, args.documents, args.queries)
+    queries = [
+        (vectors[i] + rng.standard_normal(args.dimensions, dtype=np.float32) * args.noise, f"ราคา SKU-{i:06d}")
+        for i in targets
+    ]
+    # โหลดดัชนีและ page cache ก่อนจับเวลา
+    service.search_similar(queries[0][0].tolist(), MODEL, args.top_k)
+
+    print(f"{'mode':>8} {'ms/query':>10} {'hit@' + str(args.top_k):>8}")
+    for mode in ("exact", "hybrid", "lexical"):
+        hits = 0
+        start = time.perf_counter()
+        for target, (embedding, text) in zip(targets, queries):
+            results = service.search_similar(
+                embedding.tolist(), MODEL, args.top_k, mode=mode, query_text=text, candidates=args.candidates
+            )
+            hits += any(result["document_id"] == document_ids[target] for result in results)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+        print(f"{mode:>8} {elapsed_ms:>10.2f} {hits / args.queries:>8.3f}")
+
+    service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+เปรียบเทียบ overhead ต่อคำขอระหว่างการสร้าง AsyncOpenAI ใหม่ทุกคำขอ (แบบเดิมของ Depends(OpenAIService))
+กับ client ตัวเดียวที่ใช้ร่วมกันจาก create_openai_client()
+
+ค่าเริ่มต้นจะเปิดเซิร์ฟเวอร์จำลอง /v1/embeddings บน localhost (HTTP ธรรมดา จึงยังไม่รวมต้นทุน TLS
+handshake) ถ้าต้องการวัดกับ endpoint จริงผ่าน HTTPS ให้ระบุ --base-url และ OPENAI_API_KEY
+
+วิธีใช้:
+    python benchmarks/bench_openai_client.py --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+# แคช embeddings ของ service ถูกสร้างใน data/ ของโฟลเดอร์ชั่วคราว
+os.chdir(tempfile.mkdtemp(prefix="bench_openai_client_"))
+
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from openai import AsyncOpenAI  # noqa: E402
+
+
+def start_mock_server():
+    """
+    เปิดเซิร์ฟเวอร์จำลอง embeddings ใน thread แยก และคืน base URL
+    """
+    mock = FastAPI()
+
+    @mock.post("/v1/embeddings")
+    async def embeddings(body: dict):
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        return {
+            "object": "list",
+            "model": body["model"],
+            "data": [{"object": "embedding", "index": i, "embedding": [0.0] * 8} for i in range(len(texts))],
+            "usage": {"prompt_tokens": len(texts), "total_tokens": len(texts)}
+        }
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(mock, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/v1"
+
+
+async def run(make_client, shared, requests, concurrency):
+    """
+    ส่งคำขอ embeddings ทั้งหมดและคืน (คำขอต่อวินาที, latency p50, p99 เป็นมิลลิวินาที)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    client = make_client() if shared else None
+
+    async def call(i):
+        async with semaphore:
+            started = time.perf_counter()
+            if shared:
+                await client.embeddings.create(model="text-embedding-3-small", input=f"text {i}")
+            else:
+                # แบบเดิม: สร้าง client (และ connection pool ใหม่) ทุกคำขอ
+                per_request = make_client()
+                try:
+                    await per_request.embeddings.create(model="text-embedding-3-small", input=f"text {i}")
+                finally:
+                    await per_request.close()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[call(i) for i in range(requests)])
+    elapsed = time.perf_counter() - started
+    if client is not None:
+        await client.close()
+
+    latencies = np.array(latencies) * 1000
+    return requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--base-url", default=None, help="endpoint ที่ต้องการวัด ถ้าไม่ระบุจะใช้เซิร์ฟเวอร์จำลอง")
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = args.base_url or start_mock_server()
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    from services.opeai_service import create_openai_client
+
+    def per_request_client():
+        return AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], base_url=os.environ["OPENAI_BASE_URL"])
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, upstream {os.environ['OPENAI_BASE_URL']}")
+    print(f"{'client':>12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, make_client, shared in (
+        ("per-request", per_request_client, False),
+        ("shared", create_openai_client, True),
+    ):
+        throughput, p50, p99 = asyncio.run(run(make_client, shared, args.requests, args.concurrency))
+        print(f"{name:>12} {throughput:>9.1f} {p50:>9.2f} {p99:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+วัด event ต่อวินาทีต่อ core ของการส่ง chat stream เป็น Server-Sent Events ระหว่างแบบเดิมของ /chat/stream
+(json.dumps(chunk.model_dump()) และสร้าง str ต่อ event) กับ SSEWriter + encode_chat_chunk
+
+ส่ง event ผ่าน StreamingResponse ของ Starlette ไปยัง ASGI send จำลอง (ไม่ผ่านเครือข่าย) แล้วหารจำนวน event
+ด้วยเวลา CPU ของ process ทดสอบสองรูปแบบของ upstream:
+    1/tick  หนึ่ง event ต่อรอบของ event loop (เช่น chunk จาก upstream ทีละชิ้น)
+    N/tick  หลาย event ในรอบเดียวกัน (เช่นคำตอบจากแคชหรือ chunker ที่ส่งหลายส่วนพร้อมกัน)
+
+วิธีใช้:
+    python benchmarks/bench_sse_writer.py --events 200000 --burst 8
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from fastapi.responses import StreamingResponse  # noqa: E402
+from schema.openai.chat_models import ChatStreamResponse  # noqa: E402
+from services.sse_writer import SSE_HEADERS, SSEWriter, encode_chat_chunk  # noqa: E402
+
+DELTAS = ["สวัสดี", "ครับ ", "วันนี้", "อากาศ", "ดีมาก ", "Hello ", "world, ", "trip.\n"]
+
+
+async def chunks(count, burst):
+    """
+    สร้าง ChatStreamResponse count รายการ โดยคืนการทำงานให้ event loop ทุกๆ burst รายการ
+    """
+    for i in range(count):
+        if i % burst == 0:
+            await asyncio.sleep(0)
+        yield ChatStreamResponse(delta=DELTAS[i % len(DELTAS)])
+
+
+def legacy_response(events):
+    async def generate():
+        async for chunk in events:
+            if chunk.delta:
+                yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(generate(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def measure(make_response, count, burst):
+    """
+    คืน (event ต่อวินาทีต่อ core, จำนวนครั้งที่เรียก send, จำนวน bytes)
+    """
+    sends, size = 0, 0
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal sends, size
+        if message["type"] == "http.response.body":
+            sends += 1
+            size += len(message.get("body", b""))
+
+    response = make_response(chunks(count, burst))
+    started = time.process_time()
+    await response({"type": "http", "asgi": {"spec_version": "2.4"}, "method": "POST"}, receive, send)
+    return count / (time.process_time() - started), sends, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--burst", type=int, default=8, help="จำนวน event ต่อรอบของ event loop ในแบบ N/tick")
+    args = parser.parse_args()
+
+    writer = SSEWriter(encode_chat_chunk)
+    encoder = "orjson" if "orjson" in sys.modules else "json"
+    print(f"{args.events} events, JSON encoder: {encoder}")
+    print(f"{'upstream':>9} {'writer':>8} {'events/s/core':>14} {'sends':>8} {'MB':>7}")
+    for name, burst in (("1/tick", 1), (f"{args.burst}/tick", args.burst)):
+        for label, make_response in (("legacy", legacy_response), ("SSEWriter", writer.response)):
+            rate, sends, size = asyncio.run(measure(make_response, args.events, burst))
+            print(f"{name:>9} {label:>8} {rate:>14,.0f} {sends:>8} {size / 1e6:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+วัด time-to-first-visible-token (TTFT), จำนวน event และเวลาที่ข้อความถูกพักไว้ของกฎการรวมข้อความ
+ใน chat stream (services.stream_chunker) เทียบกับการบัฟเฟอร์แบบเดิมใน chat_completion_stream
+
+upstream จำลองส่งข้อความทีละ 1-3 ตัวอักษรทุกๆ --interval มิลลิวินาที (ประมาณความเร็ว token ของ LLM)
+วัดทั้งข้อความภาษาไทย (ไม่มีช่องว่างระหว่างคำ) และภาษาอังกฤษ
+    TTFT       เวลาตั้งแต่ upstream ส่งส่วนแรกจนถึง event แรกที่ client ได้รับ
+    hold p99   เวลาที่แต่ละตัวอักษรถูกพักไว้ก่อนถูกส่ง (percentile 99)
+    us/token   เวลา CPU ต่อส่วนของการรวมข้อความ วัดแยกโดยไม่มีการรอ (กฎที่มี deadline รวมต้นทุน
+               การส่งผ่านคิวระหว่าง task ซึ่งคงที่ต่อส่วน ไม่ขึ้นกับความยาวของข้อความที่พักไว้)
+
+วิธีใช้:
+    python benchmarks/bench_stream_chunker.py --tokens 300 --interval 20 --max-hold 50
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.stream_chunker import make_chunker, rechunk  # noqa: E402
+
+TEXTS = {
+    "thai": "สวัสดีครับวันนี้เราจะไปเที่ยวเชียงใหม่กันแนะนำที่พักใกล้ถนนนิมมานเหมินทร์และร้านอาหารเหนือที่อร่อย",
+    "english": "Hello there! Today we are planning a trip to Chiang Mai, so here are some hotels and local food places. ",
+}
+
+POLICIES = ["legacy", "none", "size,punctuation,whitespace", "size,punctuation,whitespace,thai", "punctuation,whitespace,thai"]
+
+
+def make_pieces(text, count, seed=0):
+    """
+    แบ่งข้อความเป็นส่วนละ 1-3 ตัวอักษรตามจำนวนที่ต้องการ
+    """
+    rng = np.random.default_rng(seed)
+    pieces, position = [], 0
+    while len(pieces) < count:
+        size = int(rng.integers(1, 4))
+        piece = "".join(text[(position + i) % len(text)] for i in range(size))
+        pieces.append(piece)
+        position += size
+    return pieces
+
+
+async def legacy_chunks(source, buffer_size_limit=10):
+    """
+    การบัฟเฟอร์แบบเดิมของ chat_completion_stream (ต่อสตริงด้วย += และสแกนบัฟเฟอร์ทั้งหมดทุก token)
+    """
+    buffer = ""
+    async for content in source:
+        buffer += content
+        should_send = (
+            len(buffer) >= buffer_size_limit or
+            any(p in buffer for p in [".", ",", "!", "?", "\n"]) or
+            " " in buffer
+        )
+        if should_send:
+            yield buffer
+            buffer = ""
+    if buffer:
+        yield buffer
+
+
+def chunked(policy, source, args):
+    if policy == "legacy":
+        return legacy_chunks(source, args.max_chars)
+    return rechunk(source, make_chunker(policy, max_chars=args.max_chars, max_hold_ms=args.max_hold))
+
+
+async def measure(policy, pieces, args):
+    """
+    คืน (TTFT, จำนวน event, hold p50, hold p99) เป็นมิลลิวินาที
+    """
+    arrivals = []
+
+    async def upstream():
+        for piece in pieces:
+            await asyncio.sleep(args.interval / 1000)
+            # เวลาที่แต่ละตัวอักษรมาถึง
+            arrivals.extend([time.perf_counter()] * len(piece))
+            yield piece
+
+    events, holds, emitted = 0, [], 0
+    first_event = None
+    async for text in chunked(policy, upstream(), args):
+        now = time.perf_counter()
+        first_event = first_event or now
+        events += 1
+        holds.extend(now - arrivals[i] for i in range(emitted, emitted + len(text)))
+        emitted += len(text)
+
+    holds = np.array(holds) * 1000
+    return (first_event - arrivals[0]) * 1000, events, np.percentile(holds, 50), np.percentile(holds, 99)
+
+
+async def cpu_per_token(policy, pieces, args):
+    """
+    เวลาเฉลี่ยต่อส่วน (ไมโครวินาที) เมื่อ upstream ส่งข้อความทั้งหมดทันที
+    """
+    async def upstream():
+        for piece in pieces:
+            yield piece
+
+    started = time.perf_counter()
+    async for _ in chunked(policy, upstream(), args):
+        pass
+    return (time.perf_counter() - started) / len(pieces) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=20.0, help="ระยะห่างระหว่างส่วนของ upstream (มิลลิวินาที)")
+    parser.add_argument("--max-hold", type=float, default=50.0, help="max_hold_ms ของ chunker")
+    parser.add_argument("--max-chars", type=int, default=10)
+    parser.add_argument("--cpu-tokens", type=int, default=200_000)
+    args = parser.parse_args()
+
+    print(f"{args.tokens} pieces every {args.interval:.0f} ms, max hold {args.max_hold:.0f} ms, max chars {args.max_chars}")
+    for language, text in TEXTS.items():
+        pieces = make_pieces(text, args.tokens)
+        cpu_pieces = make_pieces(text, args.cpu_tokens)
+        print(f"\n[{language}]")
+        print(f"{'policy':>34} {'TTFT ms':>8} {'events':>7} {'hold p50':>9} {'hold p99':>9} {'us/token':>9}")
+        for policy in POLICIES:
+            ttft, events, hold50, hold99 = asyncio.run(measure(policy, pieces, args))
+            cpu = asyncio.run(cpu_per_token(policy, cpu_pieces, args))
+            print(f"{policy:>34} {ttft:>8.1f} {events:>7} {hold50:>9.1f} {hold99:>9.1f} {cpu:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
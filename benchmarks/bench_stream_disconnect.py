@@ -0,0 +1,167 @@
+"""
+ตรวจสอบว่าเมื่อ client ปิด /api/v1/openai/chat/stream กลางทาง upstream ถูกยกเลิกและการเชื่อมต่อถูกคืนภายในไม่กี่มิลลิวินาที
+
+เปิดเซิร์ฟเวอร์สองตัวบน localhost ใน thread แยก:
+    upstream  จำลอง /v1/chat/completions แบบ stream ส่งหนึ่ง token ทุกๆ --interval มิลลิวินาที
+              และบันทึกเวลาที่การเชื่อมต่อของแต่ละ stream ถูกปิด
+    app       chat_route ของแอปที่ใช้ OpenAIService กับ client จาก create_openai_client()
+client อ่าน --read-events event แล้วปิดการเชื่อมต่อ วัดเวลาตั้งแต่ปิดจนถึง upstream เห็นการตัดการเชื่อมต่อ
+จำนวน token ที่ upstream ยังสร้างต่อหลังจากนั้น และจำนวนการเชื่อมต่อที่ยังค้างอยู่ใน pool ของ OpenAI client
+
+จบด้วย exit code 1 ถ้า upstream ไม่ถูกยกเลิกภายใน --max-release-ms
+
+วิธีใช้:
+    python benchmarks/bench_stream_disconnect.py --streams 20 --read-events 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+os.environ["CHAT_CACHE_ENABLED"] = "false"
+os.environ.setdefault("STREAM_CHUNK_POLICY", "none")
+# แคช embeddings ของ service ถูกสร้างใน data/ ของโฟลเดอร์ชั่วคราว
+os.chdir(tempfile.mkdtemp(prefix="bench_stream_disconnect_"))
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+# stream_id -> {"tokens": จำนวน token ที่ส่งแล้ว, "closed_at": เวลาที่การเชื่อมต่อถูกปิด}
+upstream_streams = {}
+
+
+def serve(app):
+    """
+    เปิด app ด้วย uvicorn ใน thread แยก และคืน base URL
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def make_upstream(args):
+    """
+    เซิร์ฟเวอร์จำลองที่ส่ง chat completion แบบ stream ยาว --tokens token
+    """
+    mock = FastAPI()
+
+    @mock.post("/v1/chat/completions")
+    async def completions(body: dict):
+        stream_id = len(upstream_streams)
+        state = upstream_streams[stream_id] = {"tokens": 0, "closed_at": None}
+
+        async def generate():
+            try:
+                for i in range(args.tokens):
+                    chunk = {
+                        "id": f"chatcmpl-{stream_id}", "object": "chat.completion.chunk", "created": 0,
+                        "model": body["model"],
+                        "choices": [{"index": 0, "delta": {"content": f"token{i} "}, "finish_reason": None}]
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    state["tokens"] += 1
+                    await asyncio.sleep(args.interval / 1000)
+                yield "data: [DONE]\n\n"
+            finally:
+                state["closed_at"] = time.perf_counter()
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    return mock
+
+
+def make_app(service_holder):
+    from routes.openai import chat_route
+    from services.opeai_service import OpenAIService, create_openai_client, get_openai_service
+
+    app = FastAPI()
+    app.include_router(chat_route.router)
+
+    def openai_service():
+        if "service" not in service_holder:
+            service_holder["service"] = OpenAIService(client=create_openai_client())
+        return service_holder["service"]
+
+    app.dependency_overrides[get_openai_service] = openai_service
+    return app
+
+
+async def run(app_url, args):
+    """
+    เปิด stream และปิดหลังจากอ่าน --read-events event คืนเวลาที่ปิดของแต่ละ stream ตามลำดับ
+    """
+    closed = []
+    async with httpx.AsyncClient(base_url=app_url, timeout=30) as client:
+        for i in range(args.streams):
+            body = {"messages": [{"role": "user", "content": f"question {i}"}], "model": "mock"}
+            async with client.stream("POST", "/api/v1/openai/chat/stream", json=body) as response:
+                events = 0
+                async for line in response.aiter_lines():
+                    if line.startswith("data: {"):
+                        events += 1
+                        if events >= args.read_events:
+                            break
+                closed.append(time.perf_counter())
+            # ให้ upstream มีเวลาเห็นการตัดการเชื่อมต่อก่อน stream ถัดไป
+            await asyncio.sleep(args.settle / 1000)
+    return closed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=20)
+    parser.add_argument("--tokens", type=int, default=1000, help="ความยาวของคำตอบจาก upstream (token)")
+    parser.add_argument("--interval", type=float, default=10.0, help="ระยะห่างระหว่าง token ของ upstream (มิลลิวินาที)")
+    parser.add_argument("--read-events", type=int, default=5, help="จำนวน event ที่อ่านก่อนปิดการเชื่อมต่อ")
+    parser.add_argument("--settle", type=float, default=200.0, help="เวลารอหลังปิดแต่ละ stream (มิลลิวินาที)")
+    parser.add_argument("--max-release-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    os.environ["OPENAI_BASE_URL"] = serve(make_upstream(args)) + "/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    service_holder = {}
+    app_url = serve(make_app(service_holder))
+
+    closed = asyncio.run(run(app_url, args))
+
+    release = np.array([
+        (upstream_streams[i]["closed_at"] - closed_at) * 1000 if upstream_streams[i]["closed_at"] else np.inf
+        for i, closed_at in enumerate(closed)
+    ])
+    tokens = np.array([upstream_streams[i]["tokens"] for i in range(len(closed))])
+    pool = service_holder["service"].client._client._transport._pool
+    open_connections = sum(1 for connection in pool.connections if not connection.is_idle())
+
+    print(f"{args.streams} streams of {args.tokens} tokens every {args.interval:.0f} ms, "
+          f"client disconnects after {args.read_events} events")
+    print(f"upstream cancelled after disconnect: p50 {np.percentile(release, 50):.2f} ms, "
+          f"max {release.max():.2f} ms")
+    print(f"tokens generated per stream: mean {tokens.mean():.1f} of {args.tokens}")
+    print(f"busy connections left in OpenAI client pool: {open_connections}")
+    # app ทำงานใน process เดียวกัน จึงอ่านสถิติ (ชุดเดียวกับ chat_stream_* ของ /metrics) จาก service ได้ตรงๆ
+    print(f"stream stats: {service_holder['service'].stream_usage.stats()}")
+
+    if not np.isfinite(release).all() or release.max() > args.max_release_ms:
+        print(f"FAIL: upstream not released within {args.max_release_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
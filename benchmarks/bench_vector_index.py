@@ -0,0 +1,79 @@
+"""
+เปรียบเทียบเวลาค้นหาระหว่างการวนลูปคำนวณ cosine similarity ทีละแถว (แบบเดิมของ search_similar)
+กับ VectorIndex ที่คำนวณด้วยการคูณ matrix-vector ครั้งเดียวบน segment ที่ map ด้วย memmap
+(ไฟล์ segment ถูกสร้างในโฟลเดอร์ชั่วคราว)
+
+วิธีใช้:
+    python benchmarks/bench_vector_index.py --sizes 10000 100000 1000000 --dimensions 256
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.embedding_segment import EmbeddingSegment  # noqa: E402
+from services.vector_index import VectorIndex  # noqa: E402
+
+
+def legacy_search(vectors, query, top_k):
+    """
+    จำลองการค้นหาแบบเดิม: คำนวณ cosine similarity ทีละแถวแล้วเรียงลำดับทั้งหมด
+    """
+    results = []
+    for document_id, vector in enumerate(vectors):
+        similarity = np.dot(query, vector) / (np.linalg.norm(query) * np.linalg.norm(vector))
+        results.append({"document_id": document_id, "similarity": float(similarity)})
+    results.sort(key=lambda x: x["similarity"], reverse=True)
+    return results[:top_k]
+
+
+def timed(func, repeats):
+    """
+    คืนค่าเวลาเฉลี่ยต่อครั้ง (มิลลิวินาที)
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--legacy-max-size", type=int, default=100_000,
+                        help="ข้ามการวัดแบบเดิมเมื่อจำนวนเอกสารเกินค่านี้ (ช้ามาก)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench_vector_index_")
+    print(f"{'documents':>10} {'legacy ms':>12} {'index ms':>10} {'speedup':>9}")
+
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dimensions), dtype=np.float32)
+        query = rng.standard_normal(args.dimensions, dtype=np.float32)
+
+        segment = EmbeddingSegment(f"{workdir}/bench.{size}.f32", args.dimensions)
+        index = VectorIndex(segment)
+        index.add_batch(np.arange(size), np.arange(segment.append(vectors), size))
+        index.search(query, args.top_k)  # อุ่น page cache ก่อนจับเวลา
+        index_ms = timed(lambda: index.search(query, args.top_k), args.repeats)
+
+        if size <= args.legacy_max_size:
+            legacy_ms = timed(lambda: legacy_search(vectors, query, args.top_k), 1)
+            print(f"{size:>10} {legacy_ms:>12.2f} {index_ms:>10.3f} {legacy_ms / index_ms:>8.0f}x")
+        else:
+            print(f"{size:>10} {'-':>12} {index_ms:>10.3f} {'-':>9}")
+
+        del vectors, index, segment
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+ทดสอบโหลดของแอปกับเซิร์ฟเวอร์จำลอง OpenAI (mock_openai.py) เพื่อวัดประสิทธิภาพของแอปเองโดยไม่เรียก API จริง
+
+เปิดสาม process: เซิร์ฟเวอร์จำลอง, แอป (uvicorn หนึ่ง worker) และตัวยิงโหลด (process นี้) แต่ละ scenario ยิงคำขอ
+ที่ไม่ซ้ำกันด้วย --concurrency ผู้ใช้พร้อมกันเป็นเวลา --duration วินาที (หลัง warm-up --warmup วินาที) แล้วรายงาน
+คำขอต่อวินาที, latency p50/p99, TTFT p50/p99 (เวลาถึง event แรกของ stream) และหน่วยความจำ (RSS) ของ process แอป
+
+scenario:
+    chat          POST /api/v1/openai/chat
+    chat_stream   POST /api/v1/openai/chat/stream
+    embeddings    POST /api/v1/openai/embeddings (--embedding-batch ข้อความต่อคำขอ)
+    travel_plan   POST /api/v1/tourism/travel-plan
+    search        POST /api/v1/embeddings-storage/search บนฐานข้อมูลขนาด --search-documents แต่ละขนาด
+                  (เปิดแอปใหม่ต่อขนาด ฐานข้อมูลที่เตรียมแล้วใน --data-dir จะถูกใช้ซ้ำในการรันครั้งถัดไป)
+
+แอปถูกประกอบจาก router ที่ทดสอบและ lifespan แบบเดียวกับ main.py (main.py ไม่ได้เปิด router ของ embeddings
+และต้องใช้ route ของ MT5) ถ้าต้องการทดสอบเซิร์ฟเวอร์ที่เปิดไว้แล้ว (เช่นหลาย worker) ให้ระบุ --app-url และ --app-pid
+และชี้ OPENAI_BASE_URL ของเซิร์ฟเวอร์นั้นไปที่ mock_openai.py
+
+เปรียบเทียบกับ baseline:
+    python benchmarks/loadtest.py --save-baseline baseline.json          # บันทึกผลก่อนแก้ไข
+    python benchmarks/loadtest.py --baseline baseline.json --tolerance 10  # เปรียบเทียบหลังแก้ไข
+จบด้วย exit code 1 ถ้า req/s ลดลง หรือ p99/TTFT p99/RSS เพิ่มขึ้นเกิน --tolerance เปอร์เซ็นต์
+
+วิธีใช้:
+    python benchmarks/loadtest.py --scenarios chat,chat_stream,embeddings,travel_plan,search \\
+        --search-documents 10000,100000,1000000 --concurrency 32 --duration 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+APP_DIR = BENCHMARKS_DIR.parent / "app"
+sys.path.insert(0, str(APP_DIR))
+
+import httpx  # noqa: E402
+
+SEARCH_MODEL = "text-embedding-3-small"
+
+
+class Scenario:
+    """
+    คำขอของ scenario หนึ่งรายการ: path, ฟังก์ชันสร้าง body จากลำดับของคำขอ และเป็น stream หรือไม่
+    """
+
+    def __init__(self, path, body, stream=False):
+        self.path = path
+        self.body = body
+        self.stream = stream
+
+
+def build_scenarios(args):
+    return {
+        "chat": Scenario(
+            "/api/v1/openai/chat",
+            lambda i: {"messages": [{"role": "user", "content": f"คำถามที่ {i}"}], "model": args.model,
+                       "max_tokens": args.completion_tokens, "cache": False}
+        ),
+        "chat_stream": Scenario(
+            "/api/v1/openai/chat/stream",
+            lambda i: {"messages": [{"role": "user", "content": f"คำถามที่ {i}"}], "model": args.model,
+                       "max_tokens": args.completion_tokens, "cache": False},
+            stream=True
+        ),
+        "embeddings": Scenario(
+            "/api/v1/openai/embeddings",
+            lambda i: {"input": [f"ข้อความที่ {i}-{j}" for j in range(args.embedding_batch)], "model": SEARCH_MODEL}
+        ),
+        "travel_plan": Scenario(
+            "/api/v1/tourism/travel-plan",
+            # ไม่ระบุ destination เพื่อให้ key ของแคชแผนการท่องเที่ยวมาจากข้อความคำขอซึ่งไม่ซ้ำกัน
+            lambda i: {"query": f"อยากเที่ยวเชียงใหม่ แผนที่ {i}", "duration": args.plan_days}
+        ),
+        "search": Scenario(
+            "/api/v1/embeddings-storage/search",
+            lambda i: {"query": f"คำค้นหาที่ {i}", "model": SEARCH_MODEL, "top_k": 5}
+        ),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        exited = process.poll() is not None if isinstance(process, subprocess.Popen) else not process.is_alive()
+        if exited:
+            raise RuntimeError(f"server on port {port} exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"server on port {port} did not start within {timeout:.0f} s")
+
+
+def start_mock(args):
+    """
+    เปิด mock_openai.py ใน process แยก และคืน (process, base URL)
+    """
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, str(BENCHMARKS_DIR / "mock_openai.py"), "--port", str(port),
+        "--latency-ms", str(args.mock_latency_ms), "--tokens-per-second", str(args.mock_tokens_per_second),
+        "--completion-tokens", str(args.completion_tokens), "--dimensions", str(args.dimensions),
+        "--plan-days", str(args.plan_days)
+    ])
+    wait_for_port(port, process)
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def serve_app(port, workdir):
+    """
+    (ใน process ของแอป) ประกอบแอปจาก router ที่ทดสอบ แล้วเปิดด้วย uvicorn
+    """
+    os.chdir(workdir)
+    sys.path.insert(0, str(APP_DIR))
+
+    from contextlib import asynccontextmanager
+    import uvicorn
+    from fastapi import FastAPI
+    from routes.embeddings_storage_route import router as storage_router
+    from routes.openai.chat_route import router as chat_router
+    from routes.openai.embeddings_route import router as embeddings_router
+    from routes.tourism.tourism_router import router as tourism_router
+    from services.metrics import MetricsMiddleware, metrics
+    from services.opeai_service import OpenAIService, create_upstream_pool, embedding_cache
+    from services.tourism_service import TourismService
+    from services.upstream_scheduler import UpstreamOverloaded, upstream_overloaded_handler
+
+    @asynccontextmanager
+    async def lifespan(app):
+        upstream_pool = create_upstream_pool()
+        app.state.openai_service = OpenAIService(upstream_pool=upstream_pool)
+        app.state.tourism_service = TourismService(upstream_pool=upstream_pool)
+        yield
+        await upstream_pool.close()
+        if embedding_cache is not None:
+            embedding_cache.close()
+
+    app = FastAPI(lifespan=lifespan)
+    for router in (chat_router, embeddings_router, tourism_router, storage_router):
+        app.include_router(router)
+    if metrics is not None:
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+    app.add_exception_handler(UpstreamOverloaded, upstream_overloaded_handler)
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def start_app(workdir):
+    """
+    เปิดแอปใน process แยก (spawn เพื่อไม่ให้สืบทอดหน่วยความจำของตัวยิงโหลด) และคืน (process, URL)
+    """
+    port = free_port()
+    process = multiprocessing.get_context("spawn").Process(target=serve_app, args=(port, str(workdir)), daemon=True)
+    process.start()
+    wait_for_port(port, process)
+    return process, f"http://127.0.0.1:{port}"
+
+
+def stop(process):
+    if process is None:
+        return
+    process.terminate()
+    if isinstance(process, subprocess.Popen):
+        process.wait(10)
+    else:
+        process.join(10)
+
+
+def memory_mb(pid):
+    """
+    (RSS ปัจจุบัน, RSS สูงสุด) ของ process เป็น MB จาก /proc หรือ (None, None) ถ้าไม่มี /proc
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    values[name] = int(value.split()[0]) / 1024
+    except (OSError, TypeError):
+        pass
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+def prepare_search_db(workdir, documents, dimensions):
+    """
+    สร้างฐานข้อมูลเอกสาร documents รายการที่มี embedding แบบสุ่ม (ข้ามถ้าเคยเตรียมไว้แล้ว)
+    """
+    marker = workdir / "prepared.json"
+    if marker.exists():
+        return
+    from services.sqlite_service import SQLiteService
+
+    print(f"preparing {documents:,} documents ({dimensions} dims) in {workdir} ...", flush=True)
+    started = time.perf_counter()
+    service = SQLiteService(db_path=str(workdir / "data" / "embeddings.db"), migrate_in_background=False)
+    rng = np.random.default_rng(0)
+    try:
+        for start in range(0, documents, 10000):
+            count = min(10000, documents - start)
+            vectors = rng.standard_normal((count, dimensions), dtype=np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            service.add_documents([
+                {"content": f"เอกสารที่ {start + j}", "embedding": vector, "metadata": {"group": (start + j) % 10}}
+                for j, vector in enumerate(vectors)
+            ], SEARCH_MODEL)
+    finally:
+        service.close()
+    marker.write_text(json.dumps({"documents": documents, "dimensions": dimensions}))
+    print(f"prepared in {time.perf_counter() - started:.1f} s", flush=True)
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+async def run_scenario(url, scenario, args):
+    """
+    ยิง scenario ด้วยผู้ใช้พร้อมกัน args.concurrency ราย คืนผลเฉพาะคำขอที่เริ่มหลัง warm-up
+    """
+    counter = itertools.count()
+    latencies, ttfts = [], []
+    errors = 0
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        async def request():
+            body = scenario.body(next(counter))
+            started = time.perf_counter()
+            first_event = None
+            if scenario.stream:
+                async with client.stream("POST", scenario.path, json=body) as response:
+                    async for line in response.aiter_lines():
+                        if first_event is None and line.startswith("data: {"):
+                            first_event = time.perf_counter()
+                    ok = response.status_code == 200
+            else:
+                response = await client.post(scenario.path, json=body)
+                ok = response.status_code == 200
+            return ok, started, time.perf_counter(), first_event
+
+        async def user(measure_from, until):
+            nonlocal errors
+            while time.perf_counter() < until:
+                try:
+                    ok, started, finished, first_event = await request()
+                except httpx.HTTPError:
+                    ok, started, finished, first_event = False, time.perf_counter(), time.perf_counter(), None
+                if started < measure_from:
+                    continue
+                if not ok:
+                    errors += 1
+                    continue
+                latencies.append((finished - started) * 1000)
+                if first_event is not None:
+                    ttfts.append((first_event - started) * 1000)
+
+        cpu_started = time.process_time()
+        measure_from = time.perf_counter() + args.warmup
+        until = measure_from + args.duration
+        await asyncio.gather(*(user(measure_from, until) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - measure_from
+        loader_cpu = (time.process_time() - cpu_started) / (elapsed + args.warmup)
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "ttft_p50_ms": percentile(ttfts, 50),
+        "ttft_p99_ms": percentile(ttfts, 99),
+        "loader_cpu": loader_cpu,
+    }
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_result(name, result):
+    print(f"{name:>14} {result['rps']:>9.1f} {fmt(result['p50_ms']):>9} {fmt(result['p99_ms']):>9} "
+          f"{fmt(result['ttft_p50_ms']):>9} {fmt(result['ttft_p99_ms']):>9} {result['errors']:>7} "
+          f"{fmt(result['rss_mb']):>8} {fmt(result['peak_rss_mb']):>9}", flush=True)
+    if result["loader_cpu"] > 0.9:
+        print(f"{'':>14} warning: load generator used {result['loader_cpu']:.0%} of a core, results may be limited by it")
+
+
+def compare(results, baseline, tolerance):
+    """
+    เปรียบเทียบกับ baseline และคืนรายการ regression ที่เกิน tolerance เปอร์เซ็นต์
+    """
+    # (ชื่อค่า, ค่าที่มากกว่าดีกว่าหรือไม่)
+    metrics = (("rps", True), ("p99_ms", False), ("ttft_p99_ms", False), ("peak_rss_mb", False))
+    regressions = []
+    print(f"\ncompared with baseline (tolerance {tolerance:.0f}%):")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:>14} not in baseline")
+            continue
+        changes = []
+        for metric, higher_is_better in metrics:
+            if result.get(metric) is None or not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric] * 100
+            changes.append(f"{metric} {change:+.1f}%")
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name} {metric} {change:+.1f}%")
+        print(f"{name:>14} " + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="chat,chat_stream,embeddings,travel_plan,search")
+    parser.add_argument("--search-documents", default="10000,100000,1000000", help="ขนาดฐานข้อมูลของ scenario search คั่นด้วยจุลภาค")
+    parser.add_argument("--dimensions", type=int, default=256, help="จำนวนมิติของ embedding จากเซิร์ฟเวอร์จำลอง")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="เวลาวัดผลต่อ scenario (วินาที)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="เวลา warm-up ก่อนวัดผล (วินาที)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--model", default="gpt-4o-mini")
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--embedding-batch", type=int, default=16)
+    parser.add_argument("--plan-days", type=int, default=3)
+    parser.add_argument("--mock-latency-ms", type=float, default=50.0, help="เวลาก่อน token แรกของเซิร์ฟเวอร์จำลอง")
+    parser.add_argument("--mock-tokens-per-second", type=float, default=200.0, help="อัตราการสร้าง token ของเซิร์ฟเวอร์จำลอง")
+    parser.add_argument("--data-dir", default=None, help="โฟลเดอร์เก็บฐานข้อมูลของ search เพื่อใช้ซ้ำ (ค่าเริ่มต้นคือโฟลเดอร์ชั่วคราว)")
+    parser.add_argument("--app-url", default=None, help="URL ของแอปที่เปิดไว้แล้ว (ไม่เปิดแอปและเซิร์ฟเวอร์จำลองเอง)")
+    parser.add_argument("--app-pid", type=int, default=None, help="pid ของแอปที่เปิดไว้แล้ว สำหรับวัดหน่วยความจำ")
+    parser.add_argument("--save-baseline", default=None, help="บันทึกผลเป็น JSON")
+    parser.add_argument("--baseline", default=None, help="เปรียบเทียบกับผลที่บันทึกไว้")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="เปอร์เซ็นต์ที่ยอมให้แย่ลงเมื่อเทียบกับ baseline")
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args)
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    data_dir = Path(args.data_dir or tempfile.mkdtemp(prefix="loadtest_")).resolve()
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    # (ชื่อในรายงาน, scenario, โฟลเดอร์ทำงานของแอป หรือ None ถ้าใช้ --app-url, จำนวนเอกสารของ search)
+    phases = []
+    for name in selected:
+        if args.app_url:
+            phases.append((name, name, None, None))
+        elif name == "search":
+            for documents in (int(size) for size in args.search_documents.split(",")):
+                label = f"search_{documents // 1000}k" if documents % 1000 == 0 else f"search_{documents}"
+                phases.append((label, name, data_dir / f"search_{documents}_{args.dimensions}", documents))
+        else:
+            phases.append((name, name, data_dir / "app", None))
+
+    mock = None
+    if not args.app_url:
+        mock, base_url = start_mock(args)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+
+    print(f"concurrency {args.concurrency}, {args.duration:.0f} s per scenario after {args.warmup:.0f} s warm-up, "
+          f"mock latency {args.mock_latency_ms:.0f} ms, {args.mock_tokens_per_second:.0f} tokens/s")
+    print(f"{'scenario':>14} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'ttft p50':>9} {'ttft p99':>9} "
+          f"{'errors':>7} {'RSS MB':>8} {'peak MB':>9}", flush=True)
+
+    results = {}
+    app, app_dir = None, None
+    try:
+        for label, name, workdir, documents in phases:
+            if workdir != app_dir or args.app_url:
+                stop(app)
+                app = None
+                if workdir is not None:
+                    workdir.mkdir(parents=True, exist_ok=True)
+                    if documents is not None:
+                        prepare_search_db(workdir, documents, args.dimensions)
+                    app, url = start_app(workdir)
+                else:
+                    url = args.app_url
+                app_dir = workdir
+
+            result = asyncio.run(run_scenario(url, scenarios[name], args))
+            result["rss_mb"], result["peak_rss_mb"] = memory_mb(app.pid if app is not None else args.app_pid)
+            results[label] = result
+            print_result(label, result)
+    finally:
+        stop(app)
+        stop(mock)
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+        print(f"\nbaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("FAIL: " + "; ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
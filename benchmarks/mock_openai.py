@@ -0,0 +1,172 @@
+"""
+เซิร์ฟเวอร์จำลอง OpenAI API สำหรับวัดประสิทธิภาพของแอปโดยไม่เรียก API จริง
+
+รองรับ:
+    POST /v1/chat/completions  แบบปกติและ stream (รวม stream_options.include_usage) ถ้าคำขอระบุ
+                               response_format json_object จะตอบเป็นแผนการท่องเที่ยวตาม schema ของ TravelPlan
+    POST /v1/embeddings        เวกเตอร์ที่กำหนดจากข้อความ (ข้อความเดิมได้เวกเตอร์เดิมเสมอ) และรองรับ dimensions
+
+เวลาตอบสนองกำหนดด้วย --latency-ms (เวลาถึง token แรก) และ --tokens-per-second (อัตราการสร้าง token หลังจากนั้น)
+คำตอบแบบปกติรอทั้งสองส่วนก่อนตอบ ส่วน stream ส่งหนึ่ง token ต่อ chunk
+--slow-fraction และ --slow-ms จำลองโหนดที่ช้าเป็นบางครั้ง: สัดส่วนของคำขอที่ได้เวลาก่อน token แรกเพิ่มอีก slow-ms
+
+ใช้จาก loadtest.py หรือเปิดแยกแล้วชี้แอปมาที่เซิร์ฟเวอร์นี้ด้วย OPENAI_BASE_URL=http://127.0.0.1:<port>/v1:
+    python benchmarks/mock_openai.py --port 8100 --latency-ms 300 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+
+def travel_plan_json(days: int) -> str:
+    """
+    แผนการท่องเที่ยวที่ผ่านการตรวจสอบของ TravelPlan จำนวน days วัน
+    """
+    return json.dumps({
+        "destination": "เชียงใหม่",
+        "duration": days,
+        "overview": "เที่ยวเชียงใหม่แบบสบายๆ ชมวัด ธรรมชาติ และอาหารพื้นเมือง",
+        "daily_itinerary": [
+            {
+                "day": day,
+                "attractions": [{
+                    "name": f"วัดพระธาตุดอยสุเทพ {day}",
+                    "description": "วัดสำคัญบนดอยสุเทพ ชมวิวเมืองเชียงใหม่",
+                    "category": "วัฒนธรรม",
+                    "estimated_time": "2 ชั่วโมง",
+                    "estimated_cost": 50,
+                    "recommended_time_of_day": "เช้า"
+                }],
+                "activities": [{
+                    "name": "เดินถนนคนเดิน",
+                    "description": "เลือกซื้อของที่ระลึกและอาหารท้องถิ่น",
+                    "duration": "3 ชั่วโมง",
+                    "estimated_cost": 500,
+                    "location": "ถนนราชดำเนิน"
+                }],
+                "meals": ["ข้าวซอย", "แกงฮังเล", "ไส้อั่ว"],
+                "transportation": ["รถแดง"],
+                "daily_cost_estimate": 1500
+            }
+            for day in range(1, days + 1)
+        ],
+        "total_cost_estimate": 1500 * days,
+        "tips": ["พกเสื้อกันหนาวในหน้าหนาว"],
+        "best_time_to_visit": "พฤศจิกายน - กุมภาพันธ์",
+        "local_customs": ["แต่งกายสุภาพเมื่อเข้าวัด"]
+    }, ensure_ascii=False)
+
+
+def create_mock_app(latency_ms: float = 300.0, tokens_per_second: float = 50.0, completion_tokens: int = 100,
+                    dimensions: int = 256, plan_days: int = 3, slow_fraction: float = 0.0, slow_ms: float = 0.0) -> FastAPI:
+    """
+    สร้างแอปจำลอง OpenAI API
+
+    Args:
+        latency_ms: เวลาก่อน token แรก (มิลลิวินาที)
+        tokens_per_second: อัตราการสร้าง token หลังจาก token แรก (0 คือไม่รอ)
+        completion_tokens: จำนวน token ของคำตอบ chat ทั่วไป
+        dimensions: จำนวนมิติของ embedding เมื่อคำขอไม่ได้ระบุ dimensions
+        plan_days: จำนวนวันของแผนการท่องเที่ยวที่ตอบเมื่อคำขอระบุ response_format json_object
+        slow_fraction: สัดส่วนของคำขอที่ช้ากว่าปกติ
+        slow_ms: เวลาที่เพิ่มให้คำขอที่ช้า (มิลลิวินาที)
+    """
+    mock = FastAPI()
+    plan = travel_plan_json(plan_days)
+    # แบ่งแผนเป็นส่วนละประมาณ 4 ตัวอักษรเหมือน token ของโมเดลจริง
+    plan_tokens = [plan[i:i + 4] for i in range(0, len(plan), 4)]
+    token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+
+    def first_token_delay() -> float:
+        if slow_fraction and random.random() < slow_fraction:
+            return (latency_ms + slow_ms) / 1000
+        return latency_ms / 1000
+
+    def completion_pieces(body: dict) -> list:
+        if (body.get("response_format") or {}).get("type") == "json_object":
+            return plan_tokens
+        max_tokens = body.get("max_tokens") or completion_tokens
+        return [f"คำ{i} " for i in range(min(completion_tokens, max_tokens))]
+
+    def usage(body: dict, pieces: list) -> dict:
+        prompt_tokens = sum(len(message.get("content") or "") for message in body["messages"]) // 4 + 1
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces),
+                "total_tokens": prompt_tokens + len(pieces)}
+
+    @mock.post("/v1/chat/completions")
+    async def chat_completions(body: dict):
+        pieces = completion_pieces(body)
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_delay() + token_interval * max(len(pieces) - 1, 0))
+            return {
+                "id": "chatcmpl-mock", "object": "chat.completion", "created": created, "model": body["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces)}, "finish_reason": "stop"}],
+                "usage": usage(body, pieces)
+            }
+
+        def event(choices, extra=None):
+            chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created,
+                     "model": body["model"], "choices": choices}
+            if extra:
+                chunk.update(extra)
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+        async def generate():
+            await asyncio.sleep(first_token_delay())
+            for i, piece in enumerate(pieces):
+                if i and token_interval:
+                    await asyncio.sleep(token_interval)
+                yield event([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield event([], {"usage": usage(body, pieces)})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @mock.post("/v1/embeddings")
+    async def embeddings(body: dict):
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        size = body.get("dimensions") or dimensions
+        data = []
+        for i, text in enumerate(texts):
+            vector = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(size)
+            data.append({"object": "embedding", "index": i, "embedding": (vector / np.linalg.norm(vector)).tolist()})
+        tokens = sum(len(text) for text in texts) // 4 + len(texts)
+        await asyncio.sleep(first_token_delay())
+        return {"object": "list", "model": body["model"], "data": data,
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    return mock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="เวลาก่อน token แรก (มิลลิวินาที)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="อัตราการสร้าง token (0 คือไม่รอ)")
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--plan-days", type=int, default=3)
+    parser.add_argument("--slow-fraction", type=float, default=0.0, help="สัดส่วนของคำขอที่ช้ากว่าปกติ")
+    parser.add_argument("--slow-ms", type=float, default=0.0, help="เวลาที่เพิ่มให้คำขอที่ช้า (มิลลิวินาที)")
+    args = parser.parse_args()
+
+    app = create_mock_app(args.latency_ms, args.tokens_per_second, args.completion_tokens, args.dimensions, args.plan_days,
+                          args.slow_fraction, args.slow_ms)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+ทดสอบการรันไฟล์คำขอ JSONL การทำต่อจาก checkpoint และการตัดผลลัพธ์ที่เขียนหลัง checkpoint ของ BatchRunner
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.batch_runner import BatchRunner  # noqa: E402
+
+
+class Embeddings:
+    def __init__(self, text):
+        self.text = text
+
+    def model_dump(self):
+        return {"input": self.text}
+
+
+class FakeService:
+    """
+    OpenAIService จำลองที่ตอบ embeddings ทันที ยกเว้นข้อความใน hold ที่ค้างไว้จนกว่า release จะถูกตั้ง
+    """
+
+    def __init__(self, hold=()):
+        self.hold = set(hold)
+        self.release = asyncio.Event()
+        self.calls = []
+
+    async def create_embeddings(self, request):
+        self.calls.append(request.input)
+        if request.input in self.hold:
+            await self.release.wait()
+        return Embeddings(request.input)
+
+
+def request_line(custom_id):
+    return json.dumps({
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/embeddings",
+        "body": {"input": custom_id}
+    }) + "\n"
+
+
+class BatchRunnerTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.input_path = os.path.join(self.directory.name, "requests.jsonl")
+        self.output_path = os.path.join(self.directory.name, "results.jsonl")
+        self.write_input([f"req-{i}" for i in range(5)])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_input(self, custom_ids, extra=""):
+        with open(self.input_path, "w", encoding="utf-8") as f:
+            f.write("".join(request_line(custom_id) for custom_id in custom_ids) + extra)
+
+    def runner(self, service, **kwargs):
+        return BatchRunner(service, self.input_path, self.output_path, concurrency=4, **kwargs)
+
+    def results(self):
+        with open(self.output_path, "rb") as f:
+            return [json.loads(line) for line in f]
+
+    def checkpoint(self):
+        with open(self.output_path + ".checkpoint", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def interrupted_run(self):
+        """
+        รันจนทุกบรรทัดยกเว้น req-2 เสร็จ แล้วยกเลิกงานเหมือนกด Ctrl+C
+        """
+        service = FakeService(hold={"req-2"})
+        task = asyncio.ensure_future(self.runner(service).run())
+        while len(service.calls) < 5:
+            await asyncio.sleep(0.005)
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_every_line_gets_one_result(self):
+        summary = await self.runner(FakeService()).run()
+
+        results = self.results()
+        self.assertEqual(sorted(result["custom_id"] for result in results), [f"req-{i}" for i in range(5)])
+        self.assertTrue(all(result["response"]["status_code"] == 200 for result in results))
+        self.assertEqual((summary["succeeded"], summary["failed"]), (5, 0))
+        self.assertTrue(self.checkpoint()["completed"])
+
+        # รันซ้ำหลังเสร็จแล้วไม่เรียก API อีก
+        service = FakeService()
+        await self.runner(service).run()
+        self.assertEqual(service.calls, [])
+        self.assertEqual(len(self.results()), 5)
+
+    async def test_invalid_lines_are_recorded_as_errors(self):
+        self.write_input(["req-0"], extra='\n{"custom_id": "bad", "url": "/v1/files", "body": {}}\nnot json\n')
+
+        summary = await self.runner(FakeService()).run()
+
+        errors = {result["custom_id"]: result["error"] for result in self.results() if result["error"]}
+        self.assertEqual(errors["bad"]["status_code"], 400)
+        # บรรทัดที่ไม่ใช่ JSON ไม่มี custom_id จึงใช้เลขบรรทัดแทน
+        self.assertEqual(errors["line-3"]["status_code"], 400)
+        self.assertEqual((summary["succeeded"], summary["failed"]), (1, 2))
+
+    async def test_interrupted_run_saves_the_unfinished_line(self):
+        await self.interrupted_run()
+
+        checkpoint = self.checkpoint()
+        self.assertEqual((checkpoint["next_line"], checkpoint["done"]), (2, [3, 4]))
+        self.assertEqual(checkpoint["offset"], 2 * len(request_line("req-0").encode()))
+        self.assertEqual(checkpoint["output_size"], os.path.getsize(self.output_path))
+        self.assertFalse(checkpoint["completed"])
+        self.assertEqual(len(self.results()), 4)
+
+    async def test_resume_runs_only_unfinished_lines(self):
+        await self.interrupted_run()
+
+        service = FakeService()
+        summary = await self.runner(service).run()
+
+        self.assertEqual(service.calls, ["req-2"])
+        self.assertEqual((summary["resumed_from_line"], summary["skipped"]), (2, 2))
+        self.assertEqual((summary["succeeded"], summary["failed"]), (5, 0))
+        self.assertEqual(sorted(result["custom_id"] for result in self.results()), [f"req-{i}" for i in range(5)])
+        self.assertTrue(self.checkpoint()["completed"])
+
+    async def test_results_after_the_checkpoint_are_truncated(self):
+        await self.interrupted_run()
+        # ผลลัพธ์ที่เขียนหลัง checkpoint ครั้งล่าสุดก่อน process ตาย (ไม่ครบบรรทัด)
+        with open(self.output_path, "ab") as f:
+            f.write(b'{"id": "batch_req_2", "custom_id": "req-2"')
+
+        await self.runner(FakeService()).run()
+
+        custom_ids = [result["custom_id"] for result in self.results()]
+        self.assertEqual(sorted(custom_ids), [f"req-{i}" for i in range(5)])
+
+    async def test_changed_input_is_rejected(self):
+        await self.interrupted_run()
+        self.write_input([f"req-{i}" for i in range(6)])
+
+        with self.assertRaises(ValueError):
+            await self.runner(FakeService()).run()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+ทดสอบการเก็บบทสนทนาสองชั้นและการกำหนด seq ของ message ใน ConversationStore
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from schema.openai.chat_models import ChatMessage  # noqa: E402
+from services.conversation_store import ConversationStore  # noqa: E402
+
+MODEL = "gpt-4o"
+
+
+def user(content):
+    return ChatMessage(role="user", content=content)
+
+
+class ConversationStoreTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "conversations.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_store(self, **kwargs):
+        store = ConversationStore(db_path=self.db_path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def stored_seqs(self, store, conversation_id):
+        with store._pool.connection() as conn:
+            return [
+                (seq, content) for seq, content in conn.execute(
+                    "SELECT seq, content FROM conversation_messages WHERE conversation_id = ? ORDER BY seq",
+                    (conversation_id,)
+                )
+            ]
+
+    async def test_append_allocates_consecutive_seqs(self):
+        store = self.open_store()
+        conversation = await store.create(MODEL, "ตอบสั้นๆ")
+
+        self.assertTrue(await store.append(conversation.id, [user("ก"), user("ข")]))
+        self.assertTrue(await store.append(conversation.id, [user("ค")]))
+
+        self.assertEqual(
+            self.stored_seqs(store, conversation.id),
+            [(0, "ตอบสั้นๆ"), (1, "ก"), (2, "ข"), (3, "ค")]
+        )
+
+    async def test_workers_appending_to_one_conversation_do_not_collide(self):
+        # สอง store บนไฟล์เดียวกันแทนสอง worker ที่ต่างมีสำเนาในหน่วยความจำของตัวเอง
+        first = self.open_store()
+        second = self.open_store()
+        conversation = await first.create(MODEL)
+        self.assertIsNotNone(await second.get(conversation.id))
+
+        await asyncio.gather(*(
+            store.append(conversation.id, [user(f"{name}{i}")])
+            for i in range(10)
+            for name, store in (("a", first), ("b", second))
+        ))
+
+        seqs = self.stored_seqs(first, conversation.id)
+        self.assertEqual([seq for seq, _ in seqs], list(range(20)))
+        self.assertEqual(len({content for _, content in seqs}), 20)
+
+        # store ที่เปิดใหม่โหลดทุก message ตามลำดับ seq
+        reloaded = await self.open_store().get(conversation.id)
+        self.assertEqual([message.content for message in reloaded.messages], [content for _, content in seqs])
+
+    async def test_memory_tier_and_disk_loads(self):
+        store = self.open_store(max_memory_conversations=1)
+        first = await store.create(MODEL)
+        second = await store.create(MODEL)
+
+        # first ถูกดันออกจาก LRU จึงโหลดจาก SQLite ส่วน second อยู่ในหน่วยความจำ
+        self.assertIs(await store.get(second.id), second)
+        loaded = await store.get(first.id)
+        self.assertIsNot(loaded, first)
+        self.assertEqual(loaded.id, first.id)
+        self.assertIsNone(await store.get("missing"))
+
+        stats = store.stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_loads"], stats["misses"]), (1, 1, 1))
+        self.assertEqual(stats["memory_conversations"], 1)
+
+    async def test_append_updates_cached_copy(self):
+        store = self.open_store()
+        conversation = await store.create(MODEL)
+        await store.append(conversation.id, [user("ก")])
+
+        self.assertEqual([message.content for message in (await store.get(conversation.id)).messages], ["ก"])
+        self.assertEqual(store.stats()["appended_messages"], 1)
+
+    async def test_missing_and_deleted_conversations(self):
+        store = self.open_store()
+        self.assertFalse(await store.append("missing", [user("ก")]))
+
+        conversation = await store.create(MODEL)
+        await store.append(conversation.id, [user("ก")])
+        self.assertTrue(await store.delete(conversation.id))
+        self.assertFalse(await store.delete(conversation.id))
+        self.assertIsNone(await store.get(conversation.id))
+        self.assertEqual(self.stored_seqs(store, conversation.id), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+ทดสอบการรวมคำขอ embeddings เป็นชุดและการแยกชุดเมื่อ API ปฏิเสธของ EmbeddingBatcher
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.embedding_batcher import EmbeddingBatcher  # noqa: E402
+
+MODEL = "text-embedding-3-small"
+
+
+def bad_request(message):
+    response = httpx.Response(400, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return openai.BadRequestError(message, response=response, body=None)
+
+
+class FakeEmbeddingsAPI:
+    """
+    embeddings API จำลอง: เวกเตอร์ของข้อความคือ [ความยาวข้อความ] และคืน data สลับลำดับเพื่อทดสอบการเรียงตาม index
+    ข้อความที่อยู่ใน reject ทำให้ทั้งคำขอถูกปฏิเสธด้วย 400
+    """
+
+    def __init__(self, reject=(), error=None):
+        self.reject = set(reject)
+        self.error = error
+        self.calls = []
+
+    async def __call__(self, **params):
+        self.calls.append(params)
+        if self.error is not None:
+            raise self.error
+        if self.reject.intersection(params["input"]):
+            raise bad_request("invalid input")
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text))])
+            for i, text in enumerate(params["input"])
+        ]
+        tokens = sum(len(text) for text in params["input"])
+        return SimpleNamespace(
+            data=list(reversed(data)),
+            model=params["model"],
+            usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens)
+        )
+
+
+class EmbeddingBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_callers_share_one_request(self):
+        api = FakeEmbeddingsAPI()
+        batcher = EmbeddingBatcher(api, max_batch_size=16, max_wait_ms=5)
+
+        first, second = await asyncio.gather(
+            batcher.embed(MODEL, None, ["กข", "ค"]),
+            batcher.embed(MODEL, None, ["งจฉช"])
+        )
+
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(api.calls[0]["input"], ["กข", "ค", "งจฉช"])
+        self.assertEqual(first[0], [[2.0], [1.0]])
+        self.assertEqual(second[0], [[4.0]])
+        # token ของชุดถูกแบ่งตามสัดส่วนความยาวข้อความของผู้เรียก
+        self.assertEqual((first[2].prompt_tokens, second[2].prompt_tokens), (3, 4))
+
+    async def test_full_batch_is_sent_without_waiting(self):
+        api = FakeEmbeddingsAPI()
+        batcher = EmbeddingBatcher(api, max_batch_size=2, max_wait_ms=60000)
+
+        vectors, _, _ = await asyncio.wait_for(batcher.embed(MODEL, None, ["ก", "ข"]), timeout=1)
+        self.assertEqual(vectors, [[1.0], [1.0]])
+
+    async def test_requests_are_grouped_by_dimensions_and_priority(self):
+        api = FakeEmbeddingsAPI()
+        batcher = EmbeddingBatcher(api, max_batch_size=16, max_wait_ms=5)
+
+        await asyncio.gather(
+            batcher.embed(MODEL, None, ["ก"]),
+            batcher.embed(MODEL, 256, ["ข"]),
+            batcher.embed(MODEL, None, ["ค"], priority=1)
+        )
+
+        self.assertEqual(len(api.calls), 3)
+        self.assertEqual([call.get("dimensions") for call in api.calls].count(256), 1)
+
+    async def test_rejected_batch_is_split_per_caller(self):
+        api = FakeEmbeddingsAPI(reject={"เสีย"})
+        batcher = EmbeddingBatcher(api, max_batch_size=16, max_wait_ms=5)
+
+        good, bad, other = await asyncio.gather(
+            batcher.embed(MODEL, None, ["ก"]),
+            batcher.embed(MODEL, None, ["เสีย", "ข"]),
+            batcher.embed(MODEL, None, ["คง"]),
+            return_exceptions=True
+        )
+
+        self.assertEqual(good[0], [[1.0]])
+        self.assertEqual(other[0], [[2.0]])
+        self.assertIsInstance(bad, openai.BadRequestError)
+        # ชุดรวมหนึ่งครั้ง และส่งแยกของผู้เรียกแต่ละรายอีกสามครั้ง
+        self.assertEqual(len(api.calls), 4)
+        self.assertEqual(batcher.stats()["split_retries"], 1)
+
+    async def test_other_errors_fail_the_whole_batch_once(self):
+        api = FakeEmbeddingsAPI(error=RuntimeError("upstream down"))
+        batcher = EmbeddingBatcher(api, max_batch_size=16, max_wait_ms=5)
+
+        results = await asyncio.gather(
+            batcher.embed(MODEL, None, ["ก"]),
+            batcher.embed(MODEL, None, ["ข"]),
+            return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(batcher.stats()["split_retries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+ทดสอบแคช embeddings สองชั้น (LRU ในหน่วยความจำและ SQLite) ของ EmbeddingCache
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.embedding_cache import EmbeddingCache  # noqa: E402
+
+MODEL = "text-embedding-3-small"
+
+
+class EmbeddingCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "cache", "embedding_cache.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_cache(self, **kwargs):
+        cache = EmbeddingCache(db_path=self.db_path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    async def test_memory_hit_uses_normalized_text(self):
+        cache = self.open_cache()
+        cache.put_many(MODEL, None, ["สวัสดี  ครับ"], [[0.5, 0.25]], total_tokens=4)
+
+        found = await cache.get_many(MODEL, None, [" สวัสดี ครับ", "อื่น"])
+        self.assertEqual(found, [[0.5, 0.25], None])
+        # จำนวนมิติที่ต่างกันเป็นคนละ key
+        self.assertEqual(await cache.get_many(MODEL, 256, ["สวัสดี ครับ"]), [None])
+
+        stats = cache.stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_hits"], stats["misses"]), (1, 0, 2))
+        self.assertEqual(stats["saved_tokens"], 4)
+
+    async def test_file_is_created_on_first_use(self):
+        cache = self.open_cache()
+        self.assertFalse(os.path.exists(self.db_path))
+        await cache.get_many(MODEL, None, ["ก"])
+        self.assertTrue(os.path.exists(self.db_path))
+
+    async def test_disk_tier_survives_restart_and_refills_memory(self):
+        cache = self.open_cache()
+        cache.put_many(MODEL, None, ["ก", "ข"], [[1.0], [2.0]], total_tokens=2)
+        cache.close()
+
+        restarted = self.open_cache()
+        self.assertEqual(await restarted.get_many(MODEL, None, ["ข", "ก", "ค"]), [[2.0], [1.0], None])
+        self.assertEqual(await restarted.get_many(MODEL, None, ["ก"]), [[1.0]])
+
+        stats = restarted.stats()
+        self.assertEqual((stats["memory_hits"], stats["disk_hits"], stats["misses"]), (1, 2, 1))
+        self.assertEqual(stats["memory_entries"], 2)
+
+    async def test_lru_evicts_to_disk_tier(self):
+        cache = self.open_cache(max_memory_entries=2)
+        for text in ("ก", "ข", "ค"):
+            cache.put_many(MODEL, None, [text], [[float(ord(text))]])
+        # รอการเขียนลง SQLite ที่ส่งไปใน executor
+        cache.close()
+
+        self.assertEqual(cache.stats()["memory_entries"], 2)
+        self.assertEqual(await cache.get_many(MODEL, None, ["ก"]), [[float(ord("ก"))]])
+        self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    async def test_backlogged_writes_stay_in_memory(self):
+        cache = self.open_cache(max_pending_writes=0)
+        cache.put_many(MODEL, None, ["ก"], [[1.0]])
+
+        self.assertEqual(cache.stats()["dropped_writes"], 1)
+        self.assertEqual(await cache.get_many(MODEL, None, ["ก"]), [[1.0]])
+        self.assertFalse(os.path.exists(self.db_path))
+
+    async def test_disk_errors_are_misses(self):
+        # พาธของไฟล์ฐานข้อมูลเป็นโฟลเดอร์ SQLite จึงเปิดไม่ได้
+        os.makedirs(self.db_path)
+        cache = self.open_cache()
+
+        self.assertEqual(await cache.get_many(MODEL, None, ["ก"]), [None])
+        stats = cache.stats()
+        self.assertEqual((stats["misses"], stats["disk_errors"]), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
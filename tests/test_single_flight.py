@@ -0,0 +1,187 @@
+"""
+ทดสอบการรวมคำขอที่เหมือนกันและการยกเลิก upstream ของ SingleFlight
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.single_flight import SingleFlight  # noqa: E402
+
+
+class Upstream:
+    """
+    การเรียก upstream จำลองที่รอจนกว่าจะถูกปล่อย และบันทึกว่าถูกเรียกหรือถูกยกเลิกกี่ครั้ง
+    """
+
+    def __init__(self, result="ok"):
+        self.result = result
+        self.release = asyncio.Event()
+        self.calls = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class UpstreamStream:
+    """
+    stream จำลองที่ส่งส่วนตาม queue และบันทึกว่าถูกปิดแล้วหรือไม่
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.opened = 0
+        self.closed = asyncio.Event()
+
+    async def __call__(self):
+        self.opened += 1
+        try:
+            while True:
+                item = await self.queue.get()
+                if item is None:
+                    return
+                yield item
+        finally:
+            self.closed.set()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class SingleFlightCallTest(unittest.IsolatedAsyncioTestCase):
+    async def test_identical_calls_share_one_upstream_call(self):
+        flight = SingleFlight()
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(3)]
+        await settle()
+        upstream.release.set()
+
+        self.assertEqual(await asyncio.gather(*waiters), ["ok"] * 3)
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(flight.stats()["collapsed_calls"], 2)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    async def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        upstream = Upstream(ValueError("boom"))
+        waiters = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(2)]
+        await settle()
+        upstream.release.set()
+
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+
+    async def test_one_cancelled_waiter_does_not_cancel_upstream(self):
+        flight = SingleFlight()
+        upstream = Upstream()
+        first = asyncio.ensure_future(flight.do("k", upstream))
+        second = asyncio.ensure_future(flight.do("k", upstream))
+        await settle()
+
+        first.cancel()
+        await settle()
+        self.assertEqual(upstream.cancelled, 0)
+        upstream.release.set()
+        self.assertEqual(await second, "ok")
+
+    async def test_upstream_cancelled_when_every_waiter_cancels(self):
+        flight = SingleFlight()
+        upstream = Upstream()
+        waiters = [asyncio.ensure_future(flight.do("k", upstream)) for _ in range(2)]
+        await settle()
+
+        for waiter in waiters:
+            waiter.cancel()
+        await settle()
+        self.assertEqual(upstream.cancelled, 1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+        # key เดิมเริ่มการเรียกใหม่ได้หลังจากนั้น
+        upstream.release.set()
+        self.assertEqual(await flight.do("k", upstream), "ok")
+        self.assertEqual(upstream.calls, 2)
+
+
+class SingleFlightStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def test_late_subscriber_replays_earlier_items(self):
+        flight = SingleFlight()
+        upstream = UpstreamStream()
+        first = flight.stream("k", upstream)
+        upstream.queue.put_nowait("ก")
+        self.assertEqual(await first.__anext__(), "ก")
+
+        second = flight.stream("k", upstream)
+        upstream.queue.put_nowait("ข")
+        upstream.queue.put_nowait(None)
+        self.assertEqual([item async for item in second], ["ก", "ข"])
+        self.assertEqual([item async for item in first], ["ข"])
+        self.assertEqual(upstream.opened, 1)
+        self.assertEqual(flight.stats()["collapsed_streams"], 1)
+
+    async def test_upstream_kept_open_while_a_subscriber_remains(self):
+        flight = SingleFlight()
+        upstream = UpstreamStream()
+        first = flight.stream("k", upstream)
+        second = flight.stream("k", upstream)
+        upstream.queue.put_nowait("ก")
+        self.assertEqual(await first.__anext__(), "ก")
+        self.assertEqual(await second.__anext__(), "ก")
+
+        await first.aclose()
+        await settle()
+        self.assertFalse(upstream.closed.is_set())
+
+        upstream.queue.put_nowait(None)
+        self.assertEqual([item async for item in second], [])
+
+    async def test_upstream_closed_when_last_subscriber_leaves(self):
+        flight = SingleFlight()
+        upstream = UpstreamStream()
+        subscriber = flight.stream("k", upstream)
+        upstream.queue.put_nowait("ก")
+        self.assertEqual(await subscriber.__anext__(), "ก")
+
+        await subscriber.aclose()
+        await asyncio.wait_for(upstream.closed.wait(), timeout=1)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+        # stream ใหม่ที่ใช้ key เดิมเปิด upstream ใหม่ ไม่ได้ส่วนของ stream ที่ถูกยกเลิก
+        upstream.closed.clear()
+        fresh = flight.stream("k", upstream)
+        upstream.queue.put_nowait("ข")
+        upstream.queue.put_nowait(None)
+        self.assertEqual([item async for item in fresh], ["ข"])
+        self.assertEqual(upstream.opened, 2)
+
+    async def test_upstream_error_reaches_subscribers(self):
+        flight = SingleFlight()
+
+        async def failing():
+            yield "ก"
+            raise ValueError("boom")
+
+        received = []
+        with self.assertRaises(ValueError):
+            async for item in flight.stream("k", failing):
+                received.append(item)
+        self.assertEqual(received, ["ก"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+"""
+ทดสอบว่า SSEResponse หยุดอ่าน stream ของ upstream ทันทีที่ client ตัดการเชื่อมต่อ ทั้งกับ stream จำลอง
+และกับ OpenAIService.chat_completion_stream จริง (rechunk และ SingleFlight) ที่ใช้ client จำลอง
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import sys
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from starlette.requests import ClientDisconnect  # noqa: E402
+
+from schema.openai.chat_models import ChatMessage, ChatRequest  # noqa: E402
+from services.opeai_service import OpenAIService  # noqa: E402
+from services.single_flight import SingleFlight  # noqa: E402
+from services.sse_writer import DONE_EVENT, SSEWriter  # noqa: E402
+from services.upstream_pool import UpstreamPool, UpstreamTarget  # noqa: E402
+
+
+class FakeUpstream:
+    """
+    stream ของ upstream ที่ส่ง event ตามที่กำหนด แล้วค้างไว้ (เหมือนโมเดลที่ยังคิดอยู่) จนกว่าจะถูกปิด
+    """
+
+    def __init__(self, events, stall=True):
+        self._events = events
+        self._stall = stall
+        self.closed = asyncio.Event()
+
+    async def close(self):
+        self.closed.set()
+
+    async def stream(self):
+        # เหมือน OpenAIService.chat_completion_stream ที่ปิด stream ของ upstream ใน finally
+        try:
+            for event in self._events:
+                yield event
+            if self._stall:
+                await asyncio.Event().wait()
+        finally:
+            await self.close()
+
+
+class StubChatStream:
+    """
+    stream ของ chat.completions.create(stream=True) ที่ส่งหนึ่ง chunk แล้วค้างไว้จนกว่าจะถูก close()
+    """
+
+    def __init__(self, content):
+        self._content = content
+        self.closed = asyncio.Event()
+        self.closed_at = None
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        delta = SimpleNamespace(content=self._content)
+        yield SimpleNamespace(usage=None, choices=[SimpleNamespace(finish_reason=None, delta=delta)])
+        await asyncio.Event().wait()
+
+    async def close(self):
+        self.closed_at = time.perf_counter()
+        self.closed.set()
+
+
+class StubOpenAIClient:
+    """
+    AsyncOpenAI จำลองที่มีเฉพาะ chat.completions.create และเก็บ stream ที่สร้างไว้ตรวจสอบ
+    """
+
+    def __init__(self):
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        stream = StubChatStream("สวัสดีครับ ")
+        self.streams.append(stream)
+        return stream
+
+
+def http_scope(spec_version):
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": spec_version},
+        "method": "POST",
+        "path": "/chat/stream",
+        "headers": []
+    }
+
+
+class SSEResponseDisconnectTest(unittest.IsolatedAsyncioTestCase):
+    async def test_closes_upstream_when_client_disconnects(self):
+        # spec 2.4 คือกรณีที่ StreamingResponse เดิมไม่ฟัง http.disconnect
+        for spec_version in ("2.3", "2.4"):
+            with self.subTest(spec_version=spec_version):
+                upstream = FakeUpstream([{"delta": "สวัสดี"}])
+                received_body = asyncio.Event()
+                messages = []
+
+                async def send(message):
+                    messages.append(message)
+                    if message["type"] == "http.response.body" and message["body"]:
+                        received_body.set()
+
+                async def receive():
+                    # client ตัดการเชื่อมต่อหลังได้รับ event แรก ขณะที่ upstream ยังไม่ส่งอะไรต่อ
+                    await received_body.wait()
+                    return {"type": "http.disconnect"}
+
+                response = SSEWriter().response(upstream.stream())
+                await asyncio.wait_for(response(http_scope(spec_version), receive, send), timeout=2)
+                await asyncio.wait_for(upstream.closed.wait(), timeout=2)
+
+                bodies = [message["body"] for message in messages if message["type"] == "http.response.body"]
+                self.assertIn("สวัสดี".encode("utf-8"), b"".join(bodies))
+                self.assertNotIn(DONE_EVENT, bodies)
+
+    async def test_send_error_becomes_client_disconnect(self):
+        upstream = FakeUpstream([{"delta": "สวัสดี"}])
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                raise OSError("connection reset")
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        response = SSEWriter().response(upstream.stream())
+        with self.assertRaises(ClientDisconnect):
+            await asyncio.wait_for(response(http_scope("2.4"), receive, send), timeout=2)
+        await asyncio.wait_for(upstream.closed.wait(), timeout=2)
+
+    async def test_streams_to_completion_while_connected(self):
+        upstream = FakeUpstream([{"delta": "ก"}, {"delta": "ข"}], stall=False)
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async def receive():
+            await asyncio.Event().wait()
+
+        response = SSEWriter().response(upstream.stream())
+        await asyncio.wait_for(response(http_scope("2.4"), receive, send), timeout=2)
+
+        body = b"".join(message["body"] for message in messages if message["type"] == "http.response.body")
+        self.assertTrue(body.endswith(DONE_EVENT))
+        self.assertFalse(messages[-1]["more_body"])
+        self.assertTrue(upstream.closed.is_set())
+
+
+class ChatStreamDisconnectTest(unittest.IsolatedAsyncioTestCase):
+    async def test_service_closes_upstream_stream_after_disconnect(self):
+        client = StubOpenAIClient()
+        target = UpstreamTarget("stub", client)
+        service = OpenAIService(upstream_pool=UpstreamPool([target]))
+        # ทดสอบเส้นทางเต็มโดยไม่มีแคช: SSEWriter -> rechunk -> SingleFlight._pump -> stream.close()
+        service.chat_cache = None
+        service.inflight = SingleFlight()
+        request = ChatRequest(messages=[ChatMessage(role="user", content="ทดสอบ")], model="gpt-4o", stream=True)
+
+        received_body = asyncio.Event()
+        disconnected_at = None
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message["body"]:
+                received_body.set()
+
+        async def receive():
+            nonlocal disconnected_at
+            await received_body.wait()
+            disconnected_at = time.perf_counter()
+            return {"type": "http.disconnect"}
+
+        response = SSEWriter().response(service.chat_completion_stream(request))
+        await asyncio.wait_for(response(http_scope("2.4"), receive, send), timeout=2)
+
+        self.assertEqual(len(client.streams), 1)
+        upstream = client.streams[0]
+        await asyncio.wait_for(upstream.closed.wait(), timeout=2)
+        self.assertLess(upstream.closed_at - disconnected_at, 0.05)
+        # ไม่มี stream ค้างอยู่ใน single-flight และปลายทางไม่ถูกนับว่ามีงานค้าง
+        self.assertEqual(service.inflight.stats()["in_flight"], 0)
+        self.assertEqual(target.in_flight, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
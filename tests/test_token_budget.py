@@ -0,0 +1,120 @@
+"""
+ทดสอบการตัดประวัติบทสนทนาให้พอดีงบ token และการสรุปต่อเนื่องของ TokenBudget
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from schema.openai.chat_models import ChatMessage  # noqa: E402
+from services.token_budget import TokenBudget, TokenCounter  # noqa: E402
+
+MODEL = "gpt-4o"
+
+
+def conversation(turns):
+    """
+    system message หนึ่งรายการ (5 token) และ message สลับ user/assistant รายการละ 14 token
+    (ตัวนับ heuristic: ตัวอักษร ASCII 3 ตัวต่อ token บวก 4 token ต่อ message)
+    """
+    messages = [ChatMessage(role="system", content="s")]
+    for i in range(turns):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(ChatMessage(role=role, content=f"{i:02d}" + "x" * 28))
+    return messages
+
+
+class RecordingSummarizer:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, model, summary, messages):
+        self.calls.append((summary, [message.content[:2] for message in messages]))
+        if self.fail:
+            raise RuntimeError("summary failed")
+        return f"{summary or ''}+{len(messages)}"
+
+
+class TokenBudgetTest(unittest.IsolatedAsyncioTestCase):
+    async def test_messages_within_budget_are_unchanged(self):
+        budget = TokenBudget(prompt_budget=1000)
+        messages = conversation(4)
+
+        self.assertIs(await budget.fit(MODEL, None, messages), messages)
+        self.assertEqual(budget.stats()["trimmed_requests"], 0)
+
+    async def test_drops_oldest_history_and_keeps_system(self):
+        # system 5 + reply 3 + message ล่าสุด 3 รายการ x 14 = 50
+        budget = TokenBudget(prompt_budget=50)
+        messages = conversation(5)
+
+        fitted = await budget.fit(MODEL, None, messages)
+
+        self.assertEqual(fitted, [messages[0]] + messages[3:])
+        self.assertLessEqual(budget.count_messages(MODEL, fitted), 50)
+        self.assertEqual(budget.stats()["dropped_messages"], 2)
+
+    async def test_keeps_recent_messages_even_over_budget(self):
+        budget = TokenBudget(prompt_budget=10, keep_recent=2)
+        messages = conversation(5)
+
+        self.assertEqual(await budget.fit(MODEL, None, messages), [messages[0]] + messages[4:])
+
+    async def test_max_tokens_reduces_the_budget(self):
+        budget = TokenBudget()
+        self.assertEqual(budget.budget_for(MODEL, 1000), 128000 - 1000)
+        self.assertEqual(TokenBudget(prompt_budget=500).budget_for(MODEL, 1000), 500)
+
+    async def test_summaries_chain_from_the_previous_prefix(self):
+        summarizer = RecordingSummarizer()
+        # กันงบ 14 token ให้บทสรุป จึงเหลือที่ให้ message ล่าสุด 2 รายการ
+        budget = TokenBudget(prompt_budget=50, summarizer=summarizer, summary_max_tokens=10)
+        messages = conversation(5)
+
+        fitted = await budget.fit(MODEL, None, messages)
+        self.assertEqual(fitted[1], ChatMessage(role="system", content="สรุปบทสนทนาก่อนหน้า: +3"))
+        self.assertEqual(fitted[2:], messages[4:])
+        self.assertEqual(summarizer.calls, [(None, ["00", "01", "02"])])
+
+        # รอบถัดไปสรุปเฉพาะ message ที่เพิ่งถูกตัด ต่อจากบทสรุปเดิม
+        messages = conversation(7)
+        fitted = await budget.fit(MODEL, None, messages)
+        self.assertEqual(fitted[1].content, "สรุปบทสนทนาก่อนหน้า: +3+2")
+        self.assertEqual(summarizer.calls[1], ("+3", ["03", "04"]))
+
+        # ส่วนที่ถูกตัดเหมือนเดิมใช้บทสรุปในแคช
+        await budget.fit(MODEL, None, messages)
+        self.assertEqual(len(summarizer.calls), 2)
+        self.assertEqual(budget.stats()["summaries"], 2)
+
+    async def test_summary_failure_falls_back_to_dropping(self):
+        budget = TokenBudget(prompt_budget=50, summarizer=RecordingSummarizer(fail=True), summary_max_tokens=10)
+        messages = conversation(5)
+
+        self.assertEqual(await budget.fit(MODEL, None, messages), [messages[0]] + messages[4:])
+        self.assertEqual(budget.stats()["summary_failures"], 1)
+
+    def test_message_counts_are_cached(self):
+        budget = TokenBudget()
+        messages = conversation(3)
+        budget.count_messages(MODEL, messages)
+        budget.count_messages(MODEL, messages)
+        self.assertEqual(budget.stats()["count_cache_entries"], 4)
+        self.assertEqual(budget.stats()["count_cache_hit_rate"], 0.5)
+
+    def test_unknown_counter_is_rejected(self):
+        with self.assertRaises(ValueError):
+            TokenBudget(counter="unknown")
+
+    def test_token_counter_is_abstract(self):
+        with self.assertRaises(TypeError):
+            TokenCounter()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+ทดสอบการเลือกปลายทางและการส่งคำขอซ้ำ (hedge) ของ UpstreamPool
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.upstream_pool import UpstreamPool, UpstreamTarget  # noqa: E402
+
+OPERATION = "chat:gpt-4o"
+
+
+def hedged_pool(samples=20, seconds=0.02):
+    """
+    pool สองปลายทางที่มีตัวอย่างเวลาตอบสนองพอให้ hedge ได้ทันที (hedge_delay ประมาณ seconds)
+    """
+    pool = UpstreamPool(
+        [UpstreamTarget("a", None), UpstreamTarget("b", None)],
+        hedge=True,
+        hedge_min_delay=0.01,
+        hedge_min_samples=samples
+    )
+    for _ in range(samples):
+        pool._record_sample(OPERATION, seconds)
+    return pool
+
+
+class SlowPrimary:
+    """
+    factory ที่ปลายทางแรกที่ถูกเรียกค้างไว้จนถูกยกเลิก ส่วนปลายทางอื่นตอบทันที
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, target):
+        self.calls.append(target.name)
+        if len(self.calls) == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled.append(target.name)
+                raise
+        return target.name
+
+
+class Delays:
+    """
+    factory ที่คำขอครั้งที่ i ใช้เวลา delays[i] วินาที และบันทึกปลายทางของคำขอที่ถูกยกเลิก
+    """
+
+    def __init__(self, *delays):
+        self.delays = delays
+        self.calls = []
+        self.cancelled = []
+
+    async def __call__(self, target):
+        delay = self.delays[len(self.calls)]
+        self.calls.append(target.name)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(target.name)
+            raise
+        return target.name
+
+
+class UpstreamPoolHedgeTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_loser_is_not_a_latency_sample(self):
+        pool = hedged_pool()
+        factory = SlowPrimary()
+
+        winner = await asyncio.wait_for(pool.call(OPERATION, factory, hedge=True), timeout=2)
+        await asyncio.sleep(0)
+
+        self.assertEqual(factory.cancelled, [factory.calls[0]])
+        self.assertEqual(winner, factory.calls[1])
+        # มีเพียงเวลาของคำขอที่ชนะเพิ่มเข้าหน้าต่าง เวลาของคำขอที่ถูกตัดไม่ดึงเปอร์เซ็นไทล์ลง
+        self.assertEqual(len(pool._samples[OPERATION]), 21)
+        self.assertEqual(pool.targets[0].cancelled + pool.targets[1].cancelled, 1)
+
+    async def test_hedge_goes_to_the_other_target_and_cancels_the_primary(self):
+        pool = hedged_pool()
+        factory = Delays(10, 0)
+
+        winner = await asyncio.wait_for(pool.call(OPERATION, factory, hedge=True), timeout=2)
+        await asyncio.sleep(0)
+
+        self.assertNotEqual(factory.calls[0], factory.calls[1])
+        self.assertEqual(winner, factory.calls[1])
+        self.assertEqual(factory.cancelled, [factory.calls[0]])
+        self.assertEqual((pool.hedged, pool.hedge_wins), (1, 1))
+        self.assertEqual(sum(target.in_flight for target in pool.targets), 0)
+
+    async def test_primary_answering_first_cancels_the_hedge(self):
+        pool = hedged_pool()
+        factory = Delays(0.05, 10)
+
+        winner = await asyncio.wait_for(pool.call(OPERATION, factory, hedge=True), timeout=2)
+        await asyncio.sleep(0)
+
+        self.assertEqual(winner, factory.calls[0])
+        self.assertEqual(factory.cancelled, [factory.calls[1]])
+        self.assertEqual((pool.hedged, pool.hedge_wins), (1, 0))
+
+    async def test_fast_primary_is_not_hedged(self):
+        pool = hedged_pool()
+        factory = Delays(0)
+
+        await pool.call(OPERATION, factory, hedge=True)
+        self.assertEqual(len(factory.calls), 1)
+        self.assertEqual(pool.hedged, 0)
+
+    async def test_exhausted_budget_waits_for_the_primary(self):
+        pool = hedged_pool()
+        pool._hedge_tokens = 0
+        factory = Delays(0.05)
+
+        self.assertEqual(await pool.call(OPERATION, factory, hedge=True), factory.calls[0])
+        self.assertEqual(len(factory.calls), 1)
+        self.assertEqual((pool.hedged, pool.hedge_budget_exhausted), (0, 1))
+
+    async def test_cancelling_the_caller_cancels_both_attempts(self):
+        pool = hedged_pool()
+        factory = Delays(10, 10)
+        call = asyncio.ensure_future(pool.call(OPERATION, factory, hedge=True))
+        while len(factory.calls) < 2:
+            await asyncio.sleep(0.005)
+
+        call.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        self.assertEqual(sorted(factory.cancelled), ["a", "b"])
+        self.assertEqual(sum(target.in_flight for target in pool.targets), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+ทดสอบการจัดคิวตามลำดับความสำคัญ การปฏิเสธด้วย 503 และ Retry-After ของ UpstreamScheduler
+
+วิธีใช้:
+    python -m unittest discover tests
+"""
+import asyncio
+import json
+import sys
+import unittest
+from pathlib import Path
+
+import httpx
+import openai
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+from services.upstream_scheduler import (  # noqa: E402
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    UpstreamOverloaded,
+    UpstreamScheduler,
+    request_priority,
+    upstream_overloaded_handler,
+)
+
+
+def rate_limit_error(headers):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, request=request, headers=headers)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def drained(requests_per_minute, **kwargs):
+    """
+    scheduler ที่ใช้งบคำขอหมดแล้ว คำขอถัดไปต้องรอคิว
+    """
+    scheduler = UpstreamScheduler(requests_per_minute=requests_per_minute, **kwargs)
+    scheduler.requests.level = 0
+    return scheduler
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class UpstreamSchedulerQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_admits_immediately_within_budget(self):
+        scheduler = UpstreamScheduler(requests_per_minute=60, tokens_per_minute=1000)
+        await asyncio.wait_for(scheduler.acquire(100), timeout=0.1)
+
+        stats = scheduler.stats()
+        self.assertEqual((stats["admitted"], stats["queued"]), (1, 0))
+        self.assertLess(stats["available_tokens"], 1000)
+
+    async def test_interactive_requests_overtake_bulk(self):
+        # 6000 คำขอต่อนาที คือมีงบคืนหนึ่งคำขอทุก 10 ms
+        scheduler = drained(6000)
+        admitted = []
+
+        async def request(name, priority):
+            await scheduler.acquire(0, priority)
+            admitted.append(name)
+
+        bulk = [asyncio.ensure_future(request(f"bulk{i}", PRIORITY_BULK)) for i in range(2)]
+        await settle()
+        interactive = asyncio.ensure_future(request("interactive", PRIORITY_INTERACTIVE))
+
+        await asyncio.wait_for(asyncio.gather(*bulk, interactive), timeout=1)
+        self.assertEqual(admitted, ["interactive", "bulk0", "bulk1"])
+        self.assertEqual(scheduler.stats()["queued"], 3)
+
+    async def test_priority_defaults_to_the_request_context(self):
+        scheduler = drained(6000)
+        admitted = []
+
+        async def request(name):
+            await scheduler.acquire(0)
+            admitted.append(name)
+
+        token = request_priority.set(PRIORITY_BULK)
+        bulk = asyncio.ensure_future(request("bulk"))
+        request_priority.reset(token)
+        await settle()
+        interactive = asyncio.ensure_future(request("interactive"))
+
+        await asyncio.wait_for(asyncio.gather(bulk, interactive), timeout=1)
+        self.assertEqual(admitted, ["interactive", "bulk"])
+
+    async def test_cancelled_waiter_is_skipped(self):
+        scheduler = drained(6000)
+        cancelled = asyncio.ensure_future(scheduler.acquire(0))
+        waiting = asyncio.ensure_future(scheduler.acquire(0))
+        await settle()
+
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=1)
+        self.assertEqual(scheduler.stats()["admitted"], 1)
+        self.assertEqual(scheduler.stats()["queue_length"], 0)
+
+
+class UpstreamSchedulerOverloadTest(unittest.IsolatedAsyncioTestCase):
+    async def test_full_queue_is_rejected(self):
+        scheduler = drained(60, max_queue_size=1)
+        waiting = asyncio.ensure_future(scheduler.acquire(0))
+        await settle()
+        self.addCleanup(waiting.cancel)
+
+        with self.assertRaises(UpstreamOverloaded) as caught:
+            await scheduler.acquire(0)
+        # คำขอในคิวหนึ่งรายการและคำขอใหม่ ที่หนึ่งคำขอต่อวินาที
+        self.assertEqual(caught.exception.retry_after, 2)
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+    async def test_long_wait_is_rejected_up_front(self):
+        scheduler = drained(60, max_wait_seconds=0.5)
+
+        with self.assertRaises(UpstreamOverloaded) as caught:
+            scheduler.ensure_capacity()
+        self.assertEqual(caught.exception.retry_after, 1)
+
+        with self.assertRaises(UpstreamOverloaded):
+            await scheduler.acquire(0)
+        stats = scheduler.stats()
+        self.assertEqual((stats["rejected"], stats["queued"], stats["queue_length"]), (2, 0, 0))
+
+    async def test_bulk_queue_does_not_reject_interactive(self):
+        scheduler = drained(60, max_wait_seconds=1.5)
+        bulk = asyncio.ensure_future(scheduler.acquire(0, PRIORITY_BULK))
+        await settle()
+        self.addCleanup(bulk.cancel)
+
+        # คำขอ bulk ที่รออยู่ไม่นับในเวลารอของคำขอที่สำคัญกว่า
+        scheduler.ensure_capacity(priority=PRIORITY_INTERACTIVE)
+        with self.assertRaises(UpstreamOverloaded):
+            scheduler.ensure_capacity(priority=PRIORITY_BULK)
+
+    async def test_handler_returns_503_with_retry_after(self):
+        response = await upstream_overloaded_handler(None, UpstreamOverloaded(2.1))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "3")
+        self.assertEqual(json.loads(response.body), {"detail": "Upstream is overloaded, retry later"})
+
+    def test_retry_after_is_at_least_one_second(self):
+        self.assertEqual(UpstreamOverloaded(0).retry_after, 1)
+
+
+class UpstreamSchedulerRetryTest(unittest.IsolatedAsyncioTestCase):
+    async def test_transient_errors_are_retried(self):
+        scheduler = UpstreamScheduler(max_retries=2, backoff_base=0.001)
+        errors = [rate_limit_error({"retry-after-ms": "5"})]
+
+        async def factory():
+            if errors:
+                raise errors.pop()
+            return "ok"
+
+        self.assertEqual(await scheduler.call(factory, tokens=0), "ok")
+        stats = scheduler.stats()
+        self.assertEqual((stats["retries"], stats["rate_limited"], stats["admitted"]), (1, 1, 2))
+
+    async def test_other_errors_are_not_retried(self):
+        scheduler = UpstreamScheduler(max_retries=2)
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            await scheduler.call(factory, tokens=0)
+        self.assertEqual(len(calls), 1)
+
+    async def test_exhausted_rate_limit_becomes_overloaded(self):
+        scheduler = UpstreamScheduler(max_retries=0)
+
+        async def factory():
+            raise rate_limit_error({"retry-after": "7"})
+
+        with self.assertRaises(UpstreamOverloaded) as caught:
+            await scheduler.call(factory, tokens=0)
+        # Retry-After ของ upstream ส่งต่อถึงผู้เรียก
+        self.assertEqual(caught.exception.retry_after, 7)
+        self.assertIsInstance(caught.exception.__cause__, openai.RateLimitError)
+
+
+if __name__ == "__main__":
+    unittest.main()